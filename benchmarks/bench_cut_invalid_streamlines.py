@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Times scilpy.tractograms.streamline_operations.cut_invalid_streamlines on a
+large synthetic tractogram: random walks seeded in the volume, many of them
+leaving it (as with loosely masked tracking). The tractogram has one
+data_per_point and one data_per_streamline key.
+
+With --reference, also times a simple per-streamline implementation and
+verifies that both give the same streamlines, data_per_point and
+data_per_streamline.
+
+Example:
+    python benchmarks/bench_cut_invalid_streamlines.py --nb_streamlines 1000000
+"""
+
+import argparse
+import logging
+import time
+
+from dipy.io.stateful_tractogram import Origin, Space, StatefulTractogram
+import numpy as np
+
+from scilpy.tractograms.streamline_operations import cut_invalid_streamlines
+
+
+def _build_arg_parser():
+    p = argparse.ArgumentParser(description=__doc__,
+                                formatter_class=argparse.RawTextHelpFormatter)
+    p.add_argument('--nb_streamlines', type=int, default=500000,
+                   help='Number of streamlines. [%(default)s]')
+    p.add_argument('--max_length', type=int, default=100,
+                   help='Maximal number of points per streamline. '
+                        '[%(default)s]')
+    p.add_argument('--dimension', type=int, default=50,
+                   help='Size of the (isotropic) volume. [%(default)s]')
+    p.add_argument('--step_size', type=float, default=0.8,
+                   help='Standard deviation of the random walk steps, in '
+                        'voxels. [%(default)s]')
+    p.add_argument('--reference', action='store_true',
+                   help='Also time and compare to a per-streamline '
+                        'implementation.')
+    p.add_argument('--seed', type=int, default=1234,
+                   help='Random number generator seed. [%(default)s]')
+    return p
+
+
+def _generate_sft(nb_streamlines, max_length, dimension, step_size, rng):
+    lengths = rng.integers(2, max_length + 1, nb_streamlines)
+    steps = rng.normal(0, step_size, (np.sum(lengths), 3))
+    seeds = rng.uniform(1, dimension - 1, (nb_streamlines, 3))
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+    # Random walks: cumulative sum of the steps, restarted for each streamline
+    points = np.cumsum(steps, axis=0)
+    points -= np.repeat(points[offsets] - steps[offsets] - seeds, lengths,
+                        axis=0)
+    streamlines = np.split(points.astype(np.float32), offsets[1:])
+    dpp = np.split(np.arange(len(points), dtype=np.float32)[:, None],
+                   offsets[1:])
+
+    dims = np.array([dimension] * 3)
+    return StatefulTractogram(
+        streamlines, (np.eye(4), dims, np.ones(3), 'RAS'), Space.VOX,
+        origin=Origin.TRACKVIS, data_per_point={'point_id': dpp},
+        data_per_streamline={'streamline_id': np.arange(nb_streamlines)})
+
+
+def _reference_cut(sft, epsilon=0.001):
+    """ Per-streamline implementation: longest run of valid points. """
+    dims = np.asarray(sft.dimensions)
+    streamlines, dpp, dps = [], [], []
+    for i, streamline in enumerate(sft.streamlines):
+        valid = np.all((streamline >= epsilon) &
+                       (streamline < dims - epsilon), axis=1)
+        best, start = (0, 0), None
+        for pos, is_valid in enumerate(list(valid) + [False]):
+            if is_valid and start is None:
+                start = pos
+            elif not is_valid and start is not None:
+                if pos - start > best[1] - best[0]:
+                    best = (start, pos)
+                start = None
+        if np.all(valid) or best[1] - best[0] > 1:
+            streamlines.append(streamline[best[0]:best[1]])
+            dpp.append(sft.data_per_point['point_id'][i][best[0]:best[1]])
+            dps.append(sft.data_per_streamline['streamline_id'][i])
+    return streamlines, dpp, dps
+
+
+def main():
+    parser = _build_arg_parser()
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+    rng = np.random.default_rng(args.seed)
+
+    sft = _generate_sft(args.nb_streamlines, args.max_length, args.dimension,
+                        args.step_size, rng)
+    nb_points = len(sft.streamlines._data)
+    print('Tractogram: {} streamlines, {} points.'
+          .format(len(sft), nb_points))
+
+    timer = time.perf_counter()
+    new_sft, nb_cut = cut_invalid_streamlines(sft)
+    duration = time.perf_counter() - timer
+    print('cut_invalid_streamlines: {:.2f} s ({:.1f} M points/s). {} '
+          'streamlines cut, {} removed.'
+          .format(duration, nb_points / duration / 1e6, nb_cut,
+                  len(sft) - len(new_sft)))
+
+    if args.reference:
+        timer = time.perf_counter()
+        streamlines, dpp, dps = _reference_cut(sft)
+        duration = time.perf_counter() - timer
+        print('Per-streamline reference: {:.2f} s'.format(duration))
+
+        assert len(streamlines) == len(new_sft)
+        for i in range(len(new_sft)):
+            np.testing.assert_array_equal(new_sft.streamlines[i],
+                                          streamlines[i])
+            np.testing.assert_array_equal(
+                new_sft.data_per_point['point_id'][i], dpp[i])
+        np.testing.assert_array_equal(
+            new_sft.data_per_streamline['streamline_id'], dps)
+        print('Same output as the reference.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Times the fixel-specific metric sums along streamlines on a synthetic
+whole-brain tractogram (random walks filling the volume):
+    - scilpy.tractanalysis.mrds_along_streamlines.
+      mrds_metric_sums_along_streamlines (3 tensors, 2 metrics);
+    - scilpy.tractanalysis.bingham_metric_along_streamlines.
+      bingham_metric_sum_along_streamlines (5 lobes).
+
+With --reference, also times a per-segment implementation (loop over the
+segments of each streamline, as these functions used to do) and verifies
+that both give the same maps.
+
+Example:
+    python benchmarks/bench_fixel_metrics_along_streamlines.py \\
+        --nb_streamlines 500000
+"""
+
+import argparse
+import time
+
+from dipy.io.stateful_tractogram import Origin, Space, StatefulTractogram
+import numpy as np
+
+from scilpy.reconst.bingham import bingham_to_peak_direction
+from scilpy.tractanalysis.bingham_metric_along_streamlines import \
+    bingham_metric_sum_along_streamlines
+from scilpy.tractanalysis.mrds_along_streamlines import \
+    mrds_metric_sums_along_streamlines
+from scilpy.tractanalysis.voxel_boundary_intersection import \
+    subdivide_streamlines_at_voxel_faces
+
+
+def _build_arg_parser():
+    p = argparse.ArgumentParser(description=__doc__,
+                                formatter_class=argparse.RawTextHelpFormatter)
+    p.add_argument('--nb_streamlines', type=int, default=200000,
+                   help='Number of streamlines. [%(default)s]')
+    p.add_argument('--max_length', type=int, default=150,
+                   help='Maximal number of points per streamline. '
+                        '[%(default)s]')
+    p.add_argument('--dimension', type=int, default=100,
+                   help='Size of the (isotropic) volume. [%(default)s]')
+    p.add_argument('--max_theta', type=float, default=60,
+                   help='Maximal angle between segments and fixels. '
+                        '[%(default)s]')
+    p.add_argument('--reference', action='store_true',
+                   help='Also time and compare to a per-segment '
+                        'implementation.')
+    p.add_argument('--seed', type=int, default=1234,
+                   help='Random number generator seed. [%(default)s]')
+    return p
+
+
+def _generate_sft(nb_streamlines, max_length, dimension, rng):
+    lengths = rng.integers(2, max_length + 1, nb_streamlines)
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+    # Random walks with a persistent direction, folded into the volume.
+    directions = rng.normal(0, 1, (nb_streamlines, 3))
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    steps = np.repeat(directions * 0.5, lengths, axis=0)
+    steps += rng.normal(0, 0.1, steps.shape)
+    seeds = rng.uniform(0, dimension, (nb_streamlines, 3))
+    points = np.cumsum(steps, axis=0)
+    points -= np.repeat(points[offsets] - steps[offsets] - seeds, lengths,
+                        axis=0)
+    points = np.clip(points, 0.001, dimension - 0.001)
+    streamlines = np.split(points.astype(np.float32), offsets[1:])
+
+    dims = np.array([dimension] * 3)
+    return StatefulTractogram(
+        streamlines, (np.eye(4), dims, np.ones(3), 'RAS'), Space.VOX,
+        origin=Origin.TRACKVIS)
+
+
+def _reference_sums(sft, fixel_dirs, metrics, max_theta):
+    """ Per-segment implementation: closest fixel of each segment. """
+    min_cos_theta = np.cos(np.radians(max_theta))
+    sum_maps = np.zeros((len(metrics),) + metrics[0].shape[:3])
+    weight_map = np.zeros(metrics[0].shape[:3])
+    for streamline in subdivide_streamlines_at_voxel_faces(sft.streamlines):
+        segments = streamline[1:] - streamline[:-1]
+        seg_lengths = np.linalg.norm(segments, axis=1)
+        non_zero = np.nonzero(seg_lengths)[0]
+        vox_indices = (streamline[non_zero] +
+                       0.5 * segments[non_zero]).astype(int)
+        directions = segments[non_zero] / seg_lengths[non_zero, None]
+        for vox_idx, direction in zip(vox_indices, directions):
+            vox_idx = tuple(vox_idx)
+            cos_theta = np.abs(np.dot(fixel_dirs[vox_idx], direction))
+            for i, metric in enumerate(metrics):
+                if (cos_theta > min_cos_theta).any():
+                    sum_maps[i][vox_idx] += \
+                        metric[vox_idx][np.argmax(cos_theta)]
+                weight_map[vox_idx] += 1
+    return sum_maps, weight_map
+
+
+def main():
+    parser = _build_arg_parser()
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    sft = _generate_sft(args.nb_streamlines, args.max_length, args.dimension,
+                        rng)
+    print('Tractogram: {} streamlines, {} points.'
+          .format(len(sft), len(sft.streamlines._data)))
+
+    shape = (args.dimension,) * 3
+    mrds_pdds = rng.normal(0, 1, shape + (9,))
+    mrds_metrics = [rng.random(shape + (3,)) for _ in range(2)]
+    bingham_coeffs = rng.normal(0, 1, shape + (5, 9))
+    bingham_metric = rng.random(shape + (5,))
+
+    timer = time.perf_counter()
+    mrds_sums, mrds_weights = mrds_metric_sums_along_streamlines(
+        sft, mrds_pdds, mrds_metrics, args.max_theta, False)
+    print('mrds_metric_sums_along_streamlines: {:.2f} s'
+          .format(time.perf_counter() - timer))
+
+    timer = time.perf_counter()
+    bingham_sum, bingham_weights = bingham_metric_sum_along_streamlines(
+        sft, bingham_coeffs, bingham_metric, args.max_theta, False)
+    print('bingham_metric_sum_along_streamlines: {:.2f} s'
+          .format(time.perf_counter() - timer))
+
+    if args.reference:
+        timer = time.perf_counter()
+        ref_sums, ref_weights = _reference_sums(sft, mrds_pdds.reshape(
+            shape + (3, 3)), mrds_metrics, args.max_theta)
+        print('Per-segment reference (MRDS): {:.2f} s'
+              .format(time.perf_counter() - timer))
+        np.testing.assert_allclose(mrds_sums, ref_sums, atol=1e-8)
+        np.testing.assert_allclose(mrds_weights, ref_weights)
+
+        peak_dirs = bingham_to_peak_direction(bingham_coeffs.copy())
+        timer = time.perf_counter()
+        ref_sums, ref_weights = _reference_sums(
+            sft, peak_dirs, [bingham_metric], args.max_theta)
+        print('Per-segment reference (Bingham): {:.2f} s'
+              .format(time.perf_counter() - timer))
+        np.testing.assert_allclose(bingham_sum, ref_sums[0], atol=1e-8)
+        np.testing.assert_allclose(bingham_weights, ref_weights)
+        print('Same maps as the reference.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Times the multiple-shell electrostatic energy and its gradient, as called by
+SLSQP at each iteration of scilpy.gradients.gen_gradient_sampling, for an
+increasing number of points (split evenly over the shells):
+    - all pairs at once;
+    - by blocks of --block_size points (bounded memory).
+
+With --reference, also times a per-point implementation (loop over the
+b-vectors, as these functions used to do) and verifies that all give the
+same energy and gradient.
+
+With --generate, also times the whole generation of a sampling for each
+number of points (slow for many points: SLSQP itself grows as O(n^3)).
+
+Example:
+    python benchmarks/bench_gradient_sampling_energy.py \\
+        --nb_points 100 500 1000 2000 --reference
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from scilpy.gradients.gen_gradient_sampling import (
+    _compute_weights, _get_shell_indices, _grad_multiple_shell_energy,
+    _multiple_shell_energy, generate_gradient_sampling)
+
+
+def _build_arg_parser():
+    p = argparse.ArgumentParser(description=__doc__,
+                                formatter_class=argparse.RawTextHelpFormatter)
+    p.add_argument('--nb_points', type=int, nargs='+',
+                   default=[100, 300, 1000, 3000],
+                   help='Total numbers of points to time. [%(default)s]')
+    p.add_argument('--nb_shells', type=int, default=3,
+                   help='Number of shells. [%(default)s]')
+    p.add_argument('--block_size', type=int, default=256,
+                   help='Number of points per block. [%(default)s]')
+    p.add_argument('--nb_repetitions', type=int, default=5,
+                   help='Number of calls timed for each method. '
+                        '[%(default)s]')
+    p.add_argument('--reference', action='store_true',
+                   help='Also time and compare to a per-point '
+                        'implementation.')
+    p.add_argument('--generate', action='store_true',
+                   help='Also time generate_gradient_sampling.')
+    p.add_argument('--seed', type=int, default=1234,
+                   help='Random number generator seed. [%(default)s]')
+    return p
+
+
+def _reference_energy_and_grad(bvecs, weight_matrix, alpha=1.0):
+    """ Per-point implementation: one row of pairs at a time. """
+    epsilon = 1e-9
+    nb_bvecs = bvecs.shape[0] // 3
+    bvecs = bvecs.reshape((nb_bvecs, 3))
+    energy = 0.0
+    grad = np.zeros((nb_bvecs, 3))
+    for i in range(nb_bvecs):
+        indices = np.arange(nb_bvecs) > i
+        diffs = ((bvecs[indices] - bvecs[i]) ** 2).sum(1) ** alpha
+        sums = ((bvecs[indices] + bvecs[i]) ** 2).sum(1) ** alpha
+        energy += (weight_matrix[i, indices] *
+                   (1.0 / (diffs + epsilon) + 1.0 / (sums + epsilon))).sum()
+
+        indices = np.arange(nb_bvecs) != i
+        diffs = ((bvecs[indices] - bvecs[i]) ** 2).sum(1) ** (alpha + 1)
+        sums = ((bvecs[indices] + bvecs[i]) ** 2).sum(1) ** (alpha + 1)
+        grad[i] += (- 2 * alpha * weight_matrix[i, indices] *
+                    (bvecs[i] - bvecs[indices]).T / diffs).sum(1)
+        grad[i] += (- 2 * alpha * weight_matrix[i, indices] *
+                    (bvecs[i] + bvecs[indices]).T / sums).sum(1)
+    return energy, grad.ravel()
+
+
+def _time(function, nb_repetitions):
+    timer = time.perf_counter()
+    for _ in range(nb_repetitions):
+        result = function()
+    return (time.perf_counter() - timer) / nb_repetitions, result
+
+
+def main():
+    parser = _build_arg_parser()
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    print('{:>8} {:>14} {:>14} {:>14}'.format(
+        'points', 'all pairs (s)', 'blocked (s)', 'per-point (s)'))
+    for nb_points in args.nb_points:
+        nb_points_per_shell = np.diff(np.linspace(
+            0, nb_points, args.nb_shells + 1).astype(int)).tolist()
+        shell_groups = tuple([i] for i in range(args.nb_shells))
+        shell_groups += (list(range(args.nb_shells)),)
+        weights = _compute_weights(args.nb_shells, nb_points_per_shell,
+                                   shell_groups, [1.0] * len(shell_groups))
+        bvecs = rng.normal(0, 1, (nb_points, 3))
+        bvecs = (bvecs / np.linalg.norm(bvecs, axis=1, keepdims=True)).ravel()
+
+        def _energy_and_grad(block_size):
+            energy_args = (bvecs, args.nb_shells, nb_points_per_shell,
+                           weights, block_size)
+            return (_multiple_shell_energy(*energy_args),
+                    _grad_multiple_shell_energy(*energy_args))
+
+        full_time, (energy, grad) = _time(
+            lambda: _energy_and_grad(None), args.nb_repetitions)
+        blocked_time, (blocked_energy, blocked_grad) = _time(
+            lambda: _energy_and_grad(args.block_size), args.nb_repetitions)
+        np.testing.assert_allclose(blocked_energy, energy, rtol=1e-10)
+        np.testing.assert_allclose(blocked_grad, grad, rtol=1e-10)
+
+        reference_time = ''
+        if args.reference:
+            shell_idx = _get_shell_indices(nb_points_per_shell)
+            weight_matrix = weights[np.ix_(shell_idx, shell_idx)]
+            reference_time, (ref_energy, ref_grad) = _time(
+                lambda: _reference_energy_and_grad(bvecs, weight_matrix), 1)
+            np.testing.assert_allclose(energy, ref_energy, rtol=1e-10)
+            np.testing.assert_allclose(grad, ref_grad, rtol=1e-8)
+            reference_time = '{:.4f}'.format(reference_time)
+
+        print('{:>8} {:>14.4f} {:>14.4f} {:>14}'.format(
+            nb_points, full_time, blocked_time, reference_time))
+
+        if args.generate:
+            generation_time, _ = _time(
+                lambda: generate_gradient_sampling(nb_points_per_shell, 0),
+                1)
+            print('{:>8} generate_gradient_sampling: {:.2f} s'.format(
+                '', generation_time))
+
+
+if __name__ == '__main__':
+    main()
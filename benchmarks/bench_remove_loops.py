@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Times the winding angles used to remove loops on a large synthetic
+tractogram (random walks):
+    - scilpy.tractograms.streamline_operations.compute_winding_angles
+      (vectorized on the concatenated points);
+    - the previous implementation: Dipy's winding called on each streamline
+      in a pool of --processes processes.
+
+Also verifies that both keep the same streamlines with remove_loops.
+
+Example:
+    python benchmarks/bench_remove_loops.py --nb_streamlines 1000000 \\
+        --processes 8
+"""
+
+import argparse
+from multiprocessing import Pool
+import time
+
+from dipy.tracking.metrics import winding
+from nibabel.streamlines import ArraySequence
+import numpy as np
+
+from scilpy.tractograms.streamline_operations import compute_winding_angles
+
+
+def _build_arg_parser():
+    p = argparse.ArgumentParser(description=__doc__,
+                                formatter_class=argparse.RawTextHelpFormatter)
+    p.add_argument('--nb_streamlines', type=int, default=200000,
+                   help='Number of streamlines. [%(default)s]')
+    p.add_argument('--max_length', type=int, default=100,
+                   help='Maximal number of points per streamline. '
+                        '[%(default)s]')
+    p.add_argument('--max_angle', type=float, default=360,
+                   help='Maximal winding angle of remove_loops. '
+                        '[%(default)s]')
+    p.add_argument('--processes', type=int, default=1,
+                   help='Number of processes of the previous '
+                        'implementation. [%(default)s]')
+    p.add_argument('--seed', type=int, default=1234,
+                   help='Random number generator seed. [%(default)s]')
+    return p
+
+
+def main():
+    parser = _build_arg_parser()
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    lengths = rng.integers(2, args.max_length + 1, args.nb_streamlines)
+    points = np.cumsum(rng.normal(0, 1, (np.sum(lengths), 3)), axis=0)
+    streamlines = ArraySequence(np.split(points.astype(np.float32),
+                                         np.cumsum(lengths)[:-1]))
+    print('Tractogram: {} streamlines, {} points.'
+          .format(len(streamlines), len(streamlines._data)))
+
+    timer = time.perf_counter()
+    windings = compute_winding_angles(streamlines)
+    duration_new = time.perf_counter() - timer
+    print('compute_winding_angles: {:.2f} s'.format(duration_new))
+
+    timer = time.perf_counter()
+    pool = Pool(args.processes)
+    old_windings = np.array(pool.map(winding, streamlines))
+    pool.close()
+    duration_old = time.perf_counter() - timer
+    print('Dipy winding in a pool of {} processes: {:.2f} s ({:.1f}x slower)'
+          .format(args.processes, duration_old, duration_old / duration_new))
+
+    # Dipy computes in float32 for float32 streamlines, hence small
+    # differences of the angles.
+    nb_different = np.count_nonzero((windings < args.max_angle) !=
+                                    (old_windings < args.max_angle))
+    print('Maximal difference of winding angles: {:.2e} degrees. '
+          'Streamlines kept differently: {}'
+          .format(np.nanmax(np.abs(windings - old_windings)), nb_different))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Compares two ways of resampling a large synthetic tractogram to a fixed step
+size:
+    - scilpy.tractograms.streamline_operations.resample_streamlines_step_size
+      (batched, interpolates the data_per_point);
+    - the previous implementation: Dipy's set_number_of_points called on each
+      streamline (data_per_point are lost).
+
+Also reports the maximal distance between the points of both methods.
+
+Example:
+    python benchmarks/bench_resample_streamlines_step_size.py \\
+        --nb_streamlines 1000000
+"""
+
+import argparse
+import logging
+import time
+
+from dipy.io.stateful_tractogram import Origin, Space, StatefulTractogram
+from dipy.tracking.streamlinespeed import length, set_number_of_points
+import numpy as np
+
+from scilpy.tractograms.streamline_operations import \
+    resample_streamlines_step_size
+
+
+def _build_arg_parser():
+    p = argparse.ArgumentParser(description=__doc__,
+                                formatter_class=argparse.RawTextHelpFormatter)
+    p.add_argument('--nb_streamlines', type=int, default=1000000,
+                   help='Number of streamlines. [%(default)s]')
+    p.add_argument('--max_length', type=int, default=100,
+                   help='Maximal number of points per streamline. '
+                        '[%(default)s]')
+    p.add_argument('--step_size', type=float, default=0.5,
+                   help='Step size of the resampling, in mm. [%(default)s]')
+    p.add_argument('--seed', type=int, default=1234,
+                   help='Random number generator seed. [%(default)s]')
+    return p
+
+
+def _generate_sft(nb_streamlines, max_length, rng):
+    lengths = rng.integers(2, max_length + 1, nb_streamlines)
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    points = np.cumsum(rng.normal(0, 1, (np.sum(lengths), 3)), axis=0)
+    points += 50 - np.repeat(points[offsets], lengths, axis=0)
+    streamlines = np.split(points.astype(np.float32), offsets[1:])
+    fa = np.split(rng.random((len(points), 1)).astype(np.float32),
+                  offsets[1:])
+
+    return StatefulTractogram(
+        streamlines, (np.eye(4), np.array([100, 100, 100]), np.ones(3),
+                      'RAS'),
+        Space.RASMM, origin=Origin.TRACKVIS, data_per_point={'fa': fa})
+
+
+def main():
+    parser = _build_arg_parser()
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+    rng = np.random.default_rng(args.seed)
+
+    sft = _generate_sft(args.nb_streamlines, args.max_length, rng)
+    print('Tractogram: {} streamlines, {} points.'
+          .format(len(sft), len(sft.streamlines._data)))
+
+    timer = time.perf_counter()
+    new_sft = resample_streamlines_step_size(sft, args.step_size)
+    duration_new = time.perf_counter() - timer
+    print('resample_streamlines_step_size: {:.2f} s. {} points, '
+          'data_per_point kept: {}'
+          .format(duration_new, len(new_sft.streamlines._data),
+                  list(new_sft.data_per_point.keys())))
+
+    timer = time.perf_counter()
+    nb_points = np.ceil(length(sft.streamlines) / args.step_size).astype(int)
+    nb_points[nb_points < 2] = 2
+    streamlines = [set_number_of_points(s, n) for s, n in
+                   zip(sft.streamlines, nb_points)]
+    old_sft = StatefulTractogram.from_sft(streamlines, sft)
+    duration_old = time.perf_counter() - timer
+    print('Per-streamline set_number_of_points: {:.2f} s ({:.1f}x slower)'
+          .format(duration_old, duration_old / duration_new))
+
+    distance = np.max(np.linalg.norm(
+        new_sft.streamlines._data - old_sft.streamlines._data, axis=1))
+    print('Maximal distance between points of both methods: {:.2e} mm'
+          .format(distance))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Records the startup time of every scil_*.py script, using
+python -X importtime <script> --help, and saves it as a json file:
+    {script_name: {"wall_time": s, "import_time": s, "slowest": [...]}}
+
+Given a previously saved json (--baseline), reports the scripts whose startup
+got slower by more than --tolerance. Scripts above --budget seconds are also
+reported. Returns a non-zero exit code if any script is reported.
+
+Example:
+    python benchmarks/bench_script_import_time.py import_times.json
+    (...change some code...)
+    python benchmarks/bench_script_import_time.py new.json \\
+        --baseline import_times.json
+"""
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           '..', 'scripts')
+
+
+def _build_arg_parser():
+    p = argparse.ArgumentParser(description=__doc__,
+                                formatter_class=argparse.RawTextHelpFormatter)
+    p.add_argument('out_json',
+                   help='Output json file with the startup time per script.')
+    p.add_argument('--scripts', nargs='+',
+                   help='Scripts to benchmark. Default: all scil_*.py.')
+    p.add_argument('--baseline',
+                   help='Previous output of this benchmark, to compare with.')
+    p.add_argument('--tolerance', type=float, default=0.2,
+                   help='Allowed relative increase of import time compared '
+                        'to the baseline. [%(default)s]')
+    p.add_argument('--budget', type=float,
+                   help='Maximal import time (s) allowed for a script.')
+    p.add_argument('--nb_repeats', type=int, default=3,
+                   help='Number of runs per script. The fastest is kept. '
+                        '[%(default)s]')
+    p.add_argument('--nbr_processes', type=int, default=1,
+                   help='Number of scripts measured in parallel. Use 1 for '
+                        'stable measures. [%(default)s]')
+    p.add_argument('--nb_slowest', type=int, default=5,
+                   help='Number of slowest top-level imports saved per '
+                        'script. [%(default)s]')
+    return p
+
+
+def parse_importtime(stderr):
+    """
+    Parses the output of python -X importtime.
+
+    Returns
+    -------
+    total: float
+        Sum of the cumulative import times of top-level imports, in seconds.
+    top_level: list of (str, float)
+        Top-level imports and their cumulative time, slowest first.
+    """
+    top_level = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented by two spaces per level.
+        if not name.startswith('  '):
+            top_level.append((name.strip(), int(cumulative) / 1e6))
+    top_level.sort(key=lambda x: x[1], reverse=True)
+    return sum(t for _, t in top_level), top_level
+
+
+def measure_script(script, nb_repeats=3, nb_slowest=5):
+    best = None
+    for _ in range(nb_repeats):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, '-X', 'importtime', script,
+                               '--help'], capture_output=True, text=True)
+        wall_time = time.perf_counter() - start
+        import_time, top_level = parse_importtime(proc.stderr)
+        if best is None or import_time < best['import_time']:
+            best = {'wall_time': wall_time,
+                    'import_time': import_time,
+                    'returncode': proc.returncode,
+                    'slowest': top_level[:nb_slowest]}
+    return os.path.basename(script), best
+
+
+def _measure_script_wrapper(args):
+    return measure_script(*args)
+
+
+def main():
+    parser = _build_arg_parser()
+    args = parser.parse_args()
+
+    scripts = args.scripts or sorted(
+        glob.glob(os.path.join(SCRIPTS_DIR, 'scil_*.py')))
+    jobs = [(s, args.nb_repeats, args.nb_slowest) for s in scripts]
+    if args.nbr_processes > 1:
+        with multiprocessing.Pool(args.nbr_processes) as pool:
+            results = dict(pool.map(_measure_script_wrapper, jobs))
+    else:
+        results = dict(map(_measure_script_wrapper, jobs))
+
+    with open(args.out_json, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+
+    nb_reported = 0
+    for name, res in sorted(results.items(),
+                            key=lambda x: x[1]['import_time'], reverse=True):
+        msg = '{}: {:.3f}s'.format(name, res['import_time'])
+        if res['returncode'] != 0:
+            msg += ' (--help failed)'
+        reported = res['returncode'] != 0
+        if args.budget is not None and res['import_time'] > args.budget:
+            msg += ' (over budget)'
+            reported = True
+        if name in baseline:
+            old = baseline[name]['import_time']
+            msg += ' (baseline: {:.3f}s)'.format(old)
+            if res['import_time'] > old * (1 + args.tolerance):
+                msg += ' REGRESSION'
+                reported = True
+        if reported:
+            msg += ' Slowest imports: {}'.format(
+                ', '.join('{} {:.3f}s'.format(n, t)
+                          for n, t in res['slowest']))
+            nb_reported += 1
+        print(msg)
+
+    sys.exit(1 if nb_reported else 0)
+
+
+if __name__ == "__main__":
+    main()
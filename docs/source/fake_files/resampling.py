@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+
+
+def resample_arc_length():
+    pass
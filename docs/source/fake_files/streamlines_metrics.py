@@ -3,3 +3,7 @@
 
 def compute_tract_counts_map():
     pass
+
+
+def compute_tract_counts_map_per_bundle():
+    pass
@@ -9,6 +9,7 @@ from dipy.tracking.streamlinespeed import length
 from dipy.tracking.vox2track import _streamlines_in_mask
 import h5py
 import nibabel as nib
+from nibabel.streamlines import ArraySequence
 import numpy as np
 from scipy.ndimage import map_coordinates
 
@@ -16,7 +17,8 @@ from scilpy.image.labels import get_data_as_labels
 from scilpy.io.hdf5 import reconstruct_streamlines_from_hdf5
 from scilpy.tractanalysis.reproducibility_measures import \
     compute_bundle_adjacency_voxel
-from scilpy.tractanalysis.streamlines_metrics import compute_tract_counts_map
+from scilpy.tractanalysis.streamlines_metrics import \
+    compute_tract_counts_map, compute_tract_counts_map_per_bundle
 from scilpy.tractograms.streamline_operations import \
     resample_streamlines_num_points
 from scilpy.utils.metrics_tools import compute_lesion_stats
@@ -130,6 +132,46 @@ def load_node_nifti(directory, in_label, out_label, ref_img):
     return None
 
 
+def compute_density_maps_from_hdf5(hdf5_filename, keys, dimensions,
+                                   num_threads=1):
+    """
+    Computes the density maps of many connections in a single pass over their
+    streamlines (see compute_tract_counts_map_per_bundle).
+
+    Parameters
+    ----------
+    hdf5_filename: str
+        Name of the hdf5 file containing the precomputed connections (bundles)
+    keys: list[str]
+        Names of the connections, ex: '{in_label}_{out_label}'.
+    dimensions: tuple
+        The dimensions of the volume.
+    num_threads: int
+        Number of threads, each processing whole connections.
+
+    Returns
+    -------
+    density_maps: scipy.sparse.csr_matrix
+        Matrix of shape (len(keys), prod(dimensions)). Row i is the flattened
+        density map of connection keys[i]. Rows of connections that are not
+        in the hdf5 are empty.
+    """
+    all_streamlines = ArraySequence()
+    bundle_ids = []
+    with h5py.File(hdf5_filename, 'r') as hdf5_file:
+        for i, key in enumerate(keys):
+            if key in hdf5_file:
+                streamlines = reconstruct_streamlines_from_hdf5(
+                    hdf5_file[key])
+                all_streamlines.extend(streamlines)
+                bundle_ids.append(np.full(len(streamlines), i))
+
+    bundle_ids = np.concatenate(bundle_ids) if bundle_ids else []
+    return compute_tract_counts_map_per_bundle(
+        all_streamlines, dimensions, bundle_ids, nb_bundles=len(keys),
+        num_threads=num_threads)
+
+
 def multi_proc_compute_connectivity_matrices_from_hdf5(args):
     (hdf5_filename, labels_img, comb,
      compute_volume, compute_streamline_count, compute_length,
@@ -147,7 +189,7 @@ def compute_connectivity_matrices_from_hdf5(
         compute_volume=True, compute_streamline_count=True,
         compute_length=True, similarity_directory=None, metrics_data=None,
         metrics_names=None, lesion_data=None, include_dps=False,
-        weighted=False, min_lesion_vol=0):
+        weighted=False, min_lesion_vol=0, density=None):
     """
     Parameters
     ----------
@@ -191,6 +233,10 @@ def compute_connectivity_matrices_from_hdf5(
         If true, weight the results with the density map.
     min_lesion_vol: float
         Minimum lesion volume for a lesion to be considered.
+    density: np.ndarray
+        Density map of the connection, if already computed (ex, with
+        compute_density_maps_from_hdf5). If None, it is computed here when
+        required.
 
     Returns
     -------
@@ -234,8 +280,9 @@ def compute_connectivity_matrices_from_hdf5(
 
     # If density is not required, do not compute it
     # Only required for volume, similarity and any metrics
-    if (compute_volume or similarity_directory is not None or
-            len(metrics_data) > 0):
+    if density is None and (compute_volume or
+                            similarity_directory is not None or
+                            len(metrics_data) > 0 or lesion_data is not None):
         density = compute_tract_counts_map(streamlines, dimensions)
 
     if compute_length:
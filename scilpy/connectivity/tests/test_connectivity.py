@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+
+import h5py
+import nibabel as nib
+from nibabel.streamlines import ArraySequence
+import numpy as np
+
+from scilpy.connectivity.connectivity import (
+    compute_connectivity_matrices_from_hdf5, compute_density_maps_from_hdf5)
+from scilpy.tractanalysis.streamlines_metrics import compute_tract_counts_map
+
+tmp_dir = tempfile.TemporaryDirectory()
+
+
+def _create_hdf5():
+    rng = np.random.default_rng(0)
+    connections = {}
+    for key, nb_streamlines in [('1_2', 5), ('1_3', 3)]:
+        streamlines = ArraySequence(
+            [np.cumsum(rng.uniform(0, 1, (10, 3)), axis=0).astype(np.float32)
+             for _ in range(nb_streamlines)])
+        connections[key] = streamlines
+
+    filename = os.path.join(tmp_dir.name, 'connections.h5')
+    with h5py.File(filename, 'w') as hdf5_file:
+        for key, streamlines in connections.items():
+            group = hdf5_file.create_group(key)
+            group.create_dataset('data', data=streamlines.get_data())
+            group.create_dataset('offsets', data=streamlines._offsets)
+            group.create_dataset('lengths', data=streamlines._lengths)
+    return filename, connections
+
+
+def test_compute_density_maps_from_hdf5():
+    filename, connections = _create_hdf5()
+    dimensions = (12, 12, 12)
+
+    # '2_3' is not in the hdf5: its map is empty.
+    density_maps = compute_density_maps_from_hdf5(
+        filename, ['1_3', '2_3', '1_2'], dimensions)
+
+    assert density_maps.shape == (3, np.prod(dimensions))
+    assert np.array_equal(density_maps[0].toarray().reshape(dimensions),
+                          compute_tract_counts_map(connections['1_3'],
+                                                   dimensions))
+    assert density_maps[1].nnz == 0
+    assert np.array_equal(density_maps[2].toarray().reshape(dimensions),
+                          compute_tract_counts_map(connections['1_2'],
+                                                   dimensions))
+
+
+def test_compute_connectivity_matrices_from_hdf5_density():
+    filename, _ = _create_hdf5()
+    dimensions = (12, 12, 12)
+    labels_img = nib.Nifti1Image(np.zeros(dimensions, dtype=np.int16),
+                                 np.eye(4))
+    metric = np.random.default_rng(1).uniform(0, 1, dimensions)
+
+    density_maps = compute_density_maps_from_hdf5(filename, ['1_2'],
+                                                  dimensions)
+    density = density_maps[0].toarray().reshape(dimensions)
+
+    # Using the precomputed density gives the same measures.
+    for weighted in [False, True]:
+        expected, _ = compute_connectivity_matrices_from_hdf5(
+            filename, labels_img, 1, 2, metrics_data=[metric],
+            metrics_names=['metric'], weighted=weighted)
+        result, _ = compute_connectivity_matrices_from_hdf5(
+            filename, labels_img, 1, 2, metrics_data=[metric],
+            metrics_names=['metric'], weighted=weighted, density=density)
+        assert result.keys() == expected.keys()
+        for name, value in expected[(1, 2)].items():
+            assert np.allclose(result[(1, 2)][name], value)
@@ -148,8 +148,74 @@ def compute_dwi_attenuation(dwi_weights: np.ndarray, b0: np.ndarray):
     return dwi_attenuation
 
 
+def _get_voxel_chunks(data, mask=None, chunk_size=100000):
+    """
+    Yields the voxels of a 4D volume (optionally, only those in the mask) as
+    2D arrays of shape (nb_voxels, N), by groups of whole slices (along the
+    first axis) of about chunk_size voxels.
+    """
+    nb_slices = max(1, chunk_size // int(np.prod(data.shape[1:3])))
+    for start in range(0, data.shape[0], nb_slices):
+        chunk = data[start:start + nb_slices]
+        if mask is not None:
+            yield chunk[mask[start:start + nb_slices] > 0]
+        else:
+            yield chunk.reshape((-1, data.shape[-1]))
+
+
+def compute_volume_correlations(data, volume_groups, mask=None,
+                                chunk_size=100000):
+    """
+    Computes the (Pearson) correlation between the 3D volumes of each group of
+    volumes, as np.corrcoef on the raveled volumes, without copying the
+    volumes: the data is read by chunks of voxels.
+
+    Parameters
+    ----------
+    data: np.ndarray
+        4D volume with shape (X, Y, Z, N).
+    volume_groups: list of np.ndarray
+        Indices (on the last axis) of the volumes of each group.
+    mask: np.ndarray, optional
+        3D mask. If set, only the voxels inside the mask are used.
+    chunk_size: int
+        Approximate number of voxels processed at once. Limits the memory
+        usage.
+
+    Returns
+    -------
+    correlations: list of np.ndarray
+        For each group, the correlation matrix of its volumes, of shape
+        (len(group), len(group)).
+    """
+    volume_groups = [np.asarray(group) for group in volume_groups]
+
+    # First pass: mean of each volume.
+    nb_voxels = 0
+    sums = [np.zeros(len(group)) for group in volume_groups]
+    for chunk in _get_voxel_chunks(data, mask, chunk_size):
+        nb_voxels += len(chunk)
+        for group, group_sum in zip(volume_groups, sums):
+            group_sum += np.sum(chunk[:, group], axis=0, dtype=np.float64)
+    means = [group_sum / nb_voxels for group_sum in sums]
+
+    # Second pass: Gram matrices of the centered volumes.
+    grams = [np.zeros((len(group), len(group))) for group in volume_groups]
+    for chunk in _get_voxel_chunks(data, mask, chunk_size):
+        for group, mean, gram in zip(volume_groups, means, grams):
+            centered = chunk[:, group] - mean
+            gram += centered.T @ centered
+
+    correlations = []
+    for gram in grams:
+        std = np.sqrt(np.diag(gram))
+        correlations.append(np.clip(gram / np.outer(std, std), -1, 1))
+    return correlations
+
+
 def detect_volume_outliers(data, bvals, bvecs, std_scale,
-                           b0_thr=DEFAULT_B0_THRESHOLD):
+                           b0_thr=DEFAULT_B0_THRESHOLD, mask=None,
+                           chunk_size=100000):
     """
     Detects outliers. Finds the 3 closest angular neighbors of each direction
     (per shell) and computes the voxel-wise correlation.
@@ -169,6 +235,11 @@ def detect_volume_outliers(data, bvals, bvecs, std_scale,
         outlier.
     b0_thr: float
         Value below which b-values are considered as b0.
+    mask: np.ndarray, optional
+        3D mask. If set, the correlations are computed only inside the mask.
+    chunk_size: int
+        Approximate number of voxels processed at once when computing the
+        correlations. Limits the memory usage.
 
     Returns
     -------
@@ -192,12 +263,11 @@ def detect_volume_outliers(data, bvals, bvecs, std_scale,
         logging.warning("Your b-vectors do not seem normalized... Normalizing")
         bvecs = normalize_bvecs(bvecs)
 
-    results_dict = {}
     shells_to_extract = identify_shells(bvals, b0_thr, sort=True)[0]
     bvals = round_bvals_to_shell(bvals, shells_to_extract)
-    for bval in shells_to_extract[shells_to_extract > b0_thr]:
-        shell_idx = np.where(bvals == bval)[0]
-
+    shells = shells_to_extract[shells_to_extract > b0_thr]
+    shells_idx = [np.where(bvals == bval)[0] for bval in shells]
+    for bval, shell_idx in zip(shells, shells_idx):
         # Requires at least 3 values per shell to find 3 closest values!
         # Requires at least 5 values to use argpartition, below.
         if len(shell_idx) < 5:
@@ -206,37 +276,39 @@ def detect_volume_outliers(data, bvals, bvecs, std_scale,
                 "least 5 points per shell. Got {} on shell {}."
                 .format(len(shell_idx), bval))
 
+    # Correlations between all volumes of each shell, computed once.
+    correlations = compute_volume_correlations(data, shells_idx, mask=mask,
+                                               chunk_size=chunk_size)
+
+    results_dict = {}
+    for bval, shell_idx, corr in zip(shells, shells_idx, correlations):
         shell = bvecs[shell_idx, :]  # All bvecs on that shell
-        results_dict[bval] = np.ones((len(shell), 3)) * -1
-        for i, vec in enumerate(shell):
-            # Supposing that vectors are normalized, cos(angle) = dot
-            dot_product = np.clip(np.tensordot(shell, vec, axes=1), -1, 1)
-            angles = np.rad2deg(np.arccos(dot_product))
-            angles[np.isnan(angles)] = 0
-
-            # Managing the symmetry between b-vectors:
-            # if angle is > 90, it becomes 180 - x
-            big_angles = angles > 90
-            angles[big_angles] = 180 - angles[big_angles]
-
-            # Using argpartition rather than sort; faster. With kth=4, the 4th
-            # element is correctly positioned, and smaller elements are
-            # placed before. Considering that we will then remove the b-vec
-            # itself (angle 0), we are left with the 3 closest angles in
-            # idx[0:3] (not necessarily sorted, but ok).
-            idx = np.argpartition(angles, 4).tolist()
-            idx.remove(i)
-
-            avg_angle = np.average(angles[idx[:3]])
-
-            corr = np.corrcoef([data[..., shell_idx[i]].ravel(),
-                                data[..., shell_idx[idx[0]]].ravel(),
-                                data[..., shell_idx[idx[1]]].ravel(),
-                                data[..., shell_idx[idx[2]]].ravel()])
-            # Corr is a triangular matrix. The interesting line is the first:
-            # current data vs the 3 others. First value is with itself = 1.
-            results_dict[bval][i] = [shell_idx[i], avg_angle,
-                                     np.average(corr[0, 1:])]
+        nb_vecs = len(shell)
+
+        # Supposing that vectors are normalized, cos(angle) = dot
+        dot_product = np.clip(shell @ shell.T, -1, 1)
+        angles = np.rad2deg(np.arccos(dot_product))
+        angles[np.isnan(angles)] = 0
+
+        # Managing the symmetry between b-vectors:
+        # if angle is > 90, it becomes 180 - x
+        big_angles = angles > 90
+        angles[big_angles] = 180 - angles[big_angles]
+
+        # Using argpartition rather than sort; faster. With kth=4, the 4th
+        # element is correctly positioned, and smaller elements are
+        # placed before. Removing the b-vec itself (angle 0) from the first 5
+        # elements, we are left with the 3 closest angles in the first 3
+        # remaining (not necessarily sorted, but ok).
+        idx = np.argpartition(angles, 4, axis=1)[:, :5]
+        not_itself = idx != np.arange(nb_vecs)[:, None]
+        first_3 = np.argsort(~not_itself, axis=1, kind='stable')[:, :3]
+        idx = np.take_along_axis(idx, first_3, axis=1)
+
+        rows = np.arange(nb_vecs)[:, None]
+        results_dict[bval] = np.column_stack(
+            (shell_idx, np.average(angles[rows, idx], axis=1),
+             np.average(corr[rows, idx], axis=1)))
 
     # Computation done. Now verifying if above scale.
     # Loop on shells:
@@ -2,7 +2,7 @@
 import numpy as np
 
 from scilpy.dwi.operations import compute_dwi_attenuation, \
-    detect_volume_outliers, apply_bias_field
+    compute_volume_correlations, detect_volume_outliers, apply_bias_field
 
 
 def test_apply_bias_field():
@@ -43,6 +43,24 @@ def test_compute_dwi_attenuation():
     assert np.array_equal(res, expected)
 
 
+def test_compute_volume_correlations():
+    data = np.random.rand(10, 10, 10, 6)
+    mask = np.zeros((10, 10, 10), dtype=bool)
+    mask[2:7, 3:8, :] = True
+
+    # Small chunks: a few slices at a time.
+    corr_1, corr_2 = compute_volume_correlations(data, [[0, 2, 4], [5, 1]],
+                                                 chunk_size=250)
+    assert np.allclose(corr_1, np.corrcoef(data[..., [0, 2, 4]].reshape(
+        (-1, 3)).T))
+    assert np.allclose(corr_2, np.corrcoef(data[..., [5, 1]].reshape(
+        (-1, 2)).T))
+
+    corr, = compute_volume_correlations(data, [[0, 2, 4]], mask=mask,
+                                        chunk_size=250)
+    assert np.allclose(corr, np.corrcoef(data[mask][:, [0, 2, 4]].T))
+
+
 def test_detect_volume_outliers():
     # For this test: all 90 or 180 degrees on one shell.
     bvals = 1000 * np.ones(5)
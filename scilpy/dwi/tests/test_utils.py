@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import nibabel as nib
 import numpy as np
+import pytest
 
 from scilpy.dwi.utils import extract_dwi_shell, extract_b0
 from scilpy.gradients.bvec_bval_tools import B0ExtractionStrategy
@@ -26,6 +27,72 @@ def test_extract_dwi_shell():
     assert np.array_equal(output_bvecs[:, 0], [0, 2, 4])
 
 
+def test_extract_dwi_shell_out_filename(tmp_path):
+    # Same as above, in int16, by blocks and written directly to a file.
+    dwi = np.ones((10, 10, 10, 5), dtype=np.int16)
+    bvecs = np.ones((5, 3))
+    for i in range(5):
+        dwi[..., i] = i
+        bvecs[i, :] = i
+    bvals = np.asarray([0, 1010, 12, 990, 2000])
+
+    dwi_img = nib.Nifti1Image(dwi, affine=np.eye(4))
+    out_filename = str(tmp_path / 'shell.nii.gz')
+    for block_size in [1, 2, None]:
+        indices, shell_data, _, _ = extract_dwi_shell(
+            dwi_img, bvals, bvecs, bvals_to_extract=[0, 2000], tol=15,
+            block_size=block_size, out_filename=out_filename)
+        assert np.array_equal(indices, [0, 2, 4])
+        assert shell_data is None
+
+        shell_img = nib.load(out_filename)
+        assert shell_img.get_data_dtype() == np.int16
+        assert shell_img.shape == (10, 10, 10, 3)
+        assert np.array_equal(shell_img.dataobj[0, 0, 0, :], [0, 2, 4])
+
+
+def test_extract_dwi_shell_out_filename_scaled(tmp_path):
+    # int16 with a scaling (as often written by scanners), for which 0
+    # can't be represented.
+    rng = np.random.default_rng(0)
+    dwi = rng.integers(-2000, 4000, (4, 4, 3, 5)).astype(np.int16)
+    bvecs = np.ones((5, 3))
+    bvals = np.asarray([0, 1010, 12, 990, 2000])
+
+    dwi_img = nib.Nifti1Image(dwi, affine=np.eye(4))
+    dwi_img.header.set_slope_inter(0.0152, 500)
+    dwi_filename = str(tmp_path / 'dwi.nii')
+    nib.save(dwi_img, dwi_filename)
+    dwi_img = nib.load(dwi_filename)
+
+    out_filename = str(tmp_path / 'shell.nii')
+    extract_dwi_shell(dwi_img, bvals, bvecs, bvals_to_extract=[0, 2000],
+                      tol=15, block_size=2, out_filename=out_filename)
+    shell_img = nib.load(out_filename)
+    assert shell_img.get_data_dtype() == np.int16
+    assert np.array_equal(np.asanyarray(shell_img.dataobj.get_unscaled()),
+                          dwi[..., [0, 2, 4]])
+    assert np.allclose(shell_img.get_fdata(),
+                       dwi_img.get_fdata()[..., [0, 2, 4]])
+
+
+def test_extract_dwi_shell_out_filename_same_as_input(tmp_path):
+    dwi = np.arange(4 * 4 * 3 * 5, dtype=np.int16).reshape((4, 4, 3, 5))
+    bvecs = np.ones((5, 3))
+    bvals = np.asarray([0, 1010, 12, 990, 2000])
+
+    dwi_filename = str(tmp_path / 'dwi.nii')
+    nib.save(nib.Nifti1Image(dwi, affine=np.eye(4)), dwi_filename)
+    dwi_img = nib.load(dwi_filename)
+
+    with pytest.raises(ValueError):
+        extract_dwi_shell(dwi_img, bvals, bvecs, bvals_to_extract=[0, 2000],
+                          tol=15, block_size=2, out_filename=dwi_filename)
+
+    # The input is untouched.
+    assert np.array_equal(nib.load(dwi_filename).get_fdata(), dwi)
+
+
 def test_extract_b0():
     # DWI with 5 gradients. Values for gradient #i are all i.
     dwi = np.ones((10, 10, 10, 5))
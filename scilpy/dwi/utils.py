@@ -1,15 +1,79 @@
 # -*- coding: utf-8 -*-
 import logging
+import os
 
 from dipy.core.gradients import get_bval_indices
+from nibabel.openers import ImageOpener
+from nibabel.volumeutils import array_to_file
 import numpy as np
 
 from scilpy.gradients.bvec_bval_tools import B0ExtractionStrategy
 from scilpy.image.utils import volume_iterator
 
 
+def _iter_volume_blocks(dwi, indices, block_size):
+    """
+    Reads the volumes of dwi listed in indices (sorted), by blocks of at most
+    block_size consecutive volumes. Blocks containing none of the indices are
+    not read. The data is returned as stored (no conversion to float unless
+    the image has a scaling).
+
+    Yields
+    ------
+    out_indices : ndarray
+        Positions, in indices, of the volumes of this block.
+    data : ndarray
+        The selected volumes of this block, as a 4D array.
+    """
+    for start in range(indices[0], indices[-1] + 1, block_size):
+        stop = start + block_size
+        out_indices = np.arange(np.searchsorted(indices, start),
+                                np.searchsorted(indices, stop))
+        if len(out_indices) == 0:
+            continue
+
+        # Only reading up to the last selected volume of the block.
+        stop = indices[out_indices[-1]] + 1
+        logging.info("Loading volumes {} to {}.".format(start, stop - 1))
+        data = np.asanyarray(dwi.dataobj[..., start:stop])
+        yield out_indices, data[..., indices[out_indices] - start]
+
+
+def _save_volume_blocks(dwi, indices, block_size, out_filename):
+    """
+    Writes the volumes of dwi listed in indices to a new NIfTI file, block by
+    block, in the data type (and scaling) of dwi. The volumes are contiguous
+    in a NIfTI file, so each block is appended after the previous one.
+    """
+    in_filename = dwi.get_filename()
+    if in_filename is not None and os.path.exists(out_filename) and \
+            os.path.samefile(in_filename, out_filename):
+        raise ValueError("Cannot write the volumes to the file they are read "
+                         "from: {}".format(out_filename))
+
+    header = dwi.header.copy()
+    header.set_data_shape(dwi.shape[:-1] + (len(indices),))
+    header['magic'] = header.single_magic
+    header['vox_offset'] = 0
+    # Nibabel keeps the scaling of loaded images in their proxy.
+    slope = getattr(dwi.dataobj, 'slope', 1.0)
+    inter = getattr(dwi.dataobj, 'inter', 0.0)
+    header.set_slope_inter(slope, inter)
+
+    with ImageOpener(out_filename, 'wb') as f:
+        header.write_to(f)
+        f.write(b'\x00' * (header.get_data_offset() - f.tell()))
+        for _, data in _iter_volume_blocks(dwi, indices, block_size):
+            # Values were read from the same data type and scaling: there is
+            # no NaN to replace (and the value of 0 may not be representable
+            # with the scaling).
+            array_to_file(data, f, header.get_data_dtype(), offset=None,
+                          intercept=inter, divslope=slope, order='F',
+                          nan2zero=False)
+
+
 def extract_dwi_shell(dwi, bvals, bvecs, bvals_to_extract, tol=20,
-                      block_size=None):
+                      block_size=None, out_filename=None):
     """Extracts the DWI volumes that are on specific b-value shells. Many
     shells can be extracted at once by specifying multiple b-values. The
     extracted volumes are in the same order as in the original file.
@@ -21,7 +85,9 @@ def extract_dwi_shell(dwi, bvals, bvecs, bvals_to_extract, tol=20,
 
     Files that are too large to be loaded in memory can still be processed by
     setting the --block-size argument. A block size of X means that X DWI
-    volumes are loaded at a time for processing.
+    volumes are loaded at a time for processing. To also avoid keeping the
+    extracted volumes in memory, give an out_filename: the volumes are then
+    written directly to this file, in the data type of the original file.
 
     Parameters
     ----------
@@ -39,13 +105,18 @@ def extract_dwi_shell(dwi, bvals, bvecs, bvals_to_extract, tol=20,
     block_size : int, optional
         Load the data using this block size. Useful when the data is too
         large to be loaded in memory.
+    out_filename : str, optional
+        If given, the extracted volumes are saved to this NIfTI file (with
+        the header of dwi) instead of being returned. At most block_size
+        volumes are then in memory at once. Must not be the file of dwi.
 
     Returns
     -------
     indices : ndarray
         Indices of the volumes corresponding to the provided b-values.
-    shell_data : ndarray
-        Volumes corresponding to the provided b-values.
+    shell_data : ndarray or None
+        Volumes corresponding to the provided b-values. None if out_filename
+        is given.
     output_bvals : ndarray
         Selected b-values (raw values, not rounded values, even when tol is
         given).
@@ -55,7 +126,7 @@ def extract_dwi_shell(dwi, bvals, bvecs, bvals_to_extract, tol=20,
     """
     indices = [get_bval_indices(bvals, shell, tol=tol)
                for shell in bvals_to_extract]
-    indices = np.unique(np.sort(np.hstack(indices)))
+    indices = np.unique(np.sort(np.hstack(indices))).astype(int)
 
     if len(indices) == 0:
         raise ValueError("There are no volumes that have the supplied b-values"
@@ -75,11 +146,14 @@ def extract_dwi_shell(dwi, bvals, bvecs, bvals_to_extract, tol=20,
     # Load the shells by iterating through blocks of volumes. This approach
     # is slower for small files, but allows very big files to be split
     # with less memory usage.
-    shell_data = np.zeros((dwi.shape[:-1] + (len(indices),)))
-    for vi, data in volume_iterator(dwi, block_size):
-        in_volume = np.array([i in vi for i in indices])
-        in_data = np.array([i in indices for i in vi])
-        shell_data[..., in_volume] = data[..., in_data]
+    if out_filename is not None:
+        _save_volume_blocks(dwi, indices, block_size, out_filename)
+        shell_data = None
+    else:
+        shell_data = np.zeros((dwi.shape[:-1] + (len(indices),)))
+        for out_indices, data in _iter_volume_blocks(dwi, indices,
+                                                     block_size):
+            shell_data[..., out_indices] = data
 
     output_bvals = bvals[indices].astype(int)
     output_bvecs = bvecs[indices, :]
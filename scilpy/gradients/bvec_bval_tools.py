@@ -3,9 +3,12 @@
 import logging
 from enum import Enum
 
-from dipy.core.gradients import get_bval_indices
 import numpy as np
 
+from scilpy.utils.lazy_import import lazy_import
+
+dipy_gradients = lazy_import('dipy.core.gradients')
+
 DEFAULT_B0_THRESHOLD = 20
 
 
@@ -311,7 +314,7 @@ def round_bvals_to_shell(bvals, shells_to_extract, tol=20):
     modified = np.ones((bvals.shape))
 
     for shell in shells_to_extract:
-        shell_idx = get_bval_indices(bvals, shell, tol=tol)
+        shell_idx = dipy_gradients.get_bval_indices(bvals, shell, tol=tol)
         new_bvals[shell_idx] = shell
         modified[shell_idx] = 0
         if shell_idx.size == 0:
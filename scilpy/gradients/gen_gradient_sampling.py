@@ -16,7 +16,8 @@ from scipy import optimize
 from scilpy.gradients.utils import random_uniform_on_sphere
 
 
-def generate_gradient_sampling(nb_samples_per_shell, verbose=1):
+def generate_gradient_sampling(nb_samples_per_shell, verbose=1,
+                               block_size=None):
     """
     Wrapper code to generate gradient sampling from Caruyer's
     multiple_shell_energy.py
@@ -35,6 +36,11 @@ def generate_gradient_sampling(nb_samples_per_shell, verbose=1):
     verbose: int
         0 = silent, 1 = summary upon completion, 2 = print iterations
         (To be sent to scipy).
+    block_size: int or None
+        If set, the energy and its gradient are computed for blocks of
+        block_size points at once, which limits the memory usage to
+        O(block_size * n) instead of O(n^2). Useful for very large numbers
+        of points.
 
     Return
     ------
@@ -60,7 +66,7 @@ def generate_gradient_sampling(nb_samples_per_shell, verbose=1):
     # max_iter hardcoded to fit default Caruyer's value
     bvecs = _generate_gradient_sampling_with_weights(
         nb_shells, nb_samples_per_shell, weights, max_iter=100,
-        verbose=verbose)
+        verbose=verbose, block_size=block_size)
 
     shell_idx = np.repeat(range(nb_shells), nb_samples_per_shell)
 
@@ -100,7 +106,8 @@ def _compute_weights(nb_shells, nb_points_per_shell, shell_groups, alphas):
 
 
 def _generate_gradient_sampling_with_weights(
-        nb_shells, nb_points_per_shell, weights, max_iter=100, verbose=2):
+        nb_shells, nb_points_per_shell, weights, max_iter=100, verbose=2,
+        block_size=None):
     """
     Creates a set of sampling directions on the desired number of shells.
 
@@ -115,6 +122,9 @@ def _generate_gradient_sampling_with_weights(
         balances.
     max_iter: int
         Maximum number of interations
+    block_size: int or None
+        Number of points processed at once in the energy and its gradient.
+        If None, all points are processed at once.
 
     Returns
     -------
@@ -133,19 +143,58 @@ def _generate_gradient_sampling_with_weights(
                                 fprime=_grad_multiple_shell_energy,
                                 iter=max_iter,
                                 acc=1.0e-9,
-                                args=(nb_shells, nb_points_per_shell, weights),
+                                args=(nb_shells, nb_points_per_shell, weights,
+                                      block_size),
                                 iprint=verbose)
     bvecs = bvecs.reshape((nb_point_total, 3))
     bvecs = (bvecs.T / np.sqrt((bvecs ** 2).sum(1))).T
     return bvecs
 
 
-def _multiple_shell_energy(bvecs, nb_shells, nb_points_per_shell, weights):
+def _get_shell_indices(nb_points_per_shell):
+    """
+    Index of the shell of each point.
+
+    Parameters
+    ----------
+    nb_points_per_shell: list of ints
+        Number of points per shell.
+
+    Returns
+    -------
+    shell_idx: np.ndarray, shape (N,)
+        The shell of each point. The weight of the pair of points (i, j) is
+        weights[shell_idx[i], shell_idx[j]].
+    """
+    return np.repeat(np.arange(len(nb_points_per_shell)),
+                     nb_points_per_shell)
+
+
+def _get_blocks(nb_bvecs, block_size):
+    """ Ranges of rows (points) processed at once. """
+    block_size = nb_bvecs if block_size is None else max(int(block_size), 1)
+    for start in range(0, nb_bvecs, block_size):
+        yield start, min(start + block_size, nb_bvecs)
+
+
+def _squared_distances(rows, cols):
+    """
+    Squared distances |r - c|^2 and |r + c|^2 between all rows and columns
+    vectors, from their dot products.
+    """
+    dots = 2 * rows @ cols.T
+    norms = (rows ** 2).sum(1)[:, None] + (cols ** 2).sum(1)[None]
+    return np.maximum(norms - dots, 0), np.maximum(norms + dots, 0)
+
+
+def _multiple_shell_energy(bvecs, nb_shells, nb_points_per_shell, weights,
+                           block_size=None):
     """
     Objective function (cost function) for multiple-shell energy.
 
     This is the main function called during optimization, used as
-    func(x, *args) with args = (nb_shells, nb_points_per_shell, weights)
+    func(x, *args) with args = (nb_shells, nb_points_per_shell, weights,
+    block_size)
 
     Parameters
     ----------
@@ -158,24 +207,21 @@ def _multiple_shell_energy(bvecs, nb_shells, nb_points_per_shell, weights):
     weights : array-like, shape (S, S)
         Weighting parameter, control coupling between shells and how this
         balances.
+    block_size: int or None
+        Number of points processed at once. If None, all points.
 
     Returns
     -------
     electrostatic_repulsion: float
         Sum of all interactions between any two vectors.
     """
-    nb_points_total = np.sum(nb_points_per_shell)
-    indices = np.cumsum(nb_points_per_shell).tolist()
-    indices.insert(0, 0)
-    weight_matrix = np.zeros((nb_points_total, nb_points_total))
-    for s1 in range(nb_shells):
-        for s2 in range(nb_shells):
-            weight_matrix[indices[s1]:indices[s1 + 1],
-                          indices[s2]:indices[s2 + 1]] = weights[s1, s2]
-    return _electrostatic_repulsion_energy(bvecs, weight_matrix)
-
-
-def _electrostatic_repulsion_energy(bvecs, weight_matrix, alpha=1.0):
+    shell_idx = _get_shell_indices(nb_points_per_shell)
+    return _electrostatic_repulsion_energy(bvecs, weights, shell_idx,
+                                           block_size=block_size)
+
+
+def _electrostatic_repulsion_energy(bvecs, weights, shell_idx, alpha=1.0,
+                                    block_size=None):
     """
     Electrostatic-repulsion objective function. The alpha parameter controls
     the power repulsion (energy varies as $1 / ralpha$).
@@ -184,10 +230,15 @@ def _electrostatic_repulsion_energy(bvecs, weight_matrix, alpha=1.0):
     ---------
     bvecs : array-like shape (N * 3,)
         Vectors, flattened.
-    weight_matrix: array-like, shape (N, N)
-        The contribution weight of each pair of points.
+    weights : array-like, shape (S, S)
+        The contribution weight of each pair of shells.
+    shell_idx : array-like, shape (N,)
+        The shell of each point.
     alpha : float
         Controls the power of the repulsion. Default is 1.0
+    block_size: int or None
+        Number of points processed at once (limits the memory usage to
+        block_size x N pairs). If None, all pairs are computed at once.
 
     Returns
     -------
@@ -197,13 +248,19 @@ def _electrostatic_repulsion_energy(bvecs, weight_matrix, alpha=1.0):
     epsilon = 1e-9
     nb_bvecs = bvecs.shape[0] // 3
     bvecs = bvecs.reshape((nb_bvecs, 3))
+    weights = np.asarray(weights)
     energy = 0.0
-    for i in range(nb_bvecs):
-        indices = (np.arange(nb_bvecs) > i)
-        diffs = ((bvecs[indices] - bvecs[i]) ** 2).sum(1) ** alpha
-        sums = ((bvecs[indices] + bvecs[i]) ** 2).sum(1) ** alpha
-        energy += (weight_matrix[i, indices] *
-                   (1.0 / (diffs + epsilon) + 1.0 / (sums + epsilon))).sum()
+    for start, end in _get_blocks(nb_bvecs, block_size):
+        # Pairs (i, j) with j > i: columns from start onward.
+        diffs, sums = _squared_distances(bvecs[start:end], bvecs[start:])
+        if alpha != 1:
+            diffs **= alpha
+            sums **= alpha
+        block_weights = weights[np.ix_(shell_idx[start:end],
+                                       shell_idx[start:])]
+        pair_energy = block_weights * (
+            1.0 / (diffs + epsilon) + 1.0 / (sums + epsilon))
+        energy += np.triu(pair_energy, k=1).sum()
     return energy
 
 
@@ -231,12 +288,12 @@ def _constraint_is_bvec_on_sphere(bvecs, *args):
 
 
 def _grad_multiple_shell_energy(bvecs, nb_shells, nb_points_per_shell,
-                                weights):
+                                weights, block_size=None):
     """
     Gradient of the objective function for multiple shells sampling.
 
     This is called as fprime(x, *args) during optimization, with
-    args = (nb_shells, nb_points_per_shell, weights)
+    args = (nb_shells, nb_points_per_shell, weights, block_size)
 
     Parameters
     ----------
@@ -249,25 +306,21 @@ def _grad_multiple_shell_energy(bvecs, nb_shells, nb_points_per_shell,
     weights : array-like, shape (S, S)
         Weighting parameter, control coupling between shells and how this
         balances.
+    block_size: int or None
+        Number of points processed at once. If None, all points.
 
     Returns
     -------
     grad_electrostatic_repulsion: float
         Gradient of the objective function.
     """
-    nb_bvecs = int(bvecs.shape[0] / 3)
-    indices = np.cumsum(nb_points_per_shell).tolist()
-    indices.insert(0, 0)
-    weight_matrix = np.zeros((nb_bvecs, nb_bvecs))
-    for s1 in range(nb_shells):
-        for s2 in range(nb_shells):
-            weight_matrix[indices[s1]:indices[s1 + 1],
-                          indices[s2]:indices[s2 + 1]] = weights[s1, s2]
+    shell_idx = _get_shell_indices(nb_points_per_shell)
+    return _grad_electrostatic_repulsion_energy(bvecs, weights, shell_idx,
+                                                block_size=block_size)
 
-    return _grad_electrostatic_repulsion_energy(bvecs, weight_matrix)
 
-
-def _grad_electrostatic_repulsion_energy(bvecs, weight_matrix, alpha=1.0):
+def _grad_electrostatic_repulsion_energy(bvecs, weights, shell_idx,
+                                         alpha=1.0, block_size=None):
     """
     1st-order derivative of electrostatic-like repulsion energy.
 
@@ -275,10 +328,15 @@ def _grad_electrostatic_repulsion_energy(bvecs, weight_matrix, alpha=1.0):
     ----------
     bvecs : array-like shape (N * 3,)
         Vectors.
-    weight_matrix: array-like, shape (N, N)
-        The contribution weight of each pair of bvec.
+    weights : array-like, shape (S, S)
+        The contribution weight of each pair of shells.
+    shell_idx : array-like, shape (N,)
+        The shell of each bvec.
     alpha : float
         Controls the power of the repulsion. Default is 1.0
+    block_size: int or None
+        Number of points processed at once (limits the memory usage to
+        block_size x N pairs). If None, all pairs are computed at once.
 
     Returns
     -------
@@ -287,15 +345,27 @@ def _grad_electrostatic_repulsion_energy(bvecs, weight_matrix, alpha=1.0):
     """
     nb_bvecs = bvecs.shape[0] // 3
     bvecs = bvecs.reshape((nb_bvecs, 3))
+    weights = np.asarray(weights)
     grad = np.zeros((nb_bvecs, 3))
-    for i in range(nb_bvecs):
-        indices = (np.arange(nb_bvecs) != i)
-        diffs = ((bvecs[indices] - bvecs[i]) ** 2).sum(1) ** (alpha + 1)
-        sums = ((bvecs[indices] + bvecs[i]) ** 2).sum(1) ** (alpha + 1)
-        grad[i] += (- 2 * alpha * weight_matrix[i, indices] *
-                    (bvecs[i] - bvecs[indices]).T / diffs).sum(1)
-        grad[i] += (- 2 * alpha * weight_matrix[i, indices] *
-                    (bvecs[i] + bvecs[indices]).T / sums).sum(1)
+    for start, end in _get_blocks(nb_bvecs, block_size):
+        block = np.arange(end - start)
+        diffs, sums = _squared_distances(bvecs[start:end], bvecs)
+        diffs **= alpha + 1
+        sums **= alpha + 1
+
+        # No interaction of a point with itself.
+        diffs[block, start + block] = np.inf
+        sums[block, start + block] = np.inf
+
+        # sum_j c_ij (x_i - x_j) + s_ij (x_i + x_j)
+        weight = -2 * alpha * weights[np.ix_(shell_idx[start:end],
+                                             shell_idx)]
+        coeffs_diffs = weight / diffs
+        coeffs_sums = weight / sums
+        grad[start:end] = (
+            bvecs[start:end] * (coeffs_diffs.sum(1) +
+                                coeffs_sums.sum(1))[:, None] -
+            coeffs_diffs @ bvecs + coeffs_sums @ bvecs)
     grad = grad.reshape(nb_bvecs * 3)
     return grad
 
@@ -326,7 +396,6 @@ def energy_comparison(bvecs1, bvecs2, nb_shells, nb_points_per_shell,
     energy2 : float
         Electrostatic-repulsion energy of set bvecs2.
     """
-    nb_dir = bvecs1.shape[0]
     shell_groups = ()
     for i in range(nb_shells):
         shell_groups += ([i],)
@@ -335,27 +404,10 @@ def energy_comparison(bvecs1, bvecs2, nb_shells, nb_points_per_shell,
     alphas = list(len(shell_groups) * (1.0,))
     weights = _compute_weights(nb_shells, nb_points_per_shell,
                                shell_groups, alphas)
-    nb_points_total = np.sum(nb_points_per_shell)
-    indices = np.cumsum(nb_points_per_shell).tolist()
-    indices.insert(0, 0)
-    weight_matrix = np.zeros((nb_points_total, nb_points_total))
-    for s1 in range(nb_shells):
-        for s2 in range(nb_shells):
-            weight_matrix[indices[s1]:indices[s1 + 1],
-                          indices[s2]:indices[s2 + 1]] = weights[s1, s2]
+    shell_idx = _get_shell_indices(nb_points_per_shell)
 
-    epsilon = 1e-9
-    energy1 = 0.0
-    energy2 = 0.0
-    for i in range(nb_dir):
-        indices = (np.arange(nb_dir) > i)
-        diffs = ((bvecs1[indices] - bvecs1[i]) ** 2).sum(1) ** alpha
-        sums = ((bvecs1[indices] + bvecs1[i]) ** 2).sum(1) ** alpha
-        energy1 += (weight_matrix[i, indices] *
-                    (1.0 / (diffs + epsilon) + 1.0 / (sums + epsilon))).sum()
-        diffs = ((bvecs2[indices] - bvecs2[i]) ** 2).sum(1) ** alpha
-        sums = ((bvecs2[indices] + bvecs2[i]) ** 2).sum(1) ** alpha
-        energy2 += (weight_matrix[i, indices] *
-                    (1.0 / (diffs + epsilon) + 1.0 /
-                        (sums + epsilon))).sum()
+    energy1 = _electrostatic_repulsion_energy(np.ravel(bvecs1), weights,
+                                              shell_idx, alpha)
+    energy2 = _electrostatic_repulsion_energy(np.ravel(bvecs2), weights,
+                                              shell_idx, alpha)
     return energy1, energy2
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
+from itertools import repeat
 import logging
+import multiprocessing
 
 import numpy as np
 from scipy.spatial.distance import cdist, pdist, squareform
@@ -223,8 +225,64 @@ def correct_b0s_philips(bvecs, shell_idx):
     return new_bvecs, shell_idx
 
 
+def _generate_orderings(nb_dir, nb_iter, batch_size, rand_seed):
+    """
+    Yields the random permutations of the bruteforce search, by batches of
+    at most batch_size. The permutations are drawn one after the other from
+    the legacy generator seeded with rand_seed, so they do not depend on the
+    batch size nor on the number of processes.
+    """
+    rng = np.random.RandomState(rand_seed)
+    for start in range(0, nb_iter, batch_size):
+        nb_orderings = min(batch_size, nb_iter - start)
+        yield np.array([rng.permutation(nb_dir)
+                        for _ in range(nb_orderings)], dtype=np.intp)
+
+
+def _compute_peak_powers_parallel(args):
+    (q_scheme, non_b0s_mask, ker_size, orderings) = args
+
+    return compute_peak_powers(q_scheme, non_b0s_mask, orderings,
+                               ker_size=ker_size)
+
+
+def compute_peak_powers(q_scheme, non_b0s_mask, orderings, ker_size=10):
+    """
+    Computes the peak power (see compute_peak_power) of many orderings of the
+    non-b0 samples at once.
+
+    Parameters
+    ----------
+    q_scheme: nd.array
+        Scheme of acquisition, of shape (N, 3).
+    non_b0s_mask: nd.array
+        Mask of the samples that are permuted.
+    orderings: nd.array
+        Permutations of the non-b0 samples, of shape (nb_orderings,
+        nb_non_b0s).
+    ker_size: int
+        Kernel size (default=10).
+
+    Return
+    ------
+    powers: nd.array
+        Max peak power of each ordering.
+    """
+    q_schemes = np.repeat(q_scheme[None], len(orderings), axis=0)
+    q_schemes[:, non_b0s_mask] = q_scheme[non_b0s_mask][orderings]
+
+    # Sum over the window ending at each sample (the window is truncated at
+    # the start of the scheme), as the 'full' convolution with ones.
+    windowed_sums = q_schemes.copy()
+    for shift in range(1, min(ker_size, q_scheme.shape[0])):
+        windowed_sums[:, shift:] += q_schemes[:, :-shift]
+
+    return np.max(windowed_sums, axis=(1, 2))
+
+
 def compute_min_duty_cycle_bruteforce(bvecs, shell_idx, bvals, ker_size=10,
-                                      nb_iter=100000, rand_seed=0):
+                                      nb_iter=100000, rand_seed=0,
+                                      batch_size=1000, nbr_processes=1):
     """
     Optimize the ordering of non-b0 samples to optimize gradient duty-cycle.
 
@@ -237,6 +295,11 @@ def compute_min_duty_cycle_bruteforce(bvecs, shell_idx, bvals, ker_size=10,
     3) Computing the peak power needed as max(peak_x, peak_y, peak_z)
     4) Keeping the permutation yielding the lowest peak power
 
+    The permutations are scored by batches (see compute_peak_powers), which
+    can be distributed over many processes. The best ordering is the same as
+    when scoring the permutations one by one, whatever the batch size or the
+    number of processes.
+
     Parameters
     ----------
     bvecs: numpy.array
@@ -251,6 +314,10 @@ def compute_min_duty_cycle_bruteforce(bvecs, shell_idx, bvals, ker_size=10,
         number of bruteforce iterations.
     rand_seed: int
         seed for the random permutations.
+    batch_size: int
+        Number of permutations scored at once.
+    nbr_processes: int
+        Number of sub-processes scoring the batches.
 
     Return
     ------
@@ -269,27 +336,52 @@ def compute_min_duty_cycle_bruteforce(bvecs, shell_idx, bvals, ker_size=10,
     sqrt_val = np.sqrt(np.array([bvals[idx] for idx in shell_idx]))
     q_scheme = np.abs(bvecs * sqrt_val[:, None])
 
-    q_scheme_current = q_scheme.copy()
-
     ordering_best = np.arange(N_dir)
-    power_best = compute_peak_power(q_scheme_current, ker_size=ker_size)
+    power_best = compute_peak_power(q_scheme, ker_size=ker_size)
     logging.info("Duty cycle: initial peak power = {}".format(power_best))
 
-    np.random.seed(rand_seed)
-
-    for it in range(nb_iter):
-        if not it % np.ceil(nb_iter / 10.):
-            logging.debug('Iter {} / {}  : {}'.format(it, nb_iter, power_best))
+    orderings_batches = _generate_orderings(N_dir, nb_iter, batch_size,
+                                            rand_seed)
+    if nbr_processes == 1:
+        scored_batches = ((orderings,
+                           compute_peak_powers(q_scheme, non_b0s_mask,
+                                               orderings, ker_size=ker_size))
+                          for orderings in orderings_batches)
+    else:
+        # Permutations are drawn here (in order) and only scored by the
+        # sub-processes, so the search is the same as the sequential one.
+        orderings_batches = list(orderings_batches)
+        pool = multiprocessing.Pool(nbr_processes)
+        scored_batches = zip(orderings_batches,
+                             pool.imap(_compute_peak_powers_parallel,
+                                       zip(repeat(q_scheme),
+                                           repeat(non_b0s_mask),
+                                           repeat(ker_size),
+                                           orderings_batches)))
 
-        ordering_current = np.random.permutation(N_dir)
-        q_scheme_current[non_b0s_mask] \
-            = q_scheme[non_b0s_mask][ordering_current]
-
-        power_current = compute_peak_power(q_scheme_current, ker_size=ker_size)
-
-        if power_current < power_best:
-            ordering_best = ordering_current.copy()
-            power_best = power_current
+    q_scheme_current = q_scheme.copy()
+    nb_done = 0
+    for orderings, powers in scored_batches:
+        logging.debug('Iter {} / {}  : {}'.format(nb_done, nb_iter,
+                                                  power_best))
+        nb_done += len(orderings)
+
+        # The batched sums may differ from compute_peak_power in the last
+        # bits. Candidates are verified with compute_peak_power, in order, as
+        # in the sequential search.
+        candidates = np.flatnonzero(powers <= power_best * (1 + 1e-9))
+        for i in candidates:
+            q_scheme_current[non_b0s_mask] = \
+                q_scheme[non_b0s_mask][orderings[i]]
+            power_current = compute_peak_power(q_scheme_current,
+                                               ker_size=ker_size)
+            if power_current < power_best:
+                ordering_best = orderings[i].copy()
+                power_best = power_current
+
+    if nbr_processes != 1:
+        pool.close()
+        pool.join()
 
     logging.info('Duty cycle optimization finished ({} iterations). '
                  'Final peak power: {}'.format(nb_iter, power_best))
@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 import numpy as np
 
-from scilpy.gradients.gen_gradient_sampling import generate_gradient_sampling
+from scilpy.gradients.gen_gradient_sampling import (
+    _grad_multiple_shell_energy, _multiple_shell_energy,
+    generate_gradient_sampling)
 
 
 def test_generate_gradient_sampling():
@@ -20,3 +22,41 @@ def test_generate_gradient_sampling():
     # Normalized vectors?
     norm = np.sqrt(np.sum(bvecs**2, axis=1))
     assert np.allclose(norm, 1)
+
+
+def test_multiple_shell_energy_and_gradient():
+    nb_points_per_shell = [4, 6]
+    weights = np.array([[2., 1.], [1., 3.]])
+    bvecs = np.random.RandomState(0).normal(0, 1, 30)
+    args = (2, nb_points_per_shell, weights)
+
+    energy = _multiple_shell_energy(bvecs, *args)
+    grad = _grad_multiple_shell_energy(bvecs, *args)
+
+    # Explicit sum over all pairs of points.
+    points = bvecs.reshape((-1, 3))
+    shells = np.repeat([0, 1], nb_points_per_shell)
+    expected = 0
+    for i in range(len(points)):
+        for j in range(i + 1, len(points)):
+            expected += weights[shells[i], shells[j]] * (
+                1 / (np.sum((points[i] - points[j]) ** 2) + 1e-9) +
+                1 / (np.sum((points[i] + points[j]) ** 2) + 1e-9))
+    assert np.isclose(energy, expected)
+
+    # Same result by blocks.
+    assert np.isclose(_multiple_shell_energy(bvecs, *args, block_size=3),
+                      energy)
+    assert np.allclose(_grad_multiple_shell_energy(bvecs, *args,
+                                                   block_size=3), grad)
+
+    # Gradient vs finite differences.
+    step = 1e-6
+    numerical_grad = np.zeros(len(bvecs))
+    for i in range(len(bvecs)):
+        shift = np.zeros(len(bvecs))
+        shift[i] = step
+        numerical_grad[i] = (_multiple_shell_energy(bvecs + shift, *args) -
+                             _multiple_shell_energy(bvecs - shift, *args))
+    numerical_grad /= 2 * step
+    assert np.allclose(grad, numerical_grad, rtol=1e-4, atol=1e-6)
@@ -5,7 +5,7 @@ from scilpy.gradients.gen_gradient_sampling import generate_gradient_sampling
 from scilpy.gradients.optimize_gradient_sampling import (
     add_b0s_to_bvecs, correct_b0s_philips, compute_bvalue_lin_b,
     compute_bvalue_lin_q, compute_min_duty_cycle_bruteforce,
-    compute_peak_power)
+    compute_peak_power, compute_peak_powers)
 
 
 def test_swap_sampling_eddy():
@@ -56,6 +56,14 @@ def test_compute_min_duty_cycle_bruteforce():
     for i in range(16):
         assert bvecs[i] in new_bvecs
 
+    # Same search whatever the batches and the number of processes.
+    bvecs = np.asarray(bvecs)
+    new_bvecs, _ = compute_min_duty_cycle_bruteforce(bvecs, idx, bvals,
+                                                     nb_iter=1000)
+    new_bvecs_2, _ = compute_min_duty_cycle_bruteforce(
+        bvecs, idx, bvals, nb_iter=1000, batch_size=7, nbr_processes=2)
+    assert np.array_equal(new_bvecs, new_bvecs_2)
+
 
 def test_compute_peak_power():
     nb_samples_per_shell = [6]
@@ -76,6 +84,23 @@ def test_compute_peak_power():
     assert max_total == power_best
 
 
+def test_compute_peak_powers():
+    rng = np.random.RandomState(0)
+    q_scheme = np.abs(rng.normal(0, 1, (12, 3)))
+    non_b0s_mask = np.ones(12, dtype=bool)
+    non_b0s_mask[[0, 5]] = False
+    orderings = np.array([rng.permutation(10) for _ in range(5)])
+
+    powers = compute_peak_powers(q_scheme, non_b0s_mask, orderings,
+                                 ker_size=4)
+
+    for ordering, power in zip(orderings, powers):
+        q_scheme_ordered = q_scheme.copy()
+        q_scheme_ordered[non_b0s_mask] = q_scheme[non_b0s_mask][ordering]
+        assert np.isclose(power, compute_peak_power(q_scheme_ordered,
+                                                    ker_size=4))
+
+
 def test_compute_bvalue_lin_q():
     # Linear distribution between 0 and 100000 with one in the middle
     # **after sqrt.
@@ -1,18 +1,275 @@
 # -*- coding: utf-8 -*-
 # THIS FILE IS TEMPORARY. THIS FILE WILL BE DELETED AFTER THE PR IN DIPY
 
-from multiprocessing import Pool, cpu_count
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+from multiprocessing import cpu_count
 import warnings
 
 import numpy as np
 from scipy.ndimage import affine_transform
+import scipy.sparse
 
 
-def _affine_transform(kwargs):
-    with warnings.catch_warnings():
-        warnings.filterwarnings("ignore", message=".*scipy.*18.*",
-                                category=UserWarning)
-        return affine_transform(**kwargs)
+def _axis_taps(coords, length, order, mode):
+    """
+    Computes, along one axis, the input indices and weights needed to
+    interpolate at the given coordinates, with the same conventions as
+    scipy.ndimage.
+
+    Parameters
+    ----------
+    coords : np.ndarray of float64, shape (P,)
+        Coordinates along the axis, in input voxel space.
+    length : int
+        Size of the input along the axis.
+    order : int, 0 or 1
+        Interpolation order.
+    mode : str, one of 'constant', 'nearest' or 'grid-constant'
+        See scipy.ndimage.affine_transform.
+
+    Returns
+    -------
+    taps : list of tuple (np.ndarray, np.ndarray, np.ndarray)
+        For each neighbor (1 if order 0, 2 if order 1): the (clipped)
+        indices, the weights and whether the neighbor is inside the input.
+    outside : np.ndarray of bool
+        Coordinates outside the input. With mode 'constant', their value is
+        cval.
+    """
+    outside = (coords < 0) | (coords > length - 1)
+    if order == 0:
+        neighbors = [(np.floor(coords + 0.5), np.ones(len(coords)))]
+    else:
+        lower = np.floor(coords)
+        frac = coords - lower
+        neighbors = [(lower, 1 - frac), (lower + 1, frac)]
+
+    # With mode 'nearest', neighbors outside the input are clipped to the
+    # border (as scipy does), the coordinates are not.
+    taps = []
+    for idx, weights in neighbors:
+        inside = (idx >= 0) & (idx <= length - 1)
+        taps.append((np.clip(idx, 0, length - 1).astype(np.intp), weights,
+                     inside))
+    return taps, outside
+
+
+def _interpolation_matrix(matrix, offset, input_shape, output_shape,
+                          order, mode, slices, input_order='F'):
+    """
+    Computes the sparse matrix interpolating a volume (flattened in Fortran
+    order) at the coordinates of some slices (along the last axis) of the
+    output grid.
+
+    Parameters
+    ----------
+    matrix, offset, output_shape, order, mode:
+        See affine_transform_4d.
+    input_shape : tuple, shape (3,)
+        Spatial shape of the input.
+    slices : range
+        Slices of the output grid, along its last axis.
+    input_order : str, 'F' or 'C'
+        Order in which the input volume is flattened.
+
+    Returns
+    -------
+    weights : scipy.sparse.csr_matrix, shape (nb_output_voxels,
+        nb_input_voxels)
+        Interpolation weights of the voxels of these slices (in Fortran
+        order).
+    outside : np.ndarray of bool, shape (nb_output_voxels,)
+        Voxels set to cval with mode 'constant'.
+    cval_weights : np.ndarray, shape (nb_output_voxels,)
+        Sum of the weights of neighbors outside the input, which take value
+        cval with mode 'grid-constant'.
+    """
+    chunk_shape = tuple(output_shape[:2]) + (len(slices),)
+    nb_voxels = int(np.prod(chunk_shape))
+    voxels = np.unravel_index(np.arange(nb_voxels), chunk_shape, order='F')
+    voxels = (voxels[0], voxels[1], voxels[2] + slices.start)
+    if matrix.ndim == 1:
+        # Same operations as scipy's zoom_shift, so that points on the
+        # border of the input are treated the same.
+        coords = [(voxels[i] + offset[i] / matrix[i]) * matrix[i]
+                  for i in range(3)]
+    else:
+        coords = [matrix[i, 0] * voxels[0] + matrix[i, 1] * voxels[1] +
+                  matrix[i, 2] * voxels[2] + offset[i] for i in range(3)]
+
+    taps = []
+    outside = np.zeros(nb_voxels, dtype=bool)
+    for axis in range(3):
+        axis_taps, axis_outside = _axis_taps(coords[axis], input_shape[axis],
+                                             order, mode)
+        taps.append(axis_taps)
+        outside |= axis_outside
+
+    # Each output voxel has the same number of neighbors (taps): the sparse
+    # matrix is filled directly in CSR format.
+    nb_taps = int(np.prod([len(axis_taps) for axis_taps in taps]))
+    nb_input_voxels = int(np.prod(input_shape))
+    index_dtype = np.int32 if nb_input_voxels < 2 ** 31 else np.int64
+    columns = np.empty((nb_voxels, nb_taps), dtype=index_dtype)
+    values = np.empty((nb_voxels, nb_taps))
+    cval_weights = np.zeros(nb_voxels)
+    for t, ((i, wi, in_i), (j, wj, in_j), (k, wk, in_k)) in \
+            enumerate(itertools.product(*taps)):
+        weights = wi * wj * wk
+        if mode == 'constant':
+            weights[outside] = 0
+        elif mode == 'grid-constant':
+            inside = in_i & in_j & in_k
+            cval_weights[~inside] += weights[~inside]
+            weights[~inside] = 0
+        values[:, t] = weights
+        columns[:, t] = np.ravel_multi_index((i, j, k), input_shape,
+                                             order=input_order)
+
+    indptr = np.arange(0, nb_taps * nb_voxels + 1, nb_taps,
+                       dtype=index_dtype)
+    weights = scipy.sparse.csr_matrix(
+        (values.ravel(), columns.ravel(), indptr),
+        shape=(nb_voxels, nb_input_voxels))
+    return weights, outside, cval_weights
+
+
+def affine_transform_4d(data, matrix, offset, output_shape, order=1,
+                        mode='constant', cval=0, output=None,
+                        round_integers=True, num_threads=1,
+                        chunk_size=2 ** 18):
+    """
+    Applies the same affine transformation to all volumes of a 4D image.
+
+    Equivalent to calling scipy.ndimage.affine_transform on each volume, but
+    for linear and nearest interpolation of many volumes, the interpolation
+    coordinates and weights are computed once, as a sparse matrix, and
+    applied to all volumes. The matrix is built by chunks of about
+    chunk_size output voxels (whole slices), to bound the memory, and chunks
+    are processed in parallel threads sharing the input and output arrays
+    (nothing is copied to workers). A single volume, or other interpolation
+    orders (splines), are interpolated with scipy (volumes in parallel
+    threads).
+
+    Parameters
+    ----------
+    data : np.ndarray, shape (I, J, K) or (I, J, K, N)
+        Input data.
+    matrix : np.ndarray, shape (3,) or (3, 3)
+        Maps output voxel coordinates to input voxel coordinates. If of shape
+        (3,), a diagonal matrix (scaling).
+    offset : np.ndarray, shape (3,)
+        Offset of the mapping, see scipy.ndimage.affine_transform.
+    output_shape : tuple, shape (3,)
+        Spatial shape of the output.
+    order : int, from 0 to 5
+        Order of interpolation. 0 = nearest, 1 = linear.
+    mode : str
+        Points outside the boundaries of the input are filled according to
+        the given mode. See scipy.ndimage.affine_transform. The shared
+        weights support 'constant', 'nearest' and 'grid-constant'.
+    cval : float
+        Value used for points outside the boundaries of the input if mode is
+        'constant' or 'grid-constant'.
+    output : np.ndarray, optional
+        Array in which to store the result, of shape output_shape (+ (N,)).
+        If None, an array of the same dtype as data is created.
+    round_integers : bool
+        If the output is of integer dtype, round values (half away from zero,
+        as scipy does). Else, values are truncated (as Dipy does).
+    num_threads : int
+        Number of threads. If 0, the number of cores available.
+    chunk_size : int
+        Approximate number of output voxels interpolated at once with the
+        shared weights.
+
+    Returns
+    -------
+    output : np.ndarray, shape output_shape or output_shape + (N,)
+        Resampled data.
+    """
+    output_shape = tuple(int(s) for s in output_shape)
+    if output is None:
+        output = np.zeros(output_shape + data.shape[3:], dtype=data.dtype,
+                          order='F')
+    num_threads = num_threads or cpu_count()
+    matrix = np.asarray(matrix, dtype=np.float64)
+    offset = np.asarray(offset, dtype=np.float64)
+    volumes = data if data.ndim == 4 else data[..., None]
+    outputs = output if output.ndim == 4 else output[..., None]
+    is_integer = np.issubdtype(output.dtype, np.integer)
+
+    if volumes.shape[-1] == 1 or order > 1 or \
+            mode not in ['constant', 'nearest', 'grid-constant']:
+        truncate = is_integer and not round_integers
+
+        def _transform_volume(i):
+            # scipy rounds values to integers: to truncate them instead,
+            # interpolate in float.
+            volume_output = np.zeros(output_shape) if truncate \
+                else outputs[..., i]
+            with warnings.catch_warnings():
+                warnings.filterwarnings("ignore", message=".*scipy.*18.*",
+                                        category=UserWarning)
+                affine_transform(input=volumes[..., i], matrix=matrix,
+                                 offset=offset, output_shape=output_shape,
+                                 output=volume_output, order=order,
+                                 mode=mode, cval=cval)
+            if truncate:
+                outputs[..., i] = volume_output
+
+        tasks = range(volumes.shape[-1])
+        _transform = _transform_volume
+    else:
+        round_values = round_integers and is_integer
+        slice_size = output_shape[0] * output_shape[1]
+        nb_slices = max(1, chunk_size // max(slice_size, 1))
+
+        # Volumes of images loaded with nibabel are contiguous in Fortran
+        # order: they are interpolated one at a time, with no copy. Else,
+        # all volumes are interpolated at once, from a (C-ordered) view of
+        # shape (nb_input_voxels, N).
+        input_order = 'F' if volumes.flags.f_contiguous else 'C'
+        if input_order == 'C':
+            flat_volumes = np.ascontiguousarray(volumes).reshape(
+                (-1, volumes.shape[-1]))
+
+        def _transform_chunk(slices):
+            weights, outside, cval_weights = _interpolation_matrix(
+                matrix, offset, volumes.shape[:3], output_shape, order, mode,
+                slices, input_order)
+            chunk_shape = output_shape[:2] + (len(slices),)
+
+            def _write_values(values, volume_indices):
+                if mode == 'grid-constant' and cval != 0:
+                    values += cval * cval_weights[:, None]
+                elif mode == 'constant':
+                    values[outside] = cval
+                if round_values:
+                    values = np.trunc(values + np.copysign(0.5, values))
+                outputs[:, :, slices.start:slices.stop, volume_indices] = \
+                    values.reshape(chunk_shape + (-1,), order='F')
+
+            if input_order == 'F':
+                for i in range(volumes.shape[-1]):
+                    values = weights @ volumes[..., i].ravel(order='F')
+                    _write_values(values[:, None], slice(i, i + 1))
+            else:
+                _write_values(weights @ flat_volumes, slice(None))
+
+        tasks = [range(k, min(k + nb_slices, output_shape[2]))
+                 for k in range(0, output_shape[2], nb_slices)]
+        _transform = _transform_chunk
+
+    if num_threads > 1 and len(tasks) > 1:
+        with ThreadPoolExecutor(num_threads) as executor:
+            list(executor.map(_transform, tasks))
+    else:
+        for task in tasks:
+            _transform(task)
+
+    return output
 
 
 def reslice(data, affine, zooms, new_zooms, order=1, mode='constant', cval=0,
@@ -40,10 +297,10 @@ def reslice(data, affine, zooms, new_zooms, order=1, mode='constant', cval=0,
         Value used for points outside the boundaries of the input if
         mode='constant'.
     num_processes : int
-        Split the calculation to a pool of children processes. This only
-        applies to 4D `data` arrays. If a positive integer then it defines
-        the size of the multiprocessing pool that will be used. If 0, then
-        the size of the pool will equal the number of cores available.
+        Number of threads used for the interpolation (see
+        affine_transform_4d). Volumes of 4D `data` arrays share the same
+        interpolation coordinates and weights. If 0, then the number of
+        cores available.
 
     Returns
     -------
@@ -103,27 +360,8 @@ def reslice(data, affine, zooms, new_zooms, order=1, mode='constant', cval=0,
 
         new_shape = zooms / new_zooms * np.array(data.shape[:3])
         new_shape = tuple(np.round(new_shape).astype('i8'))
-        kwargs = {'matrix': R, 'output_shape': new_shape, 'order': order,
-                  'mode': mode, 'cval': cval, 'offset': offset}
-        if data.ndim == 3:
-            data2 = affine_transform(input=data, **kwargs)
-        if data.ndim == 4:
-            data2 = np.zeros(new_shape+(data.shape[-1],), data.dtype)
-            if not num_processes:
-                num_processes = cpu_count()
-            if num_processes < 2:
-                for i in range(data.shape[-1]):
-                    affine_transform(input=data[..., i], output=data2[..., i],
-                                     **kwargs)
-            else:
-                params = []
-                for i in range(data.shape[-1]):
-                    _kwargs = {'input': data[..., i]}
-                    _kwargs.update(kwargs)
-                    params.append(_kwargs)
-                pool = Pool(num_processes)
-                for i, res in enumerate(pool.imap(_affine_transform, params)):
-                    data2[..., i] = res
-                pool.close()
+        data2 = affine_transform_4d(data, R, offset, new_shape, order=order,
+                                    mode=mode, cval=cval,
+                                    num_threads=num_processes)
 
     return data2, affine2
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import warnings
+
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+from scipy.ndimage import affine_transform
+
+from scilpy.image.reslice import affine_transform_4d, reslice
+
+
+def _scipy_affine_transform_4d(data, matrix, offset, output_shape, **kwargs):
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message=".*scipy.*18.*",
+                                category=UserWarning)
+        return np.stack([affine_transform(data[..., i], matrix,
+                                          offset=offset,
+                                          output_shape=output_shape,
+                                          **kwargs)
+                         for i in range(data.shape[-1])], axis=-1)
+
+
+def test_affine_transform_4d():
+    rng = np.random.default_rng(0)
+    data = rng.random((11, 13, 9, 4))
+    matrices = [(np.array([0.5, 0.75, 1.3]), np.array([0.25, -0.3, 0.1])),
+                (np.eye(3) + rng.random((3, 3)) * 0.2, rng.random(3) - 0.5)]
+
+    for matrix, offset in matrices:
+        for order in [0, 1, 3]:
+            for mode in ['constant', 'nearest', 'grid-constant', 'reflect']:
+                expected = _scipy_affine_transform_4d(
+                    data, matrix, offset, (12, 10, 8), order=order,
+                    mode=mode, cval=2)
+                for num_threads in [1, 2]:
+                    result = affine_transform_4d(
+                        data, matrix, offset, (12, 10, 8), order=order,
+                        mode=mode, cval=2, num_threads=num_threads)
+                    assert_allclose(result, expected, atol=1e-10)
+
+                # By chunks of slices, with volumes contiguous or not
+                for volumes in [data, np.asfortranarray(data)]:
+                    result = affine_transform_4d(
+                        volumes, matrix, offset, (12, 10, 8), order=order,
+                        mode=mode, cval=2, num_threads=2, chunk_size=250)
+                    assert_allclose(result, expected, atol=1e-10)
+
+
+def test_affine_transform_4d_3d_input():
+    rng = np.random.default_rng(0)
+    data = rng.random((11, 13, 9))
+    matrix = np.array([0.5, 0.75, 1.3])
+
+    result = affine_transform_4d(data, matrix, [0, 0, 0], (20, 15, 7))
+    expected = _scipy_affine_transform_4d(data[..., None], matrix, [0, 0, 0],
+                                          (20, 15, 7), order=1)
+    assert_allclose(result, expected[..., 0], atol=1e-10)
+
+
+def test_affine_transform_4d_integers():
+    data = np.array([0, 3, -3, -4], dtype=np.int16).reshape((1, 1, 4, 1))
+
+    # Rounded half away from zero, as scipy does.
+    result = affine_transform_4d(data, [1, 1, 1], [0, 0, 0.5], (1, 1, 4))
+    assert_array_equal(result.ravel(), [2, 0, -4, 0])
+
+    # Truncated, as Dipy does.
+    result = affine_transform_4d(data, [1, 1, 1], [0, 0, 0.5], (1, 1, 4),
+                                 round_integers=False)
+    assert_array_equal(result.ravel(), [1, 0, -3, 0])
+
+    # Same with the shared weights of many volumes
+    data = np.repeat(data, 2, axis=-1)
+    result = affine_transform_4d(data, [1, 1, 1], [0, 0, 0.5], (1, 1, 4))
+    assert_array_equal(result[..., 1].ravel(), [2, 0, -4, 0])
+    result = affine_transform_4d(data, [1, 1, 1], [0, 0, 0.5], (1, 1, 4),
+                                 round_integers=False)
+    assert_array_equal(result[..., 1].ravel(), [1, 0, -3, 0])
+
+
+def test_reslice_4d():
+    rng = np.random.default_rng(0)
+    data = rng.random((10, 10, 8, 3)).astype(np.float32)
+
+    data2, affine2 = reslice(data, np.eye(4), (2, 2, 2.5), (1.5, 1.5, 1.5))
+    assert data2.shape == (13, 13, 13, 3)
+    assert data2.dtype == np.float32
+    for i in range(3):
+        data3, affine3 = reslice(data[..., i], np.eye(4), (2, 2, 2.5),
+                                 (1.5, 1.5, 1.5))
+        assert_allclose(data2[..., i], data3)
+        assert_allclose(affine2, affine3)
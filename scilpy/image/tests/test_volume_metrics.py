@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from scilpy.image.volume_metrics import estimate_piesno_sigma
+
+
+def _get_noisy_data():
+    # Rician noise with a standard deviation increasing with the slices,
+    # around a block of signal.
+    rng = np.random.default_rng(1234)
+    shape = (40, 40, 6, 20)
+    noise_std = np.linspace(5, 10, shape[2])[:, None]
+    data = np.abs(rng.normal(0, 1, shape) * noise_std +
+                  1j * rng.normal(0, 1, shape) * noise_std)
+    data[10:30, 10:30] += 300
+    return data.astype(np.float32), noise_std.ravel()
+
+
+def test_estimate_piesno_sigma():
+    data, noise_std = _get_noisy_data()
+    sigma, mask_noise = estimate_piesno_sigma(data, number_coils=1)
+    assert np.allclose(sigma[0, 0], noise_std, rtol=0.1)
+    assert not mask_noise[10:30, 10:30].any()
+
+    # Same result in parallel.
+    sigma_parallel, mask_parallel = estimate_piesno_sigma(
+        data, number_coils=1, nbr_processes=2)
+    assert np.array_equal(sigma_parallel, sigma)
+    assert np.array_equal(mask_parallel, mask_noise)
+
+
+def test_estimate_piesno_sigma_slices():
+    data, _ = _get_noisy_data()
+    sigma, mask_noise = estimate_piesno_sigma(data, number_coils=1)
+
+    sigma_slices, mask_slices = estimate_piesno_sigma(
+        data, number_coils=1, slices=[1, 5], nbr_processes=2)
+    assert np.array_equal(sigma_slices[..., [1, 5]], sigma[..., [1, 5]])
+    assert np.array_equal(mask_slices[..., [1, 5]], mask_noise[..., [1, 5]])
+    assert not mask_slices[..., [0, 2, 3, 4]].any()
+
+    # Interpolated between slices 1 and 5, constant before slice 1.
+    assert np.allclose(sigma_slices[0, 0, :2], sigma[0, 0, 1])
+    assert np.allclose(sigma_slices[0, 0, 3],
+                       (sigma[0, 0, 1] + sigma[0, 0, 5]) / 2)
@@ -362,6 +362,22 @@ def test_compute_distance_map_overlap():
     assert np.all(distance == 0)
 
 
+def test_compute_distance_map_voxel_size():
+    mask_1 = np.ones((3, 3, 3))
+    mask_2 = np.zeros((3, 3, 3))
+    mask_2[0, 0, 0] = 1
+
+    distance = compute_distance_map(mask_1, mask_2, voxel_size=(1, 2, 3),
+                                    max_distance=3)
+    assert distance[0, 0, 0] == 0
+    assert distance[1, 0, 0] == 1
+    assert distance[0, 1, 0] == 2
+    assert np.isclose(distance[1, 1, 0], np.sqrt(5))
+    # At the maximal distance or further
+    assert np.isinf(distance[0, 0, 1])
+    assert np.isinf(distance[2, 2, 2])
+
+
 def test_compute_distance_map_wrong_shape():
     mask_1 = np.zeros((3, 3, 3))
     mask_2 = np.zeros((3, 3, 4))
@@ -401,3 +417,15 @@ def test_compute_nawm_4D():
     val, count = np.unique(nawm[..., 0], return_counts=True)
     assert np.array_equal(val, [0, 1, 2, 3])
     assert np.array_equal(count, [967, 1, 6, 26])
+
+
+def test_compute_nawm_voxel_size():
+    lesion_img = np.zeros((7, 7, 7))
+    lesion_img[3, 3, 3] = 1
+
+    # Rings of 1 voxel in x, half a voxel in y, 2 voxels in z.
+    nawm = compute_nawm(lesion_img, nb_ring=2, ring_thickness=1,
+                        voxel_size=(1, 2, 0.5))
+    assert np.array_equal(nawm[:, 3, 3], [0, 3, 2, 1, 2, 3, 0])
+    assert np.array_equal(nawm[3, :, 3], [0, 0, 3, 1, 3, 0, 0])
+    assert np.array_equal(nawm[3, 3, :], [3, 2, 2, 1, 2, 2, 3])
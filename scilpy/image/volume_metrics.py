@@ -1,11 +1,30 @@
 # -*- coding: utf-8 -*-
 import logging
+import multiprocessing
+import os
+import tempfile
 
 from dipy.denoise.noise_estimate import piesno
 import numpy as np
 
 
-def estimate_piesno_sigma(data, number_coils=0):
+def _piesno_slice_init(slices_file_name, number_coils):
+    """
+    Loads the slices in each subprocess of the pool, as a read-only memmap
+    shared by all subprocesses.
+    """
+    global multiprocess_slices, multiprocess_number_coils
+    multiprocess_slices = np.load(slices_file_name, mmap_mode='r')
+    multiprocess_number_coils = number_coils
+
+
+def _piesno_slice_parallel(i):
+    return piesno(np.asarray(multiprocess_slices[i]),
+                  N=multiprocess_number_coils, return_mask=True)
+
+
+def estimate_piesno_sigma(data, number_coils=0, slices=None,
+                          nbr_processes=1):
     """
     Here are Dipy's note on this method:
      > It is expected that
@@ -13,29 +32,90 @@ def estimate_piesno_sigma(data, number_coils=0):
      >   2. The data is a repetition of the same measurements along the last
      >      axis, i.e. dMRI or fMRI data, not structural data like T1/T2."
 
+    Each axial slice is processed independently, possibly in parallel (the
+    result does not depend on the number of processes).
+
     Parameters
     ----------
     data: np.ndarray
         The 4D volume.
     number_coils: int
         The number of coils in the scanner.
+    slices: list of int, optional
+        Indices of the axial slices to process. The sigma of the other
+        slices is linearly interpolated from the processed slices (constant
+        beyond the first and last ones) and their noise mask is empty. By
+        default, all slices are processed.
+    nbr_processes: int
+        The number of subprocesses to use. If None or <= 0, uses all CPUs.
+
+    Returns
+    -------
+    sigma: np.ndarray
+        The 3D noise standard deviation (one value per slice).
+    mask_noise: np.ndarray
+        The 3D mask of the voxels identified as pure noise.
     """
     assert len(data.shape) == 4
 
+    nbr_processes = multiprocessing.cpu_count() \
+        if nbr_processes is None or nbr_processes <= 0 \
+        else nbr_processes
+
+    if slices is None:
+        slices = np.arange(data.shape[-2])
+    else:
+        slices = np.unique(slices)
+        if len(slices) == 0 or slices[0] < 0 or \
+                slices[-1] >= data.shape[-2]:
+            raise ValueError('Slices must be between 0 and {}.'
+                             .format(data.shape[-2] - 1))
+
+    # Separating the case nbr_processes=1 to help get good coverage metrics
+    # (codecov does not deal well with multiprocessing)
+    if nbr_processes == 1 or len(slices) == 1:
+        results = []
+        for i, idx in enumerate(slices):
+            logging.info('Now processing slice {} / {}'
+                         .format(i + 1, len(slices)))
+            results.append(piesno(data[..., idx, :], N=number_coils,
+                                  return_mask=True))
+    else:
+        # The slices are saved once (contiguous) and memmapped by all
+        # subprocesses, instead of being sent with each task.
+        with tempfile.TemporaryDirectory() as tmpdir:
+            slices_file_name = os.path.join(tmpdir, 'slices.npy')
+            slices_data = np.lib.format.open_memmap(
+                slices_file_name, mode='w+', dtype=data.dtype,
+                shape=(len(slices),) + data.shape[:2] + data.shape[3:])
+            for i, idx in enumerate(slices):
+                slices_data[i] = data[..., idx, :]
+            slices_data.flush()
+            del slices_data
+
+            pool = multiprocessing.Pool(nbr_processes,
+                                        initializer=_piesno_slice_init,
+                                        initargs=(slices_file_name,
+                                                  number_coils))
+            results = pool.map(_piesno_slice_parallel, range(len(slices)))
+            pool.close()
+            pool.join()
+
+    # Slices not processed: interpolating between the processed slices.
+    slice_sigmas = np.interp(np.arange(data.shape[-2]), slices,
+                             [sigma for sigma, _ in results])
     sigma = np.zeros(data.shape[:3], dtype=np.float32)
+    sigma[...] = slice_sigmas
     mask_noise = np.zeros(data.shape[:3], dtype=np.int16)
-
-    for idx in range(data.shape[-2]):
-        logging.info('Now processing slice {} / {}'
-                     .format(idx + 1, data.shape[-2]))
-        sigma[..., idx], mask_noise[..., idx] = \
-            piesno(data[..., idx, :], N=number_coils, return_mask=True)
+    for idx, (_, slice_mask) in zip(slices, results):
+        mask_noise[..., idx] = slice_mask
 
     # If the noise mask has few voxels, the detected noise standard
     # deviation can be very low and maybe something went wrong. We
     # check here that at least 1% of noisy voxels were found and warn
     # the user otherwise.
-    frac_noisy_voxels = np.sum(mask_noise) / np.size(mask_noise) * 100
+    frac_noisy_voxels = np.sum(mask_noise) / \
+        (np.prod(data.shape[:2]) * len(slices)) * 100
 
     if frac_noisy_voxels < 1.:
         logging.warning(
@@ -15,11 +15,12 @@ from dipy.segment.mask import crop, median_otsu
 import nibabel as nib
 import numpy as np
 from numpy import ma
-from scipy.ndimage import binary_dilation, gaussian_filter
-from scipy.spatial import KDTree
+from scipy.ndimage import (binary_dilation, distance_transform_edt,
+                           find_objects, gaussian_filter)
 from sklearn import linear_model
 
-from scilpy.image.reslice import reslice  # Don't use Dipy's reslice. Buggy.
+# Don't use Dipy's reslice. Buggy.
+from scilpy.image.reslice import affine_transform_4d, reslice
 from scilpy.io.image import get_data_as_mask
 from scilpy.gradients.bvec_bval_tools import identify_shells
 from scilpy.utils.spatial import voxel_to_world
@@ -118,7 +119,7 @@ def crop_volume(img: nib.Nifti1Image, wbbox):
 
 
 def apply_transform(transfo, reference, moving,
-                    interp='linear', keep_dtype=False):
+                    interp='linear', keep_dtype=False, num_processes=1):
     """
     Apply transformation to an image using Dipy's tool
 
@@ -136,6 +137,9 @@ def apply_transform(transfo, reference, moving,
     keep_dtype : bool
         If True, keeps the data_type of the input moving image when saving
         the output image
+    num_processes: int
+        Number of threads used to interpolate 4D images (see
+        transform_dwi).
 
     Returns
     -------
@@ -173,16 +177,20 @@ def apply_transform(transfo, reference, moving,
 
         orig_type = moving_data.dtype
         resampled = transform_dwi(affine_map, static_data, moving_data,
-                                  interpolation=interp)
+                                  interpolation=interp,
+                                  num_threads=num_processes)
     else:
         raise ValueError('Does not support this dataset (shape, type, etc)')
 
     return nib.Nifti1Image(resampled.astype(orig_type), grid2world)
 
 
-def transform_dwi(reg_obj, static, dwi, interpolation='linear'):
+def transform_dwi(reg_obj, static, dwi, interpolation='linear',
+                  num_threads=1):
     """
-    Iteratively apply transformation to 4D image using Dipy's tool
+    Apply transformation to all volumes of a 4D image. Equivalent to Dipy's
+    reg_obj.transform on each volume, but the interpolation coordinates and
+    weights are computed once for all volumes (see affine_transform_4d).
 
     Parameters
     ----------
@@ -195,16 +203,43 @@ def transform_dwi(reg_obj, static, dwi, interpolation='linear'):
     interpolation : string, either 'linear' or 'nearest'
         the type of interpolation to be used, either 'linear'
         (for k-linear interpolation) or 'nearest' for nearest neighbor
+    num_threads: int
+        Number of threads used for the interpolation.
 
     Returns
     -------
     trans_dwi: nib.Nifti1Image
         The warped 4D volume.
     """
-    trans_dwi = np.zeros(static.shape + (dwi.shape[3],), dtype=dwi.dtype)
-    for i in range(dwi.shape[3]):
-        trans_dwi[..., i] = reg_obj.transform(dwi[..., i],
-                                              interpolation=interpolation)
+    if interpolation not in ['linear', 'nearest']:
+        raise ValueError('Unknown interpolation method: {}'
+                         .format(interpolation))
+
+    # Same mapping from the static grid to the moving grid as Dipy.
+    static_grid2world = reg_obj.domain_grid2world
+    moving_grid2world = reg_obj.codomain_grid2world
+    if static_grid2world is None:
+        static_grid2world = np.eye(4)
+    if moving_grid2world is None:
+        moving_grid2world = np.eye(4)
+    grid2grid = np.linalg.inv(moving_grid2world)
+    if reg_obj.affine is None:
+        grid2grid = grid2grid.dot(static_grid2world)
+    else:
+        grid2grid = grid2grid.dot(reg_obj.affine.dot(static_grid2world))
+
+    if interpolation == 'linear':
+        # Dipy's linear interpolation is zero-padded at the borders.
+        order, mode = 1, 'grid-constant'
+    else:
+        order, mode = 0, 'constant'
+
+    trans_dwi = np.zeros(static.shape[:3] + (dwi.shape[3],), dtype=dwi.dtype,
+                         order='F')
+    affine_transform_4d(dwi, grid2grid[:3, :3], grid2grid[:3, 3],
+                        static.shape[:3], order=order, mode=mode,
+                        output=trans_dwi, round_integers=False,
+                        num_threads=num_threads)
 
     return trans_dwi
 
@@ -498,7 +533,8 @@ def _interp_code_to_order(interp_code):
 
 def resample_volume(img, ref_img=None, volume_shape=None, iso_min=False,
                     voxel_res=None,
-                    interp='lin', enforce_dimensions=False):
+                    interp='lin', enforce_dimensions=False,
+                    num_processes=1):
     """
     Function to resample a dataset to match the resolution of another reference
     dataset or to the resolution specified as in argument.
@@ -528,6 +564,8 @@ def resample_volume(img, ref_img=None, volume_shape=None, iso_min=False,
     enforce_dimensions: bool, optional
         If True, enforce the reference volume dimension (only if res is not
         None). (Default = False)
+    num_processes: int, optional
+        Number of threads used to interpolate 4D images (see reslice).
 
     Returns
     -------
@@ -578,7 +616,8 @@ def resample_volume(img, ref_img=None, volume_shape=None, iso_min=False,
     logging.info('Resampling data to %s with mode %s', new_zooms, interp)
 
     data2, affine2 = reslice(data, affine, original_zooms, new_zooms,
-                             _interp_code_to_order(interp))
+                             _interp_code_to_order(interp),
+                             num_processes=num_processes)
 
     logging.info('Resampled data shape: %s', data2.shape)
     logging.info('Resampled data affine: %s', affine2)
@@ -767,7 +806,7 @@ def merge_metrics(*arrays, beta=1.0):
 
 
 def compute_distance_map(mask_1, mask_2, symmetric=False,
-                         max_distance=np.inf):
+                         max_distance=np.inf, voxel_size=None):
     """
     Compute the distance map between two binary masks.
     The distance is computed using the Euclidean distance between the
@@ -785,11 +824,15 @@ def compute_distance_map(mask_1, mask_2, symmetric=False,
     mask_2: np.ndarray
         Second binary mask.
     symmetric: bool, optional
-        If True, compute the symmetric distance map. Default is np.inf
+        If True, compute the symmetric distance map. Default is False.
     max_distance: float, optional
-        Maximum distance to consider for kdtree exploration. Default is None.
-        If you put any value, coordinates further than this value will be
-        considered as np.inf.
+        Maximum distance to consider. Default is np.inf. If you put any
+        value, coordinates at this distance or further will be considered as
+        np.inf.
+    voxel_size: tuple of float, optional
+        Size of the voxels along each axis, for anisotropic voxels. The
+        distances are then in the same unit (ex, mm). Default is None
+        (distances in voxels).
 
     Returns
     -------
@@ -799,23 +842,30 @@ def compute_distance_map(mask_1, mask_2, symmetric=False,
     if mask_1.shape != mask_2.shape:
         raise ValueError("Masks must have the same shape.")
 
-    tree = KDTree(np.argwhere(mask_2))
+    def _distance_to(mask):
+        # Exact Euclidean distance transform: distance of every voxel to the
+        # closest voxel of the mask.
+        if not np.any(mask):
+            return np.full(mask.shape, np.inf)
+        distance = distance_transform_edt(np.logical_not(mask),
+                                          sampling=voxel_size)
+        distance[distance >= max_distance] = np.inf
+        return distance
+
     distance_map = np.zeros(mask_1.shape)
-    distance = tree.query(np.argwhere(mask_1),
-                          distance_upper_bound=max_distance)[0]
-    distance_map[np.where(mask_1)] = distance
+    in_mask_1 = np.asarray(mask_1) != 0
+    distance_map[in_mask_1] = _distance_to(mask_2)[in_mask_1]
 
     if symmetric:
         # Compute the symmetric distance map and merge it with the previous one
-        tree = KDTree(np.argwhere(mask_1))
-        distance = tree.query(np.argwhere(mask_2),
-                              distance_upper_bound=max_distance)[0]
-        distance_map[np.where(mask_2)] = distance
+        in_mask_2 = np.asarray(mask_2) != 0
+        distance_map[in_mask_2] = _distance_to(mask_1)[in_mask_2]
 
     return distance_map
 
 
-def compute_nawm(lesion_atlas, nb_ring, ring_thickness, mask=None):
+def compute_nawm(lesion_atlas, nb_ring, ring_thickness, mask=None,
+                 voxel_size=None):
     """
     Compute the NAWM (Normal Appearing White Matter) from a lesion map.
     The rings go from 2 to nb_ring + 2, with the lesion being 1.
@@ -826,6 +876,11 @@ def compute_nawm(lesion_atlas, nb_ring, ring_thickness, mask=None):
     If the lesion_atlas is binary, the output will be 3D. If the lesion_atlas
     is a label map, the output will be 4D, with each label having its own NAWM.
 
+    The distances to each label are computed with a Euclidean distance
+    transform restricted to the bounding box of the label, enlarged by the
+    extent of the rings. The work thus depends on the size of the lesions
+    rather than on the number of labels times the size of the volume.
+
     Parameters
     ----------
     lesion_atlas: np.ndarray
@@ -836,6 +891,10 @@ def compute_nawm(lesion_atlas, nb_ring, ring_thickness, mask=None):
         Thickness of the rings.
     mask: np.ndarray, optional
         Mask where to compute the NAWM. Default is None.
+    voxel_size: tuple of float, optional
+        Size of the voxels along each axis, for anisotropic voxels. The ring
+        thickness is then in the same unit. Default is None (thickness in
+        voxels).
 
     Returns
     -------
@@ -849,36 +908,45 @@ def compute_nawm(lesion_atlas, nb_ring, ring_thickness, mask=None):
     if np.unique(lesion_atlas).size == 1:
         raise ValueError('Input lesion map is empty.')
     is_binary = True if np.unique(lesion_atlas).size == 2 else False
-    labels = np.unique(lesion_atlas)[1:]
-    nawm = np.zeros(lesion_atlas.shape + (len(labels),), dtype=float)
+
+    # Labels as consecutive integers (0 for the background, the smallest
+    # value), to get the bounding box of all labels at once.
+    label_values, label_map = np.unique(lesion_atlas, return_inverse=True)
+    label_map = label_map.reshape(lesion_atlas.shape)
+    bounding_boxes = find_objects(label_map)
+    nawm = np.zeros(lesion_atlas.shape + (len(label_values) - 1,),
+                    dtype=np.uint16)
 
     if mask is None:
         mask = np.ones(lesion_atlas.shape, dtype=np.uint8)
+    mask = np.asarray(mask) != 0
 
-    max_distance = (nb_ring * ring_thickness) + 1
+    if voxel_size is None:
+        voxel_size = np.ones(lesion_atlas.ndim)
+    voxel_size = np.asarray(voxel_size, dtype=float)
 
-    for i, label in enumerate(labels):
-        curr_mask = np.zeros(lesion_atlas.shape, dtype=np.uint8)
-        curr_mask[lesion_atlas == label] = 1
-        curr_dist_map = compute_distance_map(mask,
-                                             curr_mask,
-                                             max_distance=max_distance)
-        curr_dist_map[np.isinf(curr_dist_map)] = 0
+    # Voxels further than this are in no ring.
+    max_distance = nb_ring * ring_thickness
+    margins = np.floor(max_distance / voxel_size).astype(int)
 
-        # Mask to remember where values were computed
-        to_increase_mask = np.zeros(lesion_atlas.shape, dtype=np.uint8)
-        to_increase_mask[curr_dist_map > 0] = 1
+    for i, bounding_box in enumerate(bounding_boxes):
+        box = tuple(slice(max(0, b.start - margin), b.stop + margin)
+                    for b, margin in zip(bounding_box, margins))
+        curr_mask = label_map[box] == i + 1
+        curr_dist_map = distance_transform_edt(np.logical_not(curr_mask),
+                                               sampling=voxel_size)
 
         # Compute the rings. The lesion should be 1, and the first ring
         # should be 2, and the max ring should be nb_ring + 1.
-        curr_dist_map = np.ceil(curr_dist_map / ring_thickness)
-        curr_dist_map[to_increase_mask > 0] += 1
-        curr_dist_map[curr_mask > 0] += 1
-        curr_dist_map[curr_dist_map > nb_ring + 1] = 0
+        in_ring = np.logical_and.reduce((mask[box], curr_dist_map > 0,
+                                         curr_dist_map <= max_distance))
+        rings = np.zeros(curr_mask.shape, dtype=np.uint16)
+        rings[in_ring] = np.ceil(curr_dist_map[in_ring] / ring_thickness) + 1
+        rings[curr_mask] = 1
 
-        nawm[..., i] = curr_dist_map
+        nawm[box + (i,)] = rings
 
     if is_binary:
         nawm = np.squeeze(nawm)
 
-    return nawm.astype(np.uint16)
+    return nawm
@@ -179,13 +179,13 @@ def reconstruct_streamlines_from_hdf5(hdf5_group):
 
     Returns
     -------
-    streamlines : list of np.ndarray
-        List of streamlines.
+    streamlines : ArraySequence
+        The streamlines.
     """
     if 'data' not in hdf5_group:
         raise ValueError("Expecting data in bundle's group.")
 
-    data = np.array(hdf5_group['data']).flatten()
+    data = np.array(hdf5_group['data'])
     offsets = np.array(hdf5_group['offsets'])
     lengths = np.array(hdf5_group['lengths'])
 
@@ -1,12 +1,14 @@
 # -*- coding: utf-8 -*-
 
-from dipy.io.utils import is_header_compatible
 import logging
 import nibabel as nib
 import numpy as np
 import os
 
 from scilpy.utils import is_float
+from scilpy.utils.lazy_import import lazy_import
+
+dipy_io_utils = lazy_import('dipy.io.utils')
 
 
 def load_img(arg):
@@ -48,7 +50,7 @@ def assert_same_resolution(images):
                         "resolution/affine. No image has been given")
 
     for curr_image in images[1:]:
-        if not is_header_compatible(images[0], curr_image):
+        if not dipy_io_utils.is_header_compatible(images[0], curr_image):
             raise Exception(f"Images are not of the same resolution/affine : "
                             f"({curr_image}) vs ({images[0]})")
 
@@ -5,14 +5,26 @@ import logging
 import os
 import tempfile
 
-from dipy.io.streamline import load_tractogram
-from dipy.io.streamline import save_tractogram as _save_tractogram
-from dipy.io.utils import is_header_compatible
 import nibabel as nib
 from nibabel.streamlines.array_sequence import ArraySequence
 import numpy as np
 
 from scilpy.io.utils import load_matrix_in_any_format
+from scilpy.utils.lazy_import import lazy_import
+
+dipy_io_streamline = lazy_import('dipy.io.streamline')
+dipy_io_utils = lazy_import('dipy.io.utils')
+
+
+def __getattr__(name):
+    # Names previously imported from dipy in this module. They are resolved
+    # on access to avoid importing dipy.io.streamline with every script.
+    if name == 'load_tractogram':
+        return dipy_io_streamline.load_tractogram
+    if name == 'is_header_compatible':
+        return dipy_io_utils.is_header_compatible
+    raise AttributeError("module {!r} has no attribute {!r}"
+                         .format(__name__, name))
 
 
 def check_tracts_same_format(parser, tractogram_1, tractogram_2):
@@ -89,8 +101,8 @@ def load_tractogram_with_reference(parser, args, filepath, arg_name=None):
                 arg_name and args.__getattribute__(arg_name + '_ref')):
             logging.warning('Reference is discarded for this file format '
                             '{}.'.format(filepath))
-        sft = load_tractogram(filepath, 'same',
-                              bbox_valid_check=bbox_check)
+        sft = dipy_io_streamline.load_tractogram(
+            filepath, 'same', bbox_valid_check=bbox_check)
 
         # Force dtype to int64 instead of float64
         if len(sft.streamlines) == 0:
@@ -100,9 +112,9 @@ def load_tractogram_with_reference(parser, args, filepath, arg_name=None):
         if arg_name:
             arg_ref = arg_name + '_ref'
             if args.__getattribute__(arg_ref):
-                sft = load_tractogram(filepath,
-                                      args.__getattribute__(arg_ref),
-                                      bbox_valid_check=bbox_check)
+                sft = dipy_io_streamline.load_tractogram(
+                    filepath, args.__getattribute__(arg_ref),
+                    bbox_valid_check=bbox_check)
             else:
                 parser.error('--{} is required for this file format '
                              '{}.'.format(arg_ref, filepath))
@@ -110,8 +122,8 @@ def load_tractogram_with_reference(parser, args, filepath, arg_name=None):
             parser.error('--reference is required for this file format '
                          '{}.'.format(filepath))
         else:
-            sft = load_tractogram(filepath, args.reference,
-                                  bbox_valid_check=bbox_check)
+            sft = dipy_io_streamline.load_tractogram(
+                filepath, args.reference, bbox_valid_check=bbox_check)
 
     else:
         parser.error('{} is an unsupported file format'.format(filepath))
@@ -127,7 +139,8 @@ def save_tractogram(sft, filename, no_empty, bbox_valid_check=True):
         if len(sft.streamlines) == 0:
             logging.info("Writing an empty file (0 streamlines): {} "
                          .format(filename))
-        _save_tractogram(sft, filename, bbox_valid_check=bbox_valid_check)
+        dipy_io_streamline.save_tractogram(
+            sft, filename, bbox_valid_check=bbox_valid_check)
 
 
 def verify_compatibility_with_reference_sft(ref_sft, files_to_verify,
@@ -164,7 +177,7 @@ def verify_compatibility_with_reference_sft(ref_sft, files_to_verify,
                 mask = load_tractogram_with_reference(parser, args, file)
             else:  # should be a nifti file.
                 mask = file
-            compatible = is_header_compatible(ref_sft, mask)
+            compatible = dipy_io_utils.is_header_compatible(ref_sft, mask)
             if not compatible:
                 parser.error("Reference tractogram incompatible with {}"
                              .format(file))
@@ -317,8 +330,8 @@ def reconstruct_streamlines_from_memmap(memmap_filenames, indices=None,
 
     Returns
     -------
-    streamlines : list of np.ndarray
-        List of streamlines.
+    streamlines : ArraySequence
+        The streamlines.
     """
 
     data = np.memmap(memmap_filenames[0],  dtype=strs_dtype, mode='r')
@@ -333,10 +346,15 @@ def reconstruct_streamlines(data, offsets, lengths, indices=None):
     Function to reconstruct streamlines from its data, offsets and lengths
     (from the nibabel tractogram object).
 
+    When the requested streamlines are stored contiguously in data (ex, when
+    indices is None or is a range), the returned ArraySequence is a view on
+    data (no copy). Otherwise, all points are gathered at once in a new array.
+
     Parameters
     ----------
     data : np.ndarray
-        Nx3 array representing all points of the streamlines.
+        Nx3 array (or flattened 3Nx1 array) representing all points of the
+        streamlines. Can also be a NxD array of data_per_point.
     offsets : np.ndarray
         Nx1 array representing the cumsum of length array.
     lengths : np.ndarray
@@ -346,19 +364,38 @@ def reconstruct_streamlines(data, offsets, lengths, indices=None):
 
     Returns
     -------
-    streamlines : list of np.ndarray
-        List of streamlines.
+    streamlines : ArraySequence
+        The streamlines. Note that if they are a view on a read-only memmap,
+        they can't be modified in place.
     """
-
-    if data.ndim == 2:
-        data = np.array(data).flatten()
-
-    if indices is None:
-        indices = np.arange(len(offsets))
-
-    streamlines = []
-    for i in indices:
-        streamline = data[offsets[i]*3:offsets[i]*3 + lengths[i]*3]
-        streamlines.append(streamline.reshape((lengths[i], 3)))
-
-    return ArraySequence(streamlines)
+    data = np.asarray(data)
+    if data.ndim == 1:
+        data = data.reshape((-1, 3))
+    offsets = np.asarray(offsets, dtype=np.intp)
+    lengths = np.asarray(lengths, dtype=np.intp)
+
+    if indices is not None:
+        offsets = offsets[indices]
+        lengths = lengths[indices]
+
+    streamlines = ArraySequence()
+    if len(offsets) == 0:
+        streamlines._data = data[0:0]
+        return streamlines
+
+    if np.array_equal(offsets[1:], offsets[:-1] + lengths[:-1]):
+        # Contiguous streamlines: wrapping the buffer.
+        start = offsets[0]
+        streamlines._data = data[start:start + np.sum(lengths)]
+        streamlines._offsets = offsets - start
+    else:
+        # Gathering all points of the selected streamlines at once.
+        new_offsets = np.zeros_like(offsets)
+        new_offsets[1:] = np.cumsum(lengths[:-1])
+        points = np.arange(np.sum(lengths)) + \
+            np.repeat(offsets - new_offsets, lengths)
+        streamlines._data = data[points]
+        streamlines._offsets = new_offsets
+    streamlines._lengths = lengths
+
+    return streamlines
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+
+import numpy as np
+
+from scilpy.io.streamlines import (reconstruct_streamlines,
+                                   reconstruct_streamlines_from_memmap)
+
+tmp_dir = tempfile.TemporaryDirectory()
+
+
+def _build_data():
+    # 6 streamlines of 1 to 6 points, stored contiguously.
+    lengths = np.arange(1, 7, dtype=np.int32)
+    offsets = (np.cumsum(lengths) - lengths).astype(np.int64)
+    data = np.arange(np.sum(lengths) * 3, dtype=np.float32).reshape((-1, 3))
+    expected = [data[o:o + n] for o, n in zip(offsets, lengths)]
+    return data, offsets, lengths, expected
+
+
+def _assert_streamlines_equal(streamlines, expected):
+    assert len(streamlines) == len(expected)
+    for s, e in zip(streamlines, expected):
+        assert np.array_equal(s, e)
+    # Points of the result are stored contiguously.
+    assert np.array_equal(streamlines._offsets,
+                          np.cumsum(streamlines._lengths) -
+                          streamlines._lengths)
+
+
+def test_reconstruct_streamlines_view():
+    data, offsets, lengths, expected = _build_data()
+
+    # All streamlines, or contiguous ones: a view on data.
+    for indices in [None, [2, 3, 4], np.arange(1, 6), [5]]:
+        streamlines = reconstruct_streamlines(data, offsets, lengths,
+                                              indices=indices)
+        chosen = expected if indices is None else \
+            [expected[i] for i in indices]
+        _assert_streamlines_equal(streamlines, chosen)
+        assert np.shares_memory(streamlines._data, data)
+
+    # Flattened data
+    streamlines = reconstruct_streamlines(data.ravel(), offsets, lengths)
+    _assert_streamlines_equal(streamlines, expected)
+
+
+def test_reconstruct_streamlines_gather():
+    data, offsets, lengths, expected = _build_data()
+
+    # Unsorted, with a gap or duplicated: the points are gathered.
+    for indices in [[4, 0, 2], [0, 2], [1, 1], np.array([5, 4, 3])]:
+        streamlines = reconstruct_streamlines(data, offsets, lengths,
+                                              indices=indices)
+        _assert_streamlines_equal(streamlines,
+                                  [expected[i] for i in indices])
+        assert not np.shares_memory(streamlines._data, data)
+
+
+def test_reconstruct_streamlines_empty():
+    data, offsets, lengths, _ = _build_data()
+
+    streamlines = reconstruct_streamlines(data, offsets, lengths,
+                                          indices=[])
+    assert len(streamlines) == 0
+    assert streamlines._data.shape == (0, 3)
+
+    streamlines = reconstruct_streamlines(data[:0], offsets[:0], lengths[:0])
+    assert len(streamlines) == 0
+
+
+def test_reconstruct_streamlines_from_memmap():
+    data, offsets, lengths, expected = _build_data()
+    filenames = []
+    for name, array in [('data', data), ('offsets', offsets),
+                        ('lengths', lengths)]:
+        filename = os.path.join(tmp_dir.name, name + '.dat')
+        memmap = np.memmap(filename, dtype=array.dtype, mode='w+',
+                           shape=array.shape)
+        memmap[:] = array
+        memmap.flush()
+        filenames.append(filename)
+
+    for indices in [None, [1, 2, 3], [3, 0, 5], []]:
+        streamlines = reconstruct_streamlines_from_memmap(filenames,
+                                                          indices=indices)
+        chosen = expected if indices is None else \
+            [expected[i] for i in indices]
+        _assert_streamlines_equal(streamlines, chosen)
@@ -12,15 +12,17 @@ import xml.etree.ElementTree as ET
 
 import nibabel as nib
 import numpy as np
-from dipy.data import SPHERE_FILES
-from dipy.io.utils import is_header_compatible
-from scipy.io import loadmat
-import six
 
 from scilpy.gradients.bvec_bval_tools import DEFAULT_B0_THRESHOLD
 from scilpy.utils.filenames import split_name_with_nii
+from scilpy.utils.lazy_import import lazy_import
 from scilpy.utils.spatial import RAS_AXES_NAMES
 
+# Imported lazily: this module is imported by all scripts.
+dipy_data = lazy_import('dipy.data')
+dipy_io_utils = lazy_import('dipy.io.utils')
+scipy_io = lazy_import('scipy.io')
+
 
 FLOATING_POINTS_PRECISION = 12
 
@@ -113,7 +115,7 @@ def check_tracts_same_format(parser, filename_list):
     _, ref_ext = os.path.splitext(filename_list[0])
 
     for filename in filename_list[1:]:
-        if isinstance(filename, six.string_types) and \
+        if isinstance(filename, str) and \
                 not os.path.splitext(filename)[1] == ref_ext:
             parser.error('All tracts file must use the same format.')
 
@@ -203,7 +205,7 @@ def add_reference_arg(parser, arg_name=None):
 
 
 def add_sphere_arg(parser, symmetric_only=False, default='repulsion724'):
-    spheres = sorted(SPHERE_FILES.keys())
+    spheres = sorted(dipy_data.SPHERE_FILES.keys())
     if symmetric_only:
         spheres = [s for s in spheres if 'symmetric' in s]
         if 'symmetric' not in default:
@@ -979,7 +981,7 @@ def assert_headers_compatible(parser, required, optional=None, reference=None):
         return
 
     for curr, file in zip(headers[1:], files[1:]):
-        if not is_header_compatible(headers[0], curr):
+        if not dipy_io_utils.is_header_compatible(headers[0], curr):
             # Not raising error now. Allows to show all errors.
             logging.error('ERROR: "{}" and "{}" do not have compatible '
                           'headers.'.format(files[0], file))
@@ -1026,7 +1028,7 @@ def load_matrix_in_any_format(filepath):
     elif ext == '.mat':
         # .mat are actually dictionnary. This function support .mat from
         # antsRegistration that encode a 4x4 transformation matrix.
-        transfo_dict = loadmat(filepath)
+        transfo_dict = scipy_io.loadmat(filepath)
         lps2ras = np.diag([-1, -1, 1])
         transfo_key = 'AffineTransform_double_3_3'
         if transfo_key not in transfo_dict:
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import multiprocessing
+import os
+import tempfile
+
+import numpy as np
+
+
+def _fit_tensor_init(model, data_file_name, S0_file_name):
+    """
+    Loads the data (and S0) in each subprocess of the pool, as read-only
+    memmaps shared by all subprocesses.
+    """
+    global multiprocess_model, multiprocess_data, multiprocess_S0
+    multiprocess_model = model
+    multiprocess_data = np.load(data_file_name, mmap_mode='r')
+    multiprocess_S0 = None if S0_file_name is None else \
+        np.load(S0_file_name, mmap_mode='r')
+
+
+def _fit_tensor_parallel(indices):
+    return _fit_tensor_chunk(multiprocess_model, multiprocess_data,
+                             multiprocess_S0, indices)
+
+
+def _fit_tensor_chunk(model, data, S0, indices):
+    """
+    Fits the model on the voxels at the given (flat) indices of data, of
+    shape (N, nb_volumes). Returns the model parameters and, if S0 is given,
+    the predicted signal of these voxels.
+    """
+    fit = model.fit(np.asarray(data[indices]))
+    predicted = None
+    if S0 is not None:
+        predicted = fit.predict(model.gtab,
+                                S0=np.asarray(S0[indices])).astype(np.float32)
+    return fit.model_params, predicted
+
+
+def _gather_chunks(chunks, results, nb_voxels, predicted):
+    """
+    Writes the results of each chunk, as they come, in the model parameters
+    (allocated with the first result, as their number depends on the model)
+    and in predicted (if not None). Returns the model parameters.
+    """
+    model_params = None
+    for chunk, (params, prediction) in zip(chunks, results):
+        if model_params is None:
+            model_params = np.zeros((nb_voxels, params.shape[-1]))
+        model_params[chunk] = params
+        if predicted is not None:
+            predicted[chunk] = prediction
+    return model_params
+
+
+def fit_tensor_by_chunks(model, data, mask=None, S0=None, chunk_size=10000,
+                         nbr_processes=1):
+    """
+    Fits a tensor model (ex, Dipy's TensorModel or DiffusionKurtosisModel)
+    on blocks of chunk_size voxels of the mask, possibly in parallel. Each
+    block is fitted once, giving both the model parameters and, if S0 is
+    given, the predicted signal. Results are written in preallocated arrays
+    (float32 for the predicted signal, the largest one), so only a block of
+    voxels per process is fitted at a time.
+
+    Parameters
+    ----------
+    model: dipy.reconst.base.ReconstModel
+        The model. Its fits must have model_params and a predict(gtab, S0)
+        method.
+    data: np.ndarray (x, y, z, nb_volumes)
+        Diffusion data.
+    mask: np.ndarray (x, y, z), optional
+        If given, only the voxels inside the mask are fitted. Outside the
+        mask, parameters are 0 (as in a masked Dipy fit).
+    S0: np.ndarray (x, y, z), optional
+        If given, the signal is predicted from the fit with this S0. Outside
+        the mask, the predicted signal is S0 (as predicted by a tensor of 0).
+    chunk_size: int
+        Number of voxels fitted at once by each process.
+    nbr_processes: int
+        The number of subprocesses to use. If None or <= 0, uses all CPUs.
+
+    Returns
+    -------
+    model_params: np.ndarray (x, y, z, nb_params)
+        The parameters of the model. Use them to create the fit object, ex:
+        dipy.reconst.dti.TensorFit(model, model_params). Kept in float64, as
+        some metrics (ex, radial kurtosis) are unstable in float32.
+    predicted: np.ndarray (x, y, z, nb_volumes) or None
+        The predicted signal, in float32, if S0 is given. Else, None.
+    """
+    nbr_processes = multiprocessing.cpu_count() \
+        if nbr_processes is None or nbr_processes <= 0 \
+        else nbr_processes
+
+    shape = data.shape[:-1]
+    data = data.reshape((-1, data.shape[-1]))
+    if S0 is not None:
+        S0 = np.broadcast_to(S0, shape).ravel()
+    if mask is None:
+        indices = np.arange(len(data))
+    else:
+        indices = np.flatnonzero(mask)
+    if len(indices) == 0:
+        raise ValueError('No voxel to fit: the mask is empty.')
+    chunks = np.array_split(indices, int(np.ceil(len(indices) / chunk_size)))
+
+    predicted = None
+    if S0 is not None:
+        predicted = np.repeat(S0.astype(np.float32)[:, None], data.shape[-1],
+                              axis=1)
+
+    # Separating the case nbr_processes=1 to help get good coverage metrics
+    # (codecov does not deal well with multiprocessing)
+    if nbr_processes == 1 or len(chunks) == 1:
+        results = (_fit_tensor_chunk(model, data, S0, chunk)
+                   for chunk in chunks)
+        model_params = _gather_chunks(chunks, results, len(data), predicted)
+    else:
+        # The data is saved once and memmapped by all subprocesses, instead
+        # of being sent with each chunk.
+        with tempfile.TemporaryDirectory() as tmpdir:
+            data_file_name = os.path.join(tmpdir, 'data.npy')
+            np.save(data_file_name, data)
+            S0_file_name = None
+            if S0 is not None:
+                S0_file_name = os.path.join(tmpdir, 'S0.npy')
+                np.save(S0_file_name, S0)
+
+            pool = multiprocessing.Pool(nbr_processes,
+                                        initializer=_fit_tensor_init,
+                                        initargs=(model, data_file_name,
+                                                  S0_file_name))
+            results = pool.imap(_fit_tensor_parallel, chunks)
+            model_params = _gather_chunks(chunks, results, len(data),
+                                          predicted)
+            pool.close()
+            pool.join()
+
+    model_params = model_params.reshape(shape + (-1,))
+    if predicted is not None:
+        predicted = predicted.reshape(shape + (-1,))
+
+    return model_params, predicted
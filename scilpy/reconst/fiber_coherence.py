@@ -14,6 +14,99 @@ ALL_NEIGHBORS = ALL_NEIGHBORS.T.reshape((27, 3)) - 1
 ALL_NEIGHBORS = np.delete(ALL_NEIGHBORS, 13, axis=0)
 
 
+# The 13 axes (up to their sign) of the directions to the 26 neighbors.
+# Peaks are compared to these axes in absolute value, so a neighbor and its
+# opposite share the same axis.
+ALL_AXES = ALL_NEIGHBORS[:13]
+
+
+def _get_axis_index(neighbors):
+    """
+    Index, in ALL_AXES, of the axis of each direction in neighbors (N, 3).
+    """
+    # Index in the (3, 3, 3) neighborhood, x varying first (see
+    # ALL_NEIGHBORS). The center (13) was removed: for indices i > 13, the
+    # direction is ALL_NEIGHBORS[i - 1], the opposite of ALL_NEIGHBORS[26 - i].
+    flat_index = (neighbors + 1).dot([1, 3, 9])
+    return np.where(flat_index < 13, flat_index, 26 - flat_index)
+
+
+def _compute_coherence_per_axis(peaks, values):
+    """
+    Compute, for each neighbor direction di and each axis e, the sum of the
+    values of the pairs of voxels (u, u + di) whose peaks are both aligned
+    with e (angle < ANGLE_TH). The fiber coherence of [1] is the sum of the
+    pairs for which e is the axis of di. Applying a permutation/flip t to the
+    peaks only changes which axis is used for each di (the axis of t.dot(di)),
+    so all transforms can be evaluated from this table.
+
+    Only voxels with both a peak and a non-zero value contribute to the sums,
+    so the work is restricted to them.
+
+    Parameters
+    ----------
+    peaks: ndarray (x, y, z, 3)
+        Principal fiber orientation for each voxel.
+    values: ndarray (x, y, z)
+        Anisotropy measure for each voxel (e.g. FA map).
+
+    Returns
+    -------
+    coherence: ndarray (26, 13)
+        Coherence for each neighbor direction in ALL_NEIGHBORS and each axis
+        in ALL_AXES.
+    """
+    shape = np.asarray(peaks.shape[:3])
+    norms = np.linalg.norm(peaks, axis=-1)
+    has_peak = norms > 0
+
+    # Axes aligned with the peak of each voxel, as bits of a mask (bit e for
+    # ALL_AXES[e]). Normalizing the peaks only once.
+    axes = ALL_AXES / np.linalg.norm(ALL_AXES, axis=1, keepdims=True)
+    is_aligned = np.abs((peaks[has_peak] / norms[has_peak][:, None])
+                        .dot(axes.T)) > np.cos(ANGLE_TH)
+    bits = 2 ** np.arange(len(ALL_AXES))
+    aligned_mask = np.zeros(shape + 2, dtype=np.uint16)
+    aligned_mask[1:-1, 1:-1, 1:-1][has_peak] = is_aligned.dot(bits)
+
+    # Flat indices in the volume with a one-voxel padding (no peak), so that
+    # all neighbors exist.
+    aligned_mask = aligned_mask.ravel()
+    strides = np.array([(shape[1] + 2) * (shape[2] + 2), shape[2] + 2, 1])
+
+    # Voxels contributing to the sums.
+    in_sum = np.logical_and(has_peak, values != 0)
+    coords = np.argwhere(in_sum)
+    flat_coords = (coords + 1).dot(strides)
+    voxel_values = values[in_sum].astype(float)
+    voxel_mask = aligned_mask[flat_coords]
+    is_inside = np.logical_and(np.all(coords >= 1, axis=1),
+                               np.all(coords <= shape - 2, axis=1))
+
+    # The value of a voxel is counted in the pair (u, u + di) where it is u,
+    # then in the pair where it is u + di. u must not be on the border of the
+    # volume. The sums are made per mask of axes aligned in both voxels.
+    u_values = np.where(is_inside, voxel_values, 0)
+    sums_per_mask = np.zeros((len(ALL_NEIGHBORS), 2 ** len(ALL_AXES)))
+    for i, di in enumerate(ALL_NEIGHBORS):
+        v_values = np.where(
+            np.logical_and(np.all(coords >= 1 + di, axis=1),
+                           np.all(coords <= shape - 2 + di, axis=1)),
+            voxel_values, 0)
+        for pair_values, offset in ((u_values, di.dot(strides)),
+                                    (v_values, -di.dot(strides))):
+            both_aligned = voxel_mask & aligned_mask[flat_coords + offset]
+            sums_per_mask[i] += np.bincount(both_aligned,
+                                            weights=pair_values,
+                                            minlength=len(sums_per_mask[i]))
+
+    # Sum of the masks where each axis is aligned.
+    masks = np.arange(sums_per_mask.shape[1])
+    coherence = sums_per_mask.dot((masks[:, None] & bits) > 0)
+
+    return coherence
+
+
 def compute_coherence_table_for_transforms(directions, values):
     """
     Compute fiber coherence indexes for all possible axes permutations/flips
@@ -24,6 +117,8 @@ def compute_coherence_table_for_transforms(directions, values):
     orientation in diffusion MRI scans. Magn Reson Imaging. 2019 May;58:82-89.
     doi: 10.1016/j.mri.2019.01.018.
 
+    The neighborhood of the voxels is only scanned once for all transforms.
+
     Parameters
     ----------
     directions: ndarray (x, y, z, 3)
@@ -51,11 +146,14 @@ def compute_coherence_table_for_transforms(directions, values):
             flip[ii, ii] = -1
             transforms[ii+i*NB_FLIPS+1] = transforms[i*NB_FLIPS].dot(flip)
 
-    # Compute the coherence for each one.
+    # Compute the coherence for each one. With the peaks transformed by t,
+    # the angle between a peak p and di is the angle between p and t.dot(di).
+    coherence_per_axis = _compute_coherence_per_axis(directions, values)
+    neighbors = np.arange(len(ALL_NEIGHBORS))
     coherence = []
     for t in transforms:
-        index = compute_fiber_coherence(directions.dot(t), values)
-        coherence.append(index)
+        axis_index = _get_axis_index(ALL_NEIGHBORS.dot(t.T).astype(int))
+        coherence.append(coherence_per_axis[neighbors, axis_index].sum())
     return coherence, list(transforms)
 
 
@@ -75,40 +173,6 @@ def compute_fiber_coherence(peaks, values):
     coherence: float
         Fiber coherence value.
     """
-    # Normalizing peaks
-    norm_peaks = np.zeros_like(peaks)
-    norms = np.linalg.norm(peaks, axis=-1)
-    norm_peaks[norms > 0] = peaks[norms > 0] / norms[norms > 0][..., None]
-
-    coherence = 0.0
-    for di in ALL_NEIGHBORS:
-        tx, ty, tz = di.astype(int)
-        slice_x = slice(1 + tx, peaks.shape[0] - 1 + tx)
-        slice_y = slice(1 + ty, peaks.shape[1] - 1 + ty)
-        slice_z = slice(1 + tz, peaks.shape[2] - 1 + tz)
-
-        di_norm = di / np.linalg.norm(di)
-
-        # Spatial coherence between the peak at each voxel and the direction to
-        # the neighbor di.
-        # Ex: if the peak is aligned in x and current di is aligned in x,
-        # returns True (with angle < 30 ; cos angle > 30)
-        cos_angles = np.abs(norm_peaks.dot(di_norm))
-        I_u = cos_angles > np.cos(ANGLE_TH)
-
-        # Doing the same thing with v; results in the same image but translated
-        # from one voxel. (With 1 voxel padding around the border).
-        I_v = np.zeros_like(I_u)
-        I_v[1:-1, 1:-1, 1:-1] = I_u[slice_x, slice_y, slice_z]
-
-        # Where both conditions are met:
-        I_uv = np.logical_and(I_u, I_v)
-        u = np.nonzero(I_uv)
-
-        # v = the same voxels as u, but with the neighborhood difference.
-        v = tuple(np.array(u) + di.astype(int).reshape(3, 1))
-
-        # Summing the FA of those voxels
-        coherence += np.sum(values[u]) + np.sum(values[v])
-
-    return coherence
+    coherence_per_axis = _compute_coherence_per_axis(peaks, values)
+    return coherence_per_axis[np.arange(len(ALL_NEIGHBORS)),
+                              _get_axis_index(ALL_NEIGHBORS)].sum()
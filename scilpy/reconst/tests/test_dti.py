@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from dipy.core.gradients import gradient_table
+from dipy.reconst.dti import TensorFit, TensorModel
+from dipy.sims.voxel import single_tensor
+import numpy as np
+
+from scilpy.reconst.dti import fit_tensor_by_chunks
+
+
+def _get_data():
+    rng = np.random.default_rng(1234)
+    bvecs = rng.normal(size=(31, 3))
+    bvecs /= np.linalg.norm(bvecs, axis=1, keepdims=True)
+    bvals = np.full(31, 1000)
+    bvals[0] = 0
+    gtab = gradient_table(bvals, bvecs=bvecs)
+
+    data = np.zeros((5, 4, 3, 31))
+    for index in np.ndindex(data.shape[:3]):
+        evecs = np.linalg.qr(rng.normal(size=(3, 3)))[0]
+        data[index] = single_tensor(gtab, S0=100, evecs=evecs,
+                                    evals=[1.7e-3, 0.4e-3, 0.3e-3],
+                                    snr=30, rng=rng)
+    mask = np.zeros(data.shape[:3], dtype=bool)
+    mask[1:4, 1:3, :] = True
+    return gtab, data, mask
+
+
+def test_fit_tensor_by_chunks():
+    gtab, data, mask = _get_data()
+    model = TensorModel(gtab)
+    expected_fit = model.fit(data, mask)
+    S0 = np.mean(data[..., gtab.b0s_mask], axis=-1)
+
+    for nbr_processes in [1, 2]:
+        model_params, predicted = fit_tensor_by_chunks(
+            model, data, mask, S0=S0, chunk_size=7,
+            nbr_processes=nbr_processes)
+        assert np.allclose(model_params, expected_fit.model_params)
+        fit = TensorFit(model, model_params)
+        assert np.allclose(fit.fa, expected_fit.fa)
+
+        assert predicted.dtype == np.float32
+        assert np.allclose(predicted, expected_fit.predict(gtab, S0=S0),
+                           rtol=1e-5)
+
+
+def test_fit_tensor_by_chunks_no_mask():
+    gtab, data, _ = _get_data()
+    model = TensorModel(gtab)
+
+    model_params, predicted = fit_tensor_by_chunks(model, data,
+                                                   chunk_size=25)
+    assert np.allclose(model_params, model.fit(data).model_params)
+    assert predicted is None
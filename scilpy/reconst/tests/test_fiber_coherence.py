@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import itertools
+
 import numpy as np
 
 from scilpy.reconst.fiber_coherence import (compute_coherence_table_for_transforms,
@@ -16,6 +18,78 @@ def test_compute_fiber_coherence_fliptable():
     assert len(transforms) == 24
 
 
+def _reference_transforms():
+    # The 6 axes permutations, each followed by its 3 flips.
+    transforms = []
+    for permutation in itertools.permutations([0, 1, 2]):
+        t = np.zeros((3, 3))
+        t[np.arange(3), permutation] = 1
+        transforms.append(t)
+        for axis in range(3):
+            flip = np.eye(3)
+            flip[axis, axis] = -1
+            transforms.append(t.dot(flip))
+    return transforms
+
+
+def _reference_fiber_coherence(peaks, values):
+    # Straightforward implementation: for each pair of neighbors (u, v),
+    # add their values if both peaks are aligned with the direction from u
+    # to v (angle < 30 degrees).
+    norms = np.linalg.norm(peaks, axis=-1)
+    norm_peaks = np.zeros_like(peaks)
+    norm_peaks[norms > 0] = peaks[norms > 0] / norms[norms > 0][..., None]
+
+    coherence = 0.0
+    shape = np.array(peaks.shape[:3])
+    for di in itertools.product([-1, 0, 1], repeat=3):
+        di = np.array(di)
+        if not np.any(di):
+            continue
+        di_norm = di / np.linalg.norm(di)
+        for u in itertools.product(*[range(1, n - 1) for n in shape]):
+            v = tuple(np.array(u) + di)
+            if np.abs(norm_peaks[u].dot(di_norm)) > np.cos(np.pi / 6) and \
+                    np.abs(norm_peaks[v].dot(di_norm)) > np.cos(np.pi / 6):
+                coherence += values[u] + values[v]
+    return coherence
+
+
+def test_compute_fiber_coherence_reference():
+    rng = np.random.default_rng(4321)
+    directions = rng.normal(size=(5, 6, 7, 3))
+    directions[rng.random((5, 6, 7)) < 0.2] = 0
+    # Many peaks aligned with the axes, as in real data.
+    aligned = rng.random((5, 6, 7)) < 0.5
+    directions[aligned] = np.eye(3)[rng.integers(0, 3, np.sum(aligned))]
+    fa = rng.random((5, 6, 7))
+
+    assert np.isclose(compute_fiber_coherence(directions, fa),
+                      _reference_fiber_coherence(directions, fa))
+
+    coherence, transforms = compute_coherence_table_for_transforms(
+        directions, fa)
+    for c, t, expected_t in zip(coherence, transforms,
+                                _reference_transforms()):
+        assert np.array_equal(t, expected_t)
+        assert np.isclose(c, _reference_fiber_coherence(directions.dot(t),
+                                                        fa))
+
+
+def test_compute_fiber_coherence_fliptable_values():
+    # Each value of the table should be the coherence of the transformed
+    # peaks.
+    rng = np.random.default_rng(1234)
+    directions = rng.normal(size=(6, 7, 8, 3))
+    directions[rng.random((6, 7, 8)) < 0.2] = 0
+    fa = rng.random((6, 7, 8))
+    fa[rng.random((6, 7, 8)) < 0.2] = 0
+    coherence, transforms = compute_coherence_table_for_transforms(
+        directions, fa)
+    for c, t in zip(coherence, transforms):
+        assert np.isclose(c, compute_fiber_coherence(directions.dot(t), fa))
+
+
 def test_compute_fiber_coherence():
     # Coherence will be strong if we have voxels were the peak points towards
     # the neighbor. Ex: Imagine the corpus callosum, where the voxels in X
@@ -63,7 +137,7 @@ def test_compute_fiber_coherence():
                                          [0, 0, 1],
                                          [0, 0, -1],
                                          [0, 0, 0]], dtype=float)
-    fa = np.zeros((3, 3, 5), dtype=float)
-    fa[1, 1, :] = [1, 1, 1, 1, 0]
+    fa = np.zeros((3, 5, 3), dtype=float)
+    fa[1, :, 1] = [1, 1, 1, 1, 0]
     coherence4 = compute_fiber_coherence(directions, fa)
     assert coherence4 == 0
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import warnings
+
+from dipy.segment.clustering import qbx_and_merge
+from nibabel.streamlines.array_sequence import ArraySequence
+import numpy as np
+
+
+def _get_qbx_cache_key(streamlines, thresholds, nb_pts, rng):
+    """
+    Hash of the streamlines (coordinates and lengths), of the QBx parameters
+    and of the state of the random generator.
+    """
+    # The points of the streamlines only: a slice of an ArraySequence shares
+    # all the points of its parent.
+    data = streamlines.get_data()
+    md5 = hashlib.md5()
+    md5.update(np.ascontiguousarray(data).view(np.uint8))
+    md5.update(np.asarray(streamlines._lengths, dtype=np.int64).tobytes())
+    md5.update(json.dumps({'dtype': str(data.dtype),
+                           'thresholds': [float(t) for t in thresholds],
+                           'nb_pts': int(nb_pts)}).encode())
+    if rng is not None:
+        # Same generator state = same ordering of the streamlines in QBx.
+        if isinstance(rng, np.random.Generator):
+            state = rng.bit_generator.state
+        else:
+            state = rng.get_state(legacy=False)
+        md5.update(json.dumps(state, default=lambda x: x.tolist()).encode())
+    return md5.hexdigest()
+
+
+def qbx_and_merge_cached(streamlines, thresholds, nb_pts=12, rng=None,
+                         cache_directory=None):
+    """
+    Runs Dipy's qbx_and_merge and returns its centroids and clusters. If
+    cache_directory is given, the result is saved there, keyed by a hash of
+    the streamlines, the thresholds and the state of the random generator.
+    Clustering the same streamlines again (ex, running BundleSeg on the same
+    subject with other atlases or parameters) then loads the saved result.
+
+    Parameters
+    ----------
+    streamlines: ArraySequence or list of np.ndarray
+        Streamlines to cluster.
+    thresholds: list of float
+        Distance thresholds (mm) for QuickBundlesX.
+    nb_pts: int
+        Number of points for discretizing each streamline.
+    rng: RandomState, Generator or None
+        Random generator used by QBx to order the streamlines. When loaded
+        from the cache, the generator is not advanced.
+    cache_directory: str or None
+        Directory of the cached clusterings. Created if it does not exist.
+        If None, the clustering is always computed.
+
+    Returns
+    -------
+    centroids: ArraySequence
+        Centroid of each cluster, with nb_pts points.
+    clusters_indices: ArraySequence
+        Indices (uint32) of the streamlines of each cluster.
+    """
+    if not isinstance(streamlines, ArraySequence):
+        streamlines = ArraySequence(streamlines)
+
+    if cache_directory is not None:
+        key = _get_qbx_cache_key(streamlines, thresholds, nb_pts, rng)
+        cache_filename = os.path.join(cache_directory,
+                                      'qbx_{}.npz'.format(key))
+        if os.path.isfile(cache_filename):
+            logging.debug('Loading QBx clusters from {}'
+                          .format(cache_filename))
+            with np.load(cache_filename) as cache:
+                lengths = cache['lengths']
+                centroids = ArraySequence()
+                centroids._data = cache['centroids']
+                centroids._lengths = np.full(len(lengths), nb_pts)
+                centroids._offsets = np.arange(len(lengths)) * nb_pts
+                clusters_indices = ArraySequence()
+                clusters_indices._data = cache['indices']
+                clusters_indices._lengths = lengths
+                clusters_indices._offsets = np.concatenate(
+                    ([0], np.cumsum(lengths)[:-1]))
+            return centroids, clusters_indices
+
+    with warnings.catch_warnings(record=True) as _:
+        cluster_map = qbx_and_merge(streamlines, thresholds, nb_pts=nb_pts,
+                                    rng=rng, verbose=False)
+
+    centroids = ArraySequence(cluster_map.centroids)
+    clusters_indices = ArraySequence([cluster.indices
+                                      for cluster in cluster_map.clusters])
+    clusters_indices._data = clusters_indices._data.astype(np.uint32)
+
+    if cache_directory is not None:
+        os.makedirs(cache_directory, exist_ok=True)
+        # Writing to a temporary file first, as other processes may be
+        # reading (or writing) the same entry.
+        fd, tmp_filename = tempfile.mkstemp(suffix='.npz',
+                                            dir=cache_directory)
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, centroids=centroids.get_data(),
+                     indices=clusters_indices.get_data(),
+                     lengths=np.asarray(clusters_indices._lengths))
+        os.replace(tmp_filename, cache_filename)
+
+    return centroids, clusters_indices
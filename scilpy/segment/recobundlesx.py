@@ -7,14 +7,13 @@ import warnings
 from dipy.align.streamlinear import (BundleMinDistanceMetric,
                                      StreamlineLinearRegistration)
 from dipy.segment.fss import FastStreamlineSearch
-from dipy.segment.clustering import qbx_and_merge
 from dipy.tracking.distances import bundles_distances_mdf
 from dipy.tracking.streamline import (select_random_set_of_streamlines,
                                       transform_streamlines)
-from nibabel.streamlines.array_sequence import ArraySequence
 import numpy as np
 
 from scilpy.io.streamlines import reconstruct_streamlines_from_memmap
+from scilpy.segment.qbx_cache import qbx_and_merge_cached
 
 
 class RecobundlesX(object):
@@ -34,7 +33,7 @@ class RecobundlesX(object):
     """
 
     def __init__(self, memmap_filenames, clusters_indices, wb_centroids,
-                 rng=None):
+                 rng=None, cache_directory=None):
         """
         Parameters
         ----------
@@ -48,11 +47,15 @@ class RecobundlesX(object):
             from qbx.
         rng : RandomState
             If None then RandomState is initialized internally.
+        cache_directory : str
+            If set, the QBx clusterings of the model bundles are saved in
+            (and reused from) this directory.
         """
         self.memmap_filenames = memmap_filenames
         self.wb_clusters_indices = clusters_indices
         self.centroids = wb_centroids
         self.rng = rng
+        self.cache_directory = cache_directory
 
         # For declaration outside of init
         self.neighb_centroids = None
@@ -120,12 +123,9 @@ class RecobundlesX(object):
         identifier, str, name of the bundle for logging.
         """
         thresholds = [30, 20, 15, model_clust_thr]
-        model_cluster_map = qbx_and_merge(self.model_streamlines, thresholds,
-                                          nb_pts=12,
-                                          rng=self.rng,
-                                          verbose=False)
-
-        self.model_centroids = ArraySequence(model_cluster_map.centroids)
+        self.model_centroids, _ = qbx_and_merge_cached(
+            self.model_streamlines, thresholds, nb_pts=12, rng=self.rng,
+            cache_directory=self.cache_directory)
         len_centroids = len(self.model_centroids)
         if len_centroids > 1000:
             logging.warning('Model {0} simplified at threshold '
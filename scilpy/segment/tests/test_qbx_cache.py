@@ -0,0 +1,73 @@
+import os
+import tempfile
+
+from nibabel.streamlines import ArraySequence
+import numpy as np
+from numpy.testing import assert_array_equal, assert_equal
+
+from scilpy.segment.qbx_cache import qbx_and_merge_cached
+
+
+def _get_streamlines():
+    # Two groups of straight lines, along x and along y.
+    rng = np.random.RandomState(0)
+    line = np.linspace(0, 50, 20)[:, None] * np.array([[1, 0, 0]])
+    streamlines = [(line + rng.normal(0, 1, 3)).astype(np.float32)
+                   for _ in range(20)]
+    streamlines += [(line[:, [1, 0, 2]] + rng.normal(0, 1, 3) + 25)
+                    .astype(np.float32) for _ in range(10)]
+    return streamlines
+
+
+def test_qbx_and_merge_cached():
+    streamlines = _get_streamlines()
+    centroids, clusters_indices = qbx_and_merge_cached(
+        streamlines, [20, 10], rng=np.random.RandomState(0))
+    assert_equal(len(centroids), 2)
+    assert_equal(len(centroids[0]), 12)
+    assert_equal(sorted(len(c) for c in clusters_indices), [10, 20])
+    assert_equal(clusters_indices.get_data().dtype, np.uint32)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_dir = os.path.join(tmp_dir, 'cache')
+        # First call computes and saves the clustering, second loads it.
+        for _ in range(2):
+            cached_centroids, cached_indices = qbx_and_merge_cached(
+                streamlines, [20, 10], rng=np.random.RandomState(0),
+                cache_directory=cache_dir)
+            assert_equal(len(os.listdir(cache_dir)), 1)
+            assert_equal(len(cached_centroids), 2)
+            assert_equal(len(cached_indices), 2)
+            for i in range(2):
+                assert_array_equal(cached_centroids[i], centroids[i])
+                assert_array_equal(cached_indices[i], clusters_indices[i])
+            assert_array_equal(cached_centroids.get_data(),
+                               centroids.get_data())
+            assert_array_equal(cached_indices.get_data(),
+                               clusters_indices.get_data())
+            assert_array_equal(cached_indices._lengths,
+                               clusters_indices._lengths)
+
+        # Other thresholds, other streamlines: new entries.
+        qbx_and_merge_cached(streamlines, [20, 5],
+                             rng=np.random.RandomState(0),
+                             cache_directory=cache_dir)
+        qbx_and_merge_cached(streamlines[:-1], [20, 10],
+                             rng=np.random.RandomState(0),
+                             cache_directory=cache_dir)
+        assert_equal(len(os.listdir(cache_dir)), 3)
+
+
+def test_qbx_and_merge_cached_sliced():
+    # Slices of an ArraySequence share the points of their parent: subsets
+    # with the same lengths must still get their own entry.
+    streamlines = ArraySequence(_get_streamlines())
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for subset in [streamlines[0::2], streamlines[1::2]]:
+            expected, _ = qbx_and_merge_cached(
+                subset, [20, 10], rng=np.random.RandomState(0))
+            centroids, _ = qbx_and_merge_cached(
+                subset, [20, 10], rng=np.random.RandomState(0),
+                cache_directory=tmp_dir)
+            assert_array_equal(centroids.get_data(), expected.get_data())
+        assert_equal(len(os.listdir(tmp_dir)), 2)
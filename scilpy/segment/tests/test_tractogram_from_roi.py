@@ -1,3 +1,4 @@
+import logging
 import os
 import tempfile
 import nibabel as nib
@@ -7,8 +8,8 @@ from numpy.testing import (assert_array_equal,
                            assert_equal)
 
 from scilpy.segment.tractogram_from_roi import (_extract_vb_one_bundle,
-                                                _extract_ib_one_bundle)
-from dipy.io.stateful_tractogram import Space, StatefulTractogram
+                                                _extract_ib_all_bundles)
+from dipy.io.stateful_tractogram import Origin, Space, StatefulTractogram
 
 
 def test_extract_vb_one_bundle():
@@ -38,24 +39,89 @@ def test_extract_vb_one_bundle():
         assert_equal(bundle_stats["VS"], 0)
 
 
-def test_extract_ib_one_bundle():
-    # Testing extraction of IS corresponding to a bundle using
-    # an empty tractogram which shouldn't raise any error.
+def test_extract_ib_all_bundles():
     fake_reference = nib.Nifti1Image(
         np.zeros((10, 10, 10, 1)), affine=np.eye(4))
-    # The Space type is not important here
-    empty_sft = StatefulTractogram([], fake_reference, Space.RASMM)
+    streamlines = [np.array([[1.5, 1.5, 1.5], [8.5, 1.5, 1.5]]),  # 1 - 2
+                   np.array([[1.5, 8.5, 1.5], [8.5, 1.5, 1.5]]),  # 3 - 2
+                   np.array([[8.5, 1.5, 1.5], [1.5, 1.5, 1.5]]),  # 2 - 1
+                   np.array([[1.5, 1.5, 1.5], [5.5, 5.5, 5.5]])]  # 1 - none
+    sft = StatefulTractogram(streamlines, fake_reference, Space.VOX,
+                             origin=Origin.TRACKVIS)
 
     with tempfile.TemporaryDirectory() as tmp_dir:
-        fake_mask1_name = os.path.join(tmp_dir, 'fake_mask1.nii.gz')
-        fake_mask2_name = os.path.join(tmp_dir, 'fake_mask2.nii.gz')
-        nib.save(nib.Nifti1Image(np.zeros((10, 10, 10)),
-                 affine=np.eye(4), dtype=np.int8), fake_mask1_name)
-        nib.save(nib.Nifti1Image(np.zeros((10, 10, 10)),
-                 affine=np.eye(4), dtype=np.int8), fake_mask2_name)
+        roi_filenames = []
+        for i, vox in enumerate([(1, 1, 1), (8, 1, 1), (1, 8, 1)]):
+            mask = np.zeros((10, 10, 10), dtype=np.uint8)
+            mask[vox] = 1
+            roi_filenames.append(os.path.join(tmp_dir,
+                                              'roi{}.nii.gz'.format(i + 1)))
+            nib.save(nib.Nifti1Image(mask, affine=np.eye(4)),
+                     roi_filenames[-1])
+
+        comb_filename = [(roi_filenames[0], roi_filenames[1]),
+                         (roi_filenames[0], roi_filenames[2]),
+                         (roi_filenames[1], roi_filenames[2])]
+        args = type('args', (), {'unique': False, 'dilate_endpoints': None})
+        ib_sft_list, ic_ids_list, ib_names = _extract_ib_all_bundles(
+            comb_filename, sft, args)
+
+        assert_equal(ib_names, ['roi1_roi2', 'roi2_roi3'])
+        assert_array_equal(ic_ids_list[0], [0, 2])
+        assert_array_equal(ic_ids_list[1], [1])
+        assert_equal(len(ib_sft_list[0]), 2)
+
+        # With dilation, the last streamline does not reach any ROI either.
+        args.dilate_endpoints = 1
+        _, ic_ids_list, ib_names = _extract_ib_all_bundles(
+            comb_filename, sft, args)
+        assert_equal(ib_names, ['roi1_roi2', 'roi2_roi3'])
+        assert_array_equal(ic_ids_list[0], [0, 2])
+        assert_array_equal(ic_ids_list[1], [1])
+
+
+def test_extract_ib_all_bundles_overlapping_rois(caplog):
+    fake_reference = nib.Nifti1Image(
+        np.zeros((10, 10, 10, 1)), affine=np.eye(4))
+    streamlines = [np.array([[1.5, 1.5, 1.5], [8.5, 1.5, 1.5]]),  # 1 - 2
+                   np.array([[2.5, 1.5, 1.5], [8.5, 1.5, 1.5]]),  # 3 - 2
+                   np.array([[8.5, 1.5, 1.5], [1.5, 1.5, 1.5]])]  # 2 - 1
+    sft = StatefulTractogram(streamlines, fake_reference, Space.VOX,
+                             origin=Origin.TRACKVIS)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # roi3 overlaps roi1 in voxel (1, 1, 1).
+        roi_filenames = []
+        for i, voxels in enumerate([[(1, 1, 1)], [(8, 1, 1)],
+                                    [(1, 1, 1), (2, 1, 1)]]):
+            mask = np.zeros((10, 10, 10), dtype=np.uint8)
+            for vox in voxels:
+                mask[vox] = 1
+            roi_filenames.append(os.path.join(tmp_dir,
+                                              'roi{}.nii.gz'.format(i + 1)))
+            nib.save(nib.Nifti1Image(mask, affine=np.eye(4)),
+                     roi_filenames[-1])
+
+        comb_filename = [(roi_filenames[0], roi_filenames[1]),
+                         (roi_filenames[2], roi_filenames[1])]
 
-        fc_sft, fc_ids = _extract_ib_one_bundle(
-            empty_sft, fake_mask1_name, fake_mask2_name, None)
+        # Streamlines 0 and 2 are in both pairs, with a warning.
+        args = type('args', (), {'unique': False, 'dilate_endpoints': None})
+        with caplog.at_level(logging.WARNING):
+            _, ic_ids_list, ib_names = _extract_ib_all_bundles(
+                comb_filename, sft, args)
+        assert_equal(ib_names, ['roi1_roi2', 'roi3_roi2'])
+        assert_array_equal(ic_ids_list[0], [0, 2])
+        assert_array_equal(ic_ids_list[1], [0, 1, 2])
+        assert '2 streamlines are scored twice' in caplog.text
 
-        assert_equal(len(fc_sft), 0)
-        assert_array_equal(fc_ids, [])
+        # With unique, they are only in the first pair.
+        caplog.clear()
+        args.unique = True
+        with caplog.at_level(logging.WARNING):
+            _, ic_ids_list, ib_names = _extract_ib_all_bundles(
+                comb_filename, sft, args)
+        assert_equal(ib_names, ['roi1_roi2', 'roi3_roi2'])
+        assert_array_equal(ic_ids_list[0], [0, 2])
+        assert_array_equal(ic_ids_list[1], [1])
+        assert 'scored twice' not in caplog.text
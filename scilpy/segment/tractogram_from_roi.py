@@ -478,95 +478,130 @@ def _extract_vb_one_bundle(
     return list(vs_ids), list(wpc_ids), bundle_stats
 
 
-def _extract_ib_one_bundle(sft, mask_1_filename, mask_2_filename,
-                           dilate_endpoints):
+def _get_endpoints_in_rois(sft, roi_filenames, dilate_endpoints):
     """
-    Extract false connections based on two regions from a tractogram.
+    Finds, for every streamline, which ROIs contain its first and its last
+    point. Each ROI is loaded (and dilated) only once.
 
     Parameters
     ----------
     sft: StatefulTractogram
-        Tractogram containing the streamlines to be extracted.
-    mask_1_filename: str
-        Filename of the "head" of the bundle.
-    mask_2_filename: str
-        Filename of the "tail" of the bundle.
+        Tractogram containing the streamlines.
+    roi_filenames: list of str
+        Filenames of the ROIs.
     dilate_endpoints: int or None
         If set, dilate the masks for n iterations.
 
     Returns
     -------
-    fc_sft: StatefulTractogram
-        SFT of false connections.
-    sft: StatefulTractogram
-        SFT of remaining streamlines.
+    in_roi_beg: np.ndarray of bool
+        Array of shape (nb_streamlines, nb_rois). True if the first point of
+        the streamline is in the ROI.
+    in_roi_end: np.ndarray of bool
+        Same for the last point of the streamlines.
     """
-
-    if len(sft) > 0:
-        mask_1_img = nib.load(mask_1_filename)
-        mask_2_img = nib.load(mask_2_filename)
-        mask_1 = get_data_as_mask(mask_1_img)
-        mask_2 = get_data_as_mask(mask_2_img)
-
+    sft.to_vox()
+    sft.to_corner()
+    streamlines = sft.streamlines
+    lengths = np.asarray(streamlines._lengths)
+    offsets = np.asarray(streamlines._offsets)
+    voxel_beg = streamlines._data[offsets].astype(np.int16)
+    voxel_end = streamlines._data[offsets + lengths - 1].astype(np.int16)
+
+    # Same as map_coordinates(..., mode='nearest') in filter_grid_roi_both.
+    dims = np.asarray(sft.dimensions)
+    voxel_beg = tuple(np.clip(voxel_beg, 0, dims - 1).T)
+    voxel_end = tuple(np.clip(voxel_end, 0, dims - 1).T)
+
+    in_roi_beg = np.zeros((len(sft), len(roi_filenames)), dtype=bool)
+    in_roi_end = np.zeros((len(sft), len(roi_filenames)), dtype=bool)
+    for i, roi_filename in enumerate(roi_filenames):
+        mask = get_data_as_mask(nib.load(roi_filename))
         if dilate_endpoints:
-            mask_1 = binary_dilation(mask_1, iterations=dilate_endpoints)
-            mask_2 = binary_dilation(mask_2, iterations=dilate_endpoints)
-
-        _, fc_ids = filter_grid_roi_both(sft, mask_1, mask_2)
-    else:
-        fc_ids = []
+            mask = binary_dilation(mask, iterations=dilate_endpoints)
+        in_roi_beg[:, i] = mask[voxel_beg]
+        in_roi_end[:, i] = mask[voxel_end]
 
-    fc_sft = sft[fc_ids]
-    return fc_sft, fc_ids
+    return in_roi_beg, in_roi_end
 
 
 def _extract_ib_all_bundles(comb_filename, sft, args):
     """
-    Loop on every bundle and compute false connections, defined as connections
-    between ROIs pairs that do not form gt bundles.
+    Compute false connections, defined as connections between ROIs pairs that
+    do not form gt bundles, for every combination of endpoints masks.
 
-    (Goes through all the possible combinations of endpoints masks)
+    Both endpoints of every streamline are labelled once with all ROIs.
+    Streamlines sharing the same labels are then grouped, and the pairs
+    they connect are verified once per group rather than once per
+    streamline.
     """
     ib_sft_list = []
     ic_ids_list = []
     ib_bundle_names = []
 
-    all_ids = np.arange(len(sft))
-    for i, roi in enumerate(comb_filename):
-        roi1_filename, roi2_filename = roi
+    if len(sft) == 0 or len(comb_filename) == 0:
+        return ib_sft_list, ic_ids_list, ib_bundle_names
 
-        # Automatically generate filename for Q/C
-        prefix_1 = _extract_prefix(roi1_filename)
-        prefix_2 = _extract_prefix(roi2_filename)
+    roi_filenames = sorted(set(itertools.chain(*comb_filename)))
+    roi_idx = {roi: i for i, roi in enumerate(roi_filenames)}
+    pairs = np.array([[roi_idx[roi1], roi_idx[roi2]]
+                      for roi1, roi2 in comb_filename])
 
-        ib_sft, ic_ids = _extract_ib_one_bundle(
-            sft[all_ids], roi1_filename, roi2_filename, args.dilate_endpoints)
+    in_roi_beg, in_roi_end = _get_endpoints_in_rois(sft, roi_filenames,
+                                                    args.dilate_endpoints)
 
-        if args.unique:
-            ic_ids = all_ids[ic_ids]
-            all_ids = np.setdiff1d(all_ids, ic_ids, assume_unique=True)
+    # Grouping the streamlines with the same endpoint labels.
+    signatures, group_ids, group_sizes = np.unique(
+        np.packbits(np.hstack((in_roi_beg, in_roi_end)), axis=1),
+        axis=0, return_inverse=True, return_counts=True)
+    group_ids = group_ids.ravel()
+    signatures = np.unpackbits(signatures, axis=1,
+                               count=2 * len(roi_filenames)).astype(bool)
+    group_beg = signatures[:, :len(roi_filenames)]
+    group_end = signatures[:, len(roi_filenames):]
 
-        if len(ib_sft.streamlines) > 0:
-            logging.info("IB: Recognized {} streamlines between {} and {}"
-                         .format(len(ib_sft.streamlines), prefix_1, prefix_2))
+    # Pairs connected by each group: shape (nb_groups, nb_pairs).
+    is_connected = np.logical_or(
+        group_beg[:, pairs[:, 0]] & group_end[:, pairs[:, 1]],
+        group_end[:, pairs[:, 0]] & group_beg[:, pairs[:, 1]])
 
-            ib_sft_list.append(ib_sft)
-            ic_ids_list.append(ic_ids)
-            ib_bundle_names.append(prefix_1 + '_' + prefix_2)
+    if args.unique:
+        # Streamlines are only assigned to the first pair they connect.
+        is_connected &= np.cumsum(is_connected, axis=1) == 1
+    else:
+        # Duplicates? Number of streamlines shared by each pair of pairs.
+        connected = is_connected.astype(float)
+        nb_shared = (connected * group_sizes[:, None]).T @ connected
+        for i, j in zip(*np.nonzero(np.triu(nb_shared, k=1))):
+            logging.warning(
+                "{} streamlines are scored twice as invalid "
+                "connections\n (between pair {}\n and between pair "
+                "{}). You probably have overlapping ROIs!"
+                .format(int(nb_shared[i, j]), comb_filename[i],
+                        comb_filename[j]))
+
+    # Streamline ids of each group.
+    order = np.argsort(group_ids, kind='stable')
+    group_ends = np.cumsum(group_sizes)
+    group_starts = group_ends - group_sizes
+
+    for i, (roi1_filename, roi2_filename) in enumerate(comb_filename):
+        groups = np.flatnonzero(is_connected[:, i])
+        if len(groups) == 0:
+            continue
+
+        ic_ids = np.sort(np.concatenate(
+            [order[group_starts[g]:group_ends[g]] for g in groups]))
 
-    # Duplicates?
-    if not args.unique:
-        nb_pairs = len(ic_ids_list)
-        for i in range(nb_pairs):
-            for j in range(i + 1, nb_pairs):
-                duplicate_ids = np.intersect1d(ic_ids_list[i], ic_ids_list[j])
-                if len(duplicate_ids) > 0:
-                    logging.warning(
-                        "{} streamlines are scored twice as invalid "
-                        "connections\n (between pair {}\n and between pair "
-                        "{}). You probably have overlapping ROIs!"
-                        .format(len(duplicate_ids), comb_filename[i],
-                                comb_filename[j]))
+        # Automatically generate filename for Q/C
+        prefix_1 = _extract_prefix(roi1_filename)
+        prefix_2 = _extract_prefix(roi2_filename)
+        logging.info("IB: Recognized {} streamlines between {} and {}"
+                     .format(len(ic_ids), prefix_1, prefix_2))
+
+        ib_sft_list.append(sft[ic_ids])
+        ic_ids_list.append(ic_ids)
+        ib_bundle_names.append(prefix_1 + '_' + prefix_2)
 
     return ib_sft_list, ic_ids_list, ib_bundle_names
 
@@ -6,23 +6,22 @@ import logging
 import multiprocessing
 import os
 from time import time
-import warnings
 
 from dipy.io.streamline import load_tractogram, save_tractogram
-from dipy.segment.clustering import qbx_and_merge
 from dipy.tracking.streamline import transform_streamlines
 import nibabel as nib
-from nibabel.streamlines.array_sequence import ArraySequence
 import numpy as np
 from scipy.sparse import lil_matrix
 
 from scilpy.io.streamlines import streamlines_to_memmap
+from scilpy.segment.qbx_cache import qbx_and_merge_cached
 from scilpy.segment.recobundlesx import RecobundlesX
 
 
 class VotingScheme(object):
     def __init__(self, config, atlas_directory, transformation,
-                 output_directory, minimal_vote_ratio=0.5):
+                 output_directory, minimal_vote_ratio=0.5,
+                 cache_directory=None):
         """
         Parameters
         ----------
@@ -41,6 +40,9 @@ class VotingScheme(object):
         multi_parameters : int
             Number of runs RBx will performed.
             Enough parameter choices must be provided.
+        cache_directory : str
+            If set, the QBx clusterings of the tractogram and of the models
+            are saved in (and reused from) this directory.
         """
         self.config = config
         self.minimal_vote_ratio = minimal_vote_ratio
@@ -53,6 +55,7 @@ class VotingScheme(object):
 
         self.transformation = transformation
         self.output_directory = output_directory
+        self.cache_directory = cache_directory
 
     def _load_bundles_dictionary(self):
         """
@@ -217,29 +220,22 @@ class VotingScheme(object):
         thresholds = [45, 35, 25, 12]
         rng = np.random.RandomState(seed)
         cluster_timer = time()
-        with warnings.catch_warnings(record=True) as _:
-            cluster_map = qbx_and_merge(wb_streamlines,
-                                        thresholds,
-                                        nb_pts=12, rng=rng,
-                                        verbose=False)
-        clusters_indices = []
-        for cluster in cluster_map.clusters:
-            clusters_indices.append(cluster.indices)
-        centroids = ArraySequence(cluster_map.centroids)
-        clusters_indices = ArraySequence(clusters_indices)
-        clusters_indices._data = clusters_indices._data.astype(np.uint32)
+        centroids, clusters_indices = qbx_and_merge_cached(
+            wb_streamlines, thresholds, nb_pts=12, rng=rng,
+            cache_directory=self.cache_directory)
 
         logging.info('QBx with seed {0} at 12mm took {1}sec. gave '
                      '{2} centroids'.format(seed,
                                             round(time() - cluster_timer, 2),
-                                            len(cluster_map.centroids)))
+                                            len(centroids)))
 
         concat_sft.streamlines._data = concat_sft.streamlines._data.astype(
             'float16')
         tmp_dir, tmp_memmap_filenames = streamlines_to_memmap(wb_streamlines,
                                                               'float16')
         rbx = RecobundlesX(tmp_memmap_filenames,
-                           clusters_indices, centroids)
+                           clusters_indices, centroids,
+                           cache_directory=self.cache_directory)
 
         # Separating the case nbr_processes=1 to help get good coverage metrics
         # (codecov does not deal well with multiprocessing)
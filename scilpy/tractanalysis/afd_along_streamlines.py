@@ -3,11 +3,13 @@
 from dipy.data import get_sphere
 from dipy.reconst.shm import sh_to_sf_matrix, sph_harm_ind_list
 import numpy as np
+from scipy.spatial import cKDTree
 from scipy.special import lpn
 
 from scilpy.reconst.utils import find_order_from_nb_coeff
 from scilpy.tractanalysis.voxel_boundary_intersection import\
     subdivide_streamlines_at_voxel_faces
+from scilpy.tractograms.streamline_operations import get_segment_starts
 
 
 def afd_map_along_streamlines(sft, fodf, fodf_basis, length_weighting,
@@ -50,11 +52,15 @@ def afd_map_along_streamlines(sft, fodf, fodf_basis, length_weighting,
 
 
 def afd_and_rd_sums_along_streamlines(sft, fodf, fodf_basis,
-                                      length_weighting, is_legacy=True):
+                                      length_weighting, is_legacy=True,
+                                      chunk_size=100000):
     """
     Compute the mean Apparent Fiber Density (AFD) and mean Radial fODF (radfODF)
     maps along a bundle.
 
+    All segments (split at voxel faces) are processed at once, by chunks of
+    chunk_size segments.
+
     Parameters
     ----------
     sft : StatefulTractogram
@@ -68,6 +74,8 @@ def afd_and_rd_sums_along_streamlines(sft, fodf, fodf_basis,
         If set, will weigh the AFD values according to segment lengths.
     is_legacy : bool, optional
         Whether or not the SH basis is in its legacy form.
+    chunk_size : int, optional
+        Number of segments processed at once. Limits the memory usage.
 
     Returns
     -------
@@ -88,54 +96,59 @@ def afd_and_rd_sums_along_streamlines(sft, fodf, fodf_basis,
     b_matrix, _ = sh_to_sf_matrix(sphere, order, fodf_basis, legacy=is_legacy)
     _, n = sph_harm_ind_list(order)
     legendre0_at_n = lpn(order, 0)[0][n]
-    sphere_norm = np.linalg.norm(sphere.vertices)
 
     afd_sum_map = np.zeros(shape=fodf_data.shape[:-1])
     rd_sum_map = np.zeros(shape=fodf_data.shape[:-1])
     weight_map = np.zeros(shape=fodf_data.shape[:-1])
 
-    p_matrix = np.eye(fodf_data.shape[3]) * legendre0_at_n
+    # SH basis rows of each sphere vertex, for the AFD and the radial fODF.
+    afd_rows = b_matrix.T
+    rd_rows = afd_rows * legendre0_at_n
+
     all_split_streamlines =\
         subdivide_streamlines_at_voxel_faces(sft.streamlines)
-    for split_streamlines in all_split_streamlines:
-        segments = split_streamlines[1:] - split_streamlines[:-1]
+    points, seg_starts = get_segment_starts(all_split_streamlines)
+
+    zooms_norm = np.linalg.norm(fodf.header.get_zooms()[:3])
+    vertices_tree = cKDTree(sphere.vertices)
+    for chunk in range(0, len(seg_starts), chunk_size):
+        starts = seg_starts[chunk:chunk + chunk_size]
+        segments = points[starts + 1] - points[starts]
         seg_lengths = np.linalg.norm(segments, axis=1)
 
         # Remove points where the segment is zero.
-        # This removes numpy warnings of division by zero.
-        non_zero_lengths = np.nonzero(seg_lengths)[0]
+        non_zero_lengths = seg_lengths > 0
+        starts = starts[non_zero_lengths]
         segments = segments[non_zero_lengths]
         seg_lengths = seg_lengths[non_zero_lengths]
 
-        test = np.dot(segments, sphere.vertices.T)
-        test2 = (test.T / (seg_lengths * sphere_norm)).T
-        angles = np.arccos(test2)
-        sorted_angles = np.argsort(angles, axis=1)
-        closest_vertex_indices = sorted_angles[:, 0]
+        # The closest vertex has the smallest angle, i.e. the largest dot
+        # product, i.e. the smallest distance to the unit segment direction.
+        _, closest_vertex_indices = vertices_tree.query(
+            segments / seg_lengths[:, None])
 
         # Those starting points are used for the segment vox_idx computations
-        strl_start = split_streamlines[non_zero_lengths]
-        vox_indices = (strl_start + (0.5 * segments)).astype(int)
+        vox_indices = (points[starts] + (0.5 * segments)).astype(int)
+        flat_indices = np.ravel_multi_index(vox_indices.T, afd_sum_map.shape)
+
+        fodf_at_indices = fodf_data[tuple(vox_indices.T)]
+        afd_vals = np.einsum('ij,ij->i', afd_rows[closest_vertex_indices],
+                             fodf_at_indices)
+        rd_vals = np.einsum('ij,ij->i', rd_rows[closest_vertex_indices],
+                            fodf_at_indices)
 
         normalization_weights = np.ones_like(seg_lengths)
         if length_weighting:
-            normalization_weights = seg_lengths / \
-                np.linalg.norm(fodf.header.get_zooms()[:3])
-
-        for vox_idx, closest_vertex_index, norm_weight in zip(vox_indices,
-                                                              closest_vertex_indices,
-                                                              normalization_weights):
-            vox_idx = tuple(vox_idx)
-            b_at_idx = b_matrix.T[closest_vertex_index]
-            fodf_at_index = fodf_data[vox_idx]
-
-            afd_val = np.dot(b_at_idx, fodf_at_index)
-            rd_val = np.dot(np.dot(b_at_idx.T, p_matrix),
-                            fodf_at_index)
-
-            afd_sum_map[vox_idx] += afd_val * norm_weight
-            rd_sum_map[vox_idx] += rd_val * norm_weight
-            weight_map[vox_idx] += norm_weight
+            normalization_weights = seg_lengths / zooms_norm
+
+        # Accumulating all segments of each voxel
+        for sum_map, values in [
+                (afd_sum_map, afd_vals * normalization_weights),
+                (rd_sum_map, rd_vals * normalization_weights),
+                (weight_map, normalization_weights)]:
+            sum_map += np.bincount(flat_indices, weights=values,
+                                   minlength=sum_map.size
+                                   ).reshape(sum_map.shape)
 
     rd_sum_map[rd_sum_map < 0.] = 0.
     return afd_sum_map, rd_sum_map, weight_map
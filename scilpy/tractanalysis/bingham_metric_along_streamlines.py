@@ -4,6 +4,7 @@ import numpy as np
 from scilpy.reconst.bingham import bingham_to_peak_direction
 from scilpy.tractanalysis.voxel_boundary_intersection import\
     subdivide_streamlines_at_voxel_faces
+from scilpy.tractograms.streamline_operations import get_segment_starts
 
 
 def bingham_metric_map_along_streamlines(sft, bingham_coeffs,
@@ -41,10 +42,14 @@ def bingham_metric_map_along_streamlines(sft, bingham_coeffs,
 
 
 def bingham_metric_sum_along_streamlines(sft, bingham_coeffs, metric,
-                                         max_theta, length_weighting):
+                                         max_theta, length_weighting,
+                                         chunk_size=100000):
     """
     Compute a sum map along a bundle for a given Bingham metric.
 
+    All segments (split at voxel faces) are processed at once, by chunks of
+    chunk_size segments.
+
     Parameters
     ----------
     sft : StatefulTractogram
@@ -58,6 +63,8 @@ def bingham_metric_sum_along_streamlines(sft, bingham_coeffs, metric,
         Bingham peak direction.
     length_weighting : bool
         If True, will weight the metric values according to segment lengths.
+    chunk_size : int, optional
+        Number of segments processed at once. Limits the memory usage.
 
     Returns
     -------
@@ -74,44 +81,58 @@ def bingham_metric_sum_along_streamlines(sft, bingham_coeffs, metric,
     weight_map = np.zeros(metric.shape[:-1])
     min_cos_theta = np.cos(np.radians(max_theta))
 
+    # Peak directions are computed once per voxel, when first traversed.
+    peak_dir = np.zeros(bingham_coeffs.shape[:-1] + (3,))
+    has_peak_dir = np.zeros(weight_map.shape, dtype=bool)
+
     all_split_streamlines =\
         subdivide_streamlines_at_voxel_faces(sft.streamlines)
-    for split_streamlines in all_split_streamlines:
-        segments = split_streamlines[1:] - split_streamlines[:-1]
+    points, seg_starts = get_segment_starts(all_split_streamlines)
+
+    for chunk in range(0, len(seg_starts), chunk_size):
+        starts = seg_starts[chunk:chunk + chunk_size]
+        segments = points[starts + 1] - points[starts]
         seg_lengths = np.linalg.norm(segments, axis=1)
 
         # Remove points where the segment is zero.
         # This removes numpy warnings of division by zero.
-        non_zero_lengths = np.nonzero(seg_lengths)[0]
+        non_zero_lengths = seg_lengths > 0
+        starts = starts[non_zero_lengths]
         segments = segments[non_zero_lengths]
         seg_lengths = seg_lengths[non_zero_lengths]
 
         # Those starting points are used for the segment vox_idx computations
-        seg_start = split_streamlines[non_zero_lengths]
-        vox_indices = (seg_start + (0.5 * segments)).astype(int)
+        vox_indices = (points[starts] + (0.5 * segments)).astype(int)
+        vox_tuple = tuple(vox_indices.T)
+        flat_indices = np.ravel_multi_index(vox_tuple, weight_map.shape)
 
         normalization_weights = np.ones_like(seg_lengths)
         if length_weighting:
             normalization_weights = seg_lengths
 
-        normalized_seg = np.reshape(segments / seg_lengths[..., None], (-1, 3))
-
-        for vox_idx, seg_dir, norm_weight in zip(vox_indices,
-                                                 normalized_seg,
-                                                 normalization_weights):
-            vox_idx = tuple(vox_idx)
-            bingham_at_idx = bingham_coeffs[vox_idx]  # (5, N_PARAMS)
-
-            bingham_peak_dir = bingham_to_peak_direction(bingham_at_idx)
-            cos_theta = np.abs(np.dot(seg_dir.reshape((-1, 3)),
-                                      bingham_peak_dir.T))
-
-            metric_val = 0.0
-            if (cos_theta > min_cos_theta).any():
-                lobe_idx = np.argmax(np.squeeze(cos_theta), axis=0)  # (n_segs)
-                metric_val = metric[vox_idx][lobe_idx]
-
-            metric_sum_map[vox_idx] += metric_val * norm_weight
-            weight_map[vox_idx] += norm_weight
+        normalized_seg = segments / seg_lengths[..., None]
+
+        # Peak directions of the voxels traversed for the first time.
+        new_voxels = np.unique(
+            flat_indices[~has_peak_dir.ravel()[flat_indices]])
+        new_voxels = np.unravel_index(new_voxels, weight_map.shape)
+        peak_dir[new_voxels] = bingham_to_peak_direction(
+            bingham_coeffs[new_voxels])
+        has_peak_dir[new_voxels] = True
+
+        # Lobe of each segment: the best aligned peak, if close enough.
+        bingham_peak_dir = peak_dir[vox_tuple]  # (n_segs, 5, 3)
+        cos_theta = np.abs(np.einsum('ij,ikj->ik', normalized_seg,
+                                     bingham_peak_dir))
+        aligned = np.any(cos_theta > min_cos_theta, axis=1)
+        lobe_idx = np.argmax(cos_theta, axis=1)
+        metric_val = np.where(aligned, metric[vox_tuple + (lobe_idx,)], 0.0)
+
+        metric_sum_map += np.bincount(
+            flat_indices, weights=metric_val * normalization_weights,
+            minlength=weight_map.size).reshape(weight_map.shape)
+        weight_map += np.bincount(
+            flat_indices, weights=normalization_weights,
+            minlength=weight_map.size).reshape(weight_map.shape)
 
     return metric_sum_map, weight_map
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 
-from itertools import count, takewhile
+from itertools import count, repeat, takewhile
 import logging
+import multiprocessing
+import os
+import tempfile
 
 from dipy.segment.clustering import QuickBundles
 from dipy.segment.featurespeed import ResampleFeature
@@ -230,19 +233,85 @@ def prune(streamlines, threshold, features):
     return outlier_indices, rest_indices
 
 
+def _hierarchical_qb_init(streamlines_file_name):
+    """
+    Loads the resampled streamlines in each subprocess of the pool, as a
+    read-only memmap shared by all subprocesses.
+    """
+    global multiprocess_streamlines
+    multiprocess_streamlines = np.load(streamlines_file_name, mmap_mode='r')
+
+
+def _hierarchical_qb_parallel(args):
+    (thresholds, ordering) = args
+
+    return _hierarchical_qb_path_lengths(multiprocess_streamlines,
+                                         thresholds, ordering)
+
+
+def _hierarchical_qb_path_lengths(streamlines, thresholds, ordering):
+    """
+    Runs the hierarchical Quickbundles for one ordering of the streamlines.
+    Clusters of more than 10 streamlines are clustered again at the next
+    threshold.
+
+    Parameters
+    ----------
+    streamlines: np.ndarray
+        Streamlines, all resampled to the same number of points, of shape
+        (nb_streamlines, nb_points, 3).
+    thresholds: list of float
+        Quickbundles distance threshold of each level.
+    ordering: np.ndarray
+        Order in which the streamlines are clustered at the first level.
+
+    Returns
+    -------
+    path_lengths: np.ndarray
+        Number of levels in which each streamline was clustered.
+    """
+    metric = AveragePointwiseEuclideanMetric()
+    path_lengths = np.zeros(len(streamlines), dtype=int)
+
+    cluster_orderings = [ordering]
+    for threshold in thresholds:
+        next_cluster_orderings = []
+        qb = QuickBundles(metric=metric, threshold=threshold)
+        for cluster_ordering in cluster_orderings:
+            clusters = qb.cluster(streamlines, ordering=cluster_ordering)
+            path_lengths[cluster_ordering] += 1
+
+            for cluster in clusters:
+                if len(cluster) > 10:
+                    next_cluster_orderings.append(cluster.indices)
+
+        cluster_orderings = next_cluster_orderings
+
+    return path_lengths
+
+
 def outliers_removal_using_hierarchical_quickbundles(streamlines,
                                                      nb_points=12,
                                                      min_threshold=0.5,
                                                      nb_samplings_max=30,
                                                      sampling_seed=1234,
-                                                     fast_approx=False):
+                                                     fast_approx=False,
+                                                     nbr_processes=1):
     """
     Classify inliers and outliers from a list of streamlines.
 
+    The streamlines are resampled once, and each sampling (a random ordering
+    of the streamlines, clustered hierarchically) is independent. All
+    orderings are drawn from the same random generator beforehand, so the
+    result does not depend on the number of processes.
+
     Parameters
     ----------
     streamlines: list of ndarray
         The list of streamlines from which inliers and outliers are separated.
+    nb_points: int
+        Number of points to which the streamlines are resampled for
+        Quickbundles.
     min_threshold: float
         Quickbundles distance threshold for the last threshold.
     nb_samplings_max: int
@@ -250,6 +319,11 @@ def outliers_removal_using_hierarchical_quickbundles(streamlines,
         A different sampling is used each time.
     sampling_seed: int
         Random number generation initialization seed.
+    fast_approx: bool
+        If true, uses a fixed list of thresholds instead of thresholds
+        starting from the bounding box size.
+    nbr_processes: int
+        Number of sub-processes, each running whole samplings.
 
     Returns
     -------
@@ -259,8 +333,6 @@ def outliers_removal_using_hierarchical_quickbundles(streamlines,
         raise ValueError("'nb_samplings_max' must be >= 2")
 
     rng = np.random.RandomState(sampling_seed)
-    resample_feature = ResampleFeature(nb_points=nb_points)
-    metric = AveragePointwiseEuclideanMetric(resample_feature)
 
     box_min, box_max = get_streamlines_bounding_box(streamlines)
 
@@ -277,45 +349,47 @@ def outliers_removal_using_hierarchical_quickbundles(streamlines,
                                (initial_threshold / 1.2**i for i in count()))
         thresholds = list(thresholds)
 
+    # The score only uses the first nb_samplings_max - 1 samplings (as it
+    # always did), so the last one is not computed. Each ordering is a new
+    # shuffle of the previous one.
     ordering = np.arange(len(streamlines))
-    path_lengths_per_streamline = 0
-
-    streamlines_path = np.ones((len(streamlines), len(thresholds),
-                                nb_samplings_max), dtype=int) * -1
-
-    for i in range(nb_samplings_max):
+    orderings = []
+    for _ in range(nb_samplings_max - 1):
         rng.shuffle(ordering)
+        orderings.append(ordering.copy())
 
-        cluster_orderings = [ordering]
-        for j, threshold in enumerate(thresholds):
-            id_cluster = 0
-
-            next_cluster_orderings = []
-            qb = QuickBundles(metric=metric, threshold=threshold)
-            for cluster_ordering in cluster_orderings:
-                clusters = qb.cluster(streamlines, ordering=cluster_ordering)
-
-                for _, cluster in enumerate(clusters):
-                    streamlines_path[cluster.indices, j, i] = id_cluster
-                    id_cluster += 1
-                    if len(cluster) > 10:
-                        next_cluster_orderings.append(cluster.indices)
-
-            cluster_orderings = next_cluster_orderings
-
-        if i <= 1:  # Needs at least two orderings to compute stderror.
-            continue
-
-        path_lengths_per_streamline = np.sum((streamlines_path != -1),
-                                             axis=1)[:, :i]
+    # Resampled once for all samplings and thresholds.
+    resampled = np.asarray(set_number_of_points(streamlines, nb_points),
+                           dtype=np.float32)
 
+    if nbr_processes == 1:
+        path_lengths_per_streamline = [
+            _hierarchical_qb_path_lengths(resampled, thresholds, ordering)
+            for ordering in orderings]
+    else:
+        # The resampled streamlines are saved once and memmapped by all
+        # subprocesses.
+        with tempfile.TemporaryDirectory() as tmpdir:
+            streamlines_file_name = os.path.join(tmpdir, 'streamlines.npy')
+            np.save(streamlines_file_name, resampled)
+
+            pool = multiprocessing.Pool(nbr_processes,
+                                        initializer=_hierarchical_qb_init,
+                                        initargs=(streamlines_file_name,))
+            path_lengths_per_streamline = pool.map(
+                _hierarchical_qb_parallel, zip(repeat(thresholds), orderings))
+            pool.close()
+            pool.join()
+
+    path_lengths_per_streamline = np.stack(path_lengths_per_streamline,
+                                           axis=1)
     summary = np.mean(path_lengths_per_streamline,
                       axis=1) / np.max(path_lengths_per_streamline)
     return summary
 
 
 def remove_outliers_qb(streamlines, threshold, nb_points=12, nb_samplings=30,
-                       fast_approx=False):
+                       fast_approx=False, nbr_processes=1):
     """
     Wrapper to classify inliers and outliers from a list of streamlines. Uses
     Quickbundles to separate streamlines that are different.
@@ -329,6 +403,8 @@ def remove_outliers_qb(streamlines, threshold, nb_points=12, nb_samplings=30,
     nb_points: int
     nb_samplings: int
     fast_approx: bool
+    nbr_processes: int
+        Number of sub-processes, each running whole samplings.
 
     Returns
     -------
@@ -338,7 +414,7 @@ def remove_outliers_qb(streamlines, threshold, nb_points=12, nb_samplings=30,
     """
     summary = outliers_removal_using_hierarchical_quickbundles(
         streamlines, nb_points=nb_points, nb_samplings_max=nb_samplings,
-        fast_approx=fast_approx)
+        fast_approx=fast_approx, nbr_processes=nbr_processes)
     outliers_ids, inliers_ids = prune(streamlines, threshold, summary)
 
     return outliers_ids, inliers_ids
@@ -1,5 +1,4 @@
 # -*- coding: utf-8 -*-
-import itertools
 import logging
 import os
 
@@ -9,10 +8,10 @@ from dipy.tracking.streamlinespeed import length
 from nibabel.streamlines import ArraySequence
 
 from scilpy.io.hdf5 import construct_hdf5_group_from_streamlines
-from scilpy.io.streamlines import save_tractogram
+from scilpy.io.streamlines import reconstruct_streamlines, save_tractogram
 from scilpy.tractanalysis.bundle_operations import remove_outliers_qb
 from scilpy.tractograms.streamline_and_mask_operations import \
-    compute_streamline_segment
+    _compute_streamline_segments
 from scilpy.tractograms.streamline_operations import \
     (remove_loops as perform_remove_loops,
      remove_sharp_turns_qb,
@@ -87,11 +86,79 @@ def extract_longest_segments_from_profile(strl_indices, atlas_data):
              'end_index': end_idx}]
 
 
-def compute_connectivity(indices, atlas_data, real_labels, segmenting_func):
+def _extract_longest_segments_from_profiles(indices, atlas_data):
+    """
+    Same as extract_longest_segments_from_profile, for all streamlines at
+    once, on the concatenated voxels of all streamlines.
+
+    Parameters
+    ----------
+    indices: ArraySequence
+        The 3D indices [i, j, k] of all voxels traversed by all streamlines
+        (output of uncompress).
+    atlas_data: np.ndarray
+        The loaded image containing the labels.
+
+    Returns
+    -------
+    strl_idx: np.ndarray
+        Index of the connecting streamlines.
+    start_index, end_index: np.ndarray
+        Position, in the streamline's voxels, of the first and last labelled
+        voxels.
+    start_label, end_label: np.ndarray
+        Labels of these voxels.
+    """
+    # Voxels of all streamlines, contiguous (no copy if already the case,
+    # i.e. if indices is not a slice of another ArraySequence).
+    voxels = reconstruct_streamlines(indices._data, indices._offsets,
+                                     indices._lengths)._data
+    lengths = np.asarray(indices._lengths, dtype=np.intp)
+    offsets = np.cumsum(lengths) - lengths
+    voxel_strl = np.repeat(np.arange(len(lengths)), lengths)
+
+    # Labels of all voxels, in one lookup. Streamlines out of bound are
+    # skipped.
+    in_bound = np.all(voxels < atlas_data.shape, axis=1)
+    labels = np.zeros(len(voxels), dtype=atlas_data.dtype)
+    labels[in_bound] = atlas_data[tuple(voxels[in_bound].T)]
+    valid_strl = np.ones(len(lengths), dtype=bool)
+    valid_strl[voxel_strl[~in_bound]] = False
+
+    # First and last labelled voxels of each streamline (if any).
+    labelled = np.flatnonzero(labels > 0)
+    strl_idx = voxel_strl[labelled]
+    first = np.flatnonzero(np.diff(strl_idx, prepend=-1))
+    last = np.flatnonzero(np.diff(strl_idx, append=len(lengths)))
+    strl_idx = strl_idx[first]
+    start = labelled[first]
+    end = labelled[last]
+
+    # The streamline must then reach the WM (label 0) before its second to
+    # last voxel, and end in another labelled voxel.
+    wm = np.flatnonzero(labels == 0)
+    next_wm = np.searchsorted(wm, start, side='right')
+    found_wm = next_wm < len(wm)
+    found_wm[found_wm] = wm[next_wm[found_wm]] < \
+        (offsets + lengths - 1)[strl_idx[found_wm]]
+
+    keep = valid_strl[strl_idx] & found_wm & (end > start + 1)
+    strl_idx = strl_idx[keep]
+    start = start[keep]
+    end = end[keep]
+    return (strl_idx, start - offsets[strl_idx], end - offsets[strl_idx],
+            labels[start], labels[end])
+
+
+def compute_connectivity(
+        indices, atlas_data, real_labels,
+        segmenting_func=extract_longest_segments_from_profile):
     """
     Segments a tractogram into "bundles", or "connections" between all pairs
     of labels.
 
+    With the default segmenting_func, all streamlines are processed at once.
+
     Parameters
     ----------
     indices: ArraySequence
@@ -100,7 +167,8 @@ def compute_connectivity(indices, atlas_data, real_labels, segmenting_func):
     atlas_data: np.ndarray
         The loaded image containing the labels.
     real_labels: np.ndarray
-        The list of labels of interest in the image.
+        The list of labels of interest in the image. Connections with other
+        labels are discarded.
     segmenting_func: Callable
         The function used for segmentation.
         Ex: extract_longest_segments_from_profile
@@ -108,36 +176,70 @@ def compute_connectivity(indices, atlas_data, real_labels, segmenting_func):
     Returns
     -------
     connectivity: dict
-        A dict containing one key per real_labels (ex, 1, 2) (starting point).
-
-        - The value of connectivity[1] is again a dict with again the
-            real_labels as keys.
+        A dict of flat arrays, with one value per connecting streamline:
 
-        - The value of connectivity[1][2] is a list of length n, where n is
-            the number of streamlines starting in 1 and finishing in 2. Each
-            value is a dict of the following shape:
+           >>> 'strl_idx': The index of the streamline in the raw data.
+           >>> 'in_idx': The index of its first voxel in the connection.
+           >>> 'out_idx': The index of its last voxel in the connection.
+           >>> 'start_label', 'end_label': The labels at both ends.
 
-           >>> 'strl_idx': int --> The idex of the streamline in the raw data.
-           >>> 'in_idx:    int -->
-           >>> 'out_idx': int  -->
+        Streamlines are grouped by connection, i.e. by pair of labels
+        (regardless of their order), as in construct_hdf5_from_connectivity.
+        Connections between different labels come first, sorted by labels,
+        then connections from a label to itself.
     """
-    connectivity = {k: {lab: [] for lab in real_labels} for k in real_labels}
-
-    # toDo. real_labels is not used in segmenting func!
-    for strl_idx, strl_vox_indices in enumerate(indices):
-        # Managing streamlines out of bound.
-        if (np.array(strl_vox_indices) > atlas_data.shape).any():
-            continue
-
-        # Finding start_label and end_label.
-        segments_info = segmenting_func(strl_vox_indices, atlas_data)
-        for si in segments_info:
-            connectivity[si['start_label']][si['end_label']].append(
-                {'strl_idx': strl_idx,
-                 'in_idx': si['start_index'],
-                 'out_idx': si['end_index']})
+    if segmenting_func is extract_longest_segments_from_profile:
+        strl_idx, in_idx, out_idx, start_label, end_label = \
+            _extract_longest_segments_from_profiles(indices, atlas_data)
+    else:
+        infos = []
+        for idx, strl_vox_indices in enumerate(indices):
+            # Managing streamlines out of bound.
+            if (np.array(strl_vox_indices) > atlas_data.shape).any():
+                continue
+
+            # Finding start_label and end_label.
+            for si in segmenting_func(strl_vox_indices, atlas_data):
+                infos.append((idx, si['start_index'], si['end_index'],
+                              si['start_label'], si['end_label']))
+        infos = np.array(infos, dtype=np.int64).reshape((-1, 5))
+        strl_idx, in_idx, out_idx, start_label, end_label = infos.T
+
+    keep = np.isin(start_label, real_labels) & np.isin(end_label, real_labels)
+    connectivity = {'strl_idx': strl_idx[keep],
+                    'in_idx': in_idx[keep],
+                    'out_idx': out_idx[keep],
+                    'start_label': start_label[keep],
+                    'end_label': end_label[keep]}
+
+    # Grouping by connection: streamlines from the lowest label first, then
+    # from the highest label.
+    low = np.minimum(connectivity['start_label'], connectivity['end_label'])
+    high = np.maximum(connectivity['start_label'], connectivity['end_label'])
+    order = np.lexsort((connectivity['strl_idx'],
+                        connectivity['start_label'] != low,
+                        high, low, low == high))
+    return {key: value[order] for key, value in connectivity.items()}
+
+
+def _get_connections(con_info):
+    """
+    Finds the connections (pairs of labels) in the result of
+    compute_connectivity.
 
-    return connectivity
+    Returns
+    -------
+    connections: list of tuple
+        (in_label, out_label, first, last) for each connection, where
+        first:last are the positions of its streamlines in con_info.
+    """
+    low = np.minimum(con_info['start_label'], con_info['end_label'])
+    high = np.maximum(con_info['start_label'], con_info['end_label'])
+    new_connection = np.flatnonzero((np.diff(low, prepend=-1) != 0) |
+                                    (np.diff(high, prepend=-1) != 0))
+    ends = np.append(new_connection[1:], len(low))
+    return [(low[first], high[first], first, last)
+            for first, last in zip(new_connection, ends)]
 
 
 def construct_hdf5_from_connectivity(
@@ -147,7 +249,7 @@ def construct_hdf5_from_connectivity(
         remove_loops, loop_max_angle,               # step 2
         remove_outliers, outlier_threshold,         # step 3
         remove_curv_dev, curv_qb_distance,          # step 4
-        nbr_cpu
+        nbr_cpu=1
 ):
     """
     Parameters
@@ -161,7 +263,8 @@ def construct_hdf5_from_connectivity(
     real_labels: np.ndarray
         The labels.
     con_info: dict
-        The result from compute_connectivity.
+        The result from compute_connectivity. Connections without
+        streamlines are not saved in the hdf5.
     hdf5_file: hdf5 file
         The opened hdf5_file to which to add the bundles (as groups).
     saving_options: dict
@@ -187,54 +290,37 @@ def construct_hdf5_from_connectivity(
         If true, remove sharp turns base on Quickbundles. Else skip step 4.
     curv_qb_distance: float
     nbr_cpu: int
-        Number of cpu for steps allowing multiprocessing.
+        Unused, kept for backward compatibility: loops are removed without
+        multiprocessing.
     """
     sft.to_vox()
     sft.to_corner()
 
-    comb_list = list(itertools.combinations(real_labels, r=2))
-    comb_list.extend(zip(real_labels, real_labels))
+    # Preparing streamlines. Keeping only the segment between the two
+    # associated labels, for all connections at once.
+    logging.debug("Keeping only the segments between the two associated "
+                  "labels for each streamline. Any data_per_point will be "
+                  "lost.")
+    vox_offsets = np.asarray(indices._offsets, dtype=np.intp)[
+        con_info['strl_idx']]
+    all_segments = _compute_streamline_segments(
+        sft.streamlines, indices, points_to_idx, con_info['strl_idx'],
+        vox_offsets + con_info['in_idx'], vox_offsets + con_info['out_idx'])
 
     # Each connection is processed independently. Multiprocessing would be
     # a burden on the I/O of most SSD/HD.
-    iteration_counter = 0
-    for in_label, out_label in comb_list:
-        iteration_counter += 1
-        if iteration_counter > 0 and iteration_counter % 100 == 0:
+    connections = _get_connections(con_info)
+    for iteration_counter, (in_label, out_label, first, last) in \
+            enumerate(connections, start=1):
+        if iteration_counter % 100 == 0:
             logging.info('Processing connection {}/{}'
-                         .format(iteration_counter, len(comb_list)))
+                         .format(iteration_counter, len(connections)))
         logging.debug('Processing connection {}/{}: labels {} - {}'
-                      .format(iteration_counter, len(comb_list),
+                      .format(iteration_counter, len(connections),
                               in_label, out_label))
 
-        # Extracting this connection's info from the big dict con_info
-        pair_info = []
-        if out_label in con_info[in_label]:
-            pair_info.extend(con_info[in_label][out_label])
-        if in_label in con_info[out_label]:
-            pair_info.extend(con_info[out_label][in_label])
-        if len(pair_info) == 0:
-            logging.debug("No streamlines found for this connection: not "
-                          "saving in the hdf5.")
-            continue
-
-        # Preparing streamlines. Keeping only the segment between the two
-        # associated labels.
-        logging.debug("- Keeping only the segments between the two associated "
-                      "labels for each streamline. Any data_per_point will be "
-                      "lost.")
-        current_streamlines = []
-        connecting_ids = []
-        for connection in pair_info:
-            strl_idx = connection['strl_idx']
-            curr_streamlines = compute_streamline_segment(
-                sft.streamlines[strl_idx],
-                indices[strl_idx],
-                connection['in_idx'],
-                connection['out_idx'],
-                points_to_idx[strl_idx])
-            current_streamlines.append(curr_streamlines)
-            connecting_ids.append(strl_idx)
+        current_streamlines = all_segments[first:last]
+        connecting_ids = con_info['strl_idx'][first:last]
         raw_dps = sft.data_per_streamline[connecting_ids]
         current_sft = StatefulTractogram.from_sft(current_streamlines, sft,
                                                   data_per_streamline=raw_dps,
@@ -285,8 +371,8 @@ def construct_hdf5_from_connectivity(
         if remove_loops:
             logging.debug("- Step 2: Removing loops > {}"
                           .format(loop_max_angle))
-            no_loop_ids, _ = perform_remove_loops(
-                current_sft.streamlines, loop_max_angle, num_processes=nbr_cpu)
+            no_loop_ids, _ = perform_remove_loops(current_sft.streamlines,
+                                                  loop_max_angle)
             loop_ids = np.setdiff1d(np.arange(len(current_sft)), no_loop_ids)
 
             # Discarded:
@@ -1,38 +1,66 @@
 # -*- coding: utf-8 -*-
 
 import numpy as np
+from scipy.sparse import csr_matrix
 from scipy.spatial import KDTree
 
 
-def min_dist_to_centroid(bundle_pts, centroid_pts, nb_pts):
+def min_dist_to_centroid(bundle_pts, centroid_pts, nb_pts, nb_neighbors=1):
     """
     Compute minimal distance to centroids
 
+    Each bundle point is labelled with the section of its closest centroid
+    point. With nb_neighbors > 1, the nb_neighbors closest centroid points
+    vote for their section, weighted by their distance (closer points have
+    more weight). The votes of all points are summed at once in a sparse
+    matrix of shape (nb_bundle_points, nb_pts).
+
     Parameters
     ----------
     bundles_pts: np.array
+        Points of the bundle (ex, sft.streamlines._data).
     centroid_pts: np.array
+        Points of the centroid(s), each resampled to nb_pts points.
     nb_pts: int
+        Number of points (sections) per centroid.
+    nb_neighbors: int
+        Number of closest centroid points voting for the label of each bundle
+        point.
 
     Returns
     -------
-    Array:
+    labels: np.ndarray of uint16
+        Label of each bundle point, in range [0, nb_pts[.
+    dists: np.ndarray
+        Average distance of each bundle point to its nb_neighbors closest
+        centroid points.
     """
+    nb_neighbors = min(nb_neighbors, len(centroid_pts))
     tree = KDTree(centroid_pts, copy_data=True)
-    dists, labels = tree.query(bundle_pts, k=1)
-    dists, labels = np.expand_dims(
-        dists, axis=1), np.expand_dims(labels, axis=1)
-
+    dists, labels = tree.query(bundle_pts, k=nb_neighbors)
     labels = np.mod(labels, nb_pts)
 
-    sum_dist = np.expand_dims(np.sum(dists, axis=1), axis=1)
-    weights = np.exp(-dists / sum_dist)
+    if nb_neighbors == 1:
+        # A single vote per point.
+        return labels.astype(np.uint16), dists
+
+    sum_dist = np.sum(dists, axis=1, keepdims=True)
+    weights = np.exp(-np.divide(dists, sum_dist, out=np.zeros_like(dists),
+                                where=sum_dist > 0))
+
+    # Votes for the same section are summed (and sorted by section) in the
+    # sparse matrix. Every row has at least one vote.
+    indptr = np.arange(0, labels.size + 1, nb_neighbors)
+    votes = csr_matrix((weights.ravel(), labels.ravel(), indptr),
+                       shape=(len(bundle_pts), nb_pts))
+    votes.sum_duplicates()
+    nb_votes = np.diff(votes.indptr)
+    max_votes = np.maximum.reduceat(votes.data, votes.indptr[:-1])
 
-    votes = []
-    for i in range(len(bundle_pts)):
-        vote = np.bincount(labels[i], weights=weights[i])
-        total = np.arange(np.amax(labels[i])+1)
-        winner = total[np.argmax(vote)]
-        votes.append(winner)
+    # Ties go to the lowest section.
+    is_max = votes.data == np.repeat(max_votes, nb_votes)
+    rows = np.repeat(np.arange(len(bundle_pts)), nb_votes)[is_max]
+    _, first_max = np.unique(rows, return_index=True)
+    winners = votes.indices[is_max][first_max]
 
-    return np.array(votes, dtype=np.uint16), np.average(dists, axis=1)
+    return winners.astype(np.uint16), np.average(dists, axis=1)
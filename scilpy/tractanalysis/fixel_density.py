@@ -1,19 +1,34 @@
 import itertools
 import multiprocessing
+import os
+import tempfile
+
 import numpy as np
 
 from dipy.io.streamline import load_tractogram
 from scilpy.tractanalysis.voxel_boundary_intersection import\
     subdivide_streamlines_at_voxel_faces
+from scilpy.tractograms.streamline_operations import get_segment_starts
+
+
+def _fixel_density_init(peaks_file_name):
+    """
+    Loads the peaks in each subprocess of the pool, as a read-only memmap
+    shared by all subprocesses.
+    """
+    global multiprocess_peaks
+    multiprocess_peaks = np.load(peaks_file_name, mmap_mode='r')
 
 
 def _fixel_density_parallel(args):
-    (peaks, max_theta, dps_key, bundle) = args
+    (max_theta, dps_key, bundle) = args
 
-    return _fixel_density_single_bundle(bundle, peaks, max_theta, dps_key)
+    return _fixel_density_single_bundle(bundle, multiprocess_peaks,
+                                        max_theta, dps_key)
 
 
-def _fixel_density_single_bundle(bundle, peaks, max_theta, dps_key):
+def _fixel_density_single_bundle(bundle, peaks, max_theta, dps_key,
+                                 chunk_size=100000):
     sft = load_tractogram(bundle, 'same')
     sft.to_vox()
     sft.to_corner()
@@ -24,43 +39,58 @@ def _fixel_density_single_bundle(bundle, peaks, max_theta, dps_key):
 
     all_split_streamlines =\
         subdivide_streamlines_at_voxel_faces(sft.streamlines)
-    for i, split_streamlines in enumerate(all_split_streamlines):
-        segments = split_streamlines[1:] - split_streamlines[:-1]
+    points, seg_starts = get_segment_starts(all_split_streamlines)
+    lengths = np.asarray(all_split_streamlines._lengths)
+    seg_streamline_ids = np.repeat(np.arange(len(lengths)),
+                                   lengths)[seg_starts]
+
+    weights = np.ones(len(lengths))
+    if dps_key:
+        weights = np.asarray(
+            sft.data_per_streamline[dps_key]).reshape(len(lengths))
+
+    for chunk in range(0, len(seg_starts), chunk_size):
+        starts = seg_starts[chunk:chunk + chunk_size]
+        segments = points[starts + 1] - points[starts]
         seg_lengths = np.linalg.norm(segments, axis=1)
 
         # Remove points where the segment is zero.
         # This removes numpy warnings of division by zero.
-        non_zero_lengths = np.nonzero(seg_lengths)[0]
+        non_zero_lengths = seg_lengths > 0
+        starts = starts[non_zero_lengths]
         segments = segments[non_zero_lengths]
         seg_lengths = seg_lengths[non_zero_lengths]
+        seg_weights = weights[
+            seg_streamline_ids[chunk:chunk + chunk_size][non_zero_lengths]]
 
         # Those starting points are used for the segment vox_idx computations
-        seg_start = split_streamlines[non_zero_lengths]
-        vox_indices = (seg_start + (0.5 * segments)).astype(int)
-
-        normalized_seg = np.reshape(segments / seg_lengths[..., None], (-1, 3))
-
-        weight = 1
-        if dps_key:
-            weight = sft.data_per_streamline[dps_key][i]
-
-        for vox_idx, seg_dir in zip(vox_indices, normalized_seg):
-            vox_idx = tuple(vox_idx)
-            peaks_at_idx = peaks[vox_idx].reshape((5, 3))
-
-            cos_theta = np.abs(np.dot(seg_dir.reshape((-1, 3)),
-                                      peaks_at_idx.T))
-
-            if (cos_theta > min_cos_theta).any():
-                lobe_idx = np.argmax(np.squeeze(cos_theta), axis=0)  # (n_segs)
-                fixel_density_maps[vox_idx][lobe_idx] += weight
+        vox_indices = (points[starts] + (0.5 * segments)).astype(int)
+        normalized_seg = segments / seg_lengths[..., None]
+
+        # Angle with the 5 peaks of the voxel of each segment
+        peaks_at_idx = peaks[tuple(vox_indices.T)].reshape((-1, 5, 3))
+        cos_theta = np.abs(np.einsum('ij,ikj->ik', normalized_seg,
+                                     peaks_at_idx))
+
+        # Each segment is assigned to its closest fixel, if close enough.
+        aligned = np.any(cos_theta > min_cos_theta, axis=1)
+        lobe_idx = np.argmax(cos_theta, axis=1)
+        fixel_keys = np.ravel_multi_index(
+            tuple(vox_indices[aligned].T) + (lobe_idx[aligned],),
+            fixel_density_maps.shape)
+        fixel_density_maps += np.bincount(
+            fixel_keys, weights=seg_weights[aligned],
+            minlength=fixel_density_maps.size
+        ).reshape(fixel_density_maps.shape)
 
     return fixel_density_maps
 
 
 def fixel_density(peaks, bundles, dps_key=None, max_theta=45,
                   nbr_processes=None):
-    """Compute the fixel density map per bundle. Can use parallel processing.
+    """Compute the fixel density map per bundle. Can use parallel processing,
+    with one bundle per process. All segments of a bundle are assigned to
+    their fixel at once.
 
     Parameters
     ----------
@@ -94,14 +124,21 @@ def fixel_density(peaks, bundles, dps_key=None, max_theta=45,
             results.append(
                 _fixel_density_single_bundle(b, peaks, max_theta, dps_key))
     else:
-        pool = multiprocessing.Pool(nbr_processes)
-        results = pool.map(_fixel_density_parallel,
-                           zip(itertools.repeat(peaks),
-                               itertools.repeat(max_theta),
-                               itertools.repeat(dps_key),
-                               bundles))
-        pool.close()
-        pool.join()
+        # The peaks are saved once and memmapped by all subprocesses, instead
+        # of being sent with each bundle.
+        with tempfile.TemporaryDirectory() as tmpdir:
+            peaks_file_name = os.path.join(tmpdir, 'peaks.npy')
+            np.save(peaks_file_name, peaks)
+
+            pool = multiprocessing.Pool(nbr_processes,
+                                        initializer=_fixel_density_init,
+                                        initargs=(peaks_file_name,))
+            results = pool.map(_fixel_density_parallel,
+                               zip(itertools.repeat(max_theta),
+                                   itertools.repeat(dps_key),
+                                   bundles))
+            pool.close()
+            pool.join()
 
     fixel_density = np.moveaxis(np.asarray(results), 0, -1)
 
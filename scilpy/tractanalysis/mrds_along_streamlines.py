@@ -4,6 +4,7 @@ import numpy as np
 
 from scilpy.tractanalysis.voxel_boundary_intersection import\
     subdivide_streamlines_at_voxel_faces
+from scilpy.tractograms.streamline_operations import get_segment_starts
 
 
 def mrds_metrics_along_streamlines(sft, mrds_pdds,
@@ -46,10 +47,14 @@ def mrds_metrics_along_streamlines(sft, mrds_pdds,
 
 
 def mrds_metric_sums_along_streamlines(sft, mrds_pdds, metrics,
-                                       max_theta, length_weighting):
+                                       max_theta, length_weighting,
+                                       chunk_size=100000):
     """
     Compute a sum map along a bundle for a given fixel-specific metric.
 
+    All segments (split at voxel faces) are processed at once, by chunks of
+    chunk_size segments.
+
     Parameters
     ----------
     sft : StatefulTractogram
@@ -63,6 +68,8 @@ def mrds_metric_sums_along_streamlines(sft, mrds_pdds, metrics,
         MRDS principal diffusion direction.
     length_weighting : bool
         If True, will weight the metric values according to segment lengths.
+    chunk_size : int, optional
+        Number of segments processed at once. Limits the memory usage.
 
     Returns
     -------
@@ -80,53 +87,54 @@ def mrds_metric_sums_along_streamlines(sft, mrds_pdds, metrics,
     weight_map = np.zeros(metrics[0].shape[:-1])
     min_cos_theta = np.cos(np.radians(max_theta))
 
+    # Reshape MRDS PDDs
+    mrds_pdds = mrds_pdds.reshape(mrds_pdds.shape[0],
+                                  mrds_pdds.shape[1],
+                                  mrds_pdds.shape[2], -1, 3)
+
     all_split_streamlines =\
         subdivide_streamlines_at_voxel_faces(sft.streamlines)
-    for split_streamlines in all_split_streamlines:
-        segments = split_streamlines[1:] - split_streamlines[:-1]
+    points, seg_starts = get_segment_starts(all_split_streamlines)
+
+    for chunk in range(0, len(seg_starts), chunk_size):
+        starts = seg_starts[chunk:chunk + chunk_size]
+        segments = points[starts + 1] - points[starts]
         seg_lengths = np.linalg.norm(segments, axis=1)
 
         # Remove points where the segment is zero.
         # This removes numpy warnings of division by zero.
-        non_zero_lengths = np.nonzero(seg_lengths)[0]
+        non_zero_lengths = seg_lengths > 0
+        starts = starts[non_zero_lengths]
         segments = segments[non_zero_lengths]
         seg_lengths = seg_lengths[non_zero_lengths]
 
         # Those starting points are used for the segment vox_idx computations
-        seg_start = split_streamlines[non_zero_lengths]
-        vox_indices = (seg_start + (0.5 * segments)).astype(int)
+        vox_indices = (points[starts] + (0.5 * segments)).astype(int)
+        vox_tuple = tuple(vox_indices.T)
+        flat_indices = np.ravel_multi_index(vox_tuple, weight_map.shape)
 
         normalization_weights = np.ones_like(seg_lengths)
         if length_weighting:
             normalization_weights = seg_lengths
 
-        normalized_seg = np.reshape(segments / seg_lengths[..., None], (-1, 3))
-
-        # Reshape MRDS PDDs
-        mrds_pdds = mrds_pdds.reshape(mrds_pdds.shape[0],
-                                      mrds_pdds.shape[1],
-                                      mrds_pdds.shape[2], -1, 3)
-
-        for vox_idx, seg_dir, norm_weight in zip(vox_indices,
-                                                 normalized_seg,
-                                                 normalization_weights):
-            vox_idx = tuple(vox_idx)
-
-            mrds_peak_dir = mrds_pdds[vox_idx]
-
-            cos_theta = np.abs(np.dot(seg_dir.reshape((-1, 3)),
-                                      mrds_peak_dir.T))
-
-            metric_val = [0.0]*len(metrics)
-            if (cos_theta > min_cos_theta).any():
-                fixel_idx = np.argmax(np.squeeze(cos_theta),
-                                      axis=0)  # (n_segs)
-
-                for metric_idx, curr_metric in enumerate(metrics):
-                    metric_val[metric_idx] = curr_metric[vox_idx][fixel_idx]
-
-            for metric_idx, curr_metric in enumerate(metrics):
-                metrics_sum_map[metric_idx][vox_idx] += metric_val[metric_idx] * norm_weight
-                weight_map[vox_idx] += norm_weight
+        normalized_seg = segments / seg_lengths[..., None]
+
+        # Fixel of each segment: the best aligned PDD, if close enough.
+        cos_theta = np.abs(np.einsum('ij,ikj->ik', normalized_seg,
+                                     mrds_pdds[vox_tuple]))
+        aligned = np.any(cos_theta > min_cos_theta, axis=1)
+        fixel_idx = np.argmax(cos_theta, axis=1)
+
+        for metric_idx, curr_metric in enumerate(metrics):
+            metric_val = np.where(
+                aligned, curr_metric[vox_tuple + (fixel_idx,)], 0.0)
+            metrics_sum_map[metric_idx] += np.bincount(
+                flat_indices, weights=metric_val * normalization_weights,
+                minlength=weight_map.size).reshape(weight_map.shape)
+
+        # The weights are added once per metric.
+        weight_map += len(metrics) * np.bincount(
+            flat_indices, weights=normalization_weights,
+            minlength=weight_map.size).reshape(weight_map.shape)
 
     return metrics_sum_map, weight_map
@@ -179,8 +179,8 @@ def get_binary_maps(sft):
     if len(sft) == 0:
         return np.zeros(dimensions), np.zeros(dimensions)
 
-    bundles_voxels = compute_tract_counts_map(sft.streamlines,
-                                              dimensions).astype(np.int16)
+    bundles_voxels = compute_tract_counts_map(sft.streamlines, dimensions,
+                                              dtype=np.int16)
 
     endpoints_voxels = get_endpoints_density_map(sft).astype(np.int16)
 
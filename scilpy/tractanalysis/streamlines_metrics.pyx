@@ -6,12 +6,17 @@
 
 
 cimport cython
+from cython cimport floating
+from cython.parallel cimport prange, threadid
 import numpy as np
 cimport numpy as np
+from nibabel.streamlines.array_sequence import ArraySequence
+from scipy.sparse import csr_matrix
 
 from libc.math cimport sqrt, floor, ceil, fabs
 from libc.math cimport fmin as cfmin
 
+
 # Changing this to a memview was slower.
 @cython.boundscheck(False)
 @cython.wraparound(False)
@@ -20,169 +25,390 @@ cdef inline double norm(double x, double y, double z) nogil:
     return val
 
 
-# Changing this to a memview was slower.
 @cython.boundscheck(False)
 @cython.wraparound(False)
-cdef inline void c_get_closest_edge(double p_x, double p_y, double p_z,
-                                    double d_x, double d_y, double d_z,
-                                    np.double_t[:] edge,
-                                    double eps=1.) nogil:
-     edge[0] = floor(p_x + eps) if d_x >= 0.0 else ceil(p_x - eps)
-     edge[1] = floor(p_y + eps) if d_y >= 0.0 else ceil(p_y - eps)
-     edge[2] = floor(p_z + eps) if d_z >= 0.0 else ceil(p_z - eps)
+cdef inline void c_get_closest_edge(double *p, double *d, double *edge,
+                                    double eps=1.) noexcept nogil:
+    cdef int cno
+    for cno in range(3):
+        edge[cno] = floor(p[cno] + eps) if d[cno] >= 0.0 \
+            else ceil(p[cno] - eps)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline void c_tag_voxel(np.npy_intp el_no, np.npy_intp tag,
+                             np.npy_intp *touched_tags,
+                             np.uint32_t *traversal_tags,
+                             np.npy_intp *new_voxels,
+                             np.npy_intp *nb_new_voxels) noexcept nogil:
+    # Each voxel is counted only once per streamline.
+    if touched_tags[el_no] != tag:
+        touched_tags[el_no] = tag
+        if traversal_tags[el_no] == 0 and new_voxels != NULL:
+            new_voxels[nb_new_voxels[0]] = el_no
+            nb_new_voxels[0] += 1
+        traversal_tags[el_no] += 1
 
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
 @cython.cdivision(True)
-# IMPORTANT: Streamlines should be in voxel space, aligned to corner.
-def compute_tract_counts_map(streamlines, vol_dims):
-    flags = np.seterr(divide="ignore", under="ignore")
+cdef void c_tag_streamline(const floating[:, :] data,
+                           np.npy_intp start, np.npy_intp nb_points,
+                           np.npy_intp tag, np.npy_intp *vd,
+                           np.npy_intp *touched_tags,
+                           np.uint32_t *traversal_tags,
+                           np.npy_intp *new_voxels,
+                           np.npy_intp *nb_new_voxels) noexcept nogil:
+    """
+    Flags every voxel traversed by the streamline data[start:start+nb_points]
+    in traversal_tags, using touched_tags (which must hold a value different
+    from tag for all voxels) to count each voxel only once. If new_voxels is
+    not NULL, voxels going from 0 to 1 in traversal_tags are appended to it.
+    """
+    cdef double in_pt[3]
+    cdef double next_pt[3]
+    cdef double dir_vect[3]
+    cdef double cur_edge[3]
+    cdef np.npy_intp cur_voxel_coords[3]
+    cdef np.npy_intp pno, el_no
+    cdef int cno
+    cdef double dir_vect_norm, remaining_dist, length_ratio
 
-    # Inspired from Dipy track_counts
-    vol_dims = np.asarray(vol_dims).astype(int)
-    n_voxels = np.prod(vol_dims)
+    # x slice size (C array ordering)
+    cdef np.npy_intp x_slice_size = vd[1] * vd[2]
 
-    # This array counts the number of different tracks going through each voxel.
-    # Need to keep both the array and the memview on it to be able to
-    # reshape and return in the end.
-    traversal_tags = np.zeros((n_voxels,), dtype=int)
-    cdef np.int_t[:] traversal_tags_v = traversal_tags
+    if nb_points == 0:
+        return
 
-    # This array keeps track of whether the current track has already been
-    # flagged in a specific voxel.
-    cdef np.int_t[:] touched_tags_v = np.zeros((n_voxels,), dtype=int)
+    for cno in range(3):
+        in_pt[cno] = data[start, cno]
+        next_pt[cno] = data[start, cno]
+
+    # This loop is time-critical
+    # Changed to -1 because we get the next point in the loop
+    for pno in range(start, start + nb_points - 1):
+        # Assign current and next point, find vector between both,
+        # and use the current point as nearest edge for testing.
+        for cno in range(3):
+            in_pt[cno] = data[pno, cno]
+            next_pt[cno] = data[pno + 1, cno]
+            dir_vect[cno] = next_pt[cno] - in_pt[cno]
+            cur_edge[cno] = in_pt[cno]
+
+        # Compute norm
+        dir_vect_norm = norm(dir_vect[0], dir_vect[1], dir_vect[2])
+
+        # If consecutive coordinates are the same, skip one.
+        if dir_vect_norm == 0:
+            continue
+
+        # Set the "dist" var to compute remaining length of vector to process
+        remaining_dist = dir_vect_norm
+
+        # Check if it's already a real edge. If not, find the closest edge.
+        # Reverted the condition to help with code prediction
+        if floor(cur_edge[0]) != cur_edge[0] and \
+           floor(cur_edge[1]) != cur_edge[1] and \
+           floor(cur_edge[2]) != cur_edge[2]:
+            # All coordinates are not "integers", and therefore, not on the
+            # edge. Fetch the closest edge.
+            c_get_closest_edge(in_pt, dir_vect, cur_edge)
+
+        # TODO Could condition be optimized?
+        while True:
+            # Compute the smallest ratio of dir_vect's length to get to an
+            # edge. This effectively means we find the first edge
+            # encountered
+            # Set large value for length_ratio
+            length_ratio = 10000
+            for cno in range(3):
+                # To avoid dividing by zero.
+                # Gain in performance, since we can use
+                # @cython.cdivision(True)
+                if dir_vect[cno] != 0:
+                    length_ratio = cfmin(fabs((cur_edge[cno] - in_pt[cno]) /
+                                         dir_vect[cno]), length_ratio)
 
-    cdef int streamlines_len = len(streamlines)
+            remaining_dist -= length_ratio * dir_vect_norm
 
-    if streamlines_len == 0:
-        np.seterr(**flags)
-        return traversal_tags.reshape(vol_dims)
+            # Check if last point is already on an edge
+            if remaining_dist < 0 and not fabs(remaining_dist) < 1e-8:
+                break
 
-    # Memview to a streamline instance, which is a numpy array.
-    cdef np.double_t[:,:] t = streamlines[0].astype(np.double)
+            # Find the coordinates of voxel containing current point, to
+            # tag it in the map
+            for cno in range(3):
+                cur_voxel_coords[cno] = <np.npy_intp>floor(
+                    in_pt[cno] + 0.5 * length_ratio * dir_vect[cno])
 
-    # Memviews for points and direction vectors.
-    cdef np.double_t[:] in_pt = np.zeros(3, dtype=np.double)
-    cdef np.double_t[:] next_pt = np.zeros(3, dtype=np.double)
-    cdef np.double_t[:] dir_vect = np.zeros(3, dtype=np.double)
+            el_no = cur_voxel_coords[0] * x_slice_size + \
+                cur_voxel_coords[1] * vd[2] + cur_voxel_coords[2]
+            c_tag_voxel(el_no, tag, touched_tags, traversal_tags,
+                        new_voxels, nb_new_voxels)
 
-    # Memview for the current edge
-    cdef np.double_t[:] cur_edge = np.zeros(3, dtype=np.double)
+            # NOTE: in_pt is moved to the closest edge
+            for cno in range(3):
+                in_pt[cno] = length_ratio * dir_vect[cno] + in_pt[cno]
 
-    # Memview for the coordinates of the current voxel
-    cdef np.int_t[:] cur_voxel_coords = np.zeros(3, dtype=int)
+                # Snap really small values to 0.
+                if fabs(in_pt[cno]) <= 1e-16:
+                    in_pt[cno] = 0.0
 
-    # various temporary loop and working variables
-    #cdef:
-    #    int track_idx   # Index of the track when iterating.
-    cdef int tno, pno, cno
-    cdef np.npy_intp el_no, v
+            c_get_closest_edge(in_pt, dir_vect, cur_edge)
 
-    cdef int vd[3]
-    cdef double vxs[3]
+    # Add last point
     for cno in range(3):
-        vd[cno] = vol_dims[cno]
-    # x slice size (C array ordering)
-    cdef np.npy_intp x_slice_size = vd[1] * vd[2]
+        cur_voxel_coords[cno] = <np.npy_intp>floor(
+            in_pt[cno] + 0.5 * (next_pt[cno] - in_pt[cno]))
 
-    cdef np.double_t dir_vect_norm, remaining_dist, length_ratio
+    el_no = cur_voxel_coords[0] * x_slice_size + \
+        cur_voxel_coords[1] * vd[2] + cur_voxel_coords[2]
+    c_tag_voxel(el_no, tag, touched_tags, traversal_tags,
+                new_voxels, nb_new_voxels)
 
-    for track_idx in range(streamlines_len):
-        t = streamlines[track_idx].astype(np.double)
 
-        # This loop is time-critical
-        # Changed to -1 because we get the next point in the loop
-        for pno in range(t.shape[0] - 1):
-            # Assign current and next point, find vector between both,
-            # and use the current point as nearest edge for testing.
-            for cno in range(3):
-                in_pt[cno] = t[pno, cno]
-                next_pt[cno] = t[pno + 1, cno]
-                dir_vect[cno] = next_pt[cno] - in_pt[cno]
-                cur_edge[cno] = in_pt[cno]
-
-            # Compute norm
-            dir_vect_norm = norm(dir_vect[0], dir_vect[1], dir_vect[2])
-
-            # If consecutive coordinates are the same, skip one.
-            if dir_vect_norm == 0:
-                continue
-
-            # Set the "dist" var to compute remaining length of vector to process
-            remaining_dist = dir_vect_norm
-
-            # Check if it's already a real edge. If not, find the closest edge.
-            # Reverted the condition to help with code prediction
-            if floor(cur_edge[0]) != cur_edge[0] and \
-               floor(cur_edge[1]) != cur_edge[1] and \
-               floor(cur_edge[2]) != cur_edge[2]:
-                # All coordinates are not "integers", and therefore, not on the
-                # edge. Fetch the closest edge.
-                c_get_closest_edge(in_pt[0], in_pt[1], in_pt[2],
-                                   dir_vect[0], dir_vect[1], dir_vect[2],
-                                   cur_edge)
-
-            # TODO Could condition be optimized?
-            while True:
-                # Compute the smallest ratio of dir_vect's length to get to an
-                # edge. This effectively means we find the first edge
-                # encountered
-                # Set large value for length_ratio
-                length_ratio = 10000
-                for cno in range(3):
-                    # To avoid dividing by zero.
-                    # Gain in performance, since we can use
-                    # @cython.cdivision(True)
-                    if dir_vect[cno] != 0:
-                        length_ratio = cfmin(fabs((cur_edge[cno] - in_pt[cno]) /
-                                             dir_vect[cno]), length_ratio)
-
-                remaining_dist -= length_ratio * dir_vect_norm
-
-                # Check if last point is already on an edge
-                if remaining_dist < 0 and not fabs(remaining_dist) < 1e-8:
-                    break
-
-                # Find the coordinates of voxel containing current point, to
-                # tag it in the map
-                for cno in range(3):
-                    cur_voxel_coords[cno] = <int>floor(in_pt[cno] +
-                                                       0.5 * length_ratio *
-                                                       dir_vect[cno])
-
-                el_no = cur_voxel_coords[0] * x_slice_size + \
-                        cur_voxel_coords[1] * vd[2] + cur_voxel_coords[2]
-
-                # Use + 1 since the first track would be ignored
-                if touched_tags_v[el_no] != track_idx + 1:
-                    touched_tags_v[el_no] = track_idx + 1
-                    traversal_tags_v[el_no] += 1
-
-                # NOTE: in_pt is moved to the closest edge
-                for cno in range(3):
-                    in_pt[cno] = length_ratio * dir_vect[cno] + in_pt[cno]
-
-                    # Snap really small values to 0.
-                    if fabs(in_pt[cno]) <= 1e-16:
-                        in_pt[cno] = 0.0
-
-                c_get_closest_edge(in_pt[0], in_pt[1], in_pt[2],
-                                   dir_vect[0], dir_vect[1], dir_vect[2],
-                                   cur_edge)
-
-        # Add last point
-        for cno in range(3):
-            cur_voxel_coords[cno] = <int>floor(in_pt[cno] +
-                                               0.5 * (next_pt[cno] - in_pt[cno]))
+def _prepare_streamlines(streamlines):
+    """ Returns the (data, offsets, lengths) buffers of the streamlines. """
+    if not isinstance(streamlines, ArraySequence):
+        streamlines = ArraySequence(streamlines)
+
+    data = streamlines._data
+    if data.dtype not in [np.float32, np.float64]:
+        data = data.astype(np.float64)
+    if data.ndim != 2:
+        data = data.reshape((-1, 3))
+
+    offsets = np.ascontiguousarray(streamlines._offsets, dtype=np.intp)
+    lengths = np.ascontiguousarray(streamlines._lengths, dtype=np.intp)
+    return data, offsets, lengths
 
-        el_no = cur_voxel_coords[0] * x_slice_size + \
-                cur_voxel_coords[1] * vd[2] + cur_voxel_coords[2]
 
+def _saturated_cast(counts, dtype):
+    """ Casts counts to dtype, clipping to the maximal value of dtype. """
+    dtype = np.dtype(dtype)
+    if np.issubdtype(dtype, np.integer) and \
+            np.iinfo(dtype).max < np.iinfo(counts.dtype).max:
+        counts = np.minimum(counts, np.iinfo(dtype).max)
+    return counts.astype(dtype, copy=False)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void c_count_streamlines(const floating[:, :] data,
+                              np.npy_intp[::1] offsets,
+                              np.npy_intp[::1] lengths,
+                              np.npy_intp[::1] vd,
+                              np.npy_intp[:, ::1] touched_tags,
+                              np.uint32_t[:, ::1] traversal_tags,
+                              int num_threads):
+    cdef np.npy_intp track_idx
+    cdef np.npy_intp nb_streamlines = offsets.shape[0]
+    cdef int tid
+
+    for track_idx in prange(nb_streamlines, nogil=True, schedule='guided',
+                            num_threads=num_threads):
+        tid = threadid()
         # Use + 1 since the first track would be ignored
-        if touched_tags_v[el_no] != track_idx + 1:
-            touched_tags_v[el_no] = track_idx + 1
-            traversal_tags_v[el_no] += 1
+        c_tag_streamline(data, offsets[track_idx], lengths[track_idx],
+                         track_idx + 1, &vd[0], &touched_tags[tid, 0],
+                         &traversal_tags[tid, 0], NULL, NULL)
+
+
+def _store_bundle_counts(results, bundle_idx, new_voxels, traversal_tags,
+                         nb_new_voxels):
+    voxels = np.sort(np.asarray(new_voxels)[:nb_new_voxels])
+    results[bundle_idx] = (voxels, np.asarray(traversal_tags)[voxels])
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef list c_count_streamlines_per_bundle(const floating[:, :] data,
+                                         np.npy_intp[::1] offsets,
+                                         np.npy_intp[::1] lengths,
+                                         np.npy_intp[::1] vd,
+                                         np.npy_intp[::1] order,
+                                         np.npy_intp[::1] bundle_bounds,
+                                         np.npy_intp[:, ::1] touched_tags,
+                                         np.uint32_t[:, ::1] traversal_tags,
+                                         np.npy_intp[:, ::1] new_voxels,
+                                         int num_threads):
+    cdef np.npy_intp bundle_idx, pos, track_idx, i
+    cdef np.npy_intp nb_bundles = bundle_bounds.shape[0] - 1
+    cdef np.npy_intp nb_new_voxels
+    cdef int tid
+    results = [None] * nb_bundles
+
+    for bundle_idx in prange(nb_bundles, nogil=True, schedule='dynamic',
+                             num_threads=num_threads):
+        tid = threadid()
+        nb_new_voxels = 0
+        for pos in range(bundle_bounds[bundle_idx],
+                         bundle_bounds[bundle_idx + 1]):
+            track_idx = order[pos]
+            # Tags are unique across bundles, the touched buffer of a thread
+            # never needs to be reset.
+            c_tag_streamline(data, offsets[track_idx], lengths[track_idx],
+                             pos + 1, &vd[0], &touched_tags[tid, 0],
+                             &traversal_tags[tid, 0], &new_voxels[tid, 0],
+                             &nb_new_voxels)
+
+        with gil:
+            _store_bundle_counts(results, bundle_idx, new_voxels[tid],
+                                 traversal_tags[tid], nb_new_voxels)
+
+        # Reset the counts of this bundle for the next one
+        for i in range(nb_new_voxels):
+            traversal_tags[tid, new_voxels[tid, i]] = 0
+
+    return results
+
+
+# IMPORTANT: Streamlines should be in voxel space, aligned to corner.
+def compute_tract_counts_map(streamlines, vol_dims, dtype=int,
+                             num_threads=1):
+    """
+    Computes the number of streamlines traversing each voxel (a density map).
+    Each streamline is counted only once per voxel.
+
+    Parameters
+    ----------
+    streamlines: ArraySequence or list of np.ndarray
+        Streamlines, in voxel space, aligned to corner.
+    vol_dims: tuple
+        The dimensions of the volume.
+    dtype: np.dtype
+        Data type of the output map. Counts are clipped to the maximal value
+        of integer types, so a small type (ex, np.uint16) can safely be used
+        when the map is only used as a mask.
+    num_threads: int
+        Number of threads used to traverse the streamlines. Each thread keeps
+        its own buffers of the size of the volume. Has no effect if scilpy was
+        built without OpenMP.
+
+    Returns
+    -------
+    traversal_tags: np.ndarray
+        The density map, of shape vol_dims.
+    """
+    flags = np.seterr(divide="ignore", under="ignore")
+
+    # Inspired from Dipy track_counts
+    vol_dims = np.asarray(vol_dims).astype(int)
+    n_voxels = np.prod(vol_dims)
+    data, offsets, lengths = _prepare_streamlines(streamlines)
+
+    nb_streamlines = len(offsets)
+    num_threads = max(1, min(num_threads, nb_streamlines))
+
+    # These arrays count the number of different tracks going through each
+    # voxel, and keep track of whether the current track has already been
+    # flagged in a specific voxel, for each thread.
+    traversal_tags = np.zeros((num_threads, n_voxels), dtype=np.uint32)
+    touched_tags = np.zeros((num_threads, n_voxels), dtype=np.intp)
+
+    vd = np.ascontiguousarray(vol_dims, dtype=np.intp)
+    if nb_streamlines > 0 and data.dtype == np.float32:
+        c_count_streamlines[float](data, offsets, lengths, vd,
+                                   touched_tags, traversal_tags, num_threads)
+    elif nb_streamlines > 0:
+        c_count_streamlines[double](data, offsets, lengths, vd,
+                                    touched_tags, traversal_tags, num_threads)
+    del touched_tags
+
+    if num_threads > 1:
+        traversal_tags = np.sum(traversal_tags, axis=0, dtype=np.uint64)
+    else:
+        traversal_tags = traversal_tags[0]
+
+    np.seterr(**flags)
+    return _saturated_cast(traversal_tags, dtype).reshape(vol_dims)
+
+
+# IMPORTANT: Streamlines should be in voxel space, aligned to corner.
+def compute_tract_counts_map_per_bundle(streamlines, vol_dims, bundle_ids,
+                                        nb_bundles=None, dtype=np.uint32,
+                                        num_threads=1):
+    """
+    Computes the density map of many bundles in a single pass. Equivalent to
+    calling compute_tract_counts_map on the streamlines of each bundle, but
+    without allocating a full volume per bundle.
+
+    Parameters
+    ----------
+    streamlines: ArraySequence or list of np.ndarray
+        Streamlines of all bundles, in voxel space, aligned to corner.
+    vol_dims: tuple
+        The dimensions of the volume.
+    bundle_ids: np.ndarray
+        The bundle index of each streamline, in range [0, nb_bundles[.
+    nb_bundles: int
+        Number of bundles. Defaults to max(bundle_ids) + 1.
+    dtype: np.dtype
+        Data type of the output counts. Counts are clipped to the maximal
+        value of integer types.
+    num_threads: int
+        Number of threads, each processing whole bundles. Each thread keeps
+        its own buffers of the size of the volume. Has no effect if scilpy was
+        built without OpenMP.
+
+    Returns
+    -------
+    density_maps: scipy.sparse.csr_matrix
+        Matrix of shape (nb_bundles, prod(vol_dims)). Row i is the flattened
+        (C order) density map of bundle i, which can be obtained with
+        density_maps[i].toarray().reshape(vol_dims).
+    """
+    flags = np.seterr(divide="ignore", under="ignore")
+
+    vol_dims = np.asarray(vol_dims).astype(int)
+    n_voxels = np.prod(vol_dims)
+    data, offsets, lengths = _prepare_streamlines(streamlines)
+
+    bundle_ids = np.asarray(bundle_ids, dtype=np.intp).ravel()
+    if len(bundle_ids) != len(offsets):
+        raise ValueError("bundle_ids should contain one value per "
+                         "streamline ({} != {})."
+                         .format(len(bundle_ids), len(offsets)))
+    if nb_bundles is None:
+        nb_bundles = int(np.max(bundle_ids)) + 1 if len(bundle_ids) else 0
+    if len(bundle_ids) and (np.min(bundle_ids) < 0 or
+                            np.max(bundle_ids) >= nb_bundles):
+        raise ValueError("bundle_ids should be in range [0, {}[."
+                         .format(nb_bundles))
+
+    # Streamlines are processed bundle by bundle.
+    order = np.argsort(bundle_ids, kind='stable').astype(np.intp)
+    bundle_bounds = np.searchsorted(bundle_ids[order],
+                                    np.arange(nb_bundles + 1)).astype(np.intp)
+
+    num_threads = max(1, min(num_threads, nb_bundles))
+    traversal_tags = np.zeros((num_threads, n_voxels), dtype=np.uint32)
+    touched_tags = np.zeros((num_threads, n_voxels), dtype=np.intp)
+    new_voxels = np.zeros((num_threads, n_voxels), dtype=np.intp)
+
+    vd = np.ascontiguousarray(vol_dims, dtype=np.intp)
+    results = []
+    if nb_bundles > 0 and data.dtype == np.float32:
+        results = c_count_streamlines_per_bundle[float](
+            data, offsets, lengths, vd, order, bundle_bounds, touched_tags,
+            traversal_tags, new_voxels, num_threads)
+    elif nb_bundles > 0:
+        results = c_count_streamlines_per_bundle[double](
+            data, offsets, lengths, vd, order, bundle_bounds, touched_tags,
+            traversal_tags, new_voxels, num_threads)
+    del traversal_tags, touched_tags, new_voxels
+
+    indptr = np.zeros(nb_bundles + 1, dtype=np.intp)
+    indptr[1:] = np.cumsum([len(voxels) for voxels, _ in results])
+    if len(results):
+        indices = np.concatenate([voxels for voxels, _ in results])
+        counts = np.concatenate([counts for _, counts in results])
+    else:
+        indices = np.zeros(0, dtype=np.intp)
+        counts = np.zeros(0, dtype=np.uint32)
 
     np.seterr(**flags)
-    return traversal_tags.reshape(vol_dims)
+    return csr_matrix((_saturated_cast(counts, dtype), indices, indptr),
+                      shape=(nb_bundles, n_voxels))
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+from dipy.data import get_sphere
+from dipy.io.stateful_tractogram import Origin, Space, StatefulTractogram
+import nibabel as nib
+import numpy as np
+
+from scilpy.tractanalysis.afd_along_streamlines import (
+    afd_and_rd_sums_along_streamlines, afd_map_along_streamlines)
+
+
+def _build_data(a=0.5):
+    # SH of order 2 (descoteaux07 legacy): c0 * Y00 + a * Y20, with c0
+    # increasing along x.
+    fodf = np.zeros((5, 5, 5, 6), dtype=np.float32)
+    fodf[..., 0] = np.arange(1, 6)[:, None, None]
+    fodf[..., 3] = a
+    fodf_img = nib.Nifti1Image(fodf, np.eye(4))
+
+    # One streamline along x, from the middle of voxel 0 to the middle of
+    # voxel 4 (y=2, z=2).
+    streamline = np.array([[0.5, 2.5, 2.5], [4.5, 2.5, 2.5]],
+                          dtype=np.float32)
+    sft = StatefulTractogram([streamline], fodf_img, Space.VOX,
+                             origin=Origin.TRACKVIS)
+    return sft, fodf_img
+
+
+def _expected_values(a=0.5):
+    # Values at the sphere vertex closest to x.
+    sphere = get_sphere(name='repulsion724')
+    cos_theta = sphere.vertices[np.argmax(sphere.vertices[:, 0]), 2]
+    y00 = 0.5 / np.sqrt(np.pi)
+    y20 = np.sqrt(5 / (4 * np.pi)) * (3 * cos_theta ** 2 - 1) / 2
+
+    c0 = np.arange(1, 6)
+    afd = c0 * y00 + a * y20
+    # The radial fODF weights each order n by the Legendre polynomial
+    # P_n(0): P_0(0) = 1, P_2(0) = -1/2.
+    rd = c0 * y00 - 0.5 * a * y20
+    return afd, rd
+
+
+def test_afd_and_rd_sums_along_streamlines():
+    sft, fodf_img = _build_data()
+    expected_afd, expected_rd = _expected_values()
+
+    afd_sum, rd_sum, weights = afd_and_rd_sums_along_streamlines(
+        sft, fodf_img, 'descoteaux07', length_weighting=True)
+
+    # Segments of length 0.5 in the first and last voxel, normalized by the
+    # norm of the voxel size.
+    expected_weights = np.array([0.5, 1, 1, 1, 0.5]) / np.sqrt(3)
+    assert np.allclose(weights[:, 2, 2], expected_weights)
+    assert np.allclose(afd_sum[:, 2, 2], expected_afd * expected_weights)
+    assert np.allclose(rd_sum[:, 2, 2], expected_rd * expected_weights)
+
+    # Nothing outside of the streamline
+    weights[:, 2, 2] = 0
+    afd_sum[:, 2, 2] = 0
+    rd_sum[:, 2, 2] = 0
+    assert np.count_nonzero(weights) == 0
+    assert np.count_nonzero(afd_sum) == 0
+    assert np.count_nonzero(rd_sum) == 0
+
+
+def test_afd_map_along_streamlines():
+    expected_afd, expected_rd = _expected_values()
+
+    for length_weighting in [False, True]:
+        sft, fodf_img = _build_data()
+        afd, rd = afd_map_along_streamlines(sft, fodf_img, 'descoteaux07',
+                                            length_weighting)
+
+        # A single segment per voxel: the mean is the value in the voxel.
+        assert np.allclose(afd[:, 2, 2], expected_afd)
+        assert np.allclose(rd[:, 2, 2], expected_rd)
+
+    # Small chunks give the same sums.
+    sft, fodf_img = _build_data()
+    expected = afd_and_rd_sums_along_streamlines(
+        sft, fodf_img, 'descoteaux07', length_weighting=False)
+    result = afd_and_rd_sums_along_streamlines(
+        sft, fodf_img, 'descoteaux07', length_weighting=False, chunk_size=2)
+    for expected_map, result_map in zip(expected, result):
+        assert np.allclose(expected_map, result_map)
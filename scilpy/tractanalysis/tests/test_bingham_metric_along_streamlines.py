@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+from dipy.io.stateful_tractogram import Origin, Space, StatefulTractogram
+import nibabel as nib
+import numpy as np
+
+from scilpy.reconst.bingham import NB_PARAMS
+from scilpy.tractanalysis.bingham_metric_along_streamlines import (
+    bingham_metric_map_along_streamlines,
+    bingham_metric_sum_along_streamlines)
+
+
+def _build_data():
+    # Two lobes everywhere: lobe 0 has its peak along x (mu1 = 2y,
+    # mu2 = z), lobe 1 along y (mu1 = 2z, mu2 = x). Lobe 2 is empty.
+    bingham = np.zeros((5, 5, 5, 3, NB_PARAMS))
+    bingham[..., 0, :] = [1., 0, 2, 0, 0, 0, 1]
+    bingham[..., 1, :] = [1., 0, 0, 2, 1, 0, 0]
+    metric = np.zeros((5, 5, 5, 3))
+    metric[..., 0] = 2.
+    metric[..., 1] = 3.
+
+    # One streamline along x (voxels y=2, z=2), one along y (x=1, z=3)
+    # and one diagonal in the xy plane (z=1), at 45 degrees of both lobes.
+    streamlines = [
+        np.array([[0.5, 2.5, 2.5], [4.5, 2.5, 2.5]], dtype=np.float32),
+        np.array([[1.5, 0.5, 3.5], [1.5, 4.5, 3.5]], dtype=np.float32),
+        np.array([[0.5, 0.5, 1.5], [4.5, 4.5, 1.5]], dtype=np.float32)]
+    sft = StatefulTractogram(streamlines,
+                             nib.Nifti1Image(np.zeros((5, 5, 5)), np.eye(4)),
+                             Space.VOX, origin=Origin.TRACKVIS)
+    return sft, bingham, metric
+
+
+def test_bingham_metric_sum_along_streamlines():
+    sft, bingham, metric = _build_data()
+    bingham_copy = bingham.copy()
+
+    metric_sum, weights = bingham_metric_sum_along_streamlines(
+        sft, bingham, metric, max_theta=30, length_weighting=True)
+
+    # Segments of length 0.5 in the first and last voxel.
+    expected_weights = np.array([0.5, 1, 1, 1, 0.5])
+    assert np.allclose(weights[:, 2, 2], expected_weights)
+    assert np.allclose(weights[1, :, 3], expected_weights)
+    assert np.allclose(metric_sum[:, 2, 2], 2 * expected_weights)
+    assert np.allclose(metric_sum[1, :, 3], 3 * expected_weights)
+
+    # No lobe close enough to the diagonal: weights, but no metric.
+    assert np.all(weights[np.arange(5), np.arange(5), 1] > 0)
+    assert np.count_nonzero(metric_sum[..., 1]) == 0
+
+    # The coefficients are not modified.
+    assert np.array_equal(bingham, bingham_copy)
+
+    # With a large max_theta, the diagonal takes the first lobe.
+    metric_sum, _ = bingham_metric_sum_along_streamlines(
+        sft, bingham, metric, max_theta=50, length_weighting=False,
+        chunk_size=3)
+    diagonal = metric_sum[np.arange(5), np.arange(5), 1]
+    assert np.all(diagonal[diagonal > 0] == 2)
+
+
+def test_bingham_metric_map_along_streamlines():
+    sft, bingham, metric = _build_data()
+
+    mean_map = bingham_metric_map_along_streamlines(
+        sft, bingham, metric, max_theta=30, length_weighting=True)
+
+    assert np.allclose(mean_map[:, 2, 2], 2)
+    assert np.allclose(mean_map[1, :, 3], 3)
+    assert np.count_nonzero(mean_map) == 10
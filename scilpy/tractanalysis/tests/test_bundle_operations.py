@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from scilpy.tractanalysis.bundle_operations import (
+    outliers_removal_using_hierarchical_quickbundles, remove_outliers_qb)
+
+
+def _get_streamlines():
+    # A bundle of parallel lines, and two lines going elsewhere.
+    line = np.linspace(0, 20, 20)[:, None] * np.array([[1, 0, 0]])
+    rng = np.random.RandomState(0)
+    streamlines = [line + rng.normal(0, 0.5, 3) for _ in range(100)]
+    streamlines += [line[:, [1, 0, 2]], line[:, [2, 1, 0]]]
+    return [s.astype(np.float32) for s in streamlines]
+
+
+def test_outliers_removal_using_hierarchical_quickbundles():
+    streamlines = _get_streamlines()
+    summary = outliers_removal_using_hierarchical_quickbundles(
+        streamlines, nb_samplings_max=5)
+    assert np.all(summary[:100] > summary[100:].max())
+
+    # Same samplings, whatever the number of processes.
+    summary_parallel = outliers_removal_using_hierarchical_quickbundles(
+        streamlines, nb_samplings_max=5, nbr_processes=2)
+    np.testing.assert_array_equal(summary, summary_parallel)
+
+
+def test_remove_outliers_qb():
+    outliers, inliers = remove_outliers_qb(_get_streamlines(), 0.5,
+                                           nb_samplings=5)
+    np.testing.assert_array_equal(outliers, [100, 101])
+    np.testing.assert_array_equal(inliers, np.arange(100))
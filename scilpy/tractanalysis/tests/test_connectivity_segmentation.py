@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+
+import h5py
+import nibabel as nib
+import numpy as np
+from dipy.io.stateful_tractogram import Origin, Space, StatefulTractogram
+from nibabel.streamlines import ArraySequence
+
+from scilpy.tractanalysis.connectivity_segmentation import (
+    compute_connectivity, construct_hdf5_from_connectivity,
+    extract_longest_segments_from_profile)
+from scilpy.tractograms.uncompress import uncompress
+
+tmp_dir = tempfile.TemporaryDirectory()
+
+
+def _get_indices():
+    # Labels along x: 1 at x=0, WM (0) for x=1..3, 2 at x=4, 3 at x=5.
+    atlas = np.zeros((6, 2, 2), dtype=np.uint16)
+    atlas[0] = 1
+    atlas[4] = 2
+    atlas[5] = 3
+
+    def _line(xs, y=0):
+        return np.array([[x, y, 0] for x in xs], dtype=np.uint16)
+
+    indices = ArraySequence([
+        _line(range(6)),              # 1 -> 3
+        _line(range(5)[::-1]),        # 2 -> 1
+        _line([0, 1, 2, 3, 4], y=1),  # 1 -> 2
+        _line([1, 2, 3]),             # Never labelled
+        _line([0, 0, 4]),             # Never reaching the WM
+        _line([4, 5, 6])])            # Out of bound
+    return indices, atlas
+
+
+def test_compute_connectivity():
+    indices, atlas = _get_indices()
+    con_info = compute_connectivity(indices, atlas, np.array([1, 2, 3]))
+
+    # Grouped by connection (1-2, then 1-3), from the lowest label first.
+    assert np.array_equal(con_info['strl_idx'], [2, 1, 0])
+    assert np.array_equal(con_info['start_label'], [1, 2, 1])
+    assert np.array_equal(con_info['end_label'], [2, 1, 3])
+    assert np.array_equal(con_info['in_idx'], [0, 0, 0])
+    assert np.array_equal(con_info['out_idx'], [4, 4, 5])
+
+    # Same result with a custom segmenting function (which does not
+    # support voxels out of bound).
+    def _segmenting_func(strl_indices, atlas_data):
+        return extract_longest_segments_from_profile(strl_indices,
+                                                     atlas_data)
+
+    custom_info = compute_connectivity(indices[:-1], atlas,
+                                       np.array([1, 2, 3]), _segmenting_func)
+    for key, value in con_info.items():
+        assert np.array_equal(custom_info[key], value)
+
+    # Connections with other labels are discarded.
+    con_info = compute_connectivity(indices, atlas, np.array([1, 2]))
+    assert np.array_equal(con_info['strl_idx'], [2, 1])
+
+
+def test_compute_connectivity_no_label():
+    # No labelled voxel at all: no connection.
+    indices, atlas = _get_indices()
+    con_info = compute_connectivity(indices, np.zeros_like(atlas),
+                                    np.array([1, 2, 3]))
+    for value in con_info.values():
+        assert len(value) == 0
+
+
+def test_compute_connectivity_no_wm():
+    # Only labelled voxels (no WM): no streamline leaves its first label.
+    # (Without the streamline out of bound, whose voxels have no label.)
+    indices, atlas = _get_indices()
+    con_info = compute_connectivity(indices[:-1], np.ones_like(atlas),
+                                    np.array([1, 2, 3]))
+    for value in con_info.values():
+        assert len(value) == 0
+
+
+def test_construct_hdf5_from_connectivity_empty():
+    streamlines = [np.array([[0.5, 0.5, 0.5], [2.5, 0.5, 0.5],
+                             [4.5, 0.5, 0.5]], dtype=np.float32)]
+    reference = nib.Nifti1Image(np.zeros((6, 2, 2), dtype=np.uint16),
+                                np.eye(4))
+    sft = StatefulTractogram(streamlines, reference, Space.VOX,
+                             origin=Origin.TRACKVIS)
+    indices, points_to_idx = uncompress(sft.streamlines, return_mapping=True)
+    con_info = compute_connectivity(indices, reference.get_fdata(),
+                                    np.array([1, 2]))
+
+    saving_options = {'raw': False, 'intermediate': False,
+                      'discarded': False, 'final': False}
+    hdf5_filename = os.path.join(tmp_dir.name, 'empty.h5')
+    with h5py.File(hdf5_filename, 'w') as hdf5_file:
+        construct_hdf5_from_connectivity(
+            sft, indices, points_to_idx, np.array([1, 2]), con_info,
+            hdf5_file, saving_options, {}, False, 0, np.inf, False, 360,
+            False, 0.5, False, 10, 1)
+        assert len(hdf5_file.keys()) == 0
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from scilpy.tractanalysis.distance_to_centroid import min_dist_to_centroid
+
+
+def test_min_dist_to_centroid():
+    # Two centroids of 3 sections along x.
+    centroid_pts = np.array([[0, 0, 0], [2, 0, 0], [4, 0, 0],
+                             [0, 2, 0], [2, 2, 0], [4, 2, 0]], dtype=float)
+    bundle_pts = np.array([[0.2, 0, 0], [2.9, 1, 0], [3.2, 0, 0]])
+
+    labels, dists = min_dist_to_centroid(bundle_pts, centroid_pts, 3)
+    np.testing.assert_array_equal(labels, [0, 1, 2])
+    np.testing.assert_allclose(dists[0], 0.2)
+
+    # The 4 closest points of the second point are in section 1 (twice) and
+    # 2 (twice), but section 1 is closer.
+    labels, dists = min_dist_to_centroid(bundle_pts, centroid_pts, 3,
+                                         nb_neighbors=4)
+    np.testing.assert_array_equal(labels, [0, 1, 2])
+
+    # With all centroid points voting, the closest section wins the vote.
+    labels, _ = min_dist_to_centroid(bundle_pts, centroid_pts, 3,
+                                     nb_neighbors=6)
+    np.testing.assert_array_equal(labels, [0, 1, 2])
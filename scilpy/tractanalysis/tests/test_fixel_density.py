@@ -1,9 +1,56 @@
 # -*- coding: utf-8 -*-
+import os
+import tempfile
+
+from dipy.io.stateful_tractogram import Origin, Space, StatefulTractogram
+from dipy.io.streamline import save_tractogram
+import numpy as np
+
+from scilpy.tractanalysis.fixel_density import fixel_density
+
+tmp_dir = tempfile.TemporaryDirectory()
+
+
+def _save_bundle(streamlines, name, dps=None):
+    affine = np.eye(4)
+    sft = StatefulTractogram(streamlines,
+                             (affine, np.array([5, 5, 5]), np.ones(3), 'RAS'),
+                             Space.VOX, origin=Origin.TRACKVIS,
+                             data_per_streamline=dps)
+    filename = os.path.join(tmp_dir.name, name)
+    save_tractogram(sft, filename)
+    return filename
 
 
 def test_fixel_density():
-    # toDO
-    pass
+    # Peaks along x in fixel 0 and along y in fixel 1, everywhere.
+    peaks = np.zeros((5, 5, 5, 5, 3), dtype=np.float32)
+    peaks[..., 0, 0] = 1
+    peaks[..., 1, 1] = 1
+    peaks = peaks.reshape((5, 5, 5, 15))
+
+    # One streamline along x (voxels y=2, z=2) and one along y (x=1, z=3).
+    along_x = np.array([[0.5, 2.5, 2.5], [4.5, 2.5, 2.5]], dtype=np.float32)
+    along_y = np.array([[1.5, 0.5, 3.5], [1.5, 4.5, 3.5]], dtype=np.float32)
+    bundles = [_save_bundle([along_x, along_y], 'bundle.trk',
+                            dps={'weight': np.array([[2.], [3.]])})]
+
+    for nbr_processes in [1, 2]:
+        maps = fixel_density(peaks, bundles, nbr_processes=nbr_processes)
+        assert maps.shape == (5, 5, 5, 5, 1)
+        assert np.array_equal(maps[:, 2, 2, 0, 0], np.ones(5))
+        assert np.array_equal(maps[1, :, 3, 1, 0], np.ones(5))
+        assert np.sum(maps) == 10
+
+    maps = fixel_density(peaks, bundles, dps_key='weight', nbr_processes=1)
+    assert np.allclose(maps[:, 2, 2, 0, 0], 2)
+    assert np.allclose(maps[1, :, 3, 1, 0], 3)
+
+    # No fixel close enough to a diagonal streamline.
+    diagonal = np.array([[0.5, 0.5, 0.5], [4.5, 4.5, 4.5]], dtype=np.float32)
+    bundles = [_save_bundle([diagonal], 'diagonal.trk')]
+    maps = fixel_density(peaks, bundles, max_theta=30, nbr_processes=1)
+    assert np.sum(maps) == 0
 
 
 def test_maps_to_masks():
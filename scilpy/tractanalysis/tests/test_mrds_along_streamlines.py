@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from dipy.io.stateful_tractogram import Origin, Space, StatefulTractogram
+import nibabel as nib
+import numpy as np
+
+from scilpy.tractanalysis.mrds_along_streamlines import (
+    mrds_metric_sums_along_streamlines, mrds_metrics_along_streamlines)
+
+
+def _build_data():
+    # Three tensors everywhere: along x, along y, and an empty one.
+    pdds = np.zeros((5, 5, 5, 9))
+    pdds[..., 0:3] = [1, 0, 0]
+    pdds[..., 3:6] = [0, 1, 0]
+    fa = np.zeros((5, 5, 5, 3))
+    fa[..., 0] = 0.7
+    fa[..., 1] = 0.5
+    md = np.zeros((5, 5, 5, 3))
+    md[..., 0] = 1e-3
+    md[..., 1] = 2e-3
+
+    # One streamline along x (voxels y=2, z=2), one along y (x=1, z=3)
+    # and one diagonal in the xy plane (z=1), at 45 degrees of both tensors.
+    streamlines = [
+        np.array([[0.5, 2.5, 2.5], [4.5, 2.5, 2.5]], dtype=np.float32),
+        np.array([[1.5, 0.5, 3.5], [1.5, 4.5, 3.5]], dtype=np.float32),
+        np.array([[0.5, 0.5, 1.5], [4.5, 4.5, 1.5]], dtype=np.float32)]
+    sft = StatefulTractogram(streamlines,
+                             nib.Nifti1Image(np.zeros((5, 5, 5)), np.eye(4)),
+                             Space.VOX, origin=Origin.TRACKVIS)
+    return sft, pdds, fa, md
+
+
+def test_mrds_metric_sums_along_streamlines():
+    sft, pdds, fa, md = _build_data()
+
+    metric_sums, weights = mrds_metric_sums_along_streamlines(
+        sft, pdds, [fa, md], max_theta=30, length_weighting=True)
+
+    # Segments of length 0.5 in the first and last voxel. The weights are
+    # added once per metric.
+    expected_weights = np.array([0.5, 1, 1, 1, 0.5])
+    assert np.allclose(weights[:, 2, 2], 2 * expected_weights)
+    assert np.allclose(weights[1, :, 3], 2 * expected_weights)
+    assert np.allclose(metric_sums[0][:, 2, 2], 0.7 * expected_weights)
+    assert np.allclose(metric_sums[0][1, :, 3], 0.5 * expected_weights)
+    assert np.allclose(metric_sums[1][:, 2, 2], 1e-3 * expected_weights)
+    assert np.allclose(metric_sums[1][1, :, 3], 2e-3 * expected_weights)
+
+    # No tensor close enough to the diagonal: weights, but no metric.
+    assert np.all(weights[np.arange(5), np.arange(5), 1] > 0)
+    assert np.count_nonzero(metric_sums[..., 1]) == 0
+
+    # Small chunks give the same sums.
+    chunked_sums, chunked_weights = mrds_metric_sums_along_streamlines(
+        sft, pdds, [fa, md], max_theta=30, length_weighting=True,
+        chunk_size=3)
+    assert np.allclose(chunked_sums, metric_sums)
+    assert np.allclose(chunked_weights, weights)
+
+
+def test_mrds_metrics_along_streamlines():
+    sft, pdds, fa, _ = _build_data()
+
+    mean_map = mrds_metrics_along_streamlines(
+        sft, pdds, [fa], max_theta=30, length_weighting=False)[0]
+
+    assert np.allclose(mean_map[:, 2, 2], 0.7)
+    assert np.allclose(mean_map[1, :, 3], 0.5)
+    assert np.count_nonzero(mean_map) == 10
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from scilpy.tractanalysis.streamlines_metrics import (
+    compute_tract_counts_map, compute_tract_counts_map_per_bundle)
+
+
+def _get_fake_streamlines():
+    # Streamlines in voxel space, corner aligned, in a (5, 5, 5) volume.
+    return [np.asarray([[0.5, 0.5, 0.5],
+                        [3.5, 0.5, 0.5]], dtype=np.float32),
+            np.asarray([[0.5, 0.5, 0.5],
+                        [0.5, 2.5, 0.5],
+                        [0.5, 2.6, 0.5]], dtype=np.float32),
+            np.asarray([[4.5, 4.5, 4.5],
+                        [4.5, 4.5, 2.5]], dtype=np.float32)]
+
+
+def test_compute_tract_counts_map():
+    streamlines = _get_fake_streamlines()
+    density = compute_tract_counts_map(streamlines, (5, 5, 5))
+
+    expected = np.zeros((5, 5, 5), dtype=int)
+    expected[0:4, 0, 0] += 1
+    expected[0, 0:3, 0] += 1
+    expected[4, 4, 2:5] += 1
+    assert np.array_equal(density, expected)
+
+    # Saturated output type and many threads give the same result.
+    density = compute_tract_counts_map(streamlines * 200, (5, 5, 5),
+                                       dtype=np.uint8, num_threads=2)
+    assert density.dtype == np.uint8
+    assert np.array_equal(density, np.minimum(expected * 200, 255))
+
+
+def test_compute_tract_counts_map_per_bundle():
+    streamlines = _get_fake_streamlines()
+    bundle_ids = [0, 2, 0]
+    maps = compute_tract_counts_map_per_bundle(streamlines, (5, 5, 5),
+                                               bundle_ids, nb_bundles=4)
+    assert maps.shape == (4, 125)
+
+    for i in range(4):
+        expected = compute_tract_counts_map(
+            [s for s, b in zip(streamlines, bundle_ids) if b == i],
+            (5, 5, 5))
+        assert np.array_equal(maps[i].toarray().reshape((5, 5, 5)),
+                              expected)
@@ -4,9 +4,12 @@ import os
 
 import nibabel as nib
 import numpy as np
-from dipy.io.utils import is_header_compatible
 from nibabel.streamlines import LazyTractogram
 
+from scilpy.utils.lazy_import import lazy_import
+
+dipy_io_utils = lazy_import('dipy.io.utils')
+
 
 def lazy_streamlines_count(in_tractogram_path):
     """ Gets the number of streamlines as written in the tractogram header.
@@ -70,7 +73,7 @@ def lazy_concatenate(in_tractograms, out_ext):
             if header is None:
                 header = nib.streamlines.load(
                     in_file, lazy_load=True).header
-            elif not is_header_compatible(header, in_file):
+            elif not dipy_io_utils.is_header_compatible(header, in_file):
                 logging.warning('Incompatible headers in the list.')
 
     if out_ext == '.trk' and header is None:
@@ -0,0 +1,160 @@
+# encoding: utf-8
+# cython: profile=False, language_level=3
+
+cimport cython
+from cython cimport floating
+import numpy as np
+cimport numpy as cnp
+from nibabel.streamlines.array_sequence import ArraySequence
+
+from libc.math cimport sqrt
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline double c_segment_length(const floating *points,
+                                    cnp.npy_intp i) noexcept nogil:
+    """ Length of the segment between points i - 1 and i (C-ordered Nx3). """
+    cdef double dx = points[3 * i] - points[3 * i - 3]
+    cdef double dy = points[3 * i + 1] - points[3 * i - 2]
+    cdef double dz = points[3 * i + 2] - points[3 * i - 1]
+    return sqrt(dx * dx + dy * dy + dz * dz)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void c_resample_arc_length(const floating[:, ::1] points,
+                                const cnp.npy_intp[:] offsets,
+                                const cnp.npy_intp[:] lengths,
+                                const cnp.npy_intp[:] nb_points,
+                                const cnp.npy_intp[:] new_offsets,
+                                floating[:, ::1] new_points,
+                                cnp.npy_intp[:] positions,
+                                double[:] ratios,
+                                bint keep_positions) noexcept nogil:
+    cdef:
+        cnp.npy_intp i, j, k, start, nb_in, nb_out, out
+        double total, step, target, previous_arc, next_arc, ratio
+        int d
+        const floating *data = &points[0, 0]
+
+    for i in range(lengths.shape[0]):
+        start = offsets[i]
+        nb_in = lengths[i]
+        nb_out = nb_points[i]
+        out = new_offsets[i]
+
+        total = 0
+        for k in range(start + 1, start + nb_in):
+            total += c_segment_length(data, k)
+        step = total / (nb_out - 1)
+
+        # Walking along the streamline: the point j is on the segment
+        # (k - 1, k), with arc lengths (previous_arc, next_arc).
+        k = 1
+        previous_arc = 0
+        next_arc = c_segment_length(data, start + 1) if nb_in > 1 else 0
+        for j in range(nb_out - 1):
+            target = j * step
+            while k < nb_in - 1 and next_arc <= target:
+                k += 1
+                previous_arc = next_arc
+                next_arc += c_segment_length(data, start + k)
+
+            if nb_in == 1:
+                k = 0
+                ratio = 0
+            elif next_arc > previous_arc:
+                ratio = (target - previous_arc) / (next_arc - previous_arc)
+                ratio = min(max(ratio, 0.), 1.)
+            else:
+                ratio = 0
+
+            if nb_in == 1:
+                for d in range(3):
+                    new_points[out + j, d] = points[start, d]
+            else:
+                for d in range(3):
+                    new_points[out + j, d] = <floating>(
+                        points[start + k - 1, d] + ratio *
+                        (points[start + k, d] - points[start + k - 1, d]))
+            if keep_positions:
+                positions[out + j] = k - 1 if nb_in > 1 else 0
+                ratios[out + j] = ratio
+
+        # Last points are always the original ones.
+        for d in range(3):
+            new_points[out + nb_out - 1, d] = points[start + nb_in - 1, d]
+        if keep_positions:
+            positions[out + nb_out - 1] = max(nb_in - 2, 0)
+            ratios[out + nb_out - 1] = 1 if nb_in > 1 else 0
+
+
+def resample_arc_length(streamlines, nb_points, return_positions=False):
+    """
+    Resamples each streamline to the given number of points, equally spaced
+    along its arc length (as Dipy's set_number_of_points, but with a
+    different number of points per streamline). All streamlines are
+    processed in a single pass on the ArraySequence buffer.
+
+    Parameters
+    ----------
+    streamlines: nibabel.streamlines.array_sequence.ArraySequence
+        The streamlines to resample.
+    nb_points: np.ndarray of int
+        Number of points of each resampled streamline (at least 2).
+    return_positions: bool
+        If true, also returns where each new point was interpolated, to
+        interpolate other data (ex, data_per_point) at the same positions.
+
+    Returns
+    -------
+    new_streamlines: nibabel.streamlines.array_sequence.ArraySequence
+        The resampled streamlines, of the same dtype as the input.
+    positions: np.ndarray of int (optional)
+        For each new point, position (in its streamline) of the original
+        point preceding it.
+    ratios: np.ndarray of float64 (optional)
+        For each new point, its position between the preceding original point
+        (0) and the next one (1).
+    """
+    nb_points = np.asarray(nb_points, dtype=np.intp)
+    if np.any(nb_points < 2):
+        raise ValueError('Streamlines must be resampled to at least 2 '
+                         'points.')
+
+    if np.any(np.asarray(streamlines._lengths) == 0):
+        raise ValueError('Cannot resample empty streamlines.')
+
+    data = np.asarray(streamlines._data)
+    if data.dtype not in [np.float32, np.float64]:
+        data = data.astype(np.float32)
+    data = np.ascontiguousarray(data)
+    offsets = np.asarray(streamlines._offsets, dtype=np.intp)
+    lengths = np.asarray(streamlines._lengths, dtype=np.intp)
+    new_offsets = np.zeros_like(nb_points)
+    new_offsets[1:] = np.cumsum(nb_points[:-1])
+    total = int(np.sum(nb_points))
+
+    new_data = np.empty((total, 3), dtype=data.dtype)
+    positions = np.empty(total if return_positions else 0, dtype=np.intp)
+    ratios = np.empty(total if return_positions else 0, dtype=np.float64)
+
+    if data.dtype == np.float32:
+        c_resample_arc_length[float](data, offsets, lengths, nb_points,
+                                     new_offsets, new_data, positions,
+                                     ratios, return_positions)
+    else:
+        c_resample_arc_length[double](data, offsets, lengths, nb_points,
+                                      new_offsets, new_data, positions,
+                                      ratios, return_positions)
+
+    new_streamlines = ArraySequence()
+    new_streamlines._data = new_data
+    new_streamlines._offsets = new_offsets
+    new_streamlines._lengths = nb_points
+
+    if return_positions:
+        return new_streamlines, positions, ratios
+    return new_streamlines
@@ -1,20 +1,24 @@
 # -*- coding: utf-8 -*-
 from enum import Enum
 from multiprocessing import Pool
+import warnings
 
 import numpy as np
-from dipy.io.stateful_tractogram import StatefulTractogram
-
 from nibabel.streamlines import ArraySequence
 
 from scipy.ndimage import map_coordinates
 
+from scilpy.io.streamlines import reconstruct_streamlines
 from scilpy.tractograms.uncompress import uncompress
 from scilpy.tractograms.streamline_operations import \
     resample_streamlines_step_size
 
 from scilpy.tractograms.streamline_operations import \
-    filter_streamlines_by_length, _get_point_on_line, _get_streamline_pt_index
+    filter_streamlines_by_length, _get_point_on_line, _get_points_on_lines, \
+    _get_streamline_pt_index, _true_runs
+from scilpy.utils.lazy_import import lazy_import
+
+dipy_sft = lazy_import('dipy.io.stateful_tractogram')
 
 
 class CuttingStyle(Enum):
@@ -112,146 +116,171 @@ def get_head_tail_density_maps(sft, point_to_select=1, to_millimeters=False):
     return endpoints_map_head, endpoints_map_tail
 
 
-def _trim_streamline_in_mask(
-    idx, streamline, pts_to_idx, mask
-):
-    """ Trim streamlines to the bounding box or a binary mask. More
-    streamlines may be generated if the original streamline goes in and out
-    of the mask.
+def _get_mask_values(mask, indices):
+    """ Values of the mask in each voxel traversed by the streamlines, as
+    map_coordinates(mask, idx.T, order=0, mode='constant', cval=0) on each
+    streamline, but on the concatenated voxels of all streamlines.
 
     Parameters
     ----------
-    idx: np.ndarray
-        Indices of the voxels intersected by the streamline.
-    streamline: np.ndarray
-        The streamlines to cut.
-    pts_to_idx: np.ndarray
-        Mapping from streamline points to indices.
     mask: np.ndarray
-        Boolean array representing the region.
+        The 3D volume.
+    indices: ArraySequence
+        Indices of the voxels traversed by the streamlines (from uncompress).
 
     Returns
     -------
-    new_strmls : list of np.ndarray
-        New streamlines trimmed within the mask.
+    values: np.ndarray of shape (nb_voxels,)
+        Value of the mask at each voxel, 0 outside the volume.
     """
+    voxels = np.asarray(indices._data).reshape((-1, 3))
+    values = np.zeros(len(voxels), dtype=mask.dtype)
+    in_volume = np.all(voxels < mask.shape[:3], axis=1)
+    voxels = voxels[in_volume]
+    values[in_volume] = mask[voxels[:, 0], voxels[:, 1], voxels[:, 2]]
+    return values
 
-    # Find all the points of the streamline that are in the ROIs
-    roi_data_1_intersect = map_coordinates(
-        mask, idx.T, order=0, mode='constant', cval=0)
-
-    # Select the points that are not in the mask
-    split_idx = np.arange(len(roi_data_1_intersect))[
-        roi_data_1_intersect == 0]
-    # Split the streamline into segments that are in the mask
-    split_strmls = np.array_split(np.arange(len(roi_data_1_intersect)),
-                                  split_idx)
-    new_strmls = []
-    for strml in split_strmls:
-        if len(strml) <= 3:
-            continue
-        # Get the entry and exit points for each segment
-        # Skip the first point as it caused the split
-        in_strl_idx, out_strl_idx = strml[1], strml[-1]
-        cut_strl = compute_streamline_segment(streamline, idx,
-                                              in_strl_idx, out_strl_idx,
-                                              pts_to_idx)
-        new_strmls.append(cut_strl)
-
-    return new_strmls
 
-
-def _trim_streamline_endpoints_in_mask(
-    idx, streamline, pts_to_idx, mask
-):
-    """ Trim a streamline to remove its endpoints if they are outside of
-    a mask. This function does not generate new streamlines.
+def _get_segments_in_mask(values, vox_lengths, cutting_style):
+    """ Selects the segments to keep, for all streamlines at once. A
+    streamline is split at each voxel outside of the mask, and segments of
+    more than 3 voxels are kept. With KEEP_LONGEST, only the longest segment
+    is kept (if it has more than 1 voxel). With TRIM_ENDPOINTS, the segment
+    goes from the first to the last voxel in the mask.
 
     Parameters
     ----------
-    idx: np.ndarray
-        Indices of the voxels intersected by the streamline.
-    streamline: np.ndarray
-        The streamlines to cut.
-    pts_to_idx: np.ndarray
-        Mapping from streamline points to indices.
-    mask: np.ndarray
-        Boolean array representing the region.
+    values: np.ndarray of shape (nb_voxels,)
+        Value of the mask at each voxel traversed by the streamlines.
+    vox_lengths: np.ndarray
+        Number of voxels traversed by each streamline.
+    cutting_style: CuttingStyle
+        How to cut the streamlines.
 
     Returns
     -------
-    streamline: np.ndarray
-        The trimmed streamline within the mask.
+    streamline_ids: np.ndarray
+        Index of the original streamline of each segment.
+    in_vox: np.ndarray
+        Position (in the concatenated voxels) of the first voxel of each
+        segment.
+    out_vox: np.ndarray
+        Position (in the concatenated voxels) of the last voxel of each
+        segment.
     """
+    vox_lengths = np.asarray(vox_lengths, dtype=np.intp)
+    vox_offsets = np.cumsum(vox_lengths) - vox_lengths
 
-    # Find all the points of the streamline that are in the ROIs
-    roi_data_1_intersect = map_coordinates(
-        mask, idx.T, order=0, mode='constant', cval=0)
-
-    # Select the points that are in the mask
-    mask_idx = np.arange(len(roi_data_1_intersect))[
-        roi_data_1_intersect == 1]
-
-    if len(mask_idx) == 0:
-        return []
-
-    # Get the entry and exit points for each segment
-    in_strl_idx = np.amin(mask_idx)
-    out_strl_idx = np.amax(mask_idx)
+    if cutting_style == CuttingStyle.TRIM_ENDPOINTS:
+        # From the first to the last voxel in the mask.
+        in_mask = np.flatnonzero(values == 1)
+        ids = np.repeat(np.arange(len(vox_lengths)), vox_lengths)[in_mask]
+        first = np.flatnonzero(np.diff(ids, prepend=-1))
+        last = np.flatnonzero(np.diff(ids, append=len(vox_lengths)))
+        return ids[first], in_mask[first], in_mask[last]
+
+    # Streamlines are split at each voxel outside of the mask. Each split
+    # segment starts with that voxel, which is skipped. The first segment of
+    # a streamline has no such voxel, but its first voxel is also skipped.
+    ids, run_starts, run_ends = _true_runs(values != 0, vox_lengths)
+    at_start = run_starts == vox_offsets[ids]
+    segment_lengths = run_ends - run_starts + ~at_start
+
+    if cutting_style == CuttingStyle.KEEP_LONGEST:
+        # Longest segment first, then first segment, for each streamline
+        order = np.lexsort((run_starts, -segment_lengths, ids))
+        best = order[np.flatnonzero(np.diff(ids[order], prepend=-1))]
+        selected = best[segment_lengths[best] > 1]
+    else:
+        selected = np.flatnonzero(segment_lengths > 3)
 
-    cut_strl = compute_streamline_segment(streamline, idx,
-                                          in_strl_idx, out_strl_idx,
-                                          pts_to_idx)
-    return [cut_strl]
+    return (ids[selected], run_starts[selected] + at_start[selected],
+            run_ends[selected] - 1)
 
 
-def _trim_streamline_in_mask_keep_longest(
-    idx, streamline, pts_to_idx, mask
-):
-    """ Trim a streamline to keep the longest segment within a mask. This
-    function does not generate new streamlines.
+def _compute_streamline_segments(streamlines, indices, points_to_idx,
+                                 streamline_ids, in_vox, out_vox):
+    """ Same as compute_streamline_segment, for many segments at once. Each
+    segment contains the points of the streamline between its entry and exit
+    voxels. Points are added on the streamline where it enters (or exits) a
+    voxel without points.
 
     Parameters
     ----------
-    idx: np.ndarray
-        Indices of the voxels intersected by the streamline.
-    streamline: np.ndarray
-        The streamlines to cut.
-    pts_to_idx: np.ndarray
-        Mapping from streamline points to indices.
-    mask: np.ndarray
-        Boolean array representing the region.
+    streamlines: ArraySequence
+        The original streamlines.
+    indices: ArraySequence
+        Indices of the voxels traversed by the streamlines (from uncompress).
+    points_to_idx: ArraySequence
+        Mapping from streamline points to indices (from uncompress).
+    streamline_ids: np.ndarray
+        Index of the original streamline of each segment.
+    in_vox: np.ndarray
+        Position (in the concatenated voxels) of the entry voxel of each
+        segment.
+    out_vox: np.ndarray
+        Position (in the concatenated voxels) of the exit voxel of each
+        segment.
 
     Returns
     -------
-    streamline: np.ndarray
-        The trimmed streamline within the mask.
+    segments: ArraySequence
+        The new streamlines. Empty if there is no segment.
     """
-
-    # Find all the points of the streamline that are in the ROIs
-    roi_data_1_intersect = map_coordinates(
-        mask, idx.T, order=0, mode='constant', cval=0)
-
-    # Select the points that are not in the mask
-    split_idx = np.arange(len(roi_data_1_intersect))[
-        roi_data_1_intersect == 0]
-    # Split the streamline into segments that are in the mask
-    split_strmls = np.array_split(np.arange(len(roi_data_1_intersect)),
-                                  split_idx)
-
-    # Find the longest segment of the streamline that is in the mask
-    longest_strml = max(split_strmls, key=len)
-
-    if len(longest_strml) <= 1:
-        return []
-
-    # Get the entry and exit points for the longest segment
-    # Skip the first point as it caused the split
-    in_strl_idx, out_strl_idx = longest_strml[1], longest_strml[-1]
-    cut_strl = compute_streamline_segment(streamline, idx,
-                                          in_strl_idx, out_strl_idx,
-                                          pts_to_idx)
-    return [cut_strl]
+    points = reconstruct_streamlines(streamlines._data, streamlines._offsets,
+                                     streamlines._lengths)._data
+    if len(in_vox) == 0:
+        segments = ArraySequence()
+        segments._data = points[:0]
+        return segments
+
+    voxels = np.asarray(indices._data).reshape((-1, 3))
+    vox_offsets = np.asarray(indices._offsets, dtype=np.intp)
+
+    # Voxel of each point, in the concatenated voxels. These are sorted, as
+    # points and voxels of a streamline follow the same order.
+    pts_lengths = np.asarray(points_to_idx._lengths, dtype=np.intp)
+    points_vox = reconstruct_streamlines(
+        np.asarray(points_to_idx._data)[:, None], points_to_idx._offsets,
+        pts_lengths)._data[:, 0].astype(np.intp)
+    points_vox += np.repeat(vox_offsets, pts_lengths)
+
+    # First point in the entry voxel. If there is none, the next point.
+    in_points = np.searchsorted(points_vox, in_vox, side='left')
+    add_start = points_vox[np.minimum(in_points, len(points_vox) - 1)] \
+        != in_vox
+    # Last point in the exit voxel. If there is none, the previous point.
+    out_points = np.searchsorted(points_vox, out_vox, side='right') - 1
+    add_exit = points_vox[np.maximum(out_points, 0)] != out_vox
+
+    start_points = _get_points_on_lines(points[in_points[add_start] - 1],
+                                        points[in_points[add_start]],
+                                        voxels[in_vox[add_start]])
+    exit_points = _get_points_on_lines(points[out_points[add_exit]],
+                                       points[out_points[add_exit] + 1],
+                                       voxels[out_vox[add_exit]])
+
+    # Position, in points + start_points + exit_points, of each new point.
+    nb_orig = out_points - in_points + 1
+    lengths = nb_orig + add_start + add_exit
+    offsets = np.cumsum(lengths) - lengths
+    sources = np.empty(np.sum(lengths), dtype=np.intp)
+    orig_offsets = np.cumsum(nb_orig) - nb_orig
+    local = np.arange(np.sum(nb_orig)) - np.repeat(orig_offsets, nb_orig)
+    sources[np.repeat(offsets + add_start, nb_orig) + local] = \
+        np.repeat(in_points, nb_orig) + local
+    sources[offsets[add_start]] = len(points) + np.arange(len(start_points))
+    sources[(offsets + lengths - 1)[add_exit]] = \
+        len(points) + len(start_points) + np.arange(len(exit_points))
+
+    all_points = np.concatenate(
+        (points, start_points.astype(points.dtype),
+         exit_points.astype(points.dtype)))
+    segments = ArraySequence()
+    segments._data = all_points[sources]
+    segments._offsets = offsets
+    segments._lengths = lengths
+    return segments
 
 
 def cut_streamlines_with_mask(
@@ -264,6 +293,9 @@ def cut_streamlines_with_mask(
     If keep_longest is set, the longest segment of the streamline that crosses
     the mask will be kept. Otherwise, the streamline will be cut at the mask.
 
+    All streamlines are cut at once, on the concatenated voxels returned by
+    uncompress.
+
     Parameters
     ----------
     sft: StatefulTractogram
@@ -279,13 +311,17 @@ def cut_streamlines_with_mask(
     min_len: float
         Minimum length from the resulting streamlines.
     processes: int
-        Number of processes to use.
+        Deprecated, has no effect: the cutting is vectorized and no longer
+        uses a pool of processes.
 
     Returns
     -------
     new_sft : StatefulTractogram
         New object with the streamlines trimmed within the mask.
     """
+    if processes != 1:
+        warnings.warn("processes is deprecated and has no effect.",
+                      DeprecationWarning, stacklevel=2)
 
     orig_space = sft.space
     orig_origin = sft.origin
@@ -303,29 +339,20 @@ def cut_streamlines_with_mask(
                          "--remove_single_point and "
                          "--remove_overlapping_points options.")
 
-    # Select the trimming function. If keep_longest is set, the longest
-    # segment of the streamline that crosses the mask will be kept. If
-    # trim_endpoints is set, the endpoints of the streamlines will be cut.
-    # Otherwise, the streamline will be cut at the mask.
-    if cutting_style == CuttingStyle.TRIM_ENDPOINTS:
-        trim_func = _trim_streamline_endpoints_in_mask
-    elif cutting_style == CuttingStyle.KEEP_LONGEST:
-        trim_func = _trim_streamline_in_mask_keep_longest
-    else:
-        trim_func = _trim_streamline_in_mask
+    # Select the segments to keep, depending on the cutting style. If
+    # keep_longest is set, the longest segment of the streamline that crosses
+    # the mask will be kept. If trim_endpoints is set, the endpoints of the
+    # streamlines will be cut. Otherwise, the streamline will be cut at the
+    # mask.
+    values = _get_mask_values(mask, indices)
+    streamline_ids, in_vox, out_vox = _get_segments_in_mask(
+        values, indices._lengths, cutting_style)
 
-    # Trim streamlines with the mask and return the new streamlines
-    pool = Pool(processes)
-    lists_of_new_strmls = pool.starmap(
-        trim_func, [(i, s, pt, mask) for (i, s, pt) in zip(
-            indices, sft.streamlines, points_to_idx)])
-    pool.close()
-    # Flatten the list of lists of new streamlines in a single list of
-    # new streamlines
-    new_strmls = ArraySequence([strml for list_of_strml in lists_of_new_strmls
-                                for strml in list_of_strml])
+    new_strmls = _compute_streamline_segments(
+        sft.streamlines, indices, points_to_idx, streamline_ids,
+        in_vox, out_vox)
 
-    new_sft = StatefulTractogram.from_sft(
+    new_sft = dipy_sft.StatefulTractogram.from_sft(
         new_strmls, sft)
     new_sft.to_space(orig_space)
     new_sft.to_origin(orig_origin)
@@ -405,7 +432,7 @@ def cut_streamlines_between_labels(
                           if strml is not None]
     new_strmls = ArraySequence(list_of_new_strmls)
 
-    new_sft = StatefulTractogram.from_sft(
+    new_sft = dipy_sft.StatefulTractogram.from_sft(
         new_strmls, sft)
     new_sft.to_space(orig_space)
     new_sft.to_origin(orig_origin)
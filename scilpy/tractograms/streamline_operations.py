@@ -1,19 +1,23 @@
 # -*- coding: utf-8 -*-
-import copy
 import logging
-from multiprocessing import Pool
+import warnings
 
 import numpy as np
 import scipy.ndimage as ndi
-from dipy.io.stateful_tractogram import StatefulTractogram
-from dipy.segment.clustering import qbx_and_merge
-from dipy.tracking import metrics as tm
 from dipy.tracking.streamlinespeed import (compress_streamlines,
                                            length,
                                            set_number_of_points)
-from scipy.interpolate import splev, splprep
+from nibabel.streamlines import ArraySequence
 from scipy.spatial.transform import Rotation
 
+from scilpy.io.streamlines import reconstruct_streamlines
+from scilpy.tractograms.resampling import resample_arc_length
+from scilpy.utils.lazy_import import lazy_import
+
+dipy_sft = lazy_import('dipy.io.stateful_tractogram')
+dipy_clustering = lazy_import('dipy.segment.clustering')
+scipy_interpolate = lazy_import('scipy.interpolate')
+
 
 def _get_streamline_pt_index(points_to_index, vox_index, from_start=True):
     """Get the index of the streamline point in the voxel.
@@ -92,6 +96,42 @@ def _get_point_on_line(first_point, second_point, vox_lower_corner):
     return first_point + ray * (t0 + t1) / 2.
 
 
+def _get_points_on_lines(first_points, second_points, vox_lower_corners):
+    """ Same as _get_point_on_line, for many lines at once.
+
+    Arguments
+    ---------
+    first_points: np.ndarray of shape (N, 3)
+        The first point of each line.
+    second_points: np.ndarray of shape (N, 3)
+        The second point of each line.
+    vox_lower_corners: np.ndarray of shape (N, 3)
+        The lower corner coordinates of each voxel.
+
+    Returns
+    -------
+    intersection_points: np.ndarray of shape (N, 3)
+        The point on each line that is in its voxel.
+    """
+    first_points = np.asarray(first_points, dtype=float)
+    rays = np.asarray(second_points, dtype=float) - first_points
+    rays /= np.linalg.norm(rays, axis=1, keepdims=True)
+
+    corners = np.asarray(vox_lower_corners, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inv_rays = 1. / rays
+        v0 = (corners - first_points) * inv_rays
+        v1 = (corners + 1 - first_points) * inv_rays
+
+    # Axes parallel to the line do not constrain the intersection
+    parallel = rays == 0.
+    t0 = np.max(np.where(parallel, 0., np.minimum(v0, v1)), axis=1)
+    t0 = np.maximum(t0, 0.)
+    t1 = np.min(np.where(parallel, np.inf, np.maximum(v0, v1)), axis=1)
+
+    return first_points + rays * ((t0 + t1) / 2.)[:, None]
+
+
 def get_angles(sft, degrees=True, add_zeros=False):
     """
     Returns the angle between each segment of the streamlines.
@@ -206,7 +246,7 @@ def compress_sft(sft, tol_error=0.01):
                         "This information will not be carried in the final "
                         "tractogram.")
 
-    compressed_sft = StatefulTractogram.from_sft(
+    compressed_sft = dipy_sft.StatefulTractogram.from_sft(
         compressed_streamlines, sft,
         data_per_streamline=sft.data_per_streamline)
 
@@ -216,10 +256,145 @@ def compress_sft(sft, tol_error=0.01):
     return compressed_sft
 
 
+def _true_runs(flags, lengths):
+    """
+    Finds all runs of consecutive points for which flags is True, on the
+    concatenated points of all streamlines. Runs never span two streamlines.
+
+    Parameters
+    ----------
+    flags: np.ndarray of bool, shape (nb_points,)
+        Flag of each point of the concatenated streamlines.
+    lengths: np.ndarray of int, shape (nb_streamlines,)
+        Number of points of each streamline.
+
+    Returns
+    -------
+    run_ids: np.ndarray of int, shape (nb_runs,)
+        Index of the streamline of each run. Runs are ordered by streamline,
+        then by position in the streamline.
+    run_starts: np.ndarray of int, shape (nb_runs,)
+        Position, in the concatenated points, of the first point of each run.
+    run_ends: np.ndarray of int, shape (nb_runs,)
+        Position, in the concatenated points, following the last point of each
+        run.
+    """
+    lengths = np.asarray(lengths, dtype=np.intp)
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+    # A run starts at a flagged point if the previous point is not flagged
+    # or belongs to another streamline. Same for ends, with the next point.
+    new_streamline = np.zeros(len(flags) + 1, dtype=bool)
+    new_streamline[offsets[lengths > 0]] = True
+    new_streamline[-1] = True
+    previous = np.concatenate(([False], flags))
+    next_flags = np.concatenate((flags, [False]))
+    run_starts = np.flatnonzero(
+        flags & (~previous[:-1] | new_streamline[:-1]))
+    run_ends = np.flatnonzero(
+        flags & (~next_flags[1:] | new_streamline[1:])) + 1
+    run_ids = np.repeat(np.arange(len(lengths)), lengths)[run_starts]
+    return run_ids, run_starts, run_ends
+
+
+def _longest_true_runs(flags, lengths):
+    """
+    Finds, for each streamline, the longest run of consecutive points for
+    which flags is True. All streamlines are processed at once.
+
+    Parameters
+    ----------
+    flags: np.ndarray of bool, shape (nb_points,)
+        Flag of each point of the concatenated streamlines.
+    lengths: np.ndarray of int, shape (nb_streamlines,)
+        Number of points of each streamline.
+
+    Returns
+    -------
+    starts: np.ndarray of int, shape (nb_streamlines,)
+        Position, in the streamline, of the first point of its longest run.
+        If there are many runs of the same length, the first one is chosen.
+    run_lengths: np.ndarray of int, shape (nb_streamlines,)
+        Number of points of the longest run. 0 if no point is flagged.
+    """
+    lengths = np.asarray(lengths, dtype=np.intp)
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    run_ids, run_starts, run_ends = _true_runs(flags, lengths)
+
+    starts = np.zeros(len(lengths), dtype=np.intp)
+    run_lengths = np.zeros(len(lengths), dtype=np.intp)
+    if len(run_starts):
+        # Longest run first, then first run, for each streamline
+        order = np.lexsort((run_starts, run_starts - run_ends, run_ids))
+        run_ids = run_ids[order]
+        first = np.flatnonzero(np.diff(run_ids, prepend=-1))
+        best = order[first]
+        starts[run_ids[first]] = run_starts[best] - offsets[run_ids[first]]
+        run_lengths[run_ids[first]] = run_ends[best] - run_starts[best]
+    return starts, run_lengths
+
+
+def _extract_streamline_segments(array_seq, indices, starts, lengths):
+    """
+    Extracts one segment per selected streamline, as a single gather on the
+    ArraySequence buffer. Also works on data_per_point.
+
+    Parameters
+    ----------
+    array_seq: ArraySequence
+        Streamlines (or data_per_point).
+    indices: np.ndarray of int
+        Indices of the streamlines to keep.
+    starts: np.ndarray of int
+        For each kept streamline, position of the first point of the segment.
+    lengths: np.ndarray of int
+        For each kept streamline, number of points of the segment.
+
+    Returns
+    -------
+    segments: ArraySequence
+        array_seq[indices[i]][starts[i]:starts[i] + lengths[i]] for all i.
+    """
+    offsets = np.asarray(array_seq._offsets, dtype=np.intp)[indices] + starts
+    return reconstruct_streamlines(array_seq._data, offsets, lengths)
+
+
+def get_segment_starts(streamlines):
+    """
+    Finds all segments of the streamlines at once, on their concatenated
+    points: a segment goes from a point to the next one, except for the last
+    point of each streamline.
+
+    Parameters
+    ----------
+    streamlines: ArraySequence
+        Streamlines.
+
+    Returns
+    -------
+    points: np.ndarray, shape (nb_points, 3)
+        Concatenated points of all streamlines.
+    seg_starts: np.ndarray of int, shape (nb_segments,)
+        Position, in points, of the first point of each segment. The segment
+        ends at seg_starts + 1.
+    """
+    points = np.asarray(streamlines.get_data()).reshape((-1, 3))
+    lengths = np.asarray(streamlines._lengths, dtype=np.intp)
+    offsets = np.cumsum(lengths) - lengths
+
+    is_last = np.zeros(len(points), dtype=bool)
+    is_last[(offsets + lengths - 1)[lengths > 0]] = True
+    return points, np.flatnonzero(~is_last)
+
+
 def cut_invalid_streamlines(sft, epsilon=0.001):
     """ Cut streamlines so their longest segment are within the bounding box.
     This function keeps the data_per_point and data_per_streamline.
 
+    All streamlines are processed at once on the concatenated points.
+    Streamlines whose longest valid segment has less than 2 points are
+    removed.
+
     Parameters
     ----------
     sft: StatefulTractogram
@@ -244,59 +419,35 @@ def cut_invalid_streamlines(sft, epsilon=0.001):
     sft.to_vox()
     sft.to_corner()
 
-    copy_sft = copy.deepcopy(sft)
-    indices_to_cut, _ = copy_sft.remove_invalid_streamlines()
-
-    new_streamlines = []
+    # Points of all streamlines, contiguous (no copy if already the case)
+    lengths = np.asarray(sft.streamlines._lengths, dtype=np.intp)
+    points = reconstruct_streamlines(sft.streamlines._data,
+                                     sft.streamlines._offsets, lengths)._data
+    valid = np.all((points >= epsilon) &
+                   (points < np.asarray(sft.dimensions) - epsilon), axis=1)
+
+    starts, new_lengths = _longest_true_runs(valid, lengths)
+    # No reason to cut if all points are within the volume
+    is_cut = new_lengths < lengths
+    is_kept = ~is_cut | (new_lengths > 1)
+    if np.any(~is_kept):
+        logging.warning('{} streamlines entirely out of the volume.'
+                        .format(np.count_nonzero(~is_kept)))
+    cutting_counter = int(np.count_nonzero(is_cut & is_kept))
+
+    indices = np.flatnonzero(is_kept)
+    starts, new_lengths = starts[indices], new_lengths[indices]
+    new_streamlines = _extract_streamline_segments(
+        sft.streamlines, indices, starts, new_lengths)
     new_data_per_point = {}
-    new_data_per_streamline = {}
     for key in sft.data_per_point.keys():
-        new_data_per_point[key] = []
+        new_data_per_point[key] = _extract_streamline_segments(
+            sft.data_per_point[key], indices, starts, new_lengths)
+    new_data_per_streamline = {}
     for key in sft.data_per_streamline.keys():
-        new_data_per_streamline[key] = []
-
-    cutting_counter = 0
-    for ind in range(len(sft.streamlines)):
-        if ind in indices_to_cut:
-            # This streamline was detected as invalid
-
-            best_pos = [0, 0]  # First and last valid points of longest segment
-            cur_pos = [0, 0]   # First and last valid points of current segment
-            for pos, point in enumerate(sft.streamlines[ind]):
-                if (point < epsilon).any() or \
-                        (point >= sft.dimensions - epsilon).any():
-                    # The coordinate is < 0 or > box. Starting new segment
-                    cur_pos = [pos+1, pos+1]
-                elif cur_pos[1] - cur_pos[0] > best_pos[1] - best_pos[0]:
-                    # We found a longer good segment.
-                    best_pos = cur_pos
-
-                # Ready to check next point.
-                cur_pos[1] += 1
-
-            # Appending the longest segment to the list of streamlines
-            if not best_pos == [0, 0]:
-                new_streamlines.append(
-                    sft.streamlines[ind][best_pos[0]:best_pos[1]])
-                cutting_counter += 1
-                for key in sft.data_per_streamline.keys():
-                    new_data_per_streamline[key].append(
-                        sft.data_per_streamline[key][ind])
-                for key in sft.data_per_point.keys():
-                    new_data_per_point[key].append(
-                        sft.data_per_point[key][ind][
-                            best_pos[0]:best_pos[1]-1])
-            else:
-                logging.warning('Streamline entirely out of the volume.')
-        else:
-            # No reason to try to cut if all points are within the volume
-            new_streamlines.append(sft.streamlines[ind])
-            for key in sft.data_per_streamline.keys():
-                new_data_per_streamline[key].append(
-                    sft.data_per_streamline[key][ind])
-            for key in sft.data_per_point.keys():
-                new_data_per_point[key].append(sft.data_per_point[key][ind])
-    new_sft = StatefulTractogram.from_sft(
+        new_data_per_streamline[key] = sft.data_per_streamline[key][indices]
+
+    new_sft = dipy_sft.StatefulTractogram.from_sft(
         new_streamlines, sft, data_per_streamline=new_data_per_streamline,
         data_per_point=new_data_per_point)
 
@@ -328,7 +479,7 @@ def remove_single_point_streamlines(sft):
     if len(indices):
         new_sft = sft[indices]
     else:
-        new_sft = StatefulTractogram.from_sft([], sft)
+        new_sft = dipy_sft.StatefulTractogram.from_sft([], sft)
 
     return new_sft
 
@@ -363,7 +514,7 @@ def remove_overlapping_points_streamlines(sft, threshold=0.001):
             new_streamline = np.delete(streamline.tolist(),
                                        indices, axis=0)
             new_streamlines.append(new_streamline)
-    new_sft = StatefulTractogram.from_sft(new_streamlines, sft)
+    new_sft = dipy_sft.StatefulTractogram.from_sft(new_streamlines, sft)
 
     return new_sft
 
@@ -539,9 +690,60 @@ def resample_streamlines_num_points(sft, num_points):
     return resampled_sft
 
 
+def _interpolate_data_per_point(data_per_point, nb_points, positions,
+                                ratios):
+    """
+    Interpolates data_per_point at the positions of resampled points (see
+    scilpy.tractograms.resampling.resample_arc_length). Floats are linearly
+    interpolated, other dtypes take the value of the nearest original point.
+
+    Parameters
+    ----------
+    data_per_point: ArraySequence
+        The data_per_point of the original streamlines.
+    nb_points: np.ndarray of int
+        Number of points of each resampled streamline.
+    positions: np.ndarray of int
+        For each new point, position (in its streamline) of the original
+        point preceding it.
+    ratios: np.ndarray of float
+        For each new point, its position between the preceding original point
+        (0) and the next one (1).
+
+    Returns
+    -------
+    new_data_per_point: ArraySequence
+        The data_per_point of the resampled streamlines.
+    """
+    data = np.asarray(data_per_point._data)
+    previous_ids = positions + np.repeat(
+        np.asarray(data_per_point._offsets, dtype=np.intp), nb_points)
+
+    if np.issubdtype(data.dtype, np.floating):
+        # In-place: previous + ratio * (next - previous)
+        next_ids = np.minimum(previous_ids + 1, len(data) - 1)
+        ratios = ratios.reshape((-1,) + (1,) * (data.ndim - 1))
+        new_data = data[previous_ids]
+        difference = data[next_ids]
+        difference -= new_data
+        difference *= ratios.astype(data.dtype, copy=False)
+        new_data += difference
+    else:
+        previous_ids[ratios >= 0.5] += 1
+        new_data = data[previous_ids]
+
+    new_data_per_point = ArraySequence()
+    new_data_per_point._data = new_data
+    new_data_per_point._offsets = np.concatenate(
+        ([0], np.cumsum(nb_points)[:-1]))
+    new_data_per_point._lengths = np.asarray(nb_points)
+    return new_data_per_point
+
+
 def resample_streamlines_step_size(sft, step_size):
     """
-    Resample streamlines using a fixed step size.
+    Resample streamlines using a fixed step size. The data_per_point are
+    interpolated at the new points.
 
     Parameters
     ----------
@@ -573,16 +775,26 @@ def resample_streamlines_step_size(sft, step_size):
     # Resampling
     lengths = length(sft.streamlines)
     nb_points = np.ceil(lengths / step_size).astype(int)
-    if np.any(nb_points == 1):
+    if np.any(nb_points < 2):
         logging.warning("Some streamlines are shorter than the provided "
                         "step size...")
-        nb_points[nb_points == 1] = 2
-
-    resampled_streamlines = [set_number_of_points(s, n) for s, n in
-                             zip(sft.streamlines, nb_points)]
+        nb_points[nb_points < 2] = 2
+
+    # All streamlines at once, on the ArraySequence buffer
+    keep_dpp = len(sft.data_per_point.keys()) > 0
+    resampled = resample_arc_length(sft.streamlines, nb_points,
+                                    return_positions=keep_dpp)
+    resampled_streamlines = resampled[0] if keep_dpp else resampled
+    resampled_dpp = {}
+    for key in sft.data_per_point.keys():
+        resampled_dpp[key] = _interpolate_data_per_point(
+            sft.data_per_point[key], nb_points, resampled[1], resampled[2])
 
     # Creating sft
-    resampled_sft = _warn_and_save(resampled_streamlines, sft)
+    resampled_sft = dipy_sft.StatefulTractogram.from_sft(
+        resampled_streamlines, sft,
+        data_per_point=resampled_dpp,
+        data_per_streamline=sft.data_per_streamline)
 
     # Return to original space
     resampled_sft.to_space(orig_space)
@@ -598,7 +810,7 @@ def _warn_and_save(new_streamlines, sft):
         logging.info("Initial StatefulTractogram contained data_per_point. "
                      "This information will not be carried in the final "
                      "tractogram.")
-    new_sft = StatefulTractogram.from_sft(
+    new_sft = dipy_sft.StatefulTractogram.from_sft(
         new_streamlines, sft, data_per_streamline=sft.data_per_streamline)
 
     return new_sft
@@ -680,9 +892,11 @@ def smooth_line_spline(streamline, smoothing_parameter, nb_ctrl_points):
     sampled_streamline = set_number_of_points(streamline, nb_ctrl_points)
 
     # Fit the spline using the control points
-    tck, u = splprep(sampled_streamline.T, s=smoothing_parameter)
+    tck, u = scipy_interpolate.splprep(sampled_streamline.T,
+                                       s=smoothing_parameter)
     # Evaluate the spline
-    smoothed_streamline = splev(np.linspace(0, 1, initial_nb_of_points), tck)
+    smoothed_streamline = scipy_interpolate.splev(
+        np.linspace(0, 1, initial_nb_of_points), tck)
     smoothed_streamline = np.squeeze(np.asarray([smoothed_streamline]).T)
 
     # Ensure first and last point remain the same
@@ -811,9 +1025,122 @@ def parallel_transport_streamline(streamline, nb_streamlines, radius,
     return new_streamlines
 
 
+def _compute_winding_angles_chunk(points, lengths):
+    """
+    Winding angles of streamlines given as concatenated points. See
+    compute_winding_angles.
+    """
+    nb_streamlines = len(lengths)
+    streamline_ids = np.repeat(np.arange(nb_streamlines), lengths)
+    points = points.astype(np.float64)
+
+    # Centering each streamline on its mean point
+    counts = np.maximum(lengths, 1)[:, None]
+    means = np.zeros((nb_streamlines, 3))
+    for axis in range(3):
+        means[:, axis] = np.bincount(streamline_ids, points[:, axis],
+                                     minlength=nb_streamlines)
+    points -= (means / counts)[streamline_ids]
+
+    # Normal of the best fitting plane: the eigenvector of the scatter
+    # matrix with the smallest eigenvalue (i.e. the last right singular
+    # vector of the centered points).
+    scatter = np.zeros((nb_streamlines, 3, 3))
+    for i in range(3):
+        for j in range(i, 3):
+            scatter[:, i, j] = np.bincount(
+                streamline_ids, points[:, i] * points[:, j],
+                minlength=nb_streamlines)
+            scatter[:, j, i] = scatter[:, i, j]
+    normals = np.linalg.eigh(scatter)[1][:, :, 0]
+
+    # Projecting on the plane. Dot products and norms are then the same as
+    # with the coordinates in the plane's own basis.
+    normal_components = np.einsum('ij,ij->i', points, normals[streamline_ids])
+    points -= normal_components[:, None] * normals[streamline_ids]
+
+    # Angles between consecutive (projected) positions of each streamline
+    pairs = np.flatnonzero(streamline_ids[1:] == streamline_ids[:-1])
+    v0 = points[pairs]
+    v1 = points[pairs + 1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cos_angles = np.einsum('ij,ij->i', v0, v1) / (
+            np.linalg.norm(v0, axis=1) * np.linalg.norm(v1, axis=1))
+    angles = np.arccos(np.clip(cos_angles, -1, 1))
+
+    return np.rad2deg(np.bincount(streamline_ids[pairs], angles,
+                                  minlength=nb_streamlines))
+
+
+def compute_winding_angles(streamlines, chunk_size=100000):
+    """
+    Computes the total turning angle of each streamline, projected on its
+    best fitting plane (as dipy.tracking.metrics.winding). All streamlines
+    are processed at once on the concatenated points, by chunks of
+    chunk_size streamlines to bound the memory.
+
+    Parameters
+    ----------
+    streamlines: ArraySequence or list of np.ndarray
+        The streamlines.
+    chunk_size: int
+        Number of streamlines processed at once.
+
+    Returns
+    -------
+    windings: np.ndarray of float, shape (nb_streamlines,)
+        The winding angle of each streamline, in degrees. As in Dipy, it is
+        nan if a point is at the mean position of its streamline.
+    """
+    if not isinstance(streamlines, ArraySequence):
+        streamlines = ArraySequence(streamlines)
+
+    windings = np.zeros(len(streamlines))
+    for start in range(0, len(streamlines), chunk_size):
+        chunk = range(start, min(start + chunk_size, len(streamlines)))
+        chunk_streamlines = reconstruct_streamlines(
+            streamlines._data, streamlines._offsets, streamlines._lengths,
+            indices=chunk)
+        windings[chunk] = _compute_winding_angles_chunk(
+            chunk_streamlines._data,
+            np.asarray(chunk_streamlines._lengths, dtype=np.intp))
+    return windings
+
+
+def compute_mean_curvatures(streamlines):
+    """
+    Computes the mean curvature of each streamline (as
+    dipy.tracking.metrics.mean_curvature). Streamlines with the same number
+    of points (ex, QuickBundles centroids) are processed at once.
+
+    Parameters
+    ----------
+    streamlines: ArraySequence or list of np.ndarray
+        The streamlines. Each must have at least 2 points.
+
+    Returns
+    -------
+    curvatures: np.ndarray of float, shape (nb_streamlines,)
+        The mean curvature of each streamline.
+    """
+    lengths = np.array([len(s) for s in streamlines], dtype=np.intp)
+    curvatures = np.zeros(len(lengths))
+    for nb_points in np.unique(lengths):
+        ids = np.flatnonzero(lengths == nb_points)
+        xyz = np.stack([streamlines[i] for i in ids])
+
+        dxyz = np.gradient(xyz, axis=1)
+        ddxyz = np.gradient(dxyz, axis=1)
+        curvature = np.linalg.norm(np.cross(dxyz, ddxyz), axis=2) / \
+            np.linalg.norm(dxyz, axis=2) ** 3
+        curvatures[ids] = np.mean(curvature, axis=1)
+    return curvatures
+
+
 def remove_loops(streamlines, max_angle, num_processes=1):
     """
-    Remove loops from a list of streamlines.
+    Remove loops from a list of streamlines. The winding angle of all
+    streamlines is computed at once (see compute_winding_angles).
 
     Parameters
     ----------
@@ -823,21 +1150,24 @@ def remove_loops(streamlines, max_angle, num_processes=1):
         Maximal winding angle a streamline can have before being classified as
         a loop.
     num_processes : int
-        Split the calculation to a pool of children processes.
+        Deprecated, has no effect: the computation is vectorized and no
+        longer uses a pool of processes.
 
     Returns
     -------
-    ids: list
+    ids: np.ndarray
         Ids of the streamlines with no loop.
     streamlines_clean: list or ndarray
         The remaining streamlines.
     """
-    pool = Pool(num_processes)
-    windings = pool.map(tm.winding, streamlines)
-    pool.close()
+    if num_processes != 1:
+        warnings.warn("num_processes is deprecated and has no effect.",
+                      DeprecationWarning, stacklevel=2)
+
+    windings = compute_winding_angles(streamlines)
 
-    streamlines_clean = streamlines[np.array(windings) < max_angle]
-    ids = list(np.where(np.array(windings) < max_angle)[0])
+    ids = np.flatnonzero(windings < max_angle)
+    streamlines_clean = streamlines[windings < max_angle]
 
     return ids, streamlines_clean
 
@@ -847,6 +1177,9 @@ def remove_sharp_turns_qb(streamlines, qb_threshold=15.0, qb_seed=0):
     Remove sharp turns from a list of streamlines. Should only be used on
     bundled streamlines, not on whole-brain tractograms.
 
+    Streamlines are clustered with QuickBundles. Clusters whose centroid has
+    a mean curvature above the average of all centroids are removed.
+
     Parameters
     ----------
     streamlines: list or ndarray
@@ -858,29 +1191,22 @@ def remove_sharp_turns_qb(streamlines, qb_threshold=15.0, qb_seed=0):
 
     Returns
     -------
-    ids: list
+    ids: np.ndarray
         Ids of good streamlines.
     """
-    ids = []
     if len(streamlines) > 1:
-        curvature = []
-
         rng = np.random.RandomState(qb_seed)
-        clusters = qbx_and_merge(streamlines, [40, 30, 20, qb_threshold],
-                                 rng=rng, verbose=False)
+        clusters = dipy_clustering.qbx_and_merge(
+            streamlines, [40, 30, 20, qb_threshold], rng=rng, verbose=False)
 
-        for cc in clusters.centroids:
-            curvature.append(tm.mean_curvature(cc))
-        mean_curvature = sum(curvature) / len(curvature)
-
-        for i in range(len(clusters.centroids)):
-            if tm.mean_curvature(clusters.centroids[i]) <= mean_curvature:
-                ids.extend(clusters[i].indices)
+        curvatures = compute_mean_curvatures(clusters.centroids)
+        kept = np.flatnonzero(curvatures <= np.mean(curvatures))
+        ids = np.concatenate([clusters[i].indices for i in kept]).astype(int)
     else:
         logging.info("Impossible to remove sharp turns using Quickbundles "
                      "because the tractogram does not contain at least 2 "
                      "streamlines.")
-        ids = [0]
+        ids = np.arange(len(streamlines))
     return ids
 
 
@@ -904,19 +1230,24 @@ def remove_loops_and_sharp_turns(streamlines, max_angle, qb_threshold=None,
     qb_seed: int
         Seed to initialize randomness in QuickBundles
     num_processes : int
-        Split the calculation to a pool of children processes.
+        Deprecated, has no effect (see remove_loops).
 
     Returns
     -------
-    ids: list
+    ids: np.ndarray
         Ids of good streamlines. Only the ids are returned so proper filtering
         can be done afterwards.
     """
-    ids, streamlines_clean = remove_loops(streamlines, max_angle,
-                                          num_processes)
+    if num_processes != 1:
+        warnings.warn("num_processes is deprecated and has no effect.",
+                      DeprecationWarning, stacklevel=2)
+
+    ids, streamlines_clean = remove_loops(streamlines, max_angle)
 
     if qb_threshold is not None:
-        ids = remove_sharp_turns_qb(streamlines_clean, qb_threshold, qb_seed)
+        # Ids of the sharp turns pass are in the loop-free streamlines
+        ids = ids[remove_sharp_turns_qb(streamlines_clean, qb_threshold,
+                                        qb_seed)]
     return ids
 
 
@@ -5,15 +5,15 @@ import os
 import nibabel as nib
 import numpy as np
 from dipy.io.streamline import load_tractogram
+import pytest
+from scipy.ndimage import map_coordinates
 
 from scilpy import SCILPY_HOME
 from scilpy.image.utils import split_mask_blobs_kmeans
 from scilpy.io.fetcher import fetch_data, get_testing_files_dict
 from scilpy.tractograms.streamline_and_mask_operations import (
+    _get_segments_in_mask,
     _intersects_two_rois,
-    _trim_streamline_in_mask,
-    _trim_streamline_endpoints_in_mask,
-    _trim_streamline_in_mask_keep_longest,
     compute_streamline_segment,
     cut_streamlines_between_labels,
     cut_streamlines_with_mask,
@@ -27,6 +27,157 @@ from scilpy.tractograms.uncompress import uncompress
 fetch_data(get_testing_files_dict(), keys=['tractograms.zip'])
 
 
+def _trim_streamline_in_mask(
+    idx, streamline, pts_to_idx, mask
+):
+    """ Reference implementation, one streamline at a time, of the DEFAULT
+    cutting style of cut_streamlines_with_mask.
+
+    Trim streamlines to the bounding box or a binary mask. More
+    streamlines may be generated if the original streamline goes in and out
+    of the mask.
+
+    Parameters
+    ----------
+    idx: np.ndarray
+        Indices of the voxels intersected by the streamline.
+    streamline: np.ndarray
+        The streamlines to cut.
+    pts_to_idx: np.ndarray
+        Mapping from streamline points to indices.
+    mask: np.ndarray
+        Boolean array representing the region.
+
+    Returns
+    -------
+    new_strmls : list of np.ndarray
+        New streamlines trimmed within the mask.
+    """
+
+    # Find all the points of the streamline that are in the ROIs
+    roi_data_1_intersect = map_coordinates(
+        mask, idx.T, order=0, mode='constant', cval=0)
+
+    # Select the points that are not in the mask
+    split_idx = np.arange(len(roi_data_1_intersect))[
+        roi_data_1_intersect == 0]
+    # Split the streamline into segments that are in the mask
+    split_strmls = np.array_split(np.arange(len(roi_data_1_intersect)),
+                                  split_idx)
+    new_strmls = []
+    for strml in split_strmls:
+        if len(strml) <= 3:
+            continue
+        # Get the entry and exit points for each segment
+        # Skip the first point as it caused the split
+        in_strl_idx, out_strl_idx = strml[1], strml[-1]
+        cut_strl = compute_streamline_segment(streamline, idx,
+                                              in_strl_idx, out_strl_idx,
+                                              pts_to_idx)
+        new_strmls.append(cut_strl)
+
+    return new_strmls
+
+
+def _trim_streamline_endpoints_in_mask(
+    idx, streamline, pts_to_idx, mask
+):
+    """ Reference implementation, one streamline at a time, of the
+    TRIM_ENDPOINTS cutting style of cut_streamlines_with_mask.
+
+    Trim a streamline to remove its endpoints if they are outside of
+    a mask. This function does not generate new streamlines.
+
+    Parameters
+    ----------
+    idx: np.ndarray
+        Indices of the voxels intersected by the streamline.
+    streamline: np.ndarray
+        The streamlines to cut.
+    pts_to_idx: np.ndarray
+        Mapping from streamline points to indices.
+    mask: np.ndarray
+        Boolean array representing the region.
+
+    Returns
+    -------
+    streamline: np.ndarray
+        The trimmed streamline within the mask.
+    """
+
+    # Find all the points of the streamline that are in the ROIs
+    roi_data_1_intersect = map_coordinates(
+        mask, idx.T, order=0, mode='constant', cval=0)
+
+    # Select the points that are in the mask
+    mask_idx = np.arange(len(roi_data_1_intersect))[
+        roi_data_1_intersect == 1]
+
+    if len(mask_idx) == 0:
+        return []
+
+    # Get the entry and exit points for each segment
+    in_strl_idx = np.amin(mask_idx)
+    out_strl_idx = np.amax(mask_idx)
+
+    cut_strl = compute_streamline_segment(streamline, idx,
+                                          in_strl_idx, out_strl_idx,
+                                          pts_to_idx)
+    return [cut_strl]
+
+
+def _trim_streamline_in_mask_keep_longest(
+    idx, streamline, pts_to_idx, mask
+):
+    """ Reference implementation, one streamline at a time, of the
+    KEEP_LONGEST cutting style of cut_streamlines_with_mask.
+
+    Trim a streamline to keep the longest segment within a mask. This
+    function does not generate new streamlines.
+
+    Parameters
+    ----------
+    idx: np.ndarray
+        Indices of the voxels intersected by the streamline.
+    streamline: np.ndarray
+        The streamlines to cut.
+    pts_to_idx: np.ndarray
+        Mapping from streamline points to indices.
+    mask: np.ndarray
+        Boolean array representing the region.
+
+    Returns
+    -------
+    streamline: np.ndarray
+        The trimmed streamline within the mask.
+    """
+
+    # Find all the points of the streamline that are in the ROIs
+    roi_data_1_intersect = map_coordinates(
+        mask, idx.T, order=0, mode='constant', cval=0)
+
+    # Select the points that are not in the mask
+    split_idx = np.arange(len(roi_data_1_intersect))[
+        roi_data_1_intersect == 0]
+    # Split the streamline into segments that are in the mask
+    split_strmls = np.array_split(np.arange(len(roi_data_1_intersect)),
+                                  split_idx)
+
+    # Find the longest segment of the streamline that is in the mask
+    longest_strml = max(split_strmls, key=len)
+
+    if len(longest_strml) <= 1:
+        return []
+
+    # Get the entry and exit points for the longest segment
+    # Skip the first point as it caused the split
+    in_strl_idx, out_strl_idx = longest_strml[1], longest_strml[-1]
+    cut_strl = compute_streamline_segment(streamline, idx,
+                                          in_strl_idx, out_strl_idx,
+                                          pts_to_idx)
+    return [cut_strl]
+
+
 def _setup_files():
     """ Load streamlines and masks relevant to the tests here.
     """
@@ -138,9 +289,8 @@ def test_cut_outside_of_mask_streamlines():
 
 
 def test_trim_streamline_in_mask():
-    """ Test the _trim_streamline_in_mask function. This function is used by
-    cut_streamlines_with_mask, and is tested here to ensure that it works
-    correctly. Also provides with code coverage.
+    """ Test the _trim_streamline_in_mask reference implementation, against
+    which cut_streamlines_with_mask is checked.
     """
 
     sft, reference, _, _, center_roi = _setup_files()
@@ -191,9 +341,8 @@ def test_cut_outside_of_mask_streamlines_keep_longest():
 
 
 def test_trim_streamline_in_mask_keep_longest():
-    """ Test the _trim_streamline_in_mask_keep_longest function. This function
-    is used by cut_streamlines_with_mask, and is tested here to ensure that it
-    works correctly. Also provides with code coverage.
+    """ Test the _trim_streamline_in_mask_keep_longest reference
+    implementation, against which cut_streamlines_with_mask is checked.
     """
 
     sft, reference, _, _, center_roi = _setup_files()
@@ -240,10 +389,79 @@ def test_cut_outside_of_mask_streamlines_trim_endpoints():
     assert np.allclose(cut_sft.streamlines._data, res.streamlines._data)
 
 
+def test_get_segments_in_mask():
+    """ Test the _get_segments_in_mask function, which selects the segments
+    of all streamlines at once for cut_streamlines_with_mask. Segments must
+    be the same as the ones of the per-streamline reference implementations.
+    """
+
+    # Two streamlines, of 9 and 4 voxels.
+    values = np.array([1, 1, 1, 1, 0, 1, 1, 1, 0,
+                       0, 1, 1, 0])
+    lengths = [9, 4]
+
+    ids, in_vox, out_vox = _get_segments_in_mask(
+        values, lengths, CuttingStyle.DEFAULT)
+    assert np.array_equal(ids, [0, 0])
+    assert np.array_equal(in_vox, [1, 5])
+    assert np.array_equal(out_vox, [3, 7])
+
+    ids, in_vox, out_vox = _get_segments_in_mask(
+        values, lengths, CuttingStyle.KEEP_LONGEST)
+    assert np.array_equal(ids, [0, 1])
+    assert np.array_equal(in_vox, [1, 10])
+    assert np.array_equal(out_vox, [3, 11])
+
+    ids, in_vox, out_vox = _get_segments_in_mask(
+        values, lengths, CuttingStyle.TRIM_ENDPOINTS)
+    assert np.array_equal(ids, [0, 1])
+    assert np.array_equal(in_vox, [0, 10])
+    assert np.array_equal(out_vox, [7, 11])
+
+
+def test_get_segments_in_mask_empty():
+    """ Test the _get_segments_in_mask function when no voxel is in the mask.
+    """
+
+    values = np.zeros(13)
+    lengths = [9, 4]
+
+    for cutting_style in CuttingStyle:
+        ids, in_vox, out_vox = _get_segments_in_mask(
+            values, lengths, cutting_style)
+        assert len(ids) == len(in_vox) == len(out_vox) == 0
+
+
+def test_cut_streamlines_with_empty_mask():
+    """ Test the cut_streamlines_with_mask function with a mask that does not
+    touch any streamline: the result is empty, for all cutting styles.
+    """
+
+    sft, reference, _, _, center_roi = _setup_files()
+
+    for cutting_style in CuttingStyle:
+        cut_sft = cut_streamlines_with_mask(sft, np.zeros_like(center_roi),
+                                            cutting_style=cutting_style)
+        assert len(cut_sft) == 0
+
+
+def test_cut_streamlines_with_mask_processes():
+    """ Test that the processes argument of cut_streamlines_with_mask is
+    deprecated.
+    """
+
+    sft, _, _, _, center_roi = _setup_files()
+
+    expected = cut_streamlines_with_mask(sft, center_roi)
+    with pytest.warns(DeprecationWarning):
+        cut_sft = cut_streamlines_with_mask(sft, center_roi, processes=2)
+    assert np.allclose(cut_sft.streamlines._data,
+                       expected.streamlines._data)
+
+
 def test_trim_streamline_endpoints_in_mask():
-    """ Test the _trim_streamline_endpoints_in_mask function. This function is
-    used by cut_streamlines_with_mask, and is tested here to ensure that it
-    works correctly. Also provides with code coverage.
+    """ Test the _trim_streamline_endpoints_in_mask reference implementation,
+    against which cut_streamlines_with_mask is checked.
     """
 
     sft, reference, _, head_tail_offset_rois, _ = _setup_files()
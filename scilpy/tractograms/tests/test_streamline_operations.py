@@ -6,24 +6,32 @@ import numpy as np
 from numpy.testing import assert_array_almost_equal
 import pytest
 from dipy.io.streamline import load_tractogram
+from dipy.tracking.metrics import mean_curvature, winding
 from dipy.tracking.streamlinespeed import length
 from dipy.io.stateful_tractogram import StatefulTractogram
+from nibabel.streamlines import ArraySequence
 
 from scilpy import SCILPY_HOME
 from scilpy.io.fetcher import fetch_data, get_testing_files_dict
 from scilpy.tractograms.streamline_operations import (
     compress_sft,
+    compute_mean_curvatures,
+    compute_winding_angles,
     cut_invalid_streamlines,
     filter_streamlines_by_length,
     filter_streamlines_by_total_length_per_dim,
     get_angles,
+    get_segment_starts,
     get_streamlines_as_linspaces,
     resample_streamlines_num_points,
     resample_streamlines_step_size,
     smooth_line_gaussian,
     smooth_line_spline,
     parallel_transport_streamline,
+    remove_loops,
+    remove_loops_and_sharp_turns,
     remove_overlapping_points_streamlines,
+    remove_sharp_turns_qb,
     remove_single_point_streamlines)
 from scilpy.tractograms.tractogram_operations import concatenate_sft
 
@@ -104,6 +112,49 @@ def test_cut_invalid_streamlines():
     assert nb == 1
 
 
+def test_cut_invalid_streamlines_data_per_point():
+    sft = load_tractogram(in_long_sft, in_ref)
+    sft.to_vox()
+    sft.to_corner()
+    sft.data_per_point['ids'] = [np.arange(len(s))[:, None]
+                                 for s in sft.streamlines]
+    sft.data_per_streamline['sid'] = np.arange(len(sft))
+
+    # Invalid points at both ends of the first streamline, and in the middle
+    # of the second one.
+    nb_points = len(sft.streamlines[1])
+    sft.streamlines[0][[0, -1], :] = [65.0, 65.0, 2.0]
+    sft.streamlines[1][nb_points // 3, :] = [-1.0, 1.0, 1.0]
+
+    cut, nb = cut_invalid_streamlines(sft)
+    assert nb == 2
+    assert len(cut) == len(sft)
+
+    # The longest segment is kept, with its data_per_point.
+    assert_array_almost_equal(cut.streamlines[0], sft.streamlines[0][1:-1])
+    assert_array_almost_equal(cut.data_per_point['ids'][0][:, 0],
+                              np.arange(1, len(sft.streamlines[0]) - 1))
+    assert_array_almost_equal(cut.streamlines[1],
+                              sft.streamlines[1][nb_points // 3 + 1:])
+    assert_array_almost_equal(cut.data_per_streamline['sid'].ravel(),
+                              np.arange(len(sft)))
+
+
+def test_get_segment_starts():
+    streamlines = ArraySequence([np.arange(9).reshape((3, 3)),
+                                 np.arange(3).reshape((1, 3)),
+                                 np.arange(6).reshape((2, 3))])
+
+    points, seg_starts = get_segment_starts(streamlines)
+    assert np.array_equal(points, streamlines.get_data())
+    assert np.array_equal(seg_starts, [0, 1, 4])
+
+    # A slice shares the points of its parent: only its own are used.
+    points, seg_starts = get_segment_starts(streamlines[1:])
+    assert np.array_equal(points, [[0, 1, 2], [0, 1, 2], [3, 4, 5]])
+    assert np.array_equal(seg_starts, [1])
+
+
 def test_remove_single_point_streamlines():
     sft = load_tractogram(in_short_sft, in_ref)
 
@@ -311,6 +362,27 @@ def test_resample_streamlines_step_size():
     assert np.allclose(steps, step_size, atol=0.01), steps
 
 
+def test_resample_streamlines_step_size_data_per_point():
+    sft = load_tractogram(in_long_sft, in_ref)
+    sft.data_per_point['coords'] = [np.array(s) for s in sft.streamlines]
+    sft.data_per_point['ids'] = [np.arange(len(s), dtype=np.int16)[:, None]
+                                 for s in sft.streamlines]
+    sft.data_per_streamline['sid'] = np.arange(len(sft))
+
+    resampled_sft = resample_streamlines_step_size(sft, 0.5)
+
+    # Float data are interpolated as the points, other types take the value
+    # of the nearest original point.
+    assert_array_almost_equal(resampled_sft.data_per_point['coords']._data,
+                              resampled_sft.streamlines._data, decimal=4)
+    for ids, s in zip(resampled_sft.data_per_point['ids'], sft.streamlines):
+        assert ids.dtype == np.int16
+        assert ids[0, 0] == 0 and ids[-1, 0] == len(s) - 1
+        assert np.all(np.diff(ids[:, 0]) >= 0)
+    assert_array_almost_equal(resampled_sft.data_per_streamline['sid'].ravel(),
+                              np.arange(len(sft)))
+
+
 def test_smooth_line_gaussian_error():
     """ Test the smooth_line_gaussian function by adding noise to a
     streamline and smoothing it. The function does not accept a sigma
@@ -423,17 +495,84 @@ def test_parallel_transport_streamline():
     assert len(pt_streamlines) == 20
 
 
+def _get_circle(nb_turns, nb_points, radius=10.):
+    # Points on whole turns of a circle (in a tilted plane), so that its
+    # center is the mean of the points.
+    theta = np.linspace(0, 2 * np.pi * nb_turns, nb_points, endpoint=False)
+    circle = np.stack([radius * np.cos(theta), radius * np.sin(theta),
+                       np.zeros(nb_points)], axis=1)
+    tilt = np.array([[1, 0, 0], [0, 0.6, -0.8], [0, 0.8, 0.6]])
+    return (circle @ tilt.T + 50).astype(np.float32)
+
+
+def test_compute_winding_angles():
+    # Angle between consecutive points is the angular step
+    circle = _get_circle(2, 100)
+    assert np.allclose(compute_winding_angles([circle]), 99 * 720 / 100,
+                       atol=1e-3)
+
+    # Same as Dipy on random streamlines, computed by chunks
+    rng = np.random.default_rng(1234)
+    streamlines = [np.cumsum(rng.normal(0, 1, (n, 3)), axis=0)
+                   for n in rng.integers(2, 50, 100)]
+    windings = compute_winding_angles(ArraySequence(streamlines),
+                                      chunk_size=30)
+    assert np.allclose(windings, [winding(s) for s in streamlines],
+                       atol=1e-4)
+
+
+def test_compute_mean_curvatures():
+    rng = np.random.default_rng(1234)
+    streamlines = [np.cumsum(rng.normal(0, 1, (n, 3)), axis=0)
+                   for n in [20, 20, 5, 20, 12]]
+    curvatures = compute_mean_curvatures(streamlines)
+    assert np.allclose(curvatures, [mean_curvature(s) for s in streamlines])
+
+
 def test_remove_loops():
-    # toDO
-    # Coverage will not work: uses multi-processing
-    pass
+    # A quarter of a circle and a circle turning twice
+    arc = _get_circle(0.25, 30)
+    loop = _get_circle(2, 100)
+    streamlines = ArraySequence([arc, loop, arc])
+
+    ids, streamlines_clean = remove_loops(streamlines, 360)
+    assert np.array_equal(ids, [0, 2])
+    assert len(streamlines_clean) == 2
+    assert np.allclose(streamlines_clean[1], arc)
+
+    # The number of processes is deprecated.
+    with pytest.warns(DeprecationWarning):
+        ids, _ = remove_loops(streamlines, 360, num_processes=2)
+    assert np.array_equal(ids, [0, 2])
 
 
 def test_remove_sharp_turns_qb():
-    # toDO
-    pass
+    # Ten parallel straight streamlines, and five zigzags further away
+    x = np.linspace(0, 40, 20)
+    straight = [np.stack([x, np.full(20, i * 0.1), np.zeros(20)], axis=1)
+                for i in range(10)]
+    zigzag = [np.stack([x, 30 + 3 * (-1) ** np.arange(20) + i * 0.1,
+                        np.zeros(20)], axis=1) for i in range(5)]
+    streamlines = ArraySequence(zigzag[:2] + straight + zigzag[2:])
+
+    ids = remove_sharp_turns_qb(streamlines, qb_threshold=4)
+    assert np.array_equal(np.sort(ids), np.arange(2, 12))
 
 
 def test_remove_loops_and_sharp_turns():
-    # ok. Just a combination of the two previous functions.
-    pass
+    x = np.linspace(0, 40, 20)
+    straight = [np.stack([x, np.full(20, i * 0.1), np.zeros(20)], axis=1)
+                for i in range(10)]
+    # Small zigzags: sharp turns, but a winding angle below 360
+    zigzag = [np.stack([x, 30 + 0.2 * (-1) ** np.arange(20) + i * 0.1,
+                        np.zeros(20)], axis=1) for i in range(5)]
+    loop = _get_circle(2, 20)
+    streamlines = ArraySequence([loop] + zigzag + straight)
+
+    # Without QuickBundles: only the loop is removed
+    ids = remove_loops_and_sharp_turns(streamlines, 360)
+    assert np.array_equal(ids, np.arange(1, 16))
+
+    # Ids are those of the input streamlines, not of the loop-free ones
+    ids = remove_loops_and_sharp_turns(streamlines, 360, qb_threshold=4)
+    assert np.array_equal(np.sort(ids), np.arange(6, 16))
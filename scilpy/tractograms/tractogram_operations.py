@@ -12,11 +12,6 @@ import itertools
 import logging
 import random
 
-from dipy.io.stateful_tractogram import set_sft_logger_level, \
-    StatefulTractogram, Space
-from dipy.io.utils import get_reference_info, is_header_compatible
-from dipy.segment.clustering import qbx_and_merge
-from dipy.tracking.streamline import transform_streamlines
 from dipy.tracking.streamlinespeed import compress_streamlines
 from nibabel.streamlines import TrkFile, TckFile
 from nibabel.streamlines.array_sequence import ArraySequence
@@ -33,8 +28,14 @@ from scilpy.tractograms.streamline_operations import smooth_line_gaussian, \
     remove_overlapping_points_streamlines, remove_single_point_streamlines
 from scilpy.tractograms.streamline_and_mask_operations import \
     cut_streamlines_with_mask
+from scilpy.utils.lazy_import import lazy_import
 from scilpy.utils.spatial import generate_rotation_matrix
 
+dipy_sft = lazy_import('dipy.io.stateful_tractogram')
+dipy_io_utils = lazy_import('dipy.io.utils')
+dipy_clustering = lazy_import('dipy.segment.clustering')
+dipy_streamline = lazy_import('dipy.tracking.streamline')
+
 MIN_NB_POINTS = 10
 KEY_INDEX = np.concatenate((range(5), range(-1, -6, -1)))
 
@@ -61,7 +62,7 @@ def shuffle_streamlines(sft, rng_seed=None):
     data_per_streamline = sft.data_per_streamline[indices]
     data_per_point = sft.data_per_point[indices]
 
-    shuffled_sft = StatefulTractogram.from_sft(
+    shuffled_sft = dipy_sft.StatefulTractogram.from_sft(
         streamlines, sft,
         data_per_streamline=data_per_streamline,
         data_per_point=data_per_point)
@@ -102,7 +103,7 @@ def shuffle_streamlines_orientation(sft, rng_seed=None):
             else:
                 shuffled_streamlines.append(s)
 
-    shuffled_sft = StatefulTractogram.from_sft(
+    shuffled_sft = dipy_sft.StatefulTractogram.from_sft(
         shuffled_streamlines, sft,
         data_per_streamline=sft.data_per_streamline)
     return shuffled_sft
@@ -173,7 +174,7 @@ def flip_sft(sft, flip_axes):
             mod_streamline -= shift_vector
             flipped_streamlines.append(mod_streamline)
 
-    new_sft = StatefulTractogram.from_sft(
+    new_sft = dipy_sft.StatefulTractogram.from_sft(
         flipped_streamlines, sft,
         data_per_point=sft.data_per_point,
         data_per_streamline=sft.data_per_streamline)
@@ -550,10 +551,11 @@ def concatenate_sft(sft_list, erase_metadata=False, metadata_fake_init=False):
                     sft.data_per_point[dpp_key] = arr_seq
 
         if not metadata_fake_init and \
-                not StatefulTractogram.are_compatible(sft, sft_list[0]):
+                not dipy_sft.StatefulTractogram.are_compatible(sft,
+                                                               sft_list[0]):
             raise ValueError('Incompatible SFT, check space attributes and '
                              'data_per_point/streamlines.')
-        elif not is_header_compatible(sft, sft_list[0]):
+        elif not dipy_io_utils.is_header_compatible(sft, sft_list[0]):
             raise ValueError('Incompatible SFT, check space attributes.')
 
         fused_sft += sft
@@ -601,21 +603,21 @@ def transform_warp_sft(sft, linear_transfo, target, inverse=False,
     sft.to_center()
 
     if len(sft.streamlines) == 0:
-        return StatefulTractogram(sft.streamlines, target,
-                                  Space.RASMM)
+        return dipy_sft.StatefulTractogram(sft.streamlines, target,
+                                           dipy_sft.Space.RASMM)
 
     if inverse:
         linear_transfo = np.linalg.inv(linear_transfo)
 
     if not reverse_op:
-        streamlines = transform_streamlines(sft.streamlines,
-                                            linear_transfo)
+        streamlines = dipy_streamline.transform_streamlines(sft.streamlines,
+                                                            linear_transfo)
     else:
         streamlines = sft.streamlines
 
     if deformation_data is not None:
         if not reverse_op:
-            affine, _, _, _ = get_reference_info(target)
+            affine, _, _, _ = dipy_io_utils.get_reference_info(target)
         else:
             affine = sft.affine
 
@@ -634,8 +636,8 @@ def transform_warp_sft(sft, linear_transfo, target, inverse=False,
 
             # To access the deformation information, we need to go in VOX space
             # No need for corner shift since we are doing interpolation
-            cur_points_vox = np.array(transform_streamlines(points,
-                                                            inv_affine)).T
+            cur_points_vox = np.array(dipy_streamline.transform_streamlines(
+                points, inv_affine)).T
 
             x_def = map_coordinates(deformation_data[..., 0],
                                     cur_points_vox.tolist(), order=1)
@@ -653,12 +655,14 @@ def transform_warp_sft(sft, linear_transfo, target, inverse=False,
             nb_iteration -= 1
 
     if reverse_op:
-        streamlines = transform_streamlines(streamlines, linear_transfo)
+        streamlines = dipy_streamline.transform_streamlines(streamlines,
+                                                            linear_transfo)
 
     streamlines._data = streamlines._data.astype(dtype)
-    new_sft = StatefulTractogram(streamlines, target, Space.RASMM,
-                                 data_per_point=sft.data_per_point,
-                                 data_per_streamline=sft.data_per_streamline)
+    new_sft = dipy_sft.StatefulTractogram(
+        streamlines, target, dipy_sft.Space.RASMM,
+        data_per_point=sft.data_per_point,
+        data_per_streamline=sft.data_per_streamline)
     if cut_invalid:
         new_sft, _ = cut_invalid_streamlines(new_sft)
     elif remove_invalid:
@@ -801,7 +805,7 @@ def upsample_tractogram(sft, nb, point_wise_std=None, tube_radius=None,
     else:
         compressed_streamlines = new_streamlines
 
-    new_sft = StatefulTractogram.from_sft(compressed_streamlines, sft)
+    new_sft = dipy_sft.StatefulTractogram.from_sft(compressed_streamlines, sft)
     return new_sft
 
 
@@ -938,8 +942,8 @@ def split_sft_randomly_per_cluster(orig_sft, chunk_sizes, seed, thresholds):
 
     logging.debug("Computing QBx")
     rng = np.random.RandomState(seed)
-    clusters = qbx_and_merge(orig_sft.streamlines, thresholds, nb_pts=20,
-                             verbose=False, rng=rng)
+    clusters = dipy_clustering.qbx_and_merge(orig_sft.streamlines, thresholds,
+                                             nb_pts=20, verbose=False, rng=rng)
 
     logging.info("Done. Now getting list of indices in each of the {} "
                  "cluster.".format(len(clusters)))
@@ -1000,7 +1004,7 @@ def subsample_streamlines_alter(sft, min_dice=0.90, epsilon=0.01,
     """
     # Import in function to avoid circular import error
     from scilpy.tractanalysis.reproducibility_measures import compute_dice_voxel
-    set_sft_logger_level(logging.ERROR)
+    dipy_sft.set_sft_logger_level(logging.ERROR)
     space = sft.space
     origin = sft.origin
 
@@ -1037,7 +1041,7 @@ def subsample_streamlines_alter(sft, min_dice=0.90, epsilon=0.01,
         else:
             init_pick_max = to_pick
 
-    new_sft = StatefulTractogram.from_sft(streamlines, sft)
+    new_sft = dipy_sft.StatefulTractogram.from_sft(streamlines, sft)
     new_sft.to_space(space)
     new_sft.to_origin(origin)
     return new_sft
@@ -1070,7 +1074,7 @@ def cut_streamlines_alter(sft, min_dice=0.90, epsilon=0.01, from_end=False):
     """
     # Import in function to avoid circular import error
     from scilpy.tractanalysis.reproducibility_measures import compute_dice_voxel
-    set_sft_logger_level(logging.ERROR)
+    dipy_sft.set_sft_logger_level(logging.ERROR)
     space = sft.space
     origin = sft.origin
 
@@ -1109,7 +1113,7 @@ def cut_streamlines_alter(sft, min_dice=0.90, epsilon=0.01, from_end=False):
         else:
             init_cut_max = to_pick
 
-    new_sft = StatefulTractogram.from_sft(streamlines, sft)
+    new_sft = dipy_sft.StatefulTractogram.from_sft(streamlines, sft)
     new_sft.to_space(space)
     new_sft.to_origin(origin)
     return compress_sft(new_sft)
@@ -1138,7 +1142,7 @@ def replace_streamlines_alter(sft, min_dice=0.90, epsilon=0.01):
         The tractogram with replaced streamlines in the same space as the input
         tractogram.
     """
-    set_sft_logger_level(logging.ERROR)
+    dipy_sft.set_sft_logger_level(logging.ERROR)
 
     logging.debug('Upsampling the streamlines by a factor 2x to then '
                   'downsample.')
@@ -1174,7 +1178,7 @@ def trim_streamlines_alter(sft, min_dice=0.90, epsilon=0.01):
     """
     # Import in function to avoid circular import error
     from scilpy.tractanalysis.reproducibility_measures import compute_dice_voxel
-    set_sft_logger_level(logging.ERROR)
+    dipy_sft.set_sft_logger_level(logging.ERROR)
     space = sft.space
     origin = sft.origin
 
@@ -1281,7 +1285,7 @@ def transform_streamlines_alter(sft, min_dice=0.90, epsilon=0.01):
     """
     # Import in function to avoid circular import error
     from scilpy.tractanalysis.reproducibility_measures import compute_dice_voxel
-    set_sft_logger_level(logging.ERROR)
+    dipy_sft.set_sft_logger_level(logging.ERROR)
     space = sft.space
     origin = sft.origin
 
@@ -1310,10 +1314,11 @@ def transform_streamlines_alter(sft, min_dice=0.90, epsilon=0.01):
 
         angles = rand_val * 2 * np.pi
         rot_mat = generate_rotation_matrix(angles)
-        streamlines = transform_streamlines(sft.streamlines, rot_mat)
+        streamlines = dipy_streamline.transform_streamlines(sft.streamlines,
+                                                            rot_mat)
 
         # Remove invalid streamlines to avoid numerical issues
-        curr_sft = StatefulTractogram.from_sft(streamlines, sft)
+        curr_sft = dipy_sft.StatefulTractogram.from_sft(streamlines, sft)
         curr_sft, _ = cut_invalid_streamlines(curr_sft)
         curr_sft = remove_single_point_streamlines(curr_sft)
         curr_sft = remove_overlapping_points_streamlines(curr_sft)
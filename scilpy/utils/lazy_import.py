@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Deferred imports of heavy dependencies (dipy, fury, matplotlib, scipy.io...).
+
+Most scripts import scilpy.io.utils, which in turn imports many scilpy
+modules. To keep the startup time of scripts low (ex, for --help), modules
+only used inside functions can be imported lazily:
+
+    dipy_io_utils = lazy_import('dipy.io.utils')
+
+    def my_function(a, b):
+        return dipy_io_utils.is_header_compatible(a, b)
+
+The real module is imported on the first attribute access.
+"""
+
+import importlib
+import sys
+import types
+
+
+class _LazyModule(types.ModuleType):
+    """ Module proxy importing the real module on first attribute access. """
+
+    def __getattr__(self, attr):
+        # Always forwarded to the real module (not copied) so that later
+        # changes to the module (ex, monkeypatching in tests) are seen.
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def _load(self):
+        module = self.__dict__.get('_lazy_module')
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__['_lazy_module'] = module
+        return module
+
+
+def lazy_import(name):
+    """
+    Returns a module that will only be imported when one of its attributes
+    is accessed. If the module is already imported, returns it directly.
+
+    Parameters
+    ----------
+    name: str
+        Full name of the module, ex: 'dipy.io.streamline'.
+
+    Returns
+    -------
+    module: types.ModuleType
+        The module, or a proxy to it.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return _LazyModule(name)
@@ -1,28 +1,29 @@
 # -*- coding: utf-8 -*-
 import ast
 from colorama import Fore, Style
+import functools
+import itertools
+import json
+import multiprocessing
 import pathlib
 import re
-import subprocess
+import shutil
 
-import nltk
 from nltk.stem import PorterStemmer
-from tqdm import tqdm
 
 SPACING_LEN = 80
 
 stemmer = PorterStemmer()
-try:
-    nltk.download('punkt', quiet=True)
-    nltk.download('wordnet', quiet=True)
-except ImportError:
-    raise ImportError("You must install the 'nltk' package to use this script."
-                      "Please run 'pip install nltk'.")
 
 # Path to the JSON file containing script information and keywords
 VOCAB_FILE_PATH = pathlib.Path(
     __file__).parent.parent.parent/'data' / 'vocabulary.json'
 
+# Name of the inverted index file, saved with the help files.
+INDEX_FILENAME = 'search_index.json'
+# Version of the index format. Indexes of another version are rebuilt.
+INDEX_VERSION = 2
+
 
 OBJECTS = [
     'aodf', 'bids', 'bingham', 'btensor', 'bundle',
@@ -153,92 +154,502 @@ def _stem_keywords(keywords):
     return [_stem_word(keyword) for keyword in keywords]
 
 
-def _stem_text(text):
+def _stem_phrase(phrase):
     """
-    Stem all words in a text using PorterStemmer.
+    Stem all words in a phrase using PorterStemmer.
 
     Parameters
     ----------
-    text : str
-        Text to be stemmed.
+    phrase : str
+        Phrase to be stemmed.
 
     Returns
     -------
     str
-        Stemmed text.
+        Stemmed phrase.
     """
-    words = nltk.word_tokenize(text)
+    words = phrase.split()
     return ' '.join([_stem_word(word) for word in words])
 
 
-def _stem_phrase(phrase):
+def _join_string_constants(node, variables=None):
     """
-    Stem all words in a phrase using PorterStemmer.
+    Concatenate all string constants found in an AST node, in order of
+    appearance. Used to rebuild help strings written as implicit
+    concatenations, sums or formatted strings, without executing any code.
 
     Parameters
     ----------
-    phrase : str
-        Phrase to be stemmed.
+    node : ast.AST
+        Node to parse.
+    variables : dict
+        Known string variables, {name: text}. Their names found in the node
+        are replaced by their text.
 
     Returns
     -------
     str
-        Stemmed phrase.
+        Concatenated strings, or an empty string if there was none.
     """
-    words = phrase.split()
-    return ' '.join([_stem_word(word) for word in words])
+    variables = variables or {}
+    parts = [n for n in ast.walk(node)
+             if (isinstance(n, ast.Constant) and isinstance(n.value, str)) or
+             (isinstance(n, ast.Name) and n.id in variables)]
+    # ast.walk is breadth-first; sort back in order of appearance.
+    parts.sort(key=lambda n: (n.lineno, n.col_offset))
+    return ''.join(n.value if isinstance(n, ast.Constant) else variables[n.id]
+                   for n in parts)
+
 
+def _get_string_variables(nodes, variables=None):
+    """
+    Find the variables assigned a string in a list of statements (ex, the
+    EPILOG of a script). Assignments calling functions are ignored, as their
+    result can't be known without executing the code.
+
+    Parameters
+    ----------
+    nodes : list of ast.AST
+        Statements to parse.
+    variables : dict
+        Variables already known (ex, module constants), {name: text}.
 
-def _generate_help_files():
+    Returns
+    -------
+    dict
+        {name: text}. Text of variables assigned many times are joined.
+    """
+    found = {}
+    for node in nodes:
+        for assign in ast.walk(node):
+            if not isinstance(assign, ast.Assign) or \
+                    any(isinstance(n, ast.Call)
+                        for n in ast.walk(assign.value)):
+                continue
+            text = _join_string_constants(assign.value, variables)
+            for target in assign.targets:
+                if isinstance(target, ast.Name) and text:
+                    found.setdefault(target.id, []).append(text)
+
+    variables = dict(variables or {})
+    variables.update({name: '\n'.join(texts)
+                      for name, texts in found.items()})
+    return variables
+
+
+def _get_argparse_calls(func_node, helpers, constants=None):
+    """
+    Find the arguments and groups added to a parser in a function, statically.
+
+    Parameters
+    ----------
+    func_node : ast.FunctionDef
+        Function building (or adding arguments to) a parser.
+    helpers : dict
+        Arguments added by known helper functions (ex, add_overwrite_arg),
+        {function name: list of (names, help)}.
+    constants : dict
+        String constants of the module, {name: text}.
+
+    Returns
+    -------
+    list of tuple (str, str)
+        The option names (or group title) and their help text, in the order
+        they were added.
+    """
+    # Help strings stored in variables (ex, help=_help or epilog=EPILOG).
+    variables = _get_string_variables(func_node.body, constants)
+
+    calls = []
+    epilogs = []
+    for node in ast.walk(func_node):
+        if not isinstance(node, ast.Call):
+            continue
+
+        if isinstance(node.func, ast.Attribute):
+            if node.func.attr == 'add_argument':
+                names = [str(arg.value) for arg in node.args
+                         if isinstance(arg, ast.Constant)]
+                help_text = ''
+                for keyword in node.keywords:
+                    if keyword.arg == 'help':
+                        help_text = _join_string_constants(keyword.value,
+                                                           variables)
+                calls.append((node, [(', '.join(names), help_text)]))
+            elif node.func.attr == 'add_argument_group':
+                title = ' '.join(_join_string_constants(arg, variables)
+                                 for arg in node.args + [k.value for k in
+                                                         node.keywords])
+                calls.append((node, [(title, '')]))
+            elif node.func.attr == 'ArgumentParser':
+                # The description is the docstring, already in the help.
+                epilog = [_join_string_constants(k.value, variables)
+                          for k in node.keywords if k.arg == 'epilog']
+                if any(epilog):
+                    epilogs.append(('', '\n'.join(epilog)))
+        elif isinstance(node.func, ast.Name) and node.func.id in helpers:
+            calls.append((node, helpers[node.func.id]))
+
+    # ast.walk is breadth-first; sort back in order of appearance.
+    calls.sort(key=lambda call: (call[0].lineno, call[0].col_offset))
+    # As with --help, the epilog comes after the arguments.
+    return [entry for _, entries in calls for entry in entries] + epilogs
+
+
+@functools.lru_cache(maxsize=None)
+def _get_argparse_helpers(module_path):
+    """
+    Statically find the functions of a module adding arguments to a parser
+    (ex, add_sh_basis_args in scilpy.io.utils).
+
+    Parameters
+    ----------
+    module_path : str
+        Path to the python file of the module.
+
+    Returns
+    -------
+    dict
+        {function name: list of (names, help)}.
+    """
+    path = pathlib.Path(module_path)
+    if not path.is_file():
+        return {}
+
+    tree = ast.parse(path.read_text())
+    constants = _get_string_variables(
+        [node for node in tree.body if isinstance(node, ast.Assign)])
+    helpers = {}
+    for node in tree.body:
+        # Helpers calling other helpers of the same module are defined after
+        # them in our code, so a single pass is enough.
+        if isinstance(node, ast.FunctionDef) and node.name.startswith('add_'):
+            entries = _get_argparse_calls(node, helpers, constants)
+            if entries:
+                helpers[node.name] = entries
+    return helpers
+
+
+def _extract_help_from_script(script):
+    """
+    Build the help text of a script by static analysis: its docstring, and
+    the names and help of the arguments added in _build_arg_parser. The
+    script is never executed nor imported, making this much faster than
+    running the script with --help.
+
+    Parameters
+    ----------
+    script : str
+        Path to the script.
+
+    Returns
+    -------
+    str
+        The help text.
+    """
+    script = pathlib.Path(script)
+    tree = ast.parse(script.read_text())
+    package_dir = pathlib.Path(__file__).parent.parent
+
+    # Arguments added by helpers imported from scilpy.
+    helpers = {}
+    for node in tree.body:
+        if isinstance(node, ast.ImportFrom) and node.module and \
+                node.module.startswith('scilpy.'):
+            module_path = package_dir.parent.joinpath(
+                *node.module.split('.')).with_suffix('.py')
+            module_helpers = _get_argparse_helpers(str(module_path))
+            for alias in node.names:
+                if alias.name in module_helpers:
+                    helpers[alias.asname or alias.name] = \
+                        module_helpers[alias.name]
+
+    # Module constants used in the parser (ex, epilog=EPILOG).
+    constants = _get_string_variables(
+        [node for node in tree.body if isinstance(node, ast.Assign)])
+
+    entries = []
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and \
+                node.name == '_build_arg_parser':
+            entries = _get_argparse_calls(node, helpers, constants)
+
+    lines = [script.name, '', ast.get_docstring(tree) or '', '']
+    for names, help_text in entries:
+        if names:
+            lines.append(f'  {names}')
+        if help_text:
+            lines.extend(f'      {line}' for line in help_text.splitlines())
+    return '\n'.join(lines) + '\n'
+
+
+def _is_help_file_up_to_date(script, help_file):
+    """
+    Check if the help file of a script exists and is more recent than the
+    script.
+
+    Parameters
+    ----------
+    script : pathlib.Path
+        Path to the script.
+    help_file : pathlib.Path
+        Path to its help file.
+
+    Returns
+    -------
+    bool
+        Whether the help file can be used as is.
+    """
+    return help_file.exists() and \
+        help_file.stat().st_mtime >= script.stat().st_mtime
+
+
+def _generate_help_files(nbr_processes=1):
     """
     This function iterates over all Python scripts in the 'scripts' directory,
-    runs each script with the '--h' flag to generate help text,
-    and saves the output in the '.hidden' directory.
+    extracts their help text by static analysis (docstring and argparse
+    help, see _extract_help_from_script) and saves it in the '.hidden'
+    directory.
 
     By doing this, we can precompute the help outputs for each script,
     which can be useful for faster searches.
 
-    If a help file already exists for a script, the script is skipped,
-    and the existing help file is left unchanged.
+    If an up-to-date help file already exists for a script (more recent than
+    the script), the script is skipped. Help files of removed scripts are
+    deleted.
 
     The help output is saved in a hidden directory to avoid clutter in
     the main scripts directory.
-    """
 
+    Parameters
+    ----------
+    nbr_processes : int
+        Number of sub-processes to start.
+
+    Returns
+    -------
+    bool
+        Whether help files were generated or deleted.
+    """
     scripts_dir = pathlib.Path(__file__).parent.parent.parent / 'scripts'
-    help_dir = scripts_dir / '.hidden'
+    hidden_dir = scripts_dir / '.hidden'
 
-    scripts = [script for script in scripts_dir.glob('*.py')
+    scripts = [script for script in sorted(scripts_dir.glob('*.py'))
                if script.name not in ['__init__.py',
                                       'scil_search_keywords.py']]
-
-    helps = [help for help in help_dir.glob('*.help')]
-    scripts_to_regenerate = [script for script in scripts
-                             if help_dir / f'{script.name}.help' not in helps]
-
-    # Check if all help files are present
+    scripts_to_regenerate = [
+        script for script in scripts
+        if not _is_help_file_up_to_date(
+            script, hidden_dir / f'{script.name}.help')]
+
+    script_names = [script.name for script in scripts]
+    removed_help_files = [
+        help_file for help_file in hidden_dir.glob('*.help')
+        if help_file.stem not in script_names]
+    for help_file in removed_help_files:
+        help_file.unlink()
+
+    # Check if all help files are present and up to date
     if len(scripts_to_regenerate) == 0:
-        print("All help files are already generated.")
-        return
+        return len(removed_help_files) > 0
 
     # Hidden directory to store help files
-    hidden_dir = scripts_dir / '.hidden'
     hidden_dir.mkdir(exist_ok=True)
 
-    # Iterate over all scripts and generate help files
-    for script in tqdm(scripts_to_regenerate):
-        help_file = hidden_dir / f'{script.name}.help'
-        # Check if help file already exists
-        if help_file.exists():
-            continue
+    if nbr_processes > 1 and len(scripts_to_regenerate) > 1:
+        with multiprocessing.Pool(nbr_processes) as pool:
+            help_texts = pool.map(_extract_help_from_script,
+                                  scripts_to_regenerate)
+    else:
+        help_texts = [_extract_help_from_script(script)
+                      for script in scripts_to_regenerate]
+
+    for script, help_text in zip(scripts_to_regenerate, help_texts):
+        with open(hidden_dir / f'{script.name}.help', 'w') as f:
+            f.write(help_text)
+
+    return True
+
+
+def _tokenize_and_stem(text):
+    """
+    Split a text into lowercase words (underscores and punctuation are
+    separators, so that script names are split into words too) and stem them.
+
+    Parameters
+    ----------
+    text : str
+        Text to process.
+
+    Returns
+    -------
+    list of str
+        Stemmed words.
+    """
+    return [_stem_word(word) for word in re.findall(r'[^\W_]+', text.lower())]
+
+
+def _build_search_index(help_dir, vocab_data):
+    """
+    Build the inverted index used by scil_search_keywords.py from the help
+    files and the vocabulary.
 
-        # Run the script with --h and capture the output
-        result = subprocess.run(['python', script, '--h'],
-                                capture_output=True, text=True)
+    Parameters
+    ----------
+    help_dir : pathlib.Path
+        Directory containing the .help files.
+    vocab_data : dict
+        Content of the vocabulary file (see VOCAB_FILE_PATH).
+
+    Returns
+    -------
+    index : dict
+        - 'version': INDEX_VERSION.
+        - 'terms': {stemmed word: {script name: number of occurrences}},
+          from the help text, the script name and the vocabulary keywords.
+        - 'texts': {script name: stemmed text}, to search phrases.
+        - 'synonyms': {word or stemmed word: list of synonyms}, the synonym
+          sets of the vocabulary expanded for each of their words.
+    """
+    documents = {}
+    for help_file in sorted(help_dir.glob('*.help')):
+        script_name = help_file.stem
+        documents[script_name] = [script_name, help_file.read_text()]
+    for script in vocab_data['scripts']:
+        documents.setdefault(script['name'], [script['name']]).append(
+            ' '.join(script['keywords']))
+
+    terms = {}
+    texts = {}
+    for script_name, document in documents.items():
+        # Each part on its own line, so that phrases can't span two parts.
+        stemmed_parts = [_tokenize_and_stem(part) for part in document]
+        for word in itertools.chain(*stemmed_parts):
+            postings = terms.setdefault(word, {})
+            postings[script_name] = postings.get(script_name, 0) + 1
+        texts[script_name] = '\n'.join(' '.join(part)
+                                       for part in stemmed_parts)
+
+    synonyms = {}
+    for synonym_set in vocab_data['synonyms']:
+        synonym_set = [synonym.lower() for synonym in synonym_set]
+        for synonym in synonym_set:
+            for key in {synonym, _stem_word(synonym)}:
+                synonyms.setdefault(key, set()).update(synonym_set)
 
-        # Save the output to the hidden file
-        with open(help_file, 'w') as f:
-            f.write(result.stdout)
+    return {'version': INDEX_VERSION, 'terms': terms, 'texts': texts,
+            'synonyms': {key: sorted(value)
+                         for key, value in synonyms.items()}}
+
+
+def _load_search_index(nbr_processes=1, regenerate=False):
+    """
+    Load the search index, generating the help files and (re)building the
+    index first if needed: on first use, when scripts were added, modified or
+    removed, when the vocabulary file changed or when the index was built
+    by another version.
+
+    Parameters
+    ----------
+    nbr_processes : int
+        Number of sub-processes to start to generate help files.
+    regenerate : bool
+        If true, regenerate all help files and the index.
+
+    Returns
+    -------
+    index : dict
+        See _build_search_index.
+    """
+    scripts_dir = pathlib.Path(__file__).parent.parent.parent / 'scripts'
+    hidden_dir = scripts_dir / '.hidden'
+    index_file = hidden_dir / INDEX_FILENAME
+
+    if regenerate:
+        shutil.rmtree(hidden_dir, ignore_errors=True)
+
+    generated = _generate_help_files(nbr_processes)
+    if not generated and index_file.exists() and \
+            index_file.stat().st_mtime >= VOCAB_FILE_PATH.stat().st_mtime:
+        with open(index_file, 'r') as f:
+            index = json.load(f)
+        if index.get('version') == INDEX_VERSION:
+            return index
+
+    with open(VOCAB_FILE_PATH, 'r') as f:
+        vocab_data = json.load(f)
+    index = _build_search_index(hidden_dir, vocab_data)
+    with open(index_file, 'w') as f:
+        json.dump(index, f)
+    return index
+
+
+def _get_synonyms_from_index(keyword, index):
+    """
+    Get synonyms for a given keyword from the prebuilt index.
+
+    Parameters
+    ----------
+    keyword : str
+        Keyword to find synonyms for.
+    index : dict
+        See _build_search_index.
+
+    Returns
+    -------
+    list of str
+        List of synonyms for the given keyword.
+    """
+    keyword = keyword.lower()
+    synonyms = set(index['synonyms'].get(keyword, []))
+    synonyms.update(index['synonyms'].get(_stem_word(keyword), []))
+    return list(synonyms)
+
+
+def _search_index(index, keywords, phrases, prefix='scil_'):
+    """
+    Score scripts from the prebuilt index.
+
+    Parameters
+    ----------
+    index : dict
+        See _build_search_index.
+    keywords : list of str
+        Stemmed keywords to search for (see _stem_keywords). They are not
+        stemmed again: stemming twice can change a word (ex, 'diffusion' is
+        stemmed to 'diffus', then to 'diffu').
+    phrases : list of str
+        Stemmed phrases to search for (see _stem_phrase).
+    prefix : str
+        Only scripts whose name starts with this prefix are scored.
+
+    Returns
+    -------
+    dict
+        {script name: {keyword or phrase: number of occurrences}}.
+    """
+    scores = {}
+    for keyword in keywords:
+        postings = index['terms'].get(keyword.lower(), {})
+        for script_name, count in postings.items():
+            if script_name.startswith(prefix):
+                update_matches_and_scores(scores, script_name,
+                                          {keyword: count})
+
+    for phrase in phrases:
+        # Split as the indexed text, without stemming again.
+        phrase_stemmed = ' '.join(re.findall(r'[^\W_]+', phrase.lower()))
+        if not phrase_stemmed:
+            continue
+        # Whole words only: 'run' must not match 'rerun'.
+        pattern = re.compile(r'\b' + re.escape(phrase_stemmed) + r'\b')
+        for script_name, text in index['texts'].items():
+            if script_name.startswith(prefix):
+                update_matches_and_scores(
+                    scores, script_name,
+                    {phrase: len(pattern.findall(text))})
+
+    return scores
 
 
 def _highlight_keywords(text, all_expressions):
@@ -274,34 +685,6 @@ def _highlight_keywords(text, all_expressions):
     return text
 
 
-def _get_synonyms(keyword, synonyms_data):
-    """
-    Get synonyms for a given keyword from the synonyms data.
-
-    Parameters
-    ----------
-    keyword : str
-        Keyword to find synonyms for.
-    synonyms_data : dict
-        Dictionary containing synonyms data.
-
-    Returns
-    -------
-    list of str
-        List of synonyms for the given keyword.
-    """
-    keyword = keyword.lower()
-    complete_synonyms = []
-    for synonym_set in synonyms_data:
-        synonym_set = [synonym.lower() for synonym in synonym_set]
-        stemmed_synonyms_set = [_stem_word(synonym) for synonym in synonym_set]
-
-        if keyword in synonym_set or _stem_word(keyword) in stemmed_synonyms_set:
-            complete_synonyms.extend(synonym_set)
-
-    return list(set(complete_synonyms))
-
-
 def _extract_keywords_and_phrases(expressions):
     """
     Extract keywords and phrases from the provided list.
@@ -329,63 +712,6 @@ def _extract_keywords_and_phrases(expressions):
     return list(keywords_set), list(phrases_set)
 
 
-def _calculate_score(keywords, phrases, text, filename, suffix=''):
-    """
-    Calculate a score for how well the text and filename match the keywords.
-
-    Parameters
-    ----------
-    keywords : list of str
-        Keywords to search for.
-    phrases : list of str
-        Phrases to search for.
-    text : str
-        Text to search within.
-    filename : str
-        Filename to search within.
-
-    Returns
-    -------
-    dict
-        Score details based on the frequency of keywords
-        in the text and filename.
-    """
-    stemmed_text = _stem_text(text.lower())
-    stemmed_filename = _stem_text(filename.lower())
-    score_details = {}
-
-    def is_match(found_word, keyword):
-        if len(keyword) <= 3:
-            return found_word == keyword
-        return _stem_word(found_word) == _stem_word(keyword)
-
-    for keyword in keywords:
-        keyword = keyword.lower()
-        # Use regular expressions to match whole words only
-
-        keyword_pattern = re.compile(
-            r'\b(\w?' + re.escape(keyword) + r's?\w?)\b', re.IGNORECASE)
-        found_words = keyword_pattern.findall(stemmed_text) \
-            + keyword_pattern.findall(stemmed_filename)
-        keyword_score = 0
-
-        for found_word in found_words:
-            if is_match(found_word, keyword):
-                keyword_score += 1
-                continue
-
-        if keyword_score > 0:
-            score_details[keyword + suffix] = keyword_score
-
-    for phrase in phrases:
-        phrase_stemmed = _stem_text(phrase.lower())
-        phrase_score = stemmed_text.count(phrase_stemmed)
-        if phrase_score > 0:
-            score_details[phrase + suffix] = phrase_score
-
-    return score_details
-
-
 def update_matches_and_scores(scores, filename, score_details):
     """
     Update the matches and scores for the given filename based
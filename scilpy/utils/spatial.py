@@ -1,10 +1,13 @@
 # -*- coding: utf-8 -*-
-from dipy.io.utils import get_reference_info
 import nibabel.orientations as ornt
 import numpy as np
 
 from numpy.lib.index_tricks import r_ as row
 
+from scilpy.utils.lazy_import import lazy_import
+
+dipy_io_utils = lazy_import('dipy.io.utils')
+
 
 RAS_AXES_NAMES = ["sagittal", "coronal", "axial"]
 RAS_AXES_COORDINATES = ["x", "y", "z"]
@@ -182,8 +185,8 @@ def compute_distance_barycenters(ref_1, ref_2, ref_2_transfo):
     distance_after: float
         The distance between the two barycenters after the transformation.
     """
-    aff_1, dim_1, _, _ = get_reference_info(ref_1)
-    aff_2, dim_2, _, _ = get_reference_info(ref_2)
+    aff_1, dim_1, _, _ = dipy_io_utils.get_reference_info(ref_1)
+    aff_2, dim_2, _, _ = dipy_io_utils.get_reference_info(ref_2)
 
     barycenter_1 = voxel_to_world(dim_1 / 2.0, aff_1)
     barycenter_2 = voxel_to_world(dim_2 / 2.0, aff_2)
@@ -0,0 +1,58 @@
+import subprocess
+import sys
+import types
+
+from scilpy.utils.lazy_import import lazy_import
+
+
+def test_lazy_import():
+    module = lazy_import('json')
+    assert module is sys.modules['json']
+
+    module = lazy_import('scilpy.utils.tests.not_a_real_module')
+    assert module.__name__ == 'scilpy.utils.tests.not_a_real_module'
+
+
+def test_lazy_import_attribute_access():
+    # Run in a new interpreter to get a clean sys.modules.
+    code = ("import sys\n"
+            "from scilpy.utils.lazy_import import lazy_import\n"
+            "m = lazy_import('wave')\n"
+            "assert 'wave' not in sys.modules\n"
+            "assert m.open is not None\n"
+            "assert 'wave' in sys.modules\n")
+    subprocess.run([sys.executable, '-c', code], check=True)
+
+
+def test_heavy_modules_not_imported_by_io_utils():
+    # All scripts import scilpy.io.utils: it must stay cheap to import.
+    code = ("import sys\n"
+            "import scilpy.io.utils\n"
+            "import scilpy.io.streamlines\n"
+            "heavy = ['dipy.data', 'dipy.io.streamline', 'dipy.segment',\n"
+            "         'matplotlib.pyplot', 'fury', 'vtk', 'scipy.io']\n"
+            "loaded = [m for m in heavy if m in sys.modules]\n"
+            "assert not loaded, loaded\n")
+    subprocess.run([sys.executable, '-c', code], check=True)
+
+
+def test_lazy_import_sees_monkeypatch(monkeypatch):
+    module = lazy_import('scilpy.utils.tests.fake_lazy_module')
+    monkeypatch.setitem(sys.modules, 'scilpy.utils.tests.fake_lazy_module',
+                        types.SimpleNamespace(value=1))
+    assert module.value == 1
+
+    # Changes made to the real module after the first access are seen.
+    monkeypatch.setattr(sys.modules['scilpy.utils.tests.fake_lazy_module'],
+                        'value', 2)
+    assert module.value == 2
+
+
+def test_io_streamlines_reexports():
+    from dipy.io.streamline import load_tractogram
+    from dipy.io.utils import is_header_compatible
+    from scilpy.io.streamlines import load_tractogram as scilpy_load
+    from scilpy.io.streamlines import is_header_compatible as scilpy_compat
+
+    assert scilpy_load is load_tractogram
+    assert scilpy_compat is is_header_compatible
@@ -1,9 +1,13 @@
 
+import os
+
 from scilpy.utils.scilpy_bot import (
     _make_title, _get_docstring_from_script_path,
-    _split_first_sentence, _stem_word, _stem_keywords, _stem_text,
-    _stem_phrase, _highlight_keywords, _get_synonyms,
-    _extract_keywords_and_phrases, _calculate_score
+    _split_first_sentence, _stem_word, _stem_keywords,
+    _stem_phrase, _highlight_keywords,
+    _extract_keywords_and_phrases,
+    _extract_help_from_script, _build_search_index,
+    _get_synonyms_from_index, _search_index, _is_help_file_up_to_date
 )
 
 
@@ -33,12 +37,6 @@ def test_stem_keywords():
     assert result == ["run", "jump"]
 
 
-def test_stem_text():
-    text = "Running and jumping."
-    result = _stem_text(text)
-    assert result == "run and jump ."
-
-
 def test_stem_phrase():
     phrase = "Running quickly"
     result = _stem_phrase(phrase)
@@ -52,13 +50,6 @@ def test_highlight_keywords():
     assert "Running" in result
 
 
-def test_get_synonyms():
-    synonyms_data = [["run", "sprint"], ["jump", "leap"]]
-    result = _get_synonyms("run", synonyms_data)
-    # There is no synonyms for "run" in the provided data
-    assert len(result) == 2
-
-
 def test_extract_keywords_and_phrases():
     keywords = ["running", "jumps", "quick run"]
     result_keywords, result_phrases = _extract_keywords_and_phrases(keywords)
@@ -86,11 +77,110 @@ def test_stem_word_specific():
     assert result == "tractometri"
 
 
-def test_calculate_score():
-    keywords = ["run"]
-    phrases = ["quick run"]
-    text = "Running quickly is fun. A quick run is good."
-    filename = "run_script.py"
-    result = _calculate_score(keywords, phrases, text, filename)
-    assert result["run"] == 2
-    assert result["quick run"] == 1
+def test_extract_help_from_script(tmp_path):
+    script_content = (
+        '"""Count the streamlines."""\n'
+        'import argparse\n'
+        'from scilpy.io.utils import add_overwrite_arg\n\n\n'
+        'def _build_arg_parser():\n'
+        '    p = argparse.ArgumentParser(description=__doc__)\n'
+        '    p.add_argument("in_tractogram",\n'
+        '                   help="Input tractogram, "\n'
+        '                        "trk or tck.")\n'
+        '    add_overwrite_arg(p)\n'
+        '    return p\n')
+    script_path = tmp_path / "scil_test_script.py"
+    script_path.write_text(script_content)
+    result = _extract_help_from_script(str(script_path))
+
+    assert "Count the streamlines." in result
+    assert "in_tractogram" in result
+    assert "Input tractogram, trk or tck." in result
+    # Argument added by a helper of scilpy.io.utils
+    assert "Force overwriting of the output files." in result
+    assert result.index("in_tractogram") < result.index("-f")
+
+
+def test_search_index(tmp_path):
+    (tmp_path / "scil_run_fast.py.help").write_text(
+        "Running quickly is fun. A quick run is good.")
+    (tmp_path / "scil_jump.py.help").write_text("Jumping.")
+    vocab_data = {"scripts": [{"name": "scil_jump.py",
+                               "keywords": ["leap", "running"]}],
+                  "synonyms": [["jump", "leap"]]}
+    index = _build_search_index(tmp_path, vocab_data)
+
+    result = _search_index(index, ["run", "leap"], ["quick run"])
+    # Twice in the help, once in the script name
+    assert result["scil_run_fast.py"] == {"run": 3, "quick run": 1}
+    # From the vocabulary keywords
+    assert result["scil_jump.py"] == {"run": 1, "leap": 1}
+
+    result = _search_index(index, ["run"], [], prefix="scil_jump")
+    assert list(result.keys()) == ["scil_jump.py"]
+
+    assert sorted(_get_synonyms_from_index("jumps", index)) == \
+        ["jump", "leap"]
+    assert _get_synonyms_from_index("run", index) == []
+
+
+def test_extract_help_from_script_constants(tmp_path):
+    script_content = (
+        '"""Count the streamlines."""\n'
+        'import argparse\n\n'
+        'EPILOG = """References: [1] Someone et al."""\n'
+        'TRACTOGRAM_HELP = "Input tractogram, " + "trk or tck."\n\n\n'
+        'def _build_arg_parser():\n'
+        '    p = argparse.ArgumentParser(description=__doc__,\n'
+        '                                epilog=EPILOG)\n'
+        '    p.add_argument("in_tractogram", help=TRACTOGRAM_HELP)\n'
+        '    return p\n')
+    script_path = tmp_path / "scil_test_script.py"
+    script_path.write_text(script_content)
+    result = _extract_help_from_script(str(script_path))
+
+    assert "Input tractogram, trk or tck." in result
+    # The epilog comes last, as with --help
+    assert result.index("in_tractogram") < result.index("References")
+
+
+def test_search_index_phrase_whole_words(tmp_path):
+    (tmp_path / "scil_runway.py.help").write_text(
+        "A quick runway. Not quick rerun.")
+    (tmp_path / "scil_run.py.help").write_text("A quick run.")
+    index = _build_search_index(tmp_path, {"scripts": [], "synonyms": []})
+
+    result = _search_index(index, [], ["quick run"])
+    assert result == {"scil_run.py": {"quick run": 1}}
+
+
+def test_is_help_file_up_to_date(tmp_path):
+    script = tmp_path / "scil_test_script.py"
+    help_file = tmp_path / "scil_test_script.py.help"
+    script.write_text("")
+    assert not _is_help_file_up_to_date(script, help_file)
+
+    help_file.write_text("")
+    os.utime(script, (1000, 1000))
+    os.utime(help_file, (2000, 2000))
+    assert _is_help_file_up_to_date(script, help_file)
+
+    # The script was modified after its help file was generated
+    os.utime(script, (3000, 3000))
+    assert not _is_help_file_up_to_date(script, help_file)
+
+
+def test_search_index_stemmed_once(tmp_path):
+    # Stemming is not idempotent: 'diffusion' -> 'diffus' -> 'diffu'. The
+    # search expressions, stemmed by the script, must not be stemmed again.
+    (tmp_path / "scil_dti_metrics.py.help").write_text(
+        "Compute the diffusion tensor and the mean diffusivity.")
+    index = _build_search_index(tmp_path, {"scripts": [], "synonyms": []})
+
+    keywords = _stem_keywords(["diffusion", "tensor"])
+    phrases = [_stem_phrase("diffusion tensor"),
+               _stem_phrase("mean diffusivity")]
+    result = _search_index(index, keywords, phrases)
+    # 'diffusivity' is also stemmed to 'diffus'.
+    assert result["scil_dti_metrics.py"] == {
+        keywords[0]: 2, keywords[1]: 1, phrases[0]: 1, phrases[1]: 1}
@@ -2,11 +2,14 @@
 
 from enum import Enum
 import numpy as np
-from fury import actor, window
-from fury.utils import get_actor_from_polydata
 
+from scilpy.utils.lazy_import import lazy_import
 from scilpy.utils.spatial import get_axis_index
 
+actor = lazy_import('fury.actor')
+window = lazy_import('fury.window')
+fury_utils = lazy_import('fury.utils')
+
 
 class CamParams(Enum):
     """
@@ -314,7 +317,7 @@ def create_contours_actor(contours, opacity=1., linewidth=3.,
         Fury object containing the contours information.
     """
 
-    contours_actor = get_actor_from_polydata(contours)
+    contours_actor = fury_utils.get_actor_from_polydata(contours)
     contours_actor.GetMapper().ScalarVisibilityOff()
     contours_actor.GetProperty().SetLineWidth(linewidth)
     contours_actor.GetProperty().SetColor(color)
@@ -1,12 +1,14 @@
 # -*- coding: utf-8 -*-
 
 import logging
-from matplotlib.font_manager import findfont
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 
+from scilpy.utils.lazy_import import lazy_import
 from scilpy.viz.color import generate_n_colors
 
+font_manager = lazy_import('matplotlib.font_manager')
+
 
 def any2grayscale(array_2d):
     """
@@ -192,7 +194,8 @@ def fetch_truetype_font(fontconfig, size, fontface_index=0, encoding="unic",
     """
 
     try:
-        font_path = findfont(fontconfig, fallback_to_default=False)
+        font_path = font_manager.findfont(fontconfig,
+                                          fallback_to_default=False)
         return ImageFont.truetype(font_path, size, fontface_index, encoding)
     except Exception as e:
         if use_default_if_not_found:
@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 
-from fury.utils import numpy_to_vtk_image_data
-import vtk
+from scilpy.utils.lazy_import import lazy_import
+
+fury_utils = lazy_import('fury.utils')
+vtk = lazy_import('vtk')
 
 
 def get_color_by_name(color_name):
@@ -162,7 +164,7 @@ def contours_from_data(data, contour_values=[1.], smoothing_radius=0.):
        Contours polydata.
     """
 
-    mask_data = numpy_to_vtk_image_data(data)
+    mask_data = fury_utils.numpy_to_vtk_image_data(data)
     mask_data.SetOrigin(0, 0, 0)
 
     if smoothing_radius > 0:
@@ -1,14 +1,16 @@
 # -*- coding: utf-8 -*-
 
-from dipy.io.stateful_tractogram import StatefulTractogram
 from fury import colormap
-import matplotlib.pyplot as plt
-from matplotlib import colors as mcolors
 import numpy as np
 from scipy.spatial import KDTree
 
+from scilpy.utils.lazy_import import lazy_import
 from scilpy.viz.backends.vtk import get_color_by_name, lut_from_colors
 
+dipy_sft = lazy_import('dipy.io.stateful_tractogram')
+plt = lazy_import('matplotlib.pyplot')
+mcolors = lazy_import('matplotlib.colors')
+
 
 def convert_color_names_to_rgb(names):
     """
@@ -338,7 +340,7 @@ def generate_local_coloring(sft):
     np.ndarray
         The generated colors.
     """
-    if isinstance(sft, StatefulTractogram):
+    if isinstance(sft, dipy_sft.StatefulTractogram):
         streamlines = sft.streamlines
     else:
         streamlines = sft
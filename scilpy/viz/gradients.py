@@ -4,13 +4,15 @@ import logging
 import numpy as np
 from tempfile import mkstemp
 
-from dipy.data import get_sphere
-from fury import actor, window
-
+from scilpy.utils.lazy_import import lazy_import
 from scilpy.viz.color import generate_n_colors
 from scilpy.viz.backends.fury import snapshot_scenes
 from scilpy.viz.screenshot import compose_image
 
+dipy_data = lazy_import('dipy.data')
+actor = lazy_import('fury.actor')
+window = lazy_import('fury.window')
+
 
 def plot_each_shell(ms, centroids, plot_sym_vecs=True, use_sphere=True,
                     same_color=False, rad=0.025, opacity=1.0, ofile=None,
@@ -45,7 +47,7 @@ def plot_each_shell(ms, centroids, plot_sym_vecs=True, use_sphere=True,
     _colors = generate_n_colors(len(ms))
 
     if use_sphere:
-        sphere = get_sphere('symmetric724')
+        sphere = dipy_data.get_sphere('symmetric724')
         shape = (1, 1, 1, sphere.vertices.shape[0])
         _, fname = mkstemp(suffix='_odf_slicer.mmap')
         odfs = np.memmap(fname, dtype=np.float64, mode='w+', shape=shape)
@@ -125,7 +127,7 @@ def plot_proj_shell(ms, use_sym=True, use_sphere=True, same_color=False,
     scene = window.Scene()
     scene.SetBackground(1, 1, 1)
     if use_sphere:
-        sphere = get_sphere(name='symmetric724')
+        sphere = dipy_data.get_sphere(name='symmetric724')
         shape = (1, 1, 1, sphere.vertices.shape[0])
         _, fname = mkstemp(suffix='_odf_slicer.mmap')
         odfs = np.memmap(fname, dtype=np.float64, mode='w+', shape=shape)
@@ -1,8 +1,10 @@
 
-import matplotlib
-import matplotlib.pyplot as plt
 import numpy as np
 
+from scilpy.utils.lazy_import import lazy_import
+
+plt = lazy_import('matplotlib.pyplot')
+
 
 def plot_metrics_stats(means, stds, title=None, xlabel=None,
                        ylabel=None, figlabel=None, fill_color=None,
@@ -33,7 +35,7 @@ def plot_metrics_stats(means, stds, title=None, xlabel=None,
     ------
     The figure object.
     """
-    matplotlib.style.use('ggplot')
+    plt.style.use('ggplot')
 
     fig, ax = plt.subplots()
 
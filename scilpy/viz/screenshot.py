@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 
 import numpy as np
-from fury import window
+
+from scilpy.utils.lazy_import import lazy_import
 from scilpy.utils.spatial import get_axis_index
 
 from scilpy.viz.backends.fury import (create_scene,
@@ -16,6 +17,8 @@ from scilpy.viz.slice import (create_contours_slicer,
                               create_peaks_slicer,
                               create_texture_slicer)
 
+window = lazy_import('fury.window')
+
 
 def screenshot_volume(img, orientation, slice_ids, size, labelmap=None):
     """
@@ -1,10 +1,9 @@
 # -*- coding: utf-8 -*-
 
-from dipy.reconst.shm import sh_to_sf
-from fury import actor
 import numpy as np
 
 from scilpy.reconst.bingham import bingham_to_sf
+from scilpy.utils.lazy_import import lazy_import
 from scilpy.viz.backends.fury import (create_contours_actor,
                                       create_odf_actors,
                                       create_peaks_actor,
@@ -13,6 +12,9 @@ from scilpy.viz.backends.vtk import contours_from_data
 from scilpy.viz.color import generate_n_colors, lut_from_matplotlib_name
 from scilpy.viz.utils import affine_from_offset
 
+dipy_shm = lazy_import('dipy.reconst.shm')
+actor = lazy_import('fury.actor')
+
 
 def create_texture_slicer(texture, orientation, slice_index, *, mask=None,
                           value_range=None, opacity=1.0, offset=0.5,
@@ -248,13 +250,14 @@ def create_odf_slicer(sh_fodf, orientation, slice_index, sphere, sh_order,
     if nb_subdivide is not None:
         sphere = sphere.subdivide(nb_subdivide)
 
-    fodf = sh_to_sf(sh_fodf, sphere, sh_order, sh_basis,
-                    full_basis=full_basis, legacy=is_legacy)
+    fodf = dipy_shm.sh_to_sf(sh_fodf, sphere, sh_order, sh_basis,
+                             full_basis=full_basis, legacy=is_legacy)
 
     fodf_var = None
     if sh_variance is not None:
-        fodf_var = sh_to_sf(sh_variance, sphere, sh_order, sh_basis,
-                            full_basis=full_basis, legacy=is_legacy)
+        fodf_var = dipy_shm.sh_to_sf(sh_variance, sphere, sh_order,
+                                     sh_basis, full_basis=full_basis,
+                                     legacy=is_legacy)
 
     odf_actor, var_actor = create_odf_actors(fodf, sphere, scale, fodf_var,
                                              mask, radial_scale,
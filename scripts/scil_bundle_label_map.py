@@ -75,6 +75,10 @@ def _build_arg_parser():
                         '[%(default)s].')
     p.add_argument('--new_labelling', action='store_true',
                    help='Use the new labelling method (multi-centroids).')
+    p.add_argument('--nb_neighbors', type=int, default=1,
+                   help='Number of closest centroid points voting for the '
+                        'label of each point.\nVotes are weighted by the '
+                        'distance to the centroid points [%(default)s].')
 
     add_reference_arg(p)
     add_verbose_arg(p)
@@ -92,6 +96,9 @@ def main():
                         optional=args.reference)
     assert_output_dirs_exist_and_empty(parser, args, args.out_dir)
 
+    if args.nb_neighbors < 1:
+        parser.error('--nb_neighbors must be at least 1.')
+
     sft_centroid = load_tractogram_with_reference(parser, args,
                                                   args.in_centroid)
 
@@ -174,7 +181,8 @@ def main():
     uniformize_bundle_sft(concat_sft, ref_bundle=sft_centroid[0])
     labels, dists = min_dist_to_centroid(concat_sft.streamlines._data,
                                          sft_centroid.streamlines._data,
-                                         args.nb_pts)
+                                         args.nb_pts,
+                                         nb_neighbors=args.nb_neighbors)
     labels += 1  # 0 means no labels
 
     # It is not allowed that labels jumps labels for consistency
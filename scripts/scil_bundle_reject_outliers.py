@@ -16,12 +16,14 @@ from dipy.io.streamline import save_tractogram
 
 from scilpy.io.streamlines import load_tractogram_with_reference
 from scilpy.io.utils import (add_json_args,
+                             add_processes_arg,
                              add_verbose_arg,
                              add_overwrite_arg,
                              add_reference_arg,
                              assert_inputs_exist,
                              assert_outputs_exist,
-                             check_tracts_same_format)
+                             check_tracts_same_format,
+                             validate_nbr_processes)
 from scilpy.tractanalysis.bundle_operations import remove_outliers_qb
 from scilpy.version import version_string
 
@@ -44,6 +46,7 @@ def _build_arg_parser():
                    help='Print streamline count before and after filtering')
 
     add_json_args(p)
+    add_processes_arg(p)
     add_reference_arg(p)
     add_verbose_arg(p)
     add_overwrite_arg(p)
@@ -60,6 +63,7 @@ def main():
     assert_outputs_exist(parser, args, args.out_bundle, args.remaining_bundle)
     if args.alpha <= 0 or args.alpha > 1:
         parser.error('--alpha should be ]0, 1]')
+    nbr_cpu = validate_nbr_processes(parser, args)
 
     sft = load_tractogram_with_reference(parser, args, args.in_bundle)
     if len(sft) == 0:
@@ -68,7 +72,8 @@ def main():
 
     check_tracts_same_format(parser, [args.in_bundle, args.out_bundle,
                                       args.remaining_bundle])
-    outliers, inliers = remove_outliers_qb(sft.streamlines, args.alpha)
+    outliers, inliers = remove_outliers_qb(sft.streamlines, args.alpha,
+                                           nbr_processes=nbr_cpu)
 
     inliers_sft = sft[inliers]
     outliers_sfts = sft[outliers]
@@ -81,7 +81,7 @@ import numpy as np
 import scipy.ndimage as ndi
 
 from scilpy.connectivity.connectivity import \
-    compute_connectivity_matrices_from_hdf5, \
+    compute_connectivity_matrices_from_hdf5, compute_density_maps_from_hdf5, \
     multi_proc_compute_connectivity_matrices_from_hdf5
 from scilpy.image.labels import get_data_as_labels
 from scilpy.io.hdf5 import assert_header_compatible_hdf5
@@ -94,6 +94,9 @@ from scilpy.io.utils import (add_overwrite_arg, add_processes_arg,
                              assert_output_dirs_exist_and_empty)
 from scilpy.version import version_string
 
+# Number of connections whose density maps are computed together.
+DENSITY_BATCH_SIZE = 100
+
 
 def _build_arg_parser():
     p = argparse.ArgumentParser(description=__doc__,
@@ -271,13 +274,29 @@ def main():
     nbr_cpu = validate_nbr_processes(parser, args)
     outputs = []
     if nbr_cpu == 1:
-        for comb in comb_list:
-            outputs.append(compute_connectivity_matrices_from_hdf5(
-                args.in_hdf5, img_labels, comb[0], comb[1],
-                compute_volume, compute_streamline_count, compute_length,
-                similarity_directory, metrics_data, metrics_names,
-                lesion_data, args.include_dps, args.density_weighting,
-                args.min_lesion_vol))
+        need_density = (compute_volume or similarity_directory is not None or
+                        len(metrics_data) > 0 or lesion_data is not None)
+        dimensions = img_labels.shape[0:3]
+
+        # The density maps of a batch of connections are computed in a
+        # single pass, instead of allocating a full volume per connection.
+        for start in range(0, len(comb_list), DENSITY_BATCH_SIZE):
+            batch = comb_list[start:start + DENSITY_BATCH_SIZE]
+            if need_density:
+                density_maps = compute_density_maps_from_hdf5(
+                    args.in_hdf5, ['{}_{}'.format(*comb) for comb in batch],
+                    dimensions)
+
+            for i, comb in enumerate(batch):
+                density = None
+                if need_density:
+                    density = density_maps[i].toarray().reshape(dimensions)
+                outputs.append(compute_connectivity_matrices_from_hdf5(
+                    args.in_hdf5, img_labels, comb[0], comb[1],
+                    compute_volume, compute_streamline_count, compute_length,
+                    similarity_directory, metrics_data, metrics_names,
+                    lesion_data, args.include_dps, args.density_weighting,
+                    args.min_lesion_vol, density=density))
     else:
         pool = multiprocessing.Pool(nbr_cpu)
 
@@ -124,6 +124,11 @@ def _build_arg_parser():
     g = p.add_argument_group("Noise estimation options: piesno")
     g.add_argument('--save_piesno_mask', metavar='filepath',
                    help="If set, save piesno mask.")
+    g.add_argument('--piesno_slices', metavar='IDX', type=int, nargs='+',
+                   help="Indices of the axial slices on which to run piesno."
+                        "\nThe sigma of the other slices is interpolated. "
+                        "By default,\nall slices are used. Slices are "
+                        "processed in parallel\nwith --processes.")
 
     add_processes_arg(p)
     add_verbose_arg(p)
@@ -155,6 +160,10 @@ def main():
             parser.error("You selected --mask_sigma, but this is "
                          "only available for the --basic_sigma method.")
 
+    if args.piesno_slices and not args.piesno:
+        parser.error("Option --piesno_slices cannot be used when --piesno "
+                     "is not selected.")
+
     if args.save_piesno_mask and not args.piesno:
         parser.error("Option --save_piesno_mask cannot be used when --pieno "
                      "is not selected.")
@@ -172,6 +181,11 @@ def main():
     if args.piesno and (len(vol_data.shape) != 4 or vol_data.shape[3] == 1):
         parser.error("The piesno method requires 4D data.")
 
+    if args.piesno_slices and (min(args.piesno_slices) < 0 or
+                               max(args.piesno_slices) >= vol_data.shape[2]):
+        parser.error("Indices of --piesno_slices must be between 0 and {}."
+                     .format(vol_data.shape[2] - 1))
+
     # Denoising mask
     if args.mask_denoise is None:
         mask_denoise = np.zeros(vol_data.shape[0:3], dtype=bool)
@@ -206,7 +220,9 @@ def main():
         sigma = np.median(sigma)  # Managing 4D data.
         logging.info('The median noise is: {}'.format(sigma))
     else:  # --piesno
-        sigma, mask_noise = estimate_piesno_sigma(vol_data, args.number_coils)
+        sigma, mask_noise = estimate_piesno_sigma(
+            vol_data, args.number_coils, slices=args.piesno_slices,
+            nbr_processes=args.nbr_processes)
 
         if args.save_piesno_mask:
             logging.info("Saving resulting Piesno noise mask in {}"
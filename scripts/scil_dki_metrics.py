@@ -57,14 +57,16 @@ from dipy.core.gradients import gradient_table
 from scilpy.dwi.operations import compute_residuals
 from scilpy.image.volume_operations import smooth_to_fwhm
 from scilpy.io.image import get_data_as_mask
-from scilpy.io.utils import (add_overwrite_arg, add_skip_b0_check_arg,
-                             add_verbose_arg, assert_inputs_exist,
-                             assert_outputs_exist, add_tolerance_arg,
-                             assert_headers_compatible)
+from scilpy.io.utils import (add_overwrite_arg, add_processes_arg,
+                             add_skip_b0_check_arg, add_verbose_arg,
+                             assert_inputs_exist, assert_outputs_exist,
+                             add_tolerance_arg, assert_headers_compatible,
+                             validate_nbr_processes)
 from scilpy.gradients.bvec_bval_tools import (check_b0_threshold,
                                               is_normalized_bvecs,
                                               identify_shells,
                                               normalize_bvecs)
+from scilpy.reconst.dti import fit_tensor_by_chunks
 from scilpy.version import version_string
 
 
@@ -142,6 +144,7 @@ def _build_arg_parser():
                    help='Output filename for the mean signal diffusion ' +
                    '(powder-average).')
 
+    add_processes_arg(p)
     add_verbose_arg(p)
     add_overwrite_arg(p)
 
@@ -178,6 +181,7 @@ def main():
         parser, [args.in_dwi, args.in_bval, args.in_bvec], args.mask)
     assert_outputs_exist(parser, args, outputs)
     assert_headers_compatible(parser, args.in_dwi, args.mask)
+    nbr_cpu = validate_nbr_processes(parser, args)
 
     # Loading
     img = nib.load(args.in_dwi)
@@ -219,9 +223,15 @@ def main():
     # Smooth to FWHM
     data = smooth_to_fwhm(data, fwhm=args.smooth)
 
-    # Compute DKI
+    # Compute DKI. Fitting once, also predicting the signal for the
+    # residuals.
     dkimodel = dki.DiffusionKurtosisModel(gtab)
-    dkifit = dkimodel.fit(data, mask=mask)
+    S0 = None
+    if args.dki_residual:
+        S0 = np.mean(data[..., gtab.b0s_mask], axis=-1)
+    dki_params, data_p = fit_tensor_by_chunks(dkimodel, data, mask, S0=S0,
+                                              nbr_processes=nbr_cpu)
+    dkifit = dki.DiffusionKurtosisFit(dkimodel, dki_params)
 
     min_k = args.min_k
     max_k = args.max_k
@@ -273,9 +283,6 @@ def main():
             nib.save(nib.Nifti1Image(MSD.astype(np.float32), affine), args.msd)
 
     if args.dki_residual:
-        S0 = np.mean(data[..., gtab.b0s_mask], axis=-1)
-        data_p = dkifit.predict(gtab=gtab, S0=S0)
-
         R, _ = compute_residuals(data_p, data,
                                  b0s_mask=gtab.b0s_mask, mask=mask)
         nib.save(nib.Nifti1Image(R.astype(np.float32), affine),
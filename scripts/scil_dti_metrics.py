@@ -33,7 +33,8 @@ import numpy as np
 from dipy.core.gradients import gradient_table
 import dipy.denoise.noise_estimate as ne
 from dipy.io.gradients import read_bvals_bvecs
-from dipy.reconst.dti import (TensorModel, color_fa, fractional_anisotropy,
+from dipy.reconst.dti import (TensorFit, TensorModel, color_fa,
+                              fractional_anisotropy,
                               geodesic_anisotropy, mean_diffusivity,
                               axial_diffusivity, norm,
                               radial_diffusivity, lower_triangular)
@@ -44,14 +45,16 @@ from scilpy.dwi.operations import compute_residuals, \
     compute_residuals_statistics
 from scilpy.io.image import get_data_as_mask
 from scilpy.io.utils import (add_b0_thresh_arg, add_overwrite_arg,
-                             add_skip_b0_check_arg, add_verbose_arg,
-                             assert_inputs_exist, assert_outputs_exist,
-                             assert_headers_compatible)
+                             add_processes_arg, add_skip_b0_check_arg,
+                             add_verbose_arg, assert_inputs_exist,
+                             assert_outputs_exist, assert_headers_compatible,
+                             validate_nbr_processes)
 from scilpy.io.tensor import convert_tensor_from_dipy_format, \
     supported_tensor_formats, tensor_format_description
 from scilpy.gradients.bvec_bval_tools import (check_b0_threshold,
                                               is_normalized_bvecs,
                                               normalize_bvecs)
+from scilpy.reconst.dti import fit_tensor_by_chunks
 from scilpy.utils.filenames import add_filename_suffix, split_name_with_nii
 from scilpy.viz.plot import plot_residuals
 from scilpy.version import version_string
@@ -145,6 +148,7 @@ def _build_arg_parser():
 
     add_b0_thresh_arg(p)
     add_skip_b0_check_arg(p, will_overwrite_with_min=True)
+    add_processes_arg(p)
     add_verbose_arg(p)
 
     return p
@@ -184,6 +188,7 @@ def main():
         parser, [args.in_dwi, args.in_bval, args.in_bvec], args.mask)
     assert_outputs_exist(parser, args, outputs)
     assert_headers_compatible(parser, args.in_dwi, args.mask)
+    nbr_cpu = validate_nbr_processes(parser, args)
 
     # Loading
     img = nib.load(args.in_dwi)
@@ -221,7 +226,14 @@ def main():
         tenmodel = TensorModel(gtab, fit_method=args.method,
                                min_signal=np.min(data[data > 0]))
 
-    tenfit = tenmodel.fit(data, mask)
+    # Fitting once, also predicting the signal for the residuals.
+    S0 = None
+    if args.residual:
+        S0 = np.maximum(np.mean(data[..., gtab.b0s_mask], axis=-1),
+                        tenmodel.min_signal)
+    tensor_params, tenfit_predict = fit_tensor_by_chunks(
+        tenmodel, data, mask, S0=S0, nbr_processes=nbr_cpu)
+    tenfit = TensorFit(tenmodel, tensor_params)
 
     # Save all metrics.
     if args.tensor:
@@ -340,21 +352,8 @@ def main():
             logging.info("Outlier detection will not be performed, since no "
                          "mask was provided.")
         # Mean residual image
-        S0 = np.mean(data[..., gtab.b0s_mask], axis=-1)
-
-        tenfit2_predict = np.zeros(data.shape, dtype=np.float32)
-
-        for i in range(data.shape[0]):
-            if args.mask is not None:
-                tenfit2 = tenmodel.fit(data[i, :, :, :], mask[i, :, :])
-            else:
-                tenfit2 = tenmodel.fit(data[i, :, :, :])
-
-            S0_i = np.maximum(S0[i, :, :], tenfit2.model.min_signal)
-            tenfit2_predict[i, :, :, :] = tenfit2.predict(gtab, S0_i)
-
         R, data_diff = compute_residuals(
-            predicted_data=tenfit2_predict.astype(np.float32),
+            predicted_data=tenfit_predict,
             real_data=data, b0s_mask=gtab.b0s_mask, mask=mask)
         nib.save(nib.Nifti1Image(R.astype(np.float32), affine), args.residual)
 
@@ -22,8 +22,10 @@ import nibabel as nib
 
 
 from scilpy.dwi.operations import detect_volume_outliers
+from scilpy.io.image import get_data_as_mask
 from scilpy.io.utils import (add_b0_thresh_arg, add_skip_b0_check_arg,
-                             add_verbose_arg, assert_inputs_exist, )
+                             add_verbose_arg, assert_headers_compatible,
+                             assert_inputs_exist)
 from scilpy.gradients.bvec_bval_tools import (check_b0_threshold,
                                               normalize_bvecs)
 from scilpy.version import version_string
@@ -44,6 +46,9 @@ def _build_arg_parser():
     p.add_argument('--std_scale', type=float, default=2.0,
                    help='How many deviation from the mean are required to be '
                         'considered an outlier. [%(default)s]')
+    p.add_argument('--mask',
+                   help='If set, the correlations are computed only inside '
+                        'the mask (ex, a brain mask).')
 
     add_b0_thresh_arg(p)
     add_skip_b0_check_arg(p, will_overwrite_with_min=True)
@@ -60,10 +65,14 @@ def main():
     else:
         logging.getLogger().setLevel(logging.getLevelName(args.verbose))
 
-    assert_inputs_exist(parser, [args.in_dwi, args.in_bval, args.in_bvec])
+    assert_inputs_exist(parser, [args.in_dwi, args.in_bval, args.in_bvec],
+                        args.mask)
+    assert_headers_compatible(parser, args.in_dwi, args.mask)
 
     bvals, bvecs = read_bvals_bvecs(args.in_bval, args.in_bvec)
     data = nib.load(args.in_dwi).get_fdata()
+    mask = get_data_as_mask(nib.load(args.mask), dtype=bool) \
+        if args.mask else None
 
     args.b0_threshold = check_b0_threshold(bvals.min(),
                                            b0_thr=args.b0_threshold,
@@ -73,7 +82,7 @@ def main():
     # Not using the result. Only printing on screen. This is why the logging
     # level can never be set higher than INFO.
     detect_volume_outliers(data, bvals, bvecs, args.std_scale,
-                           args.b0_threshold)
+                           args.b0_threshold, mask=mask)
 
 
 if __name__ == "__main__":
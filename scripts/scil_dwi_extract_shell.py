@@ -13,13 +13,16 @@ and a tolerance of 20 will extract all volumes with a b-values from 1980 to
 
 Files that are too large to be loaded in memory can still be processed by
 setting the --block-size argument. A block size of X means that X DWI volumes
-are loaded at a time for processing.
+are loaded at a time for processing. With --out_of_core, the extracted
+volumes are also written directly to out_dwi, block by block, in the data type
+of in_dwi (instead of float64), so that at most a block is in memory.
 
 Formerly: scil_extract_dwi_shell.py
 """
 
 import argparse
 import logging
+import os
 
 from dipy.io import read_bvals_bvecs
 import nibabel as nib
@@ -58,6 +61,10 @@ def _build_arg_parser():
     p.add_argument('--block-size', '-s', metavar='INT', type=int,
                    help='Loads the data using this block size. Useful\n'
                         'when the data is too large to be loaded in memory.')
+    p.add_argument('--out_of_core', action='store_true',
+                   help='Write the extracted volumes directly to out_dwi,\n'
+                        'keeping the data type of in_dwi. Only one block of\n'
+                        'volumes is in memory at a time.')
     p.add_argument('--tolerance', '-t',
                    metavar='INT', type=int, default=20,
                    help='The tolerated gap between the b-values to  extract\n'
@@ -77,6 +84,11 @@ def main():
     assert_inputs_exist(parser, [args.in_dwi, args.in_bval, args.in_bvec])
     assert_outputs_exist(parser, args, [args.out_dwi, args.out_bval,
                                         args.out_bvec], args.out_indices)
+    # The output is written while the input is being read.
+    if args.out_of_core and os.path.exists(args.out_dwi) and \
+            os.path.samefile(args.in_dwi, args.out_dwi):
+        parser.error('With --out_of_core, out_dwi must be different from '
+                     'in_dwi.')
 
     bvals, bvecs = read_bvals_bvecs(args.in_bval, args.in_bvec)
 
@@ -85,15 +97,17 @@ def main():
 
     indices, shell_data, new_bvals, new_bvecs = extract_dwi_shell(
         img, bvals, bvecs, args.in_bvals_to_extract,
-        args.tolerance, args.block_size)
+        args.tolerance, args.block_size,
+        out_filename=args.out_dwi if args.out_of_core else None)
 
     logging.info("Selected indices: {}".format(indices))
 
     # toDo Could we use: scilpy.io.gradients.save_gradient_sampling_fsl?
     np.savetxt(args.out_bval, new_bvals, '%d')
     np.savetxt(args.out_bvec, new_bvecs.T, '%0.15f')
-    nib.save(nib.Nifti1Image(shell_data, img.affine, header=img.header),
-             args.out_dwi)
+    if not args.out_of_core:
+        nib.save(nib.Nifti1Image(shell_data, img.affine, header=img.header),
+                 args.out_dwi)
 
     # output indices file
     if args.out_indices:
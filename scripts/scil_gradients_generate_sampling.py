@@ -19,7 +19,8 @@ import numpy as np
 import os
 
 from scilpy.io.utils import (
-    add_overwrite_arg, add_verbose_arg, assert_outputs_exist)
+    add_overwrite_arg, add_processes_arg, add_verbose_arg,
+    assert_outputs_exist, validate_nbr_processes)
 from scilpy.gradients.gen_gradient_sampling import (
     generate_gradient_sampling)
 from scilpy.gradients.optimize_gradient_sampling import (
@@ -95,6 +96,7 @@ def _build_arg_parser():
     g1.add_argument('--mrtrix', action='store_true',
                     help='Save in MRtrix format (.b).')
 
+    add_processes_arg(p)
     add_verbose_arg(p)
     add_overwrite_arg(p)
 
@@ -124,6 +126,7 @@ def main():
                          'but {} unique bvals.'.format(len(unique_bvals)))
     if args.b0_every is not None and args.b0_every <= 0:
         parser.error("--b0_every must be an integer > 0.")
+    nbr_cpu = validate_nbr_processes(parser, args)
 
     # ---- b-vectors generation
     # Non-b0 samples: gradient sampling generation
@@ -169,7 +172,7 @@ def main():
         logging.info("Optimizing the ordering of non-b0s samples to optimize "
                      "gradient duty-cycle.")
         bvecs, shell_idx = compute_min_duty_cycle_bruteforce(
-            bvecs, shell_idx, bvals)
+            bvecs, shell_idx, bvals, nbr_processes=nbr_cpu)
 
     # Correcting b0s bvecs for Philips
     if args.b0_philips and np.sum(shell_idx == -1) > 1:
@@ -17,7 +17,8 @@ is a label map, the output will be either:
   - 4D, with each label having its own NAWM.
   - 3D, if using --split_4D and saved into a folder as multiple 3D files.
 
-WARNING: Voxels must be isotropic.
+With anisotropic voxels, the distances take the voxel size into account and
+the ring thickness is in units of the smallest voxel dimension.
 """
 
 import argparse
@@ -54,7 +55,8 @@ def _build_arg_parser():
                         'created.')
     p.add_argument('--ring_thickness', type=int, default=2,
                    help='Integer representing the thickness (in voxels) of '
-                        'the rings to be created.')
+                        'the rings to be created.\nWith anisotropic voxels, '
+                        'in voxels of the smallest dimension.')
     p.add_argument('--mask',
                    help='Mask where to compute the NAWM (e.g WM mask).')
     p.add_argument('--split_4D', metavar='OUT_DIR',
@@ -84,10 +86,7 @@ def main():
 
     lesion_img = nib.load(args.in_image)
     lesion_atlas = get_data_as_labels(lesion_img)
-    voxel_size = lesion_img.header.get_zooms()
-
-    if not np.allclose(voxel_size, np.mean(voxel_size)):
-        raise ValueError('Voxels must be isotropic.')
+    voxel_size = np.asarray(lesion_img.header.get_zooms()[:3])
 
     if args.split_4D and np.unique(lesion_atlas).size <= 2:
         raise ValueError('Split only works with multiple lesion labels')
@@ -106,7 +105,8 @@ def main():
         mask_data = None
 
     nawm = compute_nawm(lesion_atlas, args.nb_ring, args.ring_thickness,
-                        mask=mask_data)
+                        mask=mask_data,
+                        voxel_size=voxel_size / np.min(voxel_size))
 
     if args.split_4D:
         for i in range(nawm.shape[-1]):
@@ -42,28 +42,18 @@ Examples:
 
 import argparse
 from colorama import Fore, Style
-import json
 import logging
 import pathlib
-import shutil
-
-try:
-    import nltk
-    nltk.download('punkt', quiet=True)
-    nltk.download('wordnet', quiet=True)
-except ImportError:
-    raise ImportError("You must install the 'nltk' package to use this script."
-                      "Please run 'pip install nltk'.")
 
 from scilpy.utils.scilpy_bot import (
-    _stem_keywords, update_matches_and_scores,
-    _stem_phrase, _generate_help_files,
-    _get_synonyms, _extract_keywords_and_phrases,
-    _calculate_score, _make_title, prompt_user_for_object,
+    _stem_keywords, _stem_phrase, _load_search_index,
+    _get_synonyms_from_index, _extract_keywords_and_phrases,
+    _search_index, _make_title, prompt_user_for_object,
     _split_first_sentence, _highlight_keywords
 )
-from scilpy.utils.scilpy_bot import SPACING_LEN, VOCAB_FILE_PATH
-from scilpy.io.utils import add_verbose_arg
+from scilpy.utils.scilpy_bot import SPACING_LEN
+from scilpy.io.utils import (add_processes_arg, add_verbose_arg,
+                             validate_nbr_processes)
 
 
 def _build_arg_parser():
@@ -80,8 +70,10 @@ def _build_arg_parser():
                    help='Search without using synonyms.')
 
     p.add_argument('--regenerate_help_files', action='store_true',
-                   help='Regenerate help files for all scripts.')
+                   help='Regenerate help files and the search index for '
+                        'all scripts.')
 
+    add_processes_arg(p)
     add_verbose_arg(p)
 
     return p
@@ -94,6 +86,7 @@ def main():
         logging.getLogger().setLevel(logging.INFO)
     else:
         logging.getLogger().setLevel(logging.getLevelName(args.verbose))
+    nbr_processes = validate_nbr_processes(parser, args)
 
     selected_object = None
     if args.search_category:
@@ -106,17 +99,20 @@ def main():
     # keywords are single words. Phrases are composed keywords
     keywords, phrases = _extract_keywords_and_phrases(args.expressions)
 
-    with open(VOCAB_FILE_PATH, 'r') as f:
-        vocab_data = json.load(f)
+    # Help files are extracted statically from the scripts, then indexed.
+    # This is only done on first use or when scripts / vocabulary change.
+    index = _load_search_index(nbr_processes, args.regenerate_help_files)
 
     # If synonyms are enabled, extend the search to include synonyms
+    synonyms = []
     if not args.no_synonyms:
         all_expressions = keywords + phrases
         extended_expressions = set()
         for expression in all_expressions:
-            synonyms = _get_synonyms(expression, vocab_data['synonyms'])
-            extended_expressions.update(synonyms)
+            extended_expressions.update(
+                _get_synonyms_from_index(expression, index))
         extended_expressions.update(args.expressions)
+        synonyms = list(extended_expressions)
         keywords, phrases = _extract_keywords_and_phrases(extended_expressions)
 
     stemmed_keywords = _stem_keywords(keywords)
@@ -129,48 +125,13 @@ def main():
     phrase_mapping = {stem: orig for orig,
                       stem in zip(phrases, stemmed_phrases)}
 
-    script_dir = pathlib.Path(__file__).parent
-    hidden_dir = script_dir / '.hidden'
-
-    if args.regenerate_help_files:
-        shutil.rmtree(hidden_dir)
-
-    if not hidden_dir.exists():
-        hidden_dir.mkdir()
-        logging.info('This is your first time running this script. '
-                     'Generating help files may take a few minutes\n '
-                     'Please be patient, subsequent searches will be faster.')
-
-    _generate_help_files()
-
-    scores_per_script = {}
-
-    # Search through the docstrings of all scripts
-    for script in sorted(hidden_dir.glob(f'scil_{selected_object}*.help')):
-        script_name = script.stem
-
-        with open(script, 'r') as f:
-            search_text = f.read()
-
-        score_details = _calculate_score(
-            stemmed_keywords, stemmed_phrases, search_text,
-            filename=script_name)
-
-        scores_per_script = update_matches_and_scores(scores_per_script,
-                                                      script_name, score_details)
-
-    # Search in additional keywords in the vocabulary file
-    for script in vocab_data['scripts']:
-        if selected_object and selected_object not in script:
-            continue
+    hidden_dir = pathlib.Path(__file__).parent / '.hidden'
 
-        script_name = script['name']
-        script_keywords = script['keywords']
-        search_text = ' '.join(script_keywords)
-        score_details = _calculate_score(
-            stemmed_keywords, stemmed_phrases, search_text, script_name)
-        scores_per_script = update_matches_and_scores(scores_per_script,
-                                                      script_name, score_details)
+    # Search in the script names, help files and additional keywords of the
+    # vocabulary file
+    scores_per_script = _search_index(index, stemmed_keywords,
+                                      stemmed_phrases,
+                                      prefix=f'scil_{selected_object}')
 
     # Remove scripts with no matches
     scores_per_script = {script: score for script,
@@ -192,8 +153,8 @@ def main():
             continue
 
         # Highlight keywords based on verbosity level
-        with open(hidden_dir / f'{match}.help', 'r') as f:
-            docstrings = f.read()
+        help_file = hidden_dir / f'{match}.help'
+        docstrings = help_file.read_text() if help_file.exists() else ''
 
         all_experessions = stemmed_keywords + keywords + phrases \
             + stemmed_phrases
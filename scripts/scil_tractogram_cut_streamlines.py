@@ -142,9 +142,13 @@ def main():
         mask_img = nib.load(args.mask)
         binary_mask = get_data_as_mask(mask_img)
 
+        if args.nbr_processes != 1:
+            logging.warning('Option --processes is ignored with --mask: the '
+                            'streamlines are cut all at once.')
+
         new_sft = cut_streamlines_with_mask(
             sft, binary_mask, cutting_style=style,
-            min_len=args.min_length, processes=args.nbr_processes)
+            min_len=args.min_length)
     # Label scenario. The script will cut streamlines so they are going from
     # label 1 to label 2.
     else:
@@ -29,12 +29,11 @@ from scilpy.io.streamlines import load_tractogram_with_reference, \
 from scilpy.io.utils import (add_json_args,
                              add_verbose_arg,
                              add_overwrite_arg,
-                             add_processes_arg,
                              add_reference_arg,
                              assert_inputs_exist,
                              assert_outputs_exist,
                              check_tracts_same_format,
-                             validate_nbr_processes, ranged_type)
+                             ranged_type)
 from scilpy.tractograms.streamline_operations import \
     remove_loops_and_sharp_turns
 
@@ -72,7 +71,9 @@ def _build_arg_parser():
                    help="If set, will not save outputs if they are empty.")
 
     add_json_args(p)
-    add_processes_arg(p)
+    # Deprecated: no longer has any effect.
+    p.add_argument('--processes', dest='nbr_processes', type=int,
+                   help=argparse.SUPPRESS)
     add_reference_arg(p)
     add_verbose_arg(p)
     add_overwrite_arg(p)
@@ -91,7 +92,11 @@ def main():
                          optional=args.looping_tractogram)
     check_tracts_same_format(parser, [args.in_tractogram, args.out_tractogram,
                                       args.looping_tractogram])
-    nbr_cpu = validate_nbr_processes(parser, args)
+    if args.nbr_processes is not None:
+        logging.warning("Option --processes is deprecated and ignored: "
+                        "the winding angles are computed without "
+                        "multiprocessing. It will be removed in a future "
+                        "version.")
 
     # Loading
     sft = load_tractogram_with_reference(parser, args, args.in_tractogram)
@@ -104,8 +109,7 @@ def main():
 
     # Processing
     ids_clean = remove_loops_and_sharp_turns(
-        sft.streamlines, args.angle, qb_threshold=args.qb_threshold,
-        num_processes=nbr_cpu)
+        sft.streamlines, args.angle, qb_threshold=args.qb_threshold)
     if len(ids_clean) == 0:
         logging.warning('No clean streamlines in {}. They are all looping '
                         'streamlines? Check your parameters.'
@@ -75,10 +75,10 @@ from scilpy.io.streamlines import (load_tractogram_with_reference,
                                    save_tractogram)
 from scilpy.io.image import get_data_as_mask
 from scilpy.io.utils import (add_json_args, add_overwrite_arg,
-                             add_processes_arg, add_reference_arg,
+                             add_reference_arg,
                              add_verbose_arg, assert_inputs_exist,
                              assert_output_dirs_exist_and_empty,
-                             validate_nbr_processes, assert_headers_compatible,
+                             assert_headers_compatible,
                              ranged_type)
 from scilpy.image.labels import (get_data_as_labels, load_wmparc_labels,
                                  get_binary_mask_from_labels)
@@ -140,7 +140,9 @@ def _build_arg_parser():
                    help='Do not write file if there is no streamlines.')
 
     add_json_args(p)
-    add_processes_arg(p)
+    # Deprecated: no longer has any effect.
+    p.add_argument('--processes', dest='nbr_processes', type=int,
+                   help=argparse.SUPPRESS)
     add_reference_arg(p)
     add_verbose_arg(p)
     add_overwrite_arg(p)
@@ -220,7 +222,11 @@ def main():
     assert_headers_compatible(parser, [args.in_tractogram, args.in_wmparc],
                               args.csf_bin, reference=args.reference)
 
-    nbr_cpu = validate_nbr_processes(parser, args)
+    if args.nbr_processes is not None:
+        logging.warning("Option --processes is deprecated and ignored: "
+                        "the winding angles are computed without "
+                        "multiprocessing. It will be removed in a future "
+                        "version.")
 
     if args.minL == 0 and np.isinf(args.maxL):
         logging.info("You have not specified minL nor maxL. Output will "
@@ -370,8 +376,7 @@ def main():
 
     logging.info("STEP 4: Filtering loops and sharp turns.")
     if args.angle != np.inf:
-        ids_c = remove_loops_and_sharp_turns(sft.streamlines, args.angle,
-                                             num_processes=nbr_cpu)
+        ids_c = remove_loops_and_sharp_turns(sft.streamlines, args.angle)
         sft = sft[ids_c]
     else:
         ids_c = np.arange(len(sft))
@@ -75,11 +75,11 @@ from scilpy.image.labels import get_data_as_labels
 from scilpy.io.hdf5 import construct_hdf5_header
 from scilpy.io.streamlines import load_tractogram_with_reference
 from scilpy.io.utils import (add_bbox_arg, add_overwrite_arg,
-                             add_processes_arg, add_verbose_arg,
+                             add_verbose_arg,
                              add_reference_arg, assert_inputs_exist,
                              assert_outputs_exist,
                              assert_output_dirs_exist_and_empty,
-                             validate_nbr_processes, assert_headers_compatible)
+                             assert_headers_compatible)
 from scilpy.tractanalysis.connectivity_segmentation import (
     compute_connectivity,
     construct_hdf5_from_connectivity,
@@ -209,7 +209,9 @@ def _build_arg_parser():
 
     add_reference_arg(p)
     add_bbox_arg(p)
-    add_processes_arg(p)
+    # Deprecated: no longer has any effect.
+    p.add_argument('--processes', dest='nbr_processes', type=int,
+                   help=argparse.SUPPRESS)
     add_verbose_arg(p)
     add_overwrite_arg(p)
 
@@ -228,7 +230,10 @@ def main():
     assert_outputs_exist(parser, args, args.out_hdf5, args.out_labels_list)
     assert_headers_compatible(parser, args.in_tractograms + [args.in_labels],
                               [], args.reference)
-    nbr_cpu = validate_nbr_processes(parser, args)
+    if args.nbr_processes is not None:
+        logging.warning("Option --processes is deprecated and ignored: "
+                        "loops are removed without multiprocessing. It will "
+                        "be removed in a future version.")
 
     # HDF5 will not overwrite the file
     if os.path.isfile(args.out_hdf5):
@@ -314,8 +319,7 @@ def main():
             prune_length, args.min_length, args.max_length,
             remove_loops, args.loop_max_angle,
             remove_outliers, args.outlier_threshold,
-            remove_curv_dev, args.curv_qb_distance,
-            nbr_cpu)
+            remove_curv_dev, args.curv_qb_distance)
     time2 = time.time()
     logging.info(
         '    Connections post-processing and saving took {} sec.'.format(
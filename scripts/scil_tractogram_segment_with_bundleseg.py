@@ -26,6 +26,10 @@ For RAM usage, it is recommanded to use this heuristic:
 This is important because many instances of data structures are initialized
 in parallel and can lead to a RAM overflow.
 
+With --cache_dir, the clusterings (QBx) of the tractogram and of the models
+are saved on disk and reused when running again on the same data, for
+instance with other atlases or a different --minimal_vote_ratio.
+
 Formerly: scil_recognize_multi_bundles.py
 """
 
@@ -85,6 +89,11 @@ def _build_arg_parser():
                    help='Random number generator seed %(default)s.')
     p.add_argument('--inverse', action='store_true',
                    help='Use the inverse transformation.')
+    p.add_argument('--cache_dir',
+                   help='Directory where the QBx clusterings of the '
+                        'tractogram and of the models\nare saved. Reruns on '
+                        'the same subject (ex, with other atlases or\n'
+                        'parameters) reuse them instead of clustering again.')
 
     add_reference_arg(p)
     add_processes_arg(p)
@@ -144,7 +153,8 @@ def main():
     # the last pruning step was modified to be in line with BundleSeg.
     voting = VotingScheme(config, in_models_directories,
                           transfo, args.out_dir,
-                          minimal_vote_ratio=args.minimal_vote_ratio)
+                          minimal_vote_ratio=args.minimal_vote_ratio,
+                          cache_directory=args.cache_dir)
 
     voting(args.in_tractograms, nbr_processes=args.nbr_processes,
            seed=args.seed, reference=args.reference)
@@ -17,9 +17,10 @@ import nibabel as nib
 import numpy as np
 
 from scilpy.image.volume_operations import apply_transform
-from scilpy.io.utils import (add_overwrite_arg, assert_inputs_exist,
-                             assert_outputs_exist, add_verbose_arg,
-                             load_matrix_in_any_format)
+from scilpy.io.utils import (add_overwrite_arg, add_processes_arg,
+                             assert_inputs_exist, assert_outputs_exist,
+                             add_verbose_arg, load_matrix_in_any_format,
+                             validate_nbr_processes)
 from scilpy.utils.filenames import split_name_with_nii
 
 
@@ -45,6 +46,7 @@ def _build_arg_parser():
                    choices=['linear', 'nearest'],
                    help='Interpolation: "linear" or "nearest". [%(default)s]')
 
+    add_processes_arg(p)
     add_verbose_arg(p)
     add_overwrite_arg(p)
 
@@ -60,6 +62,7 @@ def main():
     assert_inputs_exist(parser, [args.in_file, args.in_target_file,
                                  args.in_transfo])
     assert_outputs_exist(parser, args, args.out_name)
+    nbr_cpu = validate_nbr_processes(parser, args)
 
     _, ref_extension = split_name_with_nii(args.in_target_file)
     _, in_extension = split_name_with_nii(args.in_file)
@@ -79,7 +82,7 @@ def main():
     # Processing, saving
     warped_img = apply_transform(
         transfo, reference, moving, keep_dtype=args.keep_dtype,
-        interp=args.interpolation)
+        interp=args.interpolation, num_processes=nbr_cpu)
 
     nib.save(warped_img, args.out_name)
 
@@ -6,8 +6,8 @@ Compute distance map between two binary masks. The distance map is the
 Euclidean distance from each voxel of the first mask to the closest
 voxel of the second mask.
 
-Slowest scenarios are 1) two very large masks that are far appart or 2) a very
-small mask completely inside a very large mask (around 20-30 seconds).
+The distances are computed with an exact Euclidean distance transform, in
+voxels. The computation time only depends on the size of the volume.
 
 Take this command as an example:
   scil_volume_distance_map.py brain_mask.nii.gz AF_L.nii.gz \
@@ -72,7 +72,7 @@ def main():
     logging.debug(f'Loaded two masks with {np.count_nonzero(mask_1)} and '
                   f'{np.count_nonzero(mask_2)} voxels')
 
-    # Compute distance map using KDTree
+    # Compute distance map using a Euclidean distance transform
     distance_map = compute_distance_map(mask_1, mask_2,
                                         args.symmetric_distance)
 
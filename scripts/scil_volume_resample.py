@@ -22,8 +22,9 @@ import logging
 import nibabel as nib
 import numpy as np
 
-from scilpy.io.utils import (add_verbose_arg, add_overwrite_arg,
-                             assert_inputs_exist, assert_outputs_exist)
+from scilpy.io.utils import (add_overwrite_arg, add_processes_arg,
+                             add_verbose_arg, assert_inputs_exist,
+                             assert_outputs_exist, validate_nbr_processes)
 from scilpy.image.volume_operations import resample_volume
 
 
@@ -64,6 +65,7 @@ def _build_arg_parser():
     p.add_argument('--enforce_dimensions', action='store_true',
                    help='Enforce the reference volume dimension.')
 
+    add_processes_arg(p)
     add_verbose_arg(p)
     add_overwrite_arg(p)
 
@@ -78,6 +80,7 @@ def main():
     # Checking args
     assert_inputs_exist(parser, args.in_image, args.ref)
     assert_outputs_exist(parser, args, args.out_image)
+    nbr_cpu = validate_nbr_processes(parser, args)
 
     if args.enforce_dimensions and not args.ref:
         parser.error("Cannot enforce dimensions without a reference image.")
@@ -112,7 +115,8 @@ def main():
                                     iso_min=args.iso_min,
                                     voxel_res=args.voxel_size,
                                     interp=args.interp,
-                                    enforce_dimensions=args.enforce_dimensions)
+                                    enforce_dimensions=args.enforce_dimensions,
+                                    num_processes=nbr_cpu)
 
     # Saving results
     zooms = list(resampled_img.header.get_zooms())
@@ -45,3 +45,24 @@ def test_execution_piesno(script_runner, monkeypatch):
                             'dwi_denoised.nii.gz', '--processes', '1',
                             '--piesno', '--number_coils', '4')
     assert ret.success
+
+
+def test_execution_piesno_slices(script_runner, monkeypatch):
+    monkeypatch.chdir(os.path.expanduser(tmp_dir.name))
+    in_img = os.path.join(SCILPY_HOME, 'processing', 'dwi.nii.gz')
+    ret = script_runner.run('scil_denoising_nlmeans.py', in_img,
+                            'dwi_denoised_slices.nii.gz', '--processes', '2',
+                            '--piesno', '--number_coils', '4',
+                            '--piesno_slices', '0', '5', '10')
+    assert ret.success
+
+
+def test_execution_piesno_slices_out_of_range(script_runner, monkeypatch):
+    monkeypatch.chdir(os.path.expanduser(tmp_dir.name))
+    in_img = os.path.join(SCILPY_HOME, 'processing', 'dwi.nii.gz')
+    ret = script_runner.run('scil_denoising_nlmeans.py', in_img,
+                            'dwi_denoised_bad_slices.nii.gz',
+                            '--processes', '1', '--piesno',
+                            '--number_coils', '4',
+                            '--piesno_slices', '0', '1000')
+    assert not ret.success
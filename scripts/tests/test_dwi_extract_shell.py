@@ -61,3 +61,34 @@ def test_execution_processing_3000(script_runner, monkeypatch):
                             'dwi_crop_3000.nii.gz', '3000.bval', '3000.bvec',
                             '-t', '30')
     assert ret.success
+
+
+def test_execution_out_of_core(script_runner, monkeypatch):
+    monkeypatch.chdir(os.path.expanduser(tmp_dir.name))
+    in_dwi = os.path.join(SCILPY_HOME, 'processing',
+                          'dwi_crop.nii.gz')
+    in_bval = os.path.join(SCILPY_HOME, 'processing',
+                           'dwi.bval')
+    in_bvec = os.path.join(SCILPY_HOME, 'processing',
+                           'dwi.bvec')
+    ret = script_runner.run('scil_dwi_extract_shell.py', in_dwi,
+                            in_bval, in_bvec, '0', '1000',
+                            'dwi_crop_1000__2.nii.gz', '1000__2.bval',
+                            '1000__2.bvec', '-t', '30', '--block-size', '5',
+                            '--out_of_core')
+    assert ret.success
+
+
+def test_execution_out_of_core_same_file(script_runner, monkeypatch):
+    monkeypatch.chdir(os.path.expanduser(tmp_dir.name))
+    in_bval = os.path.join(SCILPY_HOME, 'processing',
+                           'dwi.bval')
+    in_bvec = os.path.join(SCILPY_HOME, 'processing',
+                           'dwi.bvec')
+    # Writing to the input file while reading it is refused.
+    ret = script_runner.run('scil_dwi_extract_shell.py',
+                            'dwi_crop_1000__2.nii.gz', in_bval, in_bvec,
+                            '0', '1000', 'dwi_crop_1000__2.nii.gz',
+                            '1000__3.bval', '1000__3.bvec', '-t', '30',
+                            '--out_of_core', '-f')
+    assert not ret.success
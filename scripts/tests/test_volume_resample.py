@@ -4,6 +4,9 @@
 import os
 import tempfile
 
+import nibabel as nib
+import numpy as np
+
 from scilpy import SCILPY_HOME
 from scilpy.io.fetcher import fetch_data, get_testing_files_dict
 
@@ -25,6 +28,19 @@ def test_execution_given_size(script_runner, monkeypatch):
     assert ret.success
 
 
+def test_execution_4d_processes(script_runner, monkeypatch):
+    monkeypatch.chdir(os.path.expanduser(tmp_dir.name))
+    # Volumes of a 4D image are resliced by --processes threads (0: all).
+    data = np.random.default_rng(0).random((10, 12, 8, 4), dtype=np.float32)
+    nib.save(nib.Nifti1Image(data, np.diag([2., 2., 2., 1.])),
+             'dwi_4d.nii.gz')
+    ret = script_runner.run('scil_volume_resample.py', 'dwi_4d.nii.gz',
+                            'dwi_4d_resample.nii.gz', '--voxel_size', '1',
+                            '--processes', '0')
+    assert ret.success
+    assert nib.load('dwi_4d_resample.nii.gz').shape == (20, 24, 16, 4)
+
+
 def test_execution_force_voxel(script_runner, monkeypatch):
     monkeypatch.chdir(os.path.expanduser(tmp_dir.name))
     ret = script_runner.run('scil_volume_resample.py', in_img,
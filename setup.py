@@ -1,4 +1,5 @@
 import os
+import sys
 
 from setuptools import setup, find_packages, Extension
 from setuptools.command.build_ext import build_ext
@@ -17,9 +18,15 @@ with open('requirements.txt') as f:
 
 def get_extensions():
     define_macros = [('NPY_NO_DEPRECATED_API', 'NPY_1_7_API_VERSION')]
+    # OpenMP is only enabled with gcc (Linux). Elsewhere, prange loops
+    # silently fall back to a single thread.
+    openmp_flags = ['-fopenmp'] if sys.platform.startswith('linux') else []
     uncompress = Extension('scilpy.tractograms.uncompress',
                            ['scilpy/tractograms/uncompress.pyx'],
                            define_macros=define_macros)
+    resampling = Extension('scilpy.tractograms.resampling',
+                           ['scilpy/tractograms/resampling.pyx'],
+                           define_macros=define_macros)
     voxel_boundary_intersection =\
         Extension('scilpy.tractanalysis.voxel_boundary_intersection',
                   ['scilpy/tractanalysis/voxel_boundary_intersection.pyx'],
@@ -27,8 +34,11 @@ def get_extensions():
     streamlines_metrics =\
         Extension('scilpy.tractanalysis.streamlines_metrics',
                   ['scilpy/tractanalysis/streamlines_metrics.pyx'],
-                  define_macros=define_macros)
-    return [uncompress, voxel_boundary_intersection, streamlines_metrics]
+                  define_macros=define_macros,
+                  extra_compile_args=openmp_flags,
+                  extra_link_args=openmp_flags)
+    return [uncompress, resampling, voxel_boundary_intersection,
+            streamlines_metrics]
 
 
 class CustomBuildExtCommand(build_ext):